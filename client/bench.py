@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the client's hot paths, with JSON baselines.
+
+Runs the real client code against the test fixtures (RecordingEPD, the
+gradient/paletted panel images) and a local stand-in server:
+
+    python3 bench.py                                  # run and print
+    python3 bench.py --save bench-baseline.json       # store a baseline
+    python3 bench.py --compare bench-baseline.json --threshold 20
+    python3 bench.py -k sha256 -k artifact --repeat 50
+
+--compare exits with status 1 when any benchmark's median is more than
+--threshold percent slower than in the baseline. Baselines are machine
+specific: record them on the hardware you compare on (e.g. the Pi Zero 2 W).
+
+Artifacts go to a temporary directory, never to the real
+EINK_LAST_SENT_PATH.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List, Optional
+
+import PIL
+import PIL.Image
+
+import client
+import config
+import standin_server
+import timing
+from test_client import (
+    BW_DISPLAY_CONFIG,
+    COLOR_DISPLAY_CONFIG,
+    RecordingEPD,
+    make_gradient_image,
+    make_paletted_panel_image,
+)
+
+DEFAULT_REPEAT = 10
+DEFAULT_THRESHOLD = 20.0
+
+PANEL_SIZE = (800, 480)
+
+
+def make_dithered_preview(width: int, height: int):
+    """Server-like /preview frame: the gradient Floyd-Steinberg dithered to the
+    6-color panel palette (compresses like a real photo, unlike the stripes)."""
+    palette = make_paletted_panel_image(6, 1)
+    return make_gradient_image(width, height).quantize(
+        palette=palette, dither=PIL.Image.Dither.FLOYDSTEINBERG
+    )
+
+
+def _png_bytes(img) -> bytes:
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class BenchEnvironment:
+    """Sandbox for one suite run: temp artifact dir, stand-in server, quiet logs.
+
+    Client module globals and the config values a benchmark touches are
+    restored on exit.
+    """
+
+    _CLIENT_STATE = (
+        "epd", "driver_name", "_last_artifact", "_last_fetch_hash", "_last_fetch_bytes",
+        "_last_displayed_hash", "_last_panel_write_monotonic", "_consecutive_hw_failures",
+        "_initial_display_done", "_hw_recovery_pending", "_preview_only", "_timer",
+        "_offline_since", "_offline_refreshes", "_offline_written_hash",
+        "_last_refresh_monotonic", "_last_frame",
+    )
+    _CONFIG_STATE = (
+        "SERVER_URL", "CLIENT_TOKEN", "LAST_SENT_PATH", "LAST_SENT_FORMAT",
+        "LAST_SENT_ASYNC", "CONTENT_SKIP", "STAGE_TIMING", "SERVER_URLS", "PREVIEW_DELTA",
+        "PREVIEW_RESUME", "COMPOSITE", "CAPABILITIES", "PLAYLIST", "TIMELINE_STEP",
+        "LONGPOLL_ADAPTIVE",
+    )
+
+    def __enter__(self) -> "BenchEnvironment":
+        self._saved_client = {name: getattr(client, name) for name in self._CLIENT_STATE}
+        self._saved_config = {name: getattr(config, name) for name in self._CONFIG_STATE}
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.artifact_path = os.path.join(self._tmpdir.name, "eink_last_sent.png")
+        self.preview_png = _png_bytes(make_dithered_preview(*PANEL_SIZE))
+        self.server = standin_server.StandinServer(self.preview_png, hold=0.05).start()
+
+        config.SERVER_URL = self.server.url
+        config.CLIENT_TOKEN = ""
+        config.LAST_SENT_PATH = self.artifact_path
+        config.LAST_SENT_FORMAT = "png"
+        config.LAST_SENT_ASYNC = False
+        config.STAGE_TIMING = False
+        # The plain /preview path, whatever EINK_* extensions the host has on.
+        config.SERVER_URLS = ""
+        config.PREVIEW_DELTA = config.COMPOSITE = config.CAPABILITIES = False
+        config.PLAYLIST = config.LONGPOLL_ADAPTIVE = False
+        config.PREVIEW_RESUME = config.TIMELINE_STEP = 0
+        client._timer = timing.StageTimer(enabled=False)
+        client._last_artifact = None
+        client.driver_name = "epd7in3e"
+
+        self._logger = logging.getLogger("eink-client")
+        self._log_level = self._logger.level
+        self._logger.setLevel(logging.ERROR)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._logger.setLevel(self._log_level)
+        self.server.stop()
+        client._artifact_writer.flush(5)
+        for name, value in self._saved_client.items():
+            setattr(client, name, value)
+        for name, value in self._saved_config.items():
+            setattr(config, name, value)
+        self._tmpdir.cleanup()
+
+
+# name -> factory(env) returning the zero-argument callable that is timed.
+# Setup work happens in the factory and is not measured.
+BENCHMARKS: Dict[str, Callable[[BenchEnvironment], Callable[[], object]]] = {}
+
+
+def benchmark(name: str):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+@benchmark("fetch_preview")
+def _bench_fetch_preview(env):
+    return lambda: client.fetch_preview("dithered")
+
+
+@benchmark("sha256_preview_png")
+def _bench_sha256_png(env):
+    data = env.preview_png
+    return lambda: hashlib.sha256(data).hexdigest()
+
+
+@benchmark("sha256_rgb_frame")
+def _bench_sha256_rgb(env):
+    data = make_gradient_image(*PANEL_SIZE).tobytes()  # 800x480x3 = 1.15 MB
+    return lambda: hashlib.sha256(data).hexdigest()
+
+
+@benchmark("sha256_bw_frame")
+def _bench_sha256_bw(env):
+    data = make_gradient_image(*PANEL_SIZE).convert("1").tobytes()  # 48 kB
+    return lambda: hashlib.sha256(data).hexdigest()
+
+
+def _display_bench(env, display_config):
+    epd = RecordingEPD()
+    img = make_gradient_image(*PANEL_SIZE)
+
+    def run():
+        client.epd = epd
+        return client.display_image(img, display_config)
+    return run
+
+
+@benchmark("display_image_color")
+def _bench_display_color(env):
+    return _display_bench(env, COLOR_DISPLAY_CONFIG)
+
+
+@benchmark("display_image_bw")
+def _bench_display_bw(env):
+    return _display_bench(env, BW_DISPLAY_CONFIG)
+
+
+@benchmark("resize_guard")
+def _bench_resize_guard(env):
+    img = make_paletted_panel_image(400, 240)
+    return lambda: client._convert_for_panel(img, COLOR_DISPLAY_CONFIG, PANEL_SIZE)
+
+
+def _artifact_bench(env, fmt):
+    img = make_gradient_image(*PANEL_SIZE)
+
+    def run():
+        config.LAST_SENT_FORMAT = fmt
+        client._last_artifact = None  # measure the write, not the dedup hit
+        client.save_last_sent_artifact(img)
+    return run
+
+
+@benchmark("artifact_png")
+def _bench_artifact_png(env):
+    return _artifact_bench(env, "png")
+
+
+@benchmark("artifact_png_fast")
+def _bench_artifact_png_fast(env):
+    return _artifact_bench(env, "png-fast")
+
+
+@benchmark("artifact_raw")
+def _bench_artifact_raw(env):
+    return _artifact_bench(env, "raw")
+
+
+@benchmark("handle_refresh")
+def _bench_handle_refresh(env):
+    epd = RecordingEPD()
+    display_config = dict(COLOR_DISPLAY_CONFIG, panel_image_mode="dithered")
+
+    def run():
+        client.epd = epd
+        client._last_artifact = None
+        return client.handle_refresh(display_config, "manual")
+    return run
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> dict:
+    """Time fn() repeat times after warmup untimed calls; stats in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    ordered = sorted(samples)
+    return {
+        "runs": repeat,
+        "min_ms": round(ordered[0], 4),
+        "median_ms": round(statistics.median(ordered), 4),
+        "p95_ms": round(timing.percentile(ordered, 0.95), 4),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+
+def select(patterns: Iterable[str]) -> List[str]:
+    """Benchmark names containing any of the substrings (all when none given)."""
+    patterns = list(patterns)
+    return [name for name in BENCHMARKS if not patterns or any(p in name for p in patterns)]
+
+
+def run_suite(names: Optional[List[str]] = None, repeat: int = DEFAULT_REPEAT,
+              warmup: int = 1) -> dict:
+    """Run the selected benchmarks in one sandbox; returns the JSON document."""
+    names = list(BENCHMARKS) if names is None else names
+    results = {}
+    with BenchEnvironment() as env:
+        for name in names:
+            results[name] = measure(BENCHMARKS[name](env), repeat, warmup)
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "machine": platform.machine(),
+            "node": platform.node(),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """Per-benchmark median change against a baseline.
+
+    Returns one row per benchmark present in both documents, with
+    change_pct = (current / baseline - 1) * 100 and regression = change_pct
+    above threshold. Benchmarks missing on either side are skipped.
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or base.get("median_ms", 0) <= 0:
+            continue
+        change = (result["median_ms"] / base["median_ms"] - 1) * 100
+        rows.append({
+            "name": name,
+            "baseline_ms": base["median_ms"],
+            "current_ms": result["median_ms"],
+            "change_pct": round(change, 1),
+            "regression": change > threshold,
+        })
+    return rows
+
+
+def format_results(doc: dict) -> str:
+    lines = [f"{'benchmark':<22} {'median':>10} {'p95':>10} {'min':>10} {'runs':>5}"]
+    for name, r in doc["results"].items():
+        lines.append(
+            f"{name:<22} {r['median_ms']:>8.3f}ms {r['p95_ms']:>8.3f}ms "
+            f"{r['min_ms']:>8.3f}ms {r['runs']:>5}"
+        )
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[dict], threshold: float) -> str:
+    lines = [f"{'benchmark':<22} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        lines.append(
+            f"{row['name']:<22} {row['baseline_ms']:>8.3f}ms {row['current_ms']:>8.3f}ms "
+            f"{row['change_pct']:>+7.1f}%{flag}"
+        )
+    lines.append(f"threshold: +{threshold:g}% on the median")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="E-Ink client micro-benchmarks")
+    parser.add_argument("-k", dest="patterns", action="append", default=[],
+                        help="only benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--save", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="regression threshold in percent (default %(default)s)")
+    parser.add_argument("--list", action="store_true", help="list benchmark names and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    names = select(args.patterns)
+    if not names:
+        parser.error(f"no benchmark matches {args.patterns}")
+
+    doc = run_suite(names, repeat=max(1, args.repeat), warmup=max(0, args.warmup))
+    print(format_results(doc))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(doc, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+        print(f"baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        rows = compare(doc, baseline, args.threshold)
+        print()
+        print(format_comparison(rows, args.threshold))
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Capability handshake (EINK_CAPABILITIES).
+
+The server renders /preview for the display profile in its settings, and
+the client learns the panel's real geometry only from its driver: when the
+two disagree, every frame is resized with NEAREST and mode-converted before
+getbuffer() (client._convert_for_panel), and the server never learns which
+formats the client could take as they are. With EINK_CAPABILITIES the
+client announces its panel once per connection, and again when the
+announcement changes:
+
+    POST /api/client_capabilities
+    {"driver": "epd7in3e", "width": 800, "height": 480,
+     "palette": ["#000000", ...], "formats": ["image/png;mode=P", ...],
+     "digest": "sha256", "delta": true}
+
+formats are the PNG image modes the driver's getbuffer() takes without a
+conversion, cheapest first (a palette PNG of the panel colors is a fraction
+of an RGB one); digest is the hash the client compares frames with and
+delta whether it fetches tile deltas (EINK_PREVIEW_DELTA). The server
+answers {"caps": "<caps_id()>"}, and a preview request carrying
+?caps=<id> is rendered at exactly width x height in the first of the
+formats it can produce (render() is the reference). Such a frame fits()
+and goes to the driver untouched.
+
+A fetched frame of another size means the server dropped the announcement
+(a restart) or ignores ?caps=: the client announces again before the next
+fetch. A server without the endpoint (404/405/501, or 401 behind its auth
+guard) switches the handshake off for the process.
+"""
+
+import hashlib
+import json
+from typing import List, Tuple
+
+from PIL import Image
+
+ENDPOINT = "/api/client_capabilities"
+DIGEST = "sha256"
+# Panel palette per driver (panels.py converts multi-panel frames with it).
+DRIVER_COLORS = {
+    "epd7in3e": ["#000000", "#FFFFFF", "#FF0000", "#00FF00", "#0000FF", "#FFFF00"],
+    "epd7in5_V2": ["#000000", "#FFFFFF"],
+}
+# Image modes each driver's getbuffer() takes as they are, cheapest first:
+# the 6-color driver converts to RGB and quantizes to its palette itself.
+DRIVER_MODES = {
+    "epd7in3e": ("P", "RGB"),
+    "epd7in5_V2": ("1",),
+}
+FORMAT_PREFIX = "image/png;mode="
+
+
+def announcement(driver: str, width: int, height: int, delta: bool) -> dict:
+    """The capabilities of driver's panel; KeyError for a driver without an entry."""
+    return {
+        "driver": driver,
+        "width": width,
+        "height": height,
+        "palette": list(DRIVER_COLORS[driver]),
+        "formats": [FORMAT_PREFIX + mode for mode in DRIVER_MODES[driver]],
+        "digest": DIGEST,
+        "delta": bool(delta),
+    }
+
+
+def caps_id(caps: dict) -> str:
+    """Short stable id of an announcement (what the server acknowledges)."""
+    canonical = json.dumps(caps, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest()[:16]
+
+
+def modes(caps: dict) -> List[str]:
+    """The image modes of caps' formats, in order."""
+    return [f[len(FORMAT_PREFIX):] for f in caps.get("formats", ())
+            if f.startswith(FORMAT_PREFIX)]
+
+
+def palette_rgb(caps: dict) -> List[Tuple[int, int, int]]:
+    return [tuple(int(c.lstrip("#")[i:i + 2], 16) for i in (0, 2, 4)) for c in caps["palette"]]
+
+
+def fits(img: Image.Image, caps: dict) -> bool:
+    """img is exactly the driver input caps asked for: size, mode and palette."""
+    if img.size != (caps["width"], caps["height"]) or img.mode not in modes(caps):
+        return False
+    if img.mode == "P":
+        flat = [c for rgb in palette_rgb(caps) for c in rgb]
+        return (img.getpalette() or [])[:len(flat)] == flat
+    return True
+
+
+def render(img: Image.Image, caps: dict) -> Tuple[Image.Image, str]:
+    """Server side: img as the exact-fit frame for caps and the mode chosen.
+
+    img is already dithered to the panel palette; NEAREST keeps its colors
+    when the size differs.
+    """
+    if img.size != (caps["width"], caps["height"]):
+        img = img.resize((caps["width"], caps["height"]), Image.Resampling.NEAREST)
+    mode = (modes(caps) or ["RGB"])[0]
+    if mode == "P":
+        colors = palette_rgb(caps)
+        pal = Image.new("P", (1, 1))
+        pal.putpalette([c for rgb in colors for c in rgb] + [0, 0, 0] * (256 - len(colors)))
+        img = img.convert("RGB").quantize(palette=pal, dither=Image.Dither.NONE)
+    elif mode == "1":
+        img = img.convert("L").point(lambda x: 0 if x < 128 else 255, "1")
+    elif img.mode != mode:
+        img = img.convert(mode)
+    return img, mode
@@ -1,40 +1,98 @@
 #!/usr/bin/env python3
 """E-Ink Picture Client — fetches rendered preview from server and displays on E-Ink."""
 
+from __future__ import annotations
+
+import argparse
+import base64
 import hashlib
 import logging
 import os
 import signal
 import sys
+import threading
 import time
 from io import BytesIO
-from typing import Optional, Tuple, Union
-
-import requests
-from PIL import Image
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import quote
 
 import config
-
-logging.basicConfig(
-    level=getattr(logging, config.LOG_LEVEL),
-    format="%(asctime)s [%(levelname)s] %(message)s"
+import endpoints
+import logpipe
+import longpoll
+import metrics
+import profiling
+import startup
+import timing
+
+# Cold start: requests and Pillow are imported on first use, not here (see
+# startup.py). Annotations mentioning them are strings (PEP 563).
+_startup = startup.StartupProfile()
+requests = startup.DeferredModule("requests", on_import=_startup.record)
+Image = startup.DeferredModule("PIL.Image", on_import=_startup.record)
+
+logpipe.install(
+    level=config.LOG_LEVEL,
+    log_file=config.LOG_FILE,
+    max_bytes=config.LOG_MAX_BYTES,
+    backups=config.LOG_BACKUPS,
+    ring=config.LOG_RING,
+    async_=config.LOG_ASYNC,
 )
 logger = logging.getLogger("eink-client")
 
 # Display driver (loaded lazily)
 epd = None
 driver_name = config.DISPLAY_DRIVER
+# config.DRIVER_PROCESS: the child process running the driver (unwrapped,
+# also while a session trace wraps epd); None in-process or when none runs.
+_driver_process = None
+# Startup driver bring-up running concurrently with the first fetches (see
+# _start_driver_bringup); None once joined.
+_driver_bringup: Optional[threading.Thread] = None
 
 # Auth failure state: the 401 hint is logged once per state change,
 # not on every poll iteration.
 _auth_error_logged = False
+# The routes the server's auth guard lets through with the client token
+# (server/internal/middleware/auth.go clientRoutes); it answers a JSON 401
+# for every other route, known or not.
+CLIENT_ROUTES = ("/settings", "/preview", "/api/refresh_status", "/api/client_heartbeat")
+# Answers to an optional endpoint that may mean the server lacks it, and
+# how many in a row it takes when they may also be the endpoint's own
+# answer (see _endpoint_unsupported).
+UNSUPPORTED_STATUS = (401, 403, 404, 405, 501)
+PROBE_LIMIT = 3
 
 # Content-skip state (E5.2). In-memory only by design: a process restart
 # always writes the first frame (no persisted hash).
 _last_fetch_hash: Optional[str] = None  # SHA-256 of the last fetched /preview wire bytes
+_last_fetch_bytes: Optional[int] = None  # size of those wire bytes (heartbeat telemetry)
 _last_displayed_hash: Optional[str] = None  # hash of the last image successfully written to the panel
 _last_panel_write_monotonic: Optional[float] = None  # time.monotonic() of that write
 
+# Tile-delta transfer (config.PREVIEW_DELTA): the last normalized frame per
+# preview path (query included), and whether the server has /preview/delta.
+_delta_bases: Dict[str, Image.Image] = {}
+_preview_delta_supported: bool = True
+
+# Local compositing (config.COMPOSITE): (digest, normalized base frame) per
+# preview path, the font loader (font files fetched once), and whether the
+# server has /preview/overlay.
+_composite_bases: Dict[str, Tuple[str, Image.Image]] = {}
+_composite_fonts = None
+_composite_supported: bool = True
+
+# Capability handshake (config.CAPABILITIES): the (id, announcement) the
+# server acknowledged - None until then and again after an outage or a
+# frame that does not fit - and whether the server has the endpoint.
+_capabilities: Optional[Tuple[str, dict]] = None
+_capabilities_supported: bool = True
+
+# Optional protocol extensions (delta, compositing, playlists, capabilities):
+# answers in a row that looked like "no such endpoint", per endpoint.
+_probe_misses: Dict[str, int] = {}
+
 # Watchdog & recovery state (E5.4). In-memory only by design: a fresh process
 # (systemd restart) starts with a clean slate and a fresh driver import.
 _preview_only: bool = False  # ImportError at driver load: permanent preview mode
@@ -42,6 +100,145 @@ _hw_recovery_pending: bool = False  # driver down after a HW error; re-load next
 _consecutive_hw_failures: int = 0  # reset only on a successful physical panel write
 _initial_display_done: bool = False  # first successful display run since process start
 
+# Last-sent artifact dedup state: (path, pixel digest) of the last artifact
+# actually written. Touched by the background writer thread when
+# config.LAST_SENT_ASYNC is on, otherwise by display_image() inline.
+_last_artifact: Optional[Tuple[str, str]] = None
+
+# Per-stage latency spans (config.STAGE_TIMING); disabled spans are no-ops.
+_timer = timing.StageTimer(enabled=config.STAGE_TIMING)
+
+# Client metrics. Counters/histograms are always updated (a dict update under
+# one lock); exporting them is opt-in (config.METRICS_PORT/METRICS_TEXTFILE,
+# started by _start_metrics_export). Callback gauges run on the scrape thread.
+_metrics = metrics.Registry()
+_m_refreshes = _metrics.counter(
+    "eink_client_refreshes_total",
+    "Refresh attempts by outcome (refreshed, skipped, failed, no_preview)",
+    labels=("result",),
+)
+_m_http_errors = _metrics.counter(
+    "eink_client_http_errors_total",
+    "Failed server requests by endpoint and HTTP status or exception type",
+    labels=("endpoint", "code"),
+)
+_m_hw_failures = _metrics.counter(
+    "eink_client_hw_failures_total", "Hardware failure cycles (E5.4)"
+)
+_m_driver_reloads = _metrics.counter(
+    "eink_client_driver_reloads_total", "Display driver re-loads after a hardware error"
+)
+_m_stage_seconds = _metrics.histogram(
+    "eink_client_stage_seconds", "Refresh pipeline stage latency", labels=("stage",)
+)
+_m_failovers = _metrics.counter(
+    "eink_client_server_failovers_total",
+    "Requests retried on the next server endpoint (EINK_SERVER_URLS)",
+)
+_m_preview_delta = _metrics.counter(
+    "eink_client_preview_delta_total",
+    "Previews fetched with EINK_PREVIEW_DELTA by outcome (patch, full, fallback)",
+    labels=("result",),
+)
+_m_composite = _metrics.counter(
+    "eink_client_preview_composite_total",
+    "Previews with EINK_COMPOSITE by outcome (composed, base, full, fallback)",
+    labels=("result",),
+)
+_m_preview_resumes = _metrics.counter(
+    "eink_client_preview_resumes_total",
+    "Interrupted preview downloads continued with a Range request (EINK_PREVIEW_RESUME)",
+)
+_m_panel_fit = _metrics.counter(
+    "eink_client_panel_fit_total",
+    "Frames written with EINK_CAPABILITIES by how they reached the driver (exact, converted)",
+    labels=("result",),
+)
+_m_longpolls = _metrics.counter(
+    "eink_client_longpolls_total",
+    "Long-polls with EINK_LONGPOLL_ADAPTIVE by outcome (held, due, broken, failed)",
+    labels=("result",),
+)
+_metrics.gauge(
+    "eink_client_longpoll_hold_seconds",
+    "Long-poll hold currently asked for (EINK_LONGPOLL_ADAPTIVE)",
+    fn=lambda: _hold_tuner.hold if _hold_tuner is not None and _hold_tuner.supported else None,
+)
+_metrics.gauge(
+    "eink_client_longpoll_reconnects_per_hour",
+    "Long-polls started in the last hour (EINK_LONGPOLL_ADAPTIVE)",
+    fn=lambda: _hold_tuner.reconnects_per_hour() if _hold_tuner is not None else None,
+)
+_m_preview_bytes = _metrics.histogram(
+    "eink_client_preview_bytes", "Size of fetched /preview responses",
+    buckets=metrics.BYTES_BUCKETS,
+)
+_metrics.gauge(
+    "eink_client_consecutive_hw_failures",
+    "Current consecutive hardware failure cycles (E5.4 escalation counter)",
+    fn=lambda: _consecutive_hw_failures,
+)
+_metrics.gauge(
+    "eink_client_frame_age_seconds",
+    "Seconds since the last successful physical panel write",
+    fn=lambda: _frame_age_seconds(),
+)
+_metrics.gauge(
+    "eink_client_process_resident_bytes", "Client process resident set size",
+    fn=metrics.process_rss_bytes,
+)
+_metrics_exports: list = []  # running MetricsServer/TextfileWriter instances
+
+# Heartbeat telemetry (config.HEARTBEAT_TELEMETRY). Cleared for the rest of
+# the process when the server rejects the extended body (400/413/422); the
+# heartbeat itself is then re-sent without the block.
+_heartbeat_telemetry_accepted: bool = True
+
+# Server endpoints (config.SERVER_URLS): (spec, EndpointPool) built on first
+# use; None = the single config.SERVER_URL without failover.
+_endpoint_pool: Optional[Tuple[str, endpoints.EndpointPool]] = None
+
+# Render-ahead timeline (config.TIMELINE_STEP); None = off. Timeline writes
+# use the last display settings fetched and start early by the duration of
+# the last successful panel write.
+_timeline = None
+_last_display_config: dict = {}
+_last_write_seconds: Optional[float] = None
+
+# Playlist mode (config.PLAYLIST): the frame cache (None = off, or the server
+# has no playlists), the index of the frame on the panel and when the next
+# rotation step is due (time.monotonic()).
+_playlist = None
+_playlist_index: int = -1
+_playlist_next: Optional[float] = None
+
+# Adaptive long-poll hold (config.LONGPOLL_ADAPTIVE): created on the first
+# poll; it stops asking once the server turns out to have a fixed hold.
+_hold_tuner: Optional[longpoll.HoldTuner] = None
+
+# Autonomous offline mode (config.REFRESH_INTERVAL): while polls fail the
+# client refreshes on its own schedule from the last frame it wrote.
+# _offline_written_hash is a frame written while offline that the server has
+# not heard about yet; the first interval refresh after the outage skips it.
+_offline_since: Optional[float] = None  # time.monotonic() of the first failed poll in a row
+_offline_refreshes: int = 0
+_offline_written_hash: Optional[str] = None
+_last_refresh_monotonic: Optional[float] = None  # last refresh decision (write or skip)
+_last_frame: Optional[Tuple[Image.Image, Optional[str]]] = None  # (image, hash) on the panel
+
+# Session trace recorder (config.TRACE_PATH); None = not recording.
+_tracer = None
+
+# cProfile/tracemalloc for the next N cycles (SIGUSR1, config.PROFILE_ON_START).
+_profiler = profiling.CycleProfiler()
+
+# config.LAST_SENT_FORMAT -> (Pillow format, save params)
+_ARTIFACT_FORMATS = {
+    "png": ("PNG", {}),
+    "png-fast": ("PNG", {"compress_level": 1}),
+    "raw": ("PPM", {}),
+}
+
 
 def _auth_headers() -> dict:
     """Headers for server requests: X-Client-Token when a token is configured.
@@ -54,9 +251,16 @@ def _auth_headers() -> dict:
     return {}
 
 
-def _track_auth_state(resp: requests.Response) -> None:
-    """Log a clear hint once when the server starts answering 401 Unauthorized."""
+def _track_auth_state(resp: requests.Response, path: str) -> None:
+    """Log a clear hint once when the server starts answering 401 Unauthorized.
+
+    Only the client routes count: the server's auth guard accepts the token
+    on those alone and answers 401 for any route it does not know, so a 401
+    from an optional endpoint says nothing about the token.
+    """
     global _auth_error_logged
+    if path.split("?", 1)[0] not in CLIENT_ROUTES:
+        return
     if resp.status_code == 401:
         if not _auth_error_logged:
             logger.error(
@@ -72,34 +276,118 @@ def _track_auth_state(resp: requests.Response) -> None:
         _auth_error_logged = False
 
 
+def _endpoint_unsupported(endpoint: str, resp: requests.Response, fallback: str) -> bool:
+    """True when resp means the server lacks the optional endpoint; the caller stops asking.
+
+    A plain (non-JSON) 404/405/501 is a server without the route and counts
+    at once. A 401/403 (the auth guard rejects routes it does not know) or a
+    JSON 404 (also the endpoint's own answer for an unknown design) counts
+    after PROBE_LIMIT of them in a row; any other answer resets the count.
+    """
+    status = resp.status_code
+    if status not in UNSUPPORTED_STATUS:
+        _probe_misses.pop(endpoint, None)
+        return False
+    misses = _probe_misses[endpoint] = _probe_misses.get(endpoint, 0) + 1
+    plain = not resp.headers.get("Content-Type", "").startswith("application/json")
+    if misses < PROBE_LIMIT and not (status in (404, 405, 501) and plain):
+        return False
+    logger.info("Server has no %s (HTTP %s) - %s", endpoint, status, fallback)
+    return True
+
+
 def _server_get(
-    path: str, timeout: Union[float, Tuple[float, float]]
+    path: str,
+    timeout: Union[float, Tuple[float, float]],
+    headers: Optional[Dict[str, str]] = None,
+    stream: bool = False,
 ) -> requests.Response:
     """GET a server endpoint with auth headers and 401 state tracking.
 
     timeout accepts a scalar or a (connect, read) tuple - the long-polling
     status request uses the tuple form to keep a short connect timeout while
-    allowing a long read.
+    allowing a long read. headers are sent next to the auth headers; with
+    stream the body is left unread (and the caller records the request in
+    the session trace once it has read it).
     """
-    resp = requests.get(
-        f"{config.SERVER_URL}{path}", headers=_auth_headers(), timeout=timeout
-    )
-    _track_auth_state(resp)
+    start = time.monotonic()
+    try:
+        resp = _server_request(
+            requests.get, path, sample=not path.startswith("/api/refresh_status"),
+            headers={**_auth_headers(), **(headers or {})}, timeout=timeout, stream=stream,
+        )
+    except Exception as e:
+        _count_http_error(path, type(e).__name__)
+        if _tracer is not None:
+            _tracer.http("get", path, start, error=e)
+        raise
+    if _tracer is not None and not stream:
+        _tracer.http("get", path, start, resp)
+    _track_auth_state(resp, path)
+    if not resp.ok:
+        _count_http_error(path, str(resp.status_code))
     return resp
 
 
 def _server_post(path: str, payload: dict, timeout: int) -> requests.Response:
     """POST to a server endpoint with auth headers and 401 state tracking."""
-    resp = requests.post(
-        f"{config.SERVER_URL}{path}",
-        json=payload,
-        headers=_auth_headers(),
-        timeout=timeout,
-    )
-    _track_auth_state(resp)
+    start = time.monotonic()
+    try:
+        resp = _server_request(
+            requests.post, path, json=payload, headers=_auth_headers(), timeout=timeout
+        )
+    except Exception as e:
+        _count_http_error(path, type(e).__name__)
+        if _tracer is not None:
+            _tracer.http("post", path, start, error=e)
+        raise
+    if _tracer is not None:
+        _tracer.http("post", path, start, resp)
+    _track_auth_state(resp, path)
+    if not resp.ok:
+        _count_http_error(path, str(resp.status_code))
     return resp
 
 
+def _server_endpoints() -> Optional[endpoints.EndpointPool]:
+    """The EINK_SERVER_URLS pool, rebuilt when the setting changes; None without it."""
+    global _endpoint_pool
+    if not config.SERVER_URLS:
+        return None
+    if _endpoint_pool is None or _endpoint_pool[0] != config.SERVER_URLS:
+        pool = endpoints.EndpointPool(
+            endpoints.parse_endpoints(config.SERVER_URLS),
+            failure_limit=config.SERVER_FAILURE_LIMIT,
+            cooldown=config.SERVER_COOLDOWN,
+            on_failover=_m_failovers.inc,
+        )
+        _endpoint_pool = (config.SERVER_URLS, pool)
+    return _endpoint_pool[1]
+
+
+def _server_label() -> str:
+    """The configured server(s), for log lines."""
+    pool = _server_endpoints()
+    return str(pool) if pool is not None else config.SERVER_URL
+
+
+def _server_request(send, path: str, sample: bool = True, **kwargs) -> requests.Response:
+    """send (requests.get/post) to config.SERVER_URL, or across the endpoint pool.
+
+    sample=False keeps the request out of the latency average (the long-poll
+    is held open by the server on purpose).
+    """
+    pool = _server_endpoints()
+    if pool is None:
+        return send(f"{config.SERVER_URL}{path}", **kwargs)
+    return pool.call(lambda base: send(f"{base}{path}", **kwargs), sample=sample)
+
+
+def _count_http_error(path: str, code: str) -> None:
+    """Metrics: one failed request; the endpoint label drops the query string."""
+    _m_http_errors.inc(endpoint=path.split("?", 1)[0], code=code)
+
+
 def _module_exit_best_effort() -> None:
     """Call epdconfig.module_exit() for the loaded driver, ignoring all errors.
 
@@ -107,13 +395,33 @@ def _module_exit_best_effort() -> None:
     hard off afterwards. That is the safe end state after a hardware error;
     a deep-sleep command over a broken SPI bus would be a silent no-op.
     """
+    global _driver_process
     try:
-        if driver_name == "epd7in3e":
+        if _driver_process is not None:
+            # Out-of-process driver: module_exit() in the child, which then
+            # exits (killed when it hangs). Never import the driver here.
+            module_exit = _driver_process.module_exit
+            _driver_process = None
+        elif config.DRIVER_PROCESS:
+            return
+        elif driver_name == "epd7in3e":
             from waveshare_epd import epd7in3e
-            epd7in3e.epdconfig.module_exit()
+            module_exit = epd7in3e.epdconfig.module_exit
         elif driver_name == "epd7in5_V2":
             from waveshare_epd import epd7in5_V2
-            epd7in5_V2.epdconfig.module_exit()
+            module_exit = epd7in5_V2.epdconfig.module_exit
+        else:
+            return
+        if _tracer is None:
+            module_exit()
+            return
+        start = _tracer.now()
+        try:
+            module_exit()
+        except Exception as e:
+            _tracer.hw("module_exit", start, error=e)
+            raise
+        _tracer.hw("module_exit", start)
     except Exception:
         pass
 
@@ -143,6 +451,7 @@ def _register_hw_failure() -> None:
     """
     global _consecutive_hw_failures
     _consecutive_hw_failures += 1
+    _m_hw_failures.inc()
     logger.warning(
         "hardware failure cycle %d (limit %d, 0 = never escalate)",
         _consecutive_hw_failures, config.HW_FAILURE_LIMIT,
@@ -155,6 +464,75 @@ def _register_hw_failure() -> None:
         raise SystemExit(1)
 
 
+def _install_panel_emulator() -> None:
+    """config.PANEL_EMULATOR: serve the waveshare_epd imports from epd_emulator.
+
+    Installed once per process; E5.4 re-loads then instantiate a fresh EPD()
+    from the same emulated modules, exactly like from the cached real ones.
+    """
+    import epd_emulator
+    if epd_emulator.current() is None:
+        epd_emulator.install(config.PANEL_EMULATOR_SCALE, config.PANEL_EMULATOR_OUTPUT)
+        logger.warning(
+            "Panel emulator active (time scale %g) - no real display is driven",
+            config.PANEL_EMULATOR_SCALE,
+        )
+
+
+def _construct_epd(factory, epdconfig=None):
+    """EPD() - traced, with the panel size, while a session trace records.
+
+    With config.SPI_TRANSPORT and the driver's epdconfig, the panel's SPI
+    methods are backed by the bulk transport (spi_transport.py).
+    """
+    if _tracer is None:
+        return _attach_spi_transport(factory(), epdconfig)
+    start = _tracer.now()
+    try:
+        panel = factory()
+    except Exception as e:
+        _tracer.hw("EPD", start, error=e)
+        raise
+    _tracer.hw("EPD", start, wh=[panel.width, panel.height])
+    return _tracer.wrap_epd(_attach_spi_transport(panel, epdconfig))
+
+
+def _attach_spi_transport(panel, epdconfig):
+    if config.SPI_TRANSPORT and epdconfig is not None:
+        import spi_transport
+        spi_transport.attach(panel, epdconfig)
+    return panel
+
+
+def _spawn_driver_process(name: str):
+    """EPD() for config.DRIVER_PROCESS: start the driver in a child process."""
+    global _driver_process
+    import driver_proc
+    if _driver_process is not None:
+        _module_exit_best_effort()  # a driver switch: release the old child's GPIO first
+    _driver_process = driver_proc.RemoteEPD(
+        name,
+        call_timeout=config.DRIVER_CALL_TIMEOUT,
+        spawn_timeout=config.DRIVER_SPAWN_TIMEOUT,
+        env=_driver_process_env(),
+    )
+    logger.info("Display driver process started (pid %d)", _driver_process.pid)
+    return _driver_process
+
+
+def _driver_process_env(emulator_output: Optional[str] = None) -> dict:
+    """The effective settings a driver child reads from its environment."""
+    if emulator_output is None:
+        emulator_output = config.PANEL_EMULATOR_OUTPUT
+    return {
+        "EINK_LOG_LEVEL": config.LOG_LEVEL,
+        "EINK_SPI_TRANSPORT": str(config.SPI_TRANSPORT).lower(),
+        "EINK_PANEL_EMULATOR": str(config.PANEL_EMULATOR).lower(),
+        "EINK_PANEL_EMULATOR_SCALE": str(config.PANEL_EMULATOR_SCALE),
+        "EINK_PANEL_EMULATOR_OUTPUT": emulator_output,
+    }
+
+
 def load_display_driver(name: str) -> None:
     """Dynamically load the correct Waveshare EPD driver.
 
@@ -163,17 +541,26 @@ def load_display_driver(name: str) -> None:
     effects can raise BadPinFactory/GPIOPinInUse/RuntimeError, spidev raises
     OSError - is treated as a transient hardware failure: full traceback via
     logger.exception, driver reset, re-load attempt on the next cycle.
+
+    config.DRIVER_PROCESS runs the driver in a child process instead
+    (driver_proc.py): every call gets a deadline, and a re-load after a reset
+    spawns a fresh child with a fresh driver import.
     """
     global epd, driver_name, _preview_only, _hw_recovery_pending
+    _join_driver_bringup()
     driver_name = name
     logger.info("Loading display driver: %s", name)
+    if config.PANEL_EMULATOR and not config.DRIVER_PROCESS:
+        _install_panel_emulator()
     try:
-        if name == "epd7in3e":
+        if config.DRIVER_PROCESS and name in ("epd7in3e", "epd7in5_V2"):
+            epd = _construct_epd(lambda: _spawn_driver_process(name))
+        elif name == "epd7in3e":
             from waveshare_epd import epd7in3e
-            epd = epd7in3e.EPD()
+            epd = _construct_epd(epd7in3e.EPD, epd7in3e.epdconfig)
         elif name == "epd7in5_V2":
             from waveshare_epd import epd7in5_V2
-            epd = epd7in5_V2.EPD()
+            epd = _construct_epd(epd7in5_V2.EPD, epd7in5_V2.epdconfig)
         else:
             logger.error("Unknown display driver: %s", name)
             return
@@ -190,6 +577,39 @@ def load_display_driver(name: str) -> None:
         _reset_display_driver()
 
 
+def _start_driver_bringup(name: str) -> None:
+    """Load the display driver on a background thread (config.PARALLEL_STARTUP).
+
+    The waveshare_epd import (gpiozero/lgpio, GPIO setup) then overlaps the
+    first /settings and /preview fetch. driver_name is set up front so a
+    /settings answer naming the same driver does not trigger a second load;
+    every other load_display_driver() call joins the thread first.
+    """
+    global _driver_bringup, driver_name
+
+    def bringup() -> None:
+        with _startup.span(f"driver {name} (import + EPD())"):
+            load_display_driver(name)
+
+    if not config.PARALLEL_STARTUP:
+        bringup()
+        return
+    driver_name = name
+    _driver_bringup = threading.Thread(target=bringup, name="driver-bringup", daemon=True)
+    _driver_bringup.start()
+
+
+def _join_driver_bringup() -> None:
+    """Wait for a running startup bring-up (no-op on the bring-up thread itself)."""
+    global _driver_bringup
+    thread = _driver_bringup
+    if thread is None or thread is threading.current_thread():
+        return
+    with _startup.span(startup.WAIT_LABEL):
+        thread.join()
+    _driver_bringup = None
+
+
 def _normalize_panel_image_mode(value: object) -> str:
     """Normalize the panel_image_mode setting to a known value.
 
@@ -201,74 +621,409 @@ def _normalize_panel_image_mode(value: object) -> str:
     return "original" if value == "original" else "dithered"
 
 
-def fetch_display_config() -> dict:
+def fetch_display_config(load_driver: bool = True) -> dict:
     """Fetch display config from server settings.
 
     panel_image_mode is a TOP-LEVEL setting (sibling of render_quality), not
     part of the nested display object, so it is surfaced into the returned dict
     here — no second HTTP request. Callers pass display_config["panel_image_mode"]
     down to fetch_preview to pick the wire endpoint.
+
+    load_driver=False leaves the display driver alone when the settings name
+    another one (multi-panel mode: every panel has its own driver).
     """
+    global _last_display_config
     try:
-        resp = _server_get("/settings", timeout=5)
-        if resp.ok:
-            settings = resp.json()
+        with _timer.span("settings"):
+            resp = _server_get("/settings", timeout=5)
+            settings = resp.json() if resp.ok else None
+        if settings is not None:
             display = settings.get("display", {})
             driver = display.get("driver", config.DISPLAY_DRIVER)
-            if driver != driver_name:
+            if load_driver and driver != driver_name:
                 load_display_driver(driver)
             display["panel_image_mode"] = _normalize_panel_image_mode(
                 settings.get("panel_image_mode")
             )
+            _last_display_config = display
             return display
     except Exception as e:
         logger.warning("Could not fetch display settings: %s", e)
     return {}
 
 
-def fetch_preview(panel_image_mode: str = "dithered") -> Optional[Image.Image]:
+def fetch_preview(
+    panel_image_mode: str = "dithered", design: Optional[str] = None
+) -> Optional[Image.Image]:
     """Fetch rendered preview PNG from server.
 
     panel_image_mode == "original" requests the ungedithered raw panel image
     (/preview?raw=true); any other value requests the server-dithered default
     (/preview). The chosen wire bytes are what get hashed below, so a mode
     switch changes the content hash and triggers exactly one extra refresh
-    before the skip (E5.2) goes quiet again.
+    before the skip (E5.2) goes quiet again. design renders that saved design
+    (/preview?name=...) instead of the active one.
 
     On success, records the SHA-256 of the raw wire bytes in
     _last_fetch_hash — the comparison point for the content skip (E5.2),
-    computed before any Pillow decode.
+    computed before any Pillow decode (of the decoded pixels when
+    EINK_SERVER_URLS names several endpoints or with EINK_PREVIEW_DELTA).
+    download/hash/decode are timed as separate stages. With
+    EINK_PREVIEW_DELTA, frames after the first are fetched as tile deltas
+    against the last one (_fetch_preview_delta). With EINK_COMPOSITE, designs
+    the server describes as a base frame plus dynamic regions are drawn by
+    the client (_fetch_preview_composite). With EINK_PREVIEW_RESUME, a full
+    download that breaks off is continued with Range requests
+    (_download_resumable). With EINK_CAPABILITIES the panel is announced
+    first and the preview requested to fit it (_announce_capabilities).
     """
-    global _last_fetch_hash
+    global _last_fetch_hash, _last_fetch_bytes, _capabilities
     try:
-        path = "/preview?raw=true" if panel_image_mode == "original" else "/preview"
-        resp = _server_get(path, timeout=30)
-        resp.raise_for_status()
-        content = resp.content
-        content_hash = hashlib.sha256(content).hexdigest()
-        img = Image.open(BytesIO(content))
+        caps = _announce_capabilities() if config.CAPABILITIES else None
+        path = _preview_path(panel_image_mode, design, caps)
+        fetched = None
+        if config.COMPOSITE and _composite_supported:
+            fetched = _fetch_preview_composite(path)
+        if fetched is None and config.PREVIEW_DELTA and _preview_delta_supported and path in _delta_bases:
+            fetched = _fetch_preview_delta(path)
+        if fetched is None:
+            fetched = _fetch_preview_full(path)
+        img, content_hash, wire_bytes = fetched
         _last_fetch_hash = content_hash
+        _last_fetch_bytes = wire_bytes
+        if _timeline is not None and design is None:
+            _timeline.set_path(path)
         logger.info("Preview fetched: %dx%d, mode=%s", img.size[0], img.size[1], img.mode)
+        if caps is not None and img.size != (_capabilities[1]["width"], _capabilities[1]["height"]):
+            logger.info("Preview does not fit the announced panel - announcing again")
+            _capabilities = None
         return img
     except requests.ConnectionError:
-        logger.warning("Server not reachable: %s", config.SERVER_URL)
+        logger.warning("Server not reachable: %s", _server_label())
     except Exception as e:
         logger.error("Failed to fetch preview: %s", e)
     return None
 
 
+def _preview_path(
+    panel_image_mode: str = "dithered", design: Optional[str] = None, caps: Optional[str] = None
+) -> str:
+    """The /preview path and query for a panel image mode, optional design and
+    acknowledged capability announcement."""
+    query = ["raw=true"] if panel_image_mode == "original" else []
+    if design:
+        query.append(f"name={quote(design)}")
+    if caps:
+        query.append(f"caps={caps}")
+    return "/preview?" + "&".join(query) if query else "/preview"
+
+
+def _announce_capabilities() -> Optional[str]:
+    """Announce the panel if the server has not acknowledged it yet; its caps id or None.
+
+    Sent once per connection and whenever the announcement changes (another
+    driver, EINK_PREVIEW_DELTA); nothing without a loaded driver. A server
+    without the endpoint is not asked again (see capabilities).
+    """
+    global _capabilities, _capabilities_supported
+    import capabilities
+    if not _capabilities_supported or epd is None or driver_name not in capabilities.DRIVER_MODES:
+        return None
+    caps = capabilities.announcement(driver_name, epd.width, epd.height, config.PREVIEW_DELTA)
+    caps_id = capabilities.caps_id(caps)
+    if _capabilities is not None and _capabilities[0] == caps_id:
+        return caps_id
+    _capabilities = None
+    try:
+        resp = _server_post(capabilities.ENDPOINT, caps, timeout=10)
+        if _endpoint_unsupported(capabilities.ENDPOINT, resp,
+                                 "previews follow its display settings"):
+            _capabilities_supported = False
+            return None
+        if resp.status_code in UNSUPPORTED_STATUS:
+            return None
+        resp.raise_for_status()
+        acknowledged = resp.json().get("caps")
+    except Exception as e:
+        logger.warning("Capability announcement failed: %s", e)
+        return None
+    if acknowledged != caps_id:
+        logger.warning("Server acknowledged capabilities %r, not %s", acknowledged, caps_id)
+        return None
+    logger.info("Announced panel %s %dx%d (%s) as %s", driver_name, epd.width, epd.height,
+                ", ".join(capabilities.modes(caps)), caps_id)
+    _capabilities = (caps_id, caps)
+    return caps_id
+
+
+def _fetch_preview_full(path: str) -> Tuple[Image.Image, str, int]:
+    """GET path: (decoded frame, content hash, wire bytes)."""
+    with _timer.span("download"):
+        if config.PREVIEW_RESUME > 0:
+            content = _download_resumable(path, timeout=30)
+        else:
+            resp = _server_get(path, timeout=30)
+            resp.raise_for_status()
+            content = resp.content
+    _m_preview_bytes.observe(len(content))
+    img, content_hash = _decode_preview(content)
+    if config.PREVIEW_DELTA:
+        _delta_bases[path] = img
+        _m_preview_delta.inc(result="full")
+    return img, content_hash, len(content)
+
+
+def _download_resumable(path: str, timeout: float) -> bytes:
+    """GET path's body, resuming a transfer that breaks off (EINK_PREVIEW_RESUME).
+
+    A response with a strong ETag and Accept-Ranges: bytes that is cut off
+    mid-body is continued with Range: bytes=<received>- and If-Range: <ETag>,
+    up to config.PREVIEW_RESUME times; a 200 instead of a 206 means the frame
+    changed meanwhile and the download starts over. Any other response is
+    read in one piece and a broken transfer fails like before. The assembled
+    body must match the full response's Content-Length and, when the server
+    sends one, its Repr-Digest (sha-256).
+    """
+    body = bytearray()
+    etag = length = digest = None
+    resumes = 0
+    while True:
+        headers = {"Range": f"bytes={len(body)}-", "If-Range": etag} if etag else None
+        start = time.monotonic()
+        received = len(body)
+        resp = None
+        try:
+            resp = _server_get(path, timeout=timeout, headers=headers, stream=True)
+            if headers and resp.status_code == 206:
+                if not resp.headers.get("Content-Range", "").startswith(f"bytes {received}-"):
+                    raise ValueError(f"unexpected Content-Range {resp.headers.get('Content-Range')!r}")
+            else:
+                resp.raise_for_status()
+                del body[:]
+                received = 0
+                etag = resp.headers.get("ETag")
+                if resp.headers.get("Accept-Ranges") != "bytes" or (etag or "W/").startswith("W/"):
+                    etag = None  # not resumable
+                length = resp.headers.get("Content-Length")
+                digest = _repr_digest(resp.headers.get("Repr-Digest", ""))
+            for chunk in resp.iter_content(16384):
+                body += chunk
+        except (requests.exceptions.ChunkedEncodingError, requests.ConnectionError) as e:
+            if resp is not None and _tracer is not None:
+                _tracer.http("get", path, start, error=e)
+            if etag is None or resumes >= config.PREVIEW_RESUME:
+                raise
+            resumes += 1
+            _m_preview_resumes.inc()
+            logger.warning("Preview download broke off after %d of %s bytes (%s) - resuming",
+                           len(body), length or "?", type(e).__name__)
+            continue
+        finally:
+            if resp is not None:
+                resp.close()  # hands the pooled connection back on every path
+        if _tracer is not None:
+            _tracer.http("get", path, start, resp, body=bytes(body[received:]))
+        break
+    if length is not None and len(body) != int(length):
+        raise ValueError(f"preview download incomplete: {len(body)} of {length} bytes")
+    if digest is not None and hashlib.sha256(body).digest() != digest:
+        raise ValueError("preview does not match its Repr-Digest")
+    return bytes(body)
+
+
+def _repr_digest(header: str) -> Optional[bytes]:
+    """The sha-256 value of a Repr-Digest header (RFC 9530); None without one."""
+    for item in header.split(","):
+        name, _, value = item.strip().partition("=")
+        if name.lower() == "sha-256" and len(value) > 2 and value[0] == value[-1] == ":":
+            try:
+                return base64.b64decode(value[1:-1], validate=True)
+            except ValueError:
+                return None
+    return None
+
+
+def _pixel_hashing() -> bool:
+    """The content skip compares decoded pixels, not preview wire bytes.
+
+    Replicas may encode the same frame into different PNG bytes (zlib
+    level, ancillary chunks): with several endpoints the content skip
+    compares decoded pixels instead, so a failover is not a new frame.
+    Delta and composed frames have no wire bytes of their own to hash either.
+    """
+    pool = _server_endpoints()
+    return bool(config.PREVIEW_DELTA or config.COMPOSITE
+                or (pool is not None and len(pool.endpoints) > 1))
+
+
+def _decode_preview(content: bytes) -> Tuple[Image.Image, str]:
+    """Decode preview wire bytes: (frame, content-skip hash)."""
+    pixel_hash = _pixel_hashing()
+    if not pixel_hash:
+        with _timer.span("hash"):
+            content_hash = hashlib.sha256(content).hexdigest()
+    with _timer.span("decode"):
+        # Decode eagerly: a corrupt PNG is a fetch failure here, not a
+        # hardware failure later inside display_image().
+        img = Image.open(BytesIO(content))
+        img.load()
+        if config.PREVIEW_DELTA or config.COMPOSITE:
+            import tile_delta
+            img = tile_delta.normalize(img)
+    if pixel_hash:
+        with _timer.span("hash"):
+            content_hash = _artifact_digest(img)
+        if _tracer is not None:
+            _tracer.frame(content, content_hash)
+    return img, content_hash
+
+
+def _fetch_preview_delta(path: str) -> Optional[Tuple[Image.Image, str, int]]:
+    """POST the last frame's tile manifest for path; None = download the full frame.
+
+    The server answers with the changed tiles (or the full frame when that is
+    smaller); the reconstructed frame must match its X-Frame-Digest. A server
+    without the endpoint is not asked again (see tile_delta).
+    """
+    global _preview_delta_supported
+    import tile_delta
+    base = _delta_bases[path]
+    delta_path = path.replace("/preview", "/preview/delta", 1)
+    with _timer.span("download"):
+        resp = _server_post(delta_path, tile_delta.manifest(base), timeout=30)
+        content = resp.content
+    content_type = resp.headers.get("Content-Type", "")
+    if _endpoint_unsupported("/preview/delta", resp, "downloading full frames"):
+        _preview_delta_supported = False
+        return None
+    if not resp.ok:
+        return None
+    _m_preview_bytes.observe(len(content))
+    try:
+        with _timer.span("decode"):
+            img = tile_delta.apply(base, content_type, content)
+        with _timer.span("hash"):
+            content_hash = _artifact_digest(img)
+    except Exception as e:
+        logger.warning("Preview delta not applicable (%s) - downloading the full frame", e)
+        _m_preview_delta.inc(result="fallback")
+        return None
+    if content_hash != resp.headers.get(tile_delta.DIGEST_HEADER):
+        logger.warning("Preview delta digest mismatch - downloading the full frame")
+        _m_preview_delta.inc(result="fallback")
+        return None
+    _delta_bases[path] = img
+    _m_preview_delta.inc(
+        result="patch" if content_type.startswith(tile_delta.CONTENT_TYPE) else "full"
+    )
+    return img, content_hash, len(content)
+
+
+def _fetch_preview_composite(path: str) -> Optional[Tuple[Image.Image, str, int]]:
+    """Draw path's dynamic regions on its cached base frame; None = fetch /preview.
+
+    The descriptor is fetched every time (it is small and says when the base
+    changed); the base frame only when its digest is new (see composite).
+    """
+    global _composite_supported, _composite_fonts
+    import composite
+    import tile_delta
+    overlay_path = path.replace("/preview", "/preview/overlay", 1)
+    with _timer.span("download"):
+        resp = _server_get(overlay_path, timeout=30)
+        content = resp.content
+    if _endpoint_unsupported("/preview/overlay", resp, "fetching rendered frames"):
+        _composite_supported = False
+        return None
+    if not resp.ok:
+        return None
+    wire_bytes = len(content)
+    try:
+        descriptor = composite.check(resp.json())
+        if not descriptor["regions"]:
+            _composite_bases.pop(path, None)
+            _m_composite.inc(result="full")
+            return None
+        cached = _composite_bases.get(path)
+        if cached is None or cached[0] != descriptor["base"]:
+            with _timer.span("download"):
+                base_resp = _server_get(path.replace("/preview", "/preview/base", 1), timeout=30)
+                base_resp.raise_for_status()
+            wire_bytes += len(base_resp.content)
+            with _timer.span("decode"):
+                base = tile_delta.normalize(Image.open(BytesIO(base_resp.content)))
+                base.load()
+            if tile_delta.frame_digest(base) != descriptor["base"]:
+                raise composite.CompositeError("base frame does not match its digest")
+            _composite_bases[path] = cached = (descriptor["base"], base)
+            _m_composite.inc(result="base")
+        if _composite_fonts is None:
+            _composite_fonts = composite.font_loader(_fetch_font)
+        with _timer.span("compose"):
+            img = composite.compose(cached[1], descriptor, time.time(), _composite_fonts)
+        with _timer.span("hash"):
+            content_hash = _artifact_digest(img)
+    except Exception as e:
+        logger.warning("Local compositing failed (%s) - fetching the rendered frame", e)
+        _m_composite.inc(result="fallback")
+        return None
+    _m_composite.inc(result="composed")
+    _m_preview_bytes.observe(wire_bytes)
+    return img, content_hash, wire_bytes
+
+
+def _fetch_font(name: str) -> bytes:
+    """A font file from the server's media library (local compositing).
+
+    Without font files the client cannot draw what the server would: a
+    server without /font/ switches local compositing off.
+    """
+    global _composite_supported
+    import composite
+    resp = _server_get(f"/font/{quote(name)}", timeout=30)
+    if _endpoint_unsupported("/font/", resp, "fetching rendered frames"):
+        _composite_supported = False
+        raise composite.CompositeError(f"font {name} not available")
+    resp.raise_for_status()
+    return resp.content
+
+
+def _artifact_digest(img: Image.Image) -> str:
+    """SHA-256 over mode, size and raw pixel bytes of a driver-ready image.
+
+    A few milliseconds for a full frame - an order of magnitude cheaper than
+    the PNG encode it lets save_last_sent_artifact() skip.
+    """
+    digest = hashlib.sha256(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
 def save_last_sent_artifact(img: Image.Image) -> None:
-    """Atomically save the exact image passed to the EPD driver as a PNG debug artifact.
+    """Atomically save the exact image passed to the EPD driver as a debug artifact.
 
     Writes to a temp file in the same directory as the target and renames via
-    os.replace(), so a concurrent scp never sees a half-written PNG. Any write
+    os.replace(), so a concurrent scp never sees a half-written file. Any write
     failure is logged as a warning and never interrupts the display refresh.
+
+    Deduplicated: when the pixel digest equals the last artifact written to the
+    same path and that file still exists, nothing is encoded or written.
+    config.LAST_SENT_FORMAT picks the encoding (see _ARTIFACT_FORMATS).
     """
+    global _last_artifact
     last_sent_path = config.LAST_SENT_PATH
     tmp_path = f"{last_sent_path}.tmp"
     try:
-        img.save(tmp_path, format="PNG")
+        digest = _artifact_digest(img)
+        if _last_artifact == (last_sent_path, digest) and os.path.exists(last_sent_path):
+            logger.debug("Last-sent artifact unchanged - write skipped")
+            return
+        fmt, params = _ARTIFACT_FORMATS.get(config.LAST_SENT_FORMAT, _ARTIFACT_FORMATS["png"])
+        if fmt == "PPM" and img.mode not in ("1", "L", "RGB"):
+            img = img.convert("RGB")
+        img.save(tmp_path, format=fmt, **params)
         os.replace(tmp_path, last_sent_path)
+        _last_artifact = (last_sent_path, digest)
         logger.debug("Last-sent artifact written to %s", last_sent_path)
     except Exception as e:
         logger.warning("Failed to write last-sent artifact to %s: %s", last_sent_path, e)
@@ -278,56 +1033,102 @@ def save_last_sent_artifact(img: Image.Image) -> None:
             pass
 
 
+class _ArtifactWriter:
+    """Background writer for the last-sent artifact (config.LAST_SENT_ASYNC).
+
+    One daemon thread, one pending slot: a frame submitted while an older one
+    is still waiting replaces it (only the newest frame matters for the debug
+    artifact). Submitted images are never mutated afterwards - display_image()
+    hands over its final local image - so no copy is taken.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._pending: Optional[Image.Image] = None
+        self._busy = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, img: Image.Image) -> None:
+        with self._cond:
+            self._pending = img
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="eink-artifact-writer", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until no frame is pending or being written; False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._pending is None and not self._busy, timeout
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                img, self._pending = self._pending, None
+                self._busy = True
+            try:
+                save_last_sent_artifact(img)
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+_artifact_writer = _ArtifactWriter()
+
+
+def _submit_last_sent_artifact(img: Image.Image) -> None:
+    """Hand the driver image to the background writer, or write it inline (default)."""
+    if config.LAST_SENT_ASYNC:
+        _artifact_writer.submit(img)
+    else:
+        save_last_sent_artifact(img)
+
+
 def display_image(img: Image.Image, display_config: dict) -> bool:
-    """Send image to E-Ink display via SPI."""
+    """Send image to E-Ink display via SPI.
+
+    Timed stages: init, convert (resize guard + mode conversion), artifact,
+    getbuffer, display, sleep.
+    """
+    global _last_write_seconds
     if not epd:
         img.save("preview_output.png")
         logger.info("No display hardware - preview saved to preview_output.png")
         return True
 
+    start = time.monotonic()
     try:
         logger.info("Initializing display...")
         # epd7in3e/epd7in5_V2 return -1 when module_init() fails. Deliberately
         # only == -1 (not != 0): MockEPD returns None, the real drivers 0.
-        if epd.init() == -1:
+        with _timer.span("init"):
+            init_result = epd.init()
+        if init_result == -1:
             raise RuntimeError("display init() returned -1 (module_init failed)")
 
-        display_width = epd.width
-        display_height = epd.height
-        if img.size != (display_width, display_height):
-            # Size mismatch signals a misconfiguration (wrong display profile
-            # or wrong server). Log the actual size before resizing.
-            logger.warning(
-                "Preview size %dx%d does not match display %dx%d - "
-                "resizing with NEAREST (check server display settings)",
-                img.size[0], img.size[1], display_width, display_height,
-            )
-            # The server output is already dithered to the panel palette.
-            # NEAREST is the only resample that keeps palette colors intact,
-            # explicitly for all image modes - do not rely on Pillow's silent
-            # P-mode resample coercion.
-            img = img.resize((display_width, display_height), Image.Resampling.NEAREST)
-
-        colors = display_config.get("colors", ["#000000", "#FFFFFF"])
-        if len(colors) > 2:
-            # 6-color display: convert to RGB, driver handles palette internally
-            if img.mode != "RGB":
-                img = img.convert("RGB")
-            logger.info("Sending to %d-color display...", len(colors))
-        else:
-            # B/W display: server already applied Floyd-Steinberg dithering,
-            # so convert without additional dithering to preserve quality
-            if img.mode != "1":
-                img = img.convert("L").point(lambda x: 0 if x < 128 else 255, "1")
-            logger.info("Sending to B/W display...")
+        with _timer.span("convert"):
+            img = _convert_for_panel(img, display_config, (epd.width, epd.height))
 
-        save_last_sent_artifact(img)
+        with _timer.span("artifact"):
+            _submit_last_sent_artifact(img)
 
-        epd.display(epd.getbuffer(img))
+        with _timer.span("getbuffer"):
+            buffer = epd.getbuffer(img)
+        with _timer.span("display"):
+            epd.display(buffer)
 
         logger.info("Display entering sleep mode...")
-        epd.sleep()
+        with _timer.span("sleep"):
+            epd.sleep()
         logger.info("Display updated successfully")
+        _last_write_seconds = time.monotonic() - start
         return True
     except Exception:
         # E5.4 recovery: full traceback, NO epd.sleep() over a possibly broken
@@ -339,32 +1140,128 @@ def display_image(img: Image.Image, display_config: dict) -> bool:
         return False
 
 
-def get_refresh_status() -> dict:
+def _convert_for_panel(
+    img: Image.Image, display_config: dict, panel_size: Tuple[int, int]
+) -> Image.Image:
+    """Resize guard (E1.4) and mode conversion to the exact driver input image.
+
+    A frame rendered to the announced capabilities (EINK_CAPABILITIES) is
+    the driver input already and passes through untouched.
+    """
+    if _capabilities is not None:
+        import capabilities
+        if capabilities.fits(img, _capabilities[1]):
+            _m_panel_fit.inc(result="exact")
+            logger.info("Sending exact-fit %s frame to display...", img.mode)
+            return img
+        _m_panel_fit.inc(result="converted")
+    display_width, display_height = panel_size
+    if img.size != (display_width, display_height):
+        # Size mismatch signals a misconfiguration (wrong display profile
+        # or wrong server). Log the actual size before resizing.
+        logger.warning(
+            "Preview size %dx%d does not match display %dx%d - "
+            "resizing with NEAREST (check server display settings)",
+            img.size[0], img.size[1], display_width, display_height,
+        )
+        # The server output is already dithered to the panel palette.
+        # NEAREST is the only resample that keeps palette colors intact,
+        # explicitly for all image modes - do not rely on Pillow's silent
+        # P-mode resample coercion.
+        img = img.resize((display_width, display_height), Image.Resampling.NEAREST)
+
+    colors = display_config.get("colors", ["#000000", "#FFFFFF"])
+    if len(colors) > 2:
+        # 6-color display: convert to RGB, driver handles palette internally
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        logger.info("Sending to %d-color display...", len(colors))
+    else:
+        # B/W display: server already applied Floyd-Steinberg dithering,
+        # so convert without additional dithering to preserve quality
+        if img.mode != "1":
+            img = img.convert("L").point(lambda x: 0 if x < 128 else 255, "1")
+        logger.info("Sending to B/W display...")
+    return img
+
+
+def get_refresh_status(max_hold: Optional[float] = None) -> dict:
     """Long-poll /api/refresh_status; empty dict on any error.
 
     The server holds this request open (up to ~25s) and answers the moment a
     manual trigger fires, so the read timeout must exceed the server hold
     (config.LONGPOLL_TIMEOUT, default 30s > 25s). A short 5s connect timeout
     still fails fast when the server is unreachable.
+
+    With EINK_LONGPOLL_ADAPTIVE the client asks for the hold itself
+    (?hold=, see longpoll.py), at most max_hold (the next local frame), and
+    the read timeout follows it once the server has shown it honors the
+    hold; a poll that breaks off while held is repeated at once with the
+    shorter hold.
     """
-    try:
-        resp = _server_get(
-            "/api/refresh_status", timeout=(5, config.LONGPOLL_TIMEOUT)
-        )
-        if resp.ok:
-            data = resp.json()
-            if isinstance(data, dict):
-                return data
-    except Exception:
-        pass
+    tuner = _longpoll_tuner()
+    for attempt in range(2):
+        hold = tuner.request(max_hold) if tuner is not None else None
+        path, read_timeout = "/api/refresh_status", config.LONGPOLL_TIMEOUT
+        if hold is not None:
+            path = f"{path}?hold={hold:g}"
+            read_timeout = tuner.read_timeout(hold, config.LONGPOLL_TIMEOUT)
+        start = time.monotonic()
+        try:
+            with _timer.span("poll"):
+                resp = _server_get(path, timeout=(5, read_timeout))
+            if resp.ok:
+                data = resp.json()
+                if isinstance(data, dict):
+                    if hold is not None:
+                        tuner.answered(hold, data)
+                        _m_longpolls.inc(result="due" if data.get("should_refresh") else "held")
+                    return data
+        except Exception as e:
+            if hold is not None:
+                broke = not isinstance(e, requests.ConnectTimeout) and tuner.failed(
+                    hold, time.monotonic() - start, isinstance(e, requests.ReadTimeout)
+                )
+                _m_longpolls.inc(result="broken" if broke else "failed")
+                if broke and attempt == 0:
+                    continue
+        break
     return {}
 
 
+def _longpoll_tuner() -> Optional[longpoll.HoldTuner]:
+    """config.LONGPOLL_ADAPTIVE: the hold tuner while the server honors ?hold=; else None."""
+    global _hold_tuner
+    if not config.LONGPOLL_ADAPTIVE:
+        return None
+    if _hold_tuner is None:
+        _hold_tuner = longpoll.HoldTuner(config.LONGPOLL_HOLD_MIN, config.LONGPOLL_HOLD_MAX)
+    return _hold_tuner if _hold_tuner.supported else None
+
+
+def _poll_window() -> float:
+    """How far ahead a local frame (timeline, playlist) is waited for instead of polling.
+
+    Adaptive holds are shortened to the next local frame, so only frames due
+    within the shortest hold are waited for.
+    """
+    if _longpoll_tuner() is not None:
+        return config.LONGPOLL_HOLD_MIN
+    return config.LONGPOLL_TIMEOUT
+
+
 def check_should_refresh() -> bool:
     """Ask server if display should refresh."""
     return bool(get_refresh_status().get("should_refresh", False))
 
 
+def _frame_age_seconds() -> Optional[float]:
+    """Seconds since the last physical panel write; None before the first one."""
+    if _last_panel_write_monotonic is None:
+        return None
+    return time.monotonic() - _last_panel_write_monotonic
+
+
 def _max_skip_elapsed() -> bool:
     """True when the last real panel write is older than MAX_SKIP_HOURS.
 
@@ -382,15 +1279,16 @@ def _should_skip_panel_write(content_hash: Optional[str], reason: Optional[str])
     """Decide whether the physical panel write can be skipped (E5.2).
 
     Conservative: skip ONLY when ALL conditions hold — content skip enabled,
-    hardware present, interval-driven refresh (reason "manual" or missing =>
-    always write), hash identical to the last successfully displayed image,
-    and the panel-care guard (MAX_SKIP_HOURS) not expired.
+    hardware present, interval-driven refresh, timeline or playlist frame or
+    offline refresh (reason "manual" or missing => always write), hash identical to
+    the last successfully displayed image, and the panel-care guard
+    (MAX_SKIP_HOURS) not expired.
     """
     if not config.CONTENT_SKIP:
         return False
     if epd is None:
         return False
-    if reason != "interval":
+    if reason not in ("interval", "timeline", "playlist", "offline"):
         return False
     if content_hash is None or _last_displayed_hash is None:
         return False
@@ -401,38 +1299,120 @@ def _should_skip_panel_write(content_hash: Optional[str], reason: Optional[str])
     return True
 
 
-def _record_panel_write(content_hash: Optional[str]) -> None:
+def _record_panel_write(content_hash: Optional[str], img: Optional[Image.Image] = None) -> None:
     """Remember hash and time of a successful physical panel write.
 
     In-memory only (a restart always writes). No-op without hardware: the
     preview-only path must never feed the skip decision. A successful
     physical write is also the ONLY event that resets the E5.4 hardware
     failure counter (skips, network errors and preview-only leave it alone).
+    img is kept as the frame offline refreshes rewrite.
     """
     global _last_displayed_hash, _last_panel_write_monotonic, _consecutive_hw_failures
+    global _last_refresh_monotonic, _last_frame, _offline_written_hash
     if epd is None:
         return
     _last_displayed_hash = content_hash
-    _last_panel_write_monotonic = time.monotonic()
+    _last_panel_write_monotonic = _last_refresh_monotonic = time.monotonic()
     _consecutive_hw_failures = 0
+    if img is not None:
+        _last_frame = (img, content_hash)
+    _offline_written_hash = content_hash if _offline_since is not None else None
+
 
+def _written_offline(content_hash: Optional[str], reason: Optional[str]) -> bool:
+    """The server's interval refresh asks for the frame already written offline.
 
-def send_heartbeat(status: str = "refreshed") -> None:
-    """Tell server that the display content is current ("refreshed" or "skipped")."""
+    The heartbeats of offline writes never arrived, so the first scheduled
+    refresh after an outage is usually for content the panel already shows;
+    it is skipped even with the content skip off. Manual triggers and the
+    panel-care guard still write.
+    """
+    return (
+        epd is not None
+        and reason == "interval"
+        and content_hash is not None
+        and content_hash == _offline_written_hash
+        and not _max_skip_elapsed()
+    )
+
+
+def _heartbeat_telemetry(reason: Optional[str], skip_reason: Optional[str]) -> dict:
+    """Compact performance snapshot of the current cycle for the heartbeat body.
+
+    stages_ms holds the stages timed so far in this cycle (the heartbeat span
+    itself is still open) plus "total"; empty when the stage timer is off
+    (telemetry does not turn it on: EINK_STAGE_TIMING or a metrics export).
+    With EINK_SERVER_URLS, "servers" lists each endpoint's circuit state and
+    request time; with EINK_LONGPOLL_ADAPTIVE, "longpoll" the hold and the
+    reconnect rate.
+    """
+    rss = metrics.process_rss_bytes()
+    telemetry = {
+        "stages_ms": {
+            stage: round(seconds * 1000)
+            for stage, seconds in _timer.current_cycle().items()
+        },
+        "wire_bytes": _last_fetch_bytes,
+        "reason": reason,
+        "skip_reason": skip_reason,
+        "digest": _last_displayed_hash,
+        "hw_failures": _consecutive_hw_failures,
+        "rss_bytes": int(rss) if rss is not None else None,
+        "driver": driver_name,
+    }
+    pool = _server_endpoints()
+    if pool is not None:
+        telemetry["servers"] = pool.snapshot()
+    if _hold_tuner is not None:
+        telemetry["longpoll"] = _hold_tuner.snapshot()
+    return telemetry
+
+
+def send_heartbeat(
+    status: str = "refreshed",
+    reason: Optional[str] = None,
+    skip_reason: Optional[str] = None,
+    extra: Optional[dict] = None,
+) -> None:
+    """Tell server that the display content is current ("refreshed" or "skipped").
+
+    reason is the trigger the cycle acted on (manual, interval, startup, ...),
+    skip_reason why a panel write was skipped. Both only travel in the
+    telemetry block (config.HEARTBEAT_TELEMETRY), and so do the extra fields
+    (multi-panel mode: the per-panel state). Servers that do not know the
+    block ignore it; one that rejects it gets the plain heartbeat again and no
+    telemetry for the rest of the process.
+    """
+    global _heartbeat_telemetry_accepted
+    payload = {
+        "status": status,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
     try:
-        _server_post(
-            "/api/client_heartbeat",
-            {
-                "status": status,
-                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-            },
-            timeout=5,
-        )
+        with _timer.span("heartbeat"):
+            with_telemetry = config.HEARTBEAT_TELEMETRY and _heartbeat_telemetry_accepted
+            if with_telemetry:
+                payload["telemetry"] = _heartbeat_telemetry(reason, skip_reason)
+                payload["telemetry"].update(extra or {})
+            resp = _server_post("/api/client_heartbeat", payload, timeout=5)
+            if with_telemetry and not resp.ok and resp.status_code in (400, 413, 422):
+                logger.info(
+                    "Server rejected heartbeat telemetry (HTTP %s) - sending plain heartbeats",
+                    resp.status_code,
+                )
+                _heartbeat_telemetry_accepted = False
+                del payload["telemetry"]
+                _server_post("/api/client_heartbeat", payload, timeout=5)
     except Exception:
         pass
 
 
-def handle_refresh(display_config: dict, reason: Optional[str]) -> bool:
+def handle_refresh(
+    display_config: dict,
+    reason: Optional[str],
+    frame: Optional[Tuple[Image.Image, str]] = None,
+) -> bool:
     """Fetch the current preview and update the panel, honoring the content skip.
 
     Returns True when the cycle made forward progress - a heartbeat was sent
@@ -451,32 +1431,90 @@ def handle_refresh(display_config: dict, reason: Optional[str]) -> bool:
     E5.4 recovery: after a hardware error the driver is re-instantiated from
     the cached module before the write attempt; a failed re-load counts as a
     hardware failure cycle. Network errors touch neither panel nor counter.
+
+    frame: an (image, content hash) already at hand (a timeline frame)
+    instead of fetching the current preview.
     """
-    global _initial_display_done
+    global _initial_display_done, _last_refresh_monotonic, _offline_written_hash
     if epd is None and _hw_recovery_pending:
+        _m_driver_reloads.inc()
         load_display_driver(driver_name)
         if epd is None and _hw_recovery_pending:
+            _m_refreshes.inc(result="failed")
             _register_hw_failure()
             return False
-    img = fetch_preview(display_config.get("panel_image_mode", "dithered"))
-    if img is None:
-        logger.warning("Failed to fetch preview for refresh")
-        return False
-    content_hash = _last_fetch_hash
+    if frame is not None:
+        img, content_hash = frame
+    else:
+        img = fetch_preview(display_config.get("panel_image_mode", "dithered"))
+        if img is None:
+            logger.warning("Failed to fetch preview for refresh")
+            _m_refreshes.inc(result="no_preview")
+            return False
+        content_hash = _last_fetch_hash
+    if _written_offline(content_hash, reason):
+        logger.info("skipping panel refresh (already written while offline)")
+        _offline_written_hash = None
+        _last_refresh_monotonic = time.monotonic()
+        _m_refreshes.inc(result="skipped")
+        send_heartbeat("skipped", reason, skip_reason="written_offline")
+        return True
     if _should_skip_panel_write(content_hash, reason):
         logger.info("skipping panel refresh (content unchanged)")
-        send_heartbeat("skipped")
+        _last_refresh_monotonic = time.monotonic()
+        _m_refreshes.inc(result="skipped")
+        send_heartbeat("skipped", reason, skip_reason="content_unchanged")
         return True
     if display_image(img, display_config):
         _initial_display_done = True
-        _record_panel_write(content_hash)
-        send_heartbeat("refreshed")
+        _record_panel_write(content_hash, img)
+        _m_refreshes.inc(result="refreshed")
+        send_heartbeat("refreshed", reason)
         return True
+    _m_refreshes.inc(result="failed")
     _register_hw_failure()
     return False
 
 
 def process_refresh_cycle() -> bool:
+    """One long-poll cycle, timed as one unit for the stage summary (see _run_refresh_cycle)."""
+    if _tracer is not None:
+        _tracer.cycle(_trace_state())
+    _timer.begin_cycle()
+    try:
+        return _run_refresh_cycle()
+    finally:
+        _log_cycle_timings()
+
+
+def _trace_state() -> dict:
+    """Client state a cycle starts in - the session trace's cycle marker, which
+    lets trace_replay.py start at any cycle and check every later one."""
+    age = _frame_age_seconds()
+    return {
+        "drv": driver_name,
+        "epd": epd is not None,
+        "wh": [epd.width, epd.height] if epd is not None else None,
+        "init": _initial_display_done,
+        "rec": _hw_recovery_pending,
+        "prev": _preview_only,
+        "hwf": _consecutive_hw_failures,
+        "tel": _heartbeat_telemetry_accepted,
+        "hash": _last_displayed_hash[:16] if _last_displayed_hash else None,
+        "age": round(age, 3) if age is not None else None,
+    }
+
+
+def _log_cycle_timings() -> None:
+    """One summary line per cycle: INFO when the cycle did more than poll, else DEBUG."""
+    cycle = _timer.end_cycle()
+    if not cycle or not config.STAGE_TIMING:
+        return
+    level = logging.INFO if set(cycle) - {"poll", "total"} else logging.DEBUG
+    logger.log(level, "cycle timings: %s", timing.format_cycle(cycle))
+
+
+def _run_refresh_cycle() -> bool:
     """One long-poll cycle: ask the server and refresh the panel if needed.
 
     Returns True when the caller may re-poll immediately: a 2xx status poll
@@ -496,23 +1534,75 @@ def process_refresh_cycle() -> bool:
     fetch + write, should_refresh/reason are ignored. This closes the
     power-outage gap when the very first fetch hits the server before it
     listens. From the first success on, exactly today's semantics apply.
+
+    Timeline (config.TIMELINE_STEP): when a stored frame is due before a
+    long-poll would return, the cycle waits for it and writes it instead of
+    polling; a refresh for any reason but "interval" drops the stored frames.
+
+    Adaptive hold (config.LONGPOLL_ADAPTIVE): the poll asks for a hold that
+    ends by the next local frame, so only frames due within the shortest
+    hold are waited for (_poll_window()).
+
+    Offline (config.REFRESH_INTERVAL): while polls fail, _offline_refresh()
+    re-evaluates the last frame once the client's own schedule is due; the
+    cycle still reports the failed poll so the reconnect backoff applies.
+
+    Playlist (config.PLAYLIST): the next rotation step is waited for like a
+    timeline frame; a changed "playlist_version" in the status or a manual
+    trigger re-syncs the bundle, and a due refresh shows the playlist frame
+    instead of fetching /preview.
     """
-    status = get_refresh_status()
+    due_in = None  # seconds until the next local frame
+    if _playlist_active() and _initial_display_done:
+        due_in = _playlist_next - time.monotonic()
+        if due_in <= _poll_window():
+            if due_in > 0:
+                time.sleep(due_in)
+            return _show_playlist_frame("playlist")
+    if _timeline is not None and _initial_display_done:
+        wait = _timeline.seconds_until_due(_last_write_seconds or 0.0)
+        if wait is not None and wait <= _poll_window():
+            if wait > 0:
+                time.sleep(wait)
+            return _show_timeline_frame()
+        if wait is not None:
+            due_in = wait if due_in is None else min(due_in, wait)
+    status = get_refresh_status(max_hold=due_in)
     # get_refresh_status() returns {} on any error and a populated dict
     # (always carrying should_refresh) on a real 2xx response: an empty dict
     # therefore means "no usable poll response -> reconnect backoff".
     poll_ok = bool(status)
+    if poll_ok:
+        _server_reachable()
+    else:
+        _server_unreachable()
+        if _offline_refresh_due():
+            return _offline_refresh()
+    if _playlist is not None and poll_ok:
+        version = status.get("playlist_version")
+        if (version is not None and str(version) != _playlist.version) or (
+            status.get("should_refresh") and status.get("reason") == "manual"
+        ):
+            _sync_playlist()
     if not _initial_display_done:
         logger.info("initial display update pending - retrying unconditionally")
         display_config = fetch_display_config()
         # The initial retry always attempts a write, so it is always "due":
         # re-poll immediately only if it actually made progress (a heartbeat),
         # otherwise back off so a fresh boot with no image yet does not spin.
-        made_progress = handle_refresh(display_config, None)
+        frame = _take_playlist_frame() if _playlist_active() else None
+        made_progress = handle_refresh(display_config, None, frame=frame)
         return poll_ok and made_progress
     if not status.get("should_refresh", False):
         return poll_ok
     logger.info("Server says: refresh needed")
+    if _playlist_active():
+        # Rewrite the frame on the panel (the first one of a re-synced
+        # playlist): its heartbeat answers the server.
+        return poll_ok and _show_playlist_frame(status.get("reason"),
+                                                advance=_playlist_index < 0)
+    if _timeline is not None and status.get("reason") != "interval":
+        _timeline.invalidate()
     display_config = fetch_display_config()
     # A due refresh may re-poll immediately only when it made progress;
     # otherwise pace the next poll so a stuck refresh does not busy-loop.
@@ -520,20 +1610,305 @@ def process_refresh_cycle() -> bool:
     return poll_ok and made_progress
 
 
+def _playlist_active() -> bool:
+    return _playlist is not None and _playlist.version is not None
+
+
+def _playlist_due() -> bool:
+    """The next playlist frame must be written now (cuts the reconnect backoff short)."""
+    return (_playlist_active() and _initial_display_done
+            and _playlist_next - time.monotonic() <= 1)
+
+
+def _take_playlist_frame(advance: bool = True) -> Optional[Tuple[Image.Image, str]]:
+    """(frame, content hash) of the next playlist frame (advance) or the current one.
+
+    Schedules the step after it by the frame's dwell time; None when the
+    cached frame is unreadable.
+    """
+    global _playlist_index, _playlist_next, _last_fetch_hash, _last_fetch_bytes
+    import playlist
+    entries = _playlist.entries
+    if advance or _playlist_index < 0:
+        _playlist_index = (_playlist_index + 1) % len(entries)
+        _playlist_next = time.monotonic() + max(
+            playlist.MIN_DWELL, float(entries[_playlist_index]["dwell"])
+        )
+    entry = entries[_playlist_index]
+    try:
+        img, content_hash = _decode_preview(_playlist.frame(entry["digest"]))
+    except Exception as e:
+        logger.warning("Playlist frame %s unusable: %s", entry["name"] or entry["digest"][:12], e)
+        return None
+    _last_fetch_hash = content_hash
+    _last_fetch_bytes = 0  # from the cache
+    logger.info("Playlist frame %d/%d: %s", _playlist_index + 1, len(entries),
+                entry["name"] or entry["digest"][:12])
+    return img, content_hash
+
+
+def _show_playlist_frame(reason: Optional[str], advance: bool = True) -> bool:
+    """Write a playlist frame; the return value is _run_refresh_cycle()'s."""
+    frame = _take_playlist_frame(advance)
+    if frame is None:
+        return True
+    return handle_refresh(_last_display_config, reason, frame=frame)
+
+
+def _sync_playlist() -> bool:
+    """Bring the playlist cache up to the server's version; True when it changed.
+
+    Sends the cached version and frame digests: an unchanged playlist costs
+    one 204, a changed one only the frames the cache lacks. A server without
+    playlists (404/405, 401 behind its auth guard) switches playlist mode off
+    for the process.
+    """
+    global _playlist, _playlist_index, _playlist_next
+    import playlist
+    path = _preview_path(_last_display_config.get("panel_image_mode", "dithered"))
+    bundle_path = path.replace("/preview", "/playlist/bundle", 1)
+    try:
+        with _timer.span("download"):
+            resp = _server_post(
+                bundle_path, {"version": _playlist.version, "have": _playlist.have()},
+                timeout=60,
+            )
+            content = resp.content
+    except Exception as e:
+        logger.warning("Playlist sync failed: %s", e)
+        return False
+    if resp.status_code == 204:
+        return False
+    content_type = resp.headers.get("Content-Type", "")
+    if _endpoint_unsupported("/playlist/bundle", resp, "playlist mode off"):
+        _playlist = None
+        return False
+    if not resp.ok or not content_type.startswith(playlist.CONTENT_TYPE):
+        logger.warning("Playlist sync failed: HTTP %s %s", resp.status_code, content_type)
+        return False
+    try:
+        version, entries, frames = playlist.decode(content)
+        written = _playlist.store(version, entries, frames)
+    except (playlist.PlaylistError, OSError) as e:
+        logger.warning("Playlist sync failed: %s", e)
+        return False
+    _m_preview_bytes.observe(len(content))
+    logger.info("Playlist %s: %d frames, %d downloaded (%d bytes)",
+                version, len(entries), len(frames), written)
+    _playlist_index, _playlist_next = -1, time.monotonic()  # start over now
+    return True
+
+
+def _start_playlist() -> None:
+    """config.PLAYLIST: resume the stored playlist and sync it with the server."""
+    global _playlist
+    if not config.PLAYLIST or _playlist is not None:
+        return
+    import playlist
+    _playlist = playlist.Cache(config.PLAYLIST_DIR, config.PLAYLIST_MAX_MB * 1024 * 1024)
+    if _playlist.load():
+        logger.info("Playlist %s from %s: %d frames", _playlist.version,
+                    config.PLAYLIST_DIR, len(_playlist.entries))
+    _sync_playlist()
+
+
+def _server_unreachable() -> None:
+    global _offline_since
+    if _offline_since is None:
+        _offline_since = time.monotonic()
+
+
+def _server_reachable() -> None:
+    """A poll answered: end offline mode (handle_refresh reconciles its writes).
+
+    The capabilities are announced again on the new connection.
+    """
+    global _offline_since, _offline_refreshes, _capabilities
+    if _offline_since is None:
+        return
+    _capabilities = None
+    logger.info(
+        "Server reachable again after %ds offline (%d offline refreshes)",
+        time.monotonic() - _offline_since, _offline_refreshes,
+    )
+    _offline_since = None
+    _offline_refreshes = 0
+
+
+def _offline_refresh_due() -> bool:
+    """The client's own schedule is due while the server does not answer.
+
+    Due REFRESH_INTERVAL seconds after the last refresh decision (or after
+    the outage began when there was none), or at once when the panel-care
+    guard expired. Needs a frame written since the process started.
+    """
+    if config.REFRESH_INTERVAL <= 0 or _offline_since is None:
+        return False
+    if not _initial_display_done or _last_frame is None or epd is None:
+        return False
+    if _max_skip_elapsed():
+        return True
+    anchor = _last_refresh_monotonic if _last_refresh_monotonic is not None else _offline_since
+    return time.monotonic() - anchor >= config.REFRESH_INTERVAL
+
+
+def _offline_refresh() -> bool:
+    """Refresh from the last frame without the server; the return value is
+    _run_refresh_cycle()'s (always False: the poll failed, back off)."""
+    global _offline_refreshes
+    _offline_refreshes += 1
+    logger.info("Server unreachable for %ds - offline refresh of the last frame",
+                time.monotonic() - _offline_since)
+    handle_refresh(_last_display_config, "offline", frame=_last_frame)
+    return False
+
+
+def _show_timeline_frame() -> bool:
+    """Write the due timeline frame; the return value is _run_refresh_cycle()'s."""
+    global _last_fetch_hash, _last_fetch_bytes
+    due = _timeline.take(_last_write_seconds or 0.0)
+    if due is None:
+        return True
+    at, content = due
+    try:
+        img, content_hash = _decode_preview(content)
+    except Exception as e:
+        logger.warning("Timeline frame for %s unusable: %s", _slot_label(at), e)
+        return True
+    _last_fetch_hash = content_hash
+    _last_fetch_bytes = len(content)
+    logger.info("Timeline frame for %s", _slot_label(at))
+    return handle_refresh(_last_display_config, "timeline", frame=(img, content_hash))
+
+
+def _slot_label(at: int) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(at))
+
+
+def _fetch_timeline_frame(path: str, at: int) -> bytes:
+    """Timeline.fetch: path rendered for Unix time at (see timeline.py)."""
+    import timeline
+    sep = "&" if "?" in path else "?"
+    resp = _server_get(f"{path}{sep}at={at}", timeout=30)
+    resp.raise_for_status()
+    if resp.headers.get(timeline.RENDER_AT_HEADER) != str(at):
+        raise timeline.TimelineUnsupported()
+    return resp.content
+
+
+def _timeline_due() -> bool:
+    """A stored timeline frame must be written now (cuts the reconnect backoff short)."""
+    if _timeline is None or not _initial_display_done:
+        return False
+    wait = _timeline.seconds_until_due(_last_write_seconds or 0.0)
+    return wait is not None and wait <= 1
+
+
+def _start_timeline() -> None:
+    """config.TIMELINE_STEP: prefetch upcoming frames (timeline.py)."""
+    global _timeline
+    if config.TIMELINE_STEP <= 0 or config.TIMELINE_AHEAD <= 0 or _timeline is not None:
+        return
+    import timeline
+    _timeline = timeline.Timeline(
+        _fetch_timeline_frame, config.TIMELINE_STEP, config.TIMELINE_AHEAD
+    ).start()
+    logger.info("Timeline: frames every %ds for the next %ds",
+                config.TIMELINE_STEP, config.TIMELINE_AHEAD)
+
+
+def _start_metrics_export() -> None:
+    """Start the optional /metrics endpoint and textfile writer (config.METRICS_*).
+
+    Exporting turns the stage timer on so stage latencies feed the
+    eink_client_stage_seconds histogram. Failures (e.g. port in use) are
+    logged and never stop the client.
+    """
+    if config.METRICS_PORT <= 0 and not config.METRICS_TEXTFILE:
+        return
+    _timer.enabled = True
+    _timer.observer = lambda stage, seconds: _m_stage_seconds.observe(seconds, stage=stage)
+    if config.METRICS_PORT > 0:
+        try:
+            server = metrics.MetricsServer(
+                _metrics, config.METRICS_ADDR, config.METRICS_PORT
+            ).start()
+            _metrics_exports.append(server)
+            logger.info(
+                "Metrics endpoint listening on http://%s:%d/metrics",
+                config.METRICS_ADDR, server.port,
+            )
+        except OSError as e:
+            logger.warning("Could not start metrics endpoint: %s", e)
+    if config.METRICS_TEXTFILE:
+        _metrics_exports.append(metrics.TextfileWriter(
+            _metrics, config.METRICS_TEXTFILE, config.METRICS_TEXTFILE_INTERVAL
+        ).start())
+        logger.info("Writing metrics textfile to %s", config.METRICS_TEXTFILE)
+
+
+def _start_session_trace() -> None:
+    """config.TRACE_PATH: record server and hardware calls (session_trace.py)."""
+    global _tracer
+    if not config.TRACE_PATH or _tracer is not None:
+        return
+    import session_trace
+    _tracer = session_trace.Tracer(
+        config.TRACE_PATH, config.TRACE_MAX_BYTES, config.TRACE_BACKUPS
+    )
+    logger.info("Session trace recording to %s", config.TRACE_PATH)
+
+
+def _profile_dir() -> str:
+    """config.PROFILE_DIR, else the directory of the last-sent artifact."""
+    return config.PROFILE_DIR or os.path.dirname(config.LAST_SENT_PATH) or "."
+
+
+def _stop_metrics_export() -> None:
+    """Stop all exporters; the textfile writer leaves one final snapshot."""
+    while _metrics_exports:
+        try:
+            _metrics_exports.pop().stop()
+        except Exception:
+            pass
+
+
 def cleanup() -> None:
-    """Clean shutdown — put display to sleep and release GPIO."""
+    """Clean shutdown — flush the artifact writer, put display to sleep, release GPIO."""
+    _join_driver_bringup()
+    if _timer.enabled:
+        stats = _timer.stats()
+        if stats:
+            logger.info("stage latency (rolling): %s", timing.format_stats(stats))
+    if not _artifact_writer.flush(timeout=10):
+        logger.warning("Last-sent artifact writer did not finish within 10s")
+    if _timeline is not None:
+        _timeline.stop()
+    _stop_metrics_export()
     if epd:
         try:
             epd.sleep()
         except Exception:
             pass
         _module_exit_best_effort()
+    if _tracer is not None:
+        _tracer.close()
+    logpipe.stop()
 
 
-def main() -> None:
-    """Main loop: poll server for refresh status, fetch preview, display, repeat."""
+def main(startup_profile: bool = False) -> None:
+    """Main loop: poll server for refresh status, fetch preview, display, repeat.
+
+    startup_profile: run only the startup path (first frame), print the
+    startup phase report and return instead of entering the poll loop.
+    config.PANELS hands the whole process over to panels.main().
+    """
     global _initial_display_done
-    logger.info("E-Ink Client starting - Server: %s, Driver: %s", config.SERVER_URL, config.DISPLAY_DRIVER)
+    if config.PANELS:
+        import panels
+        panels.main()
+        return
+    logger.info("E-Ink Client starting - Server: %s, Driver: %s", _server_label(), config.DISPLAY_DRIVER)
 
     running = True
 
@@ -544,35 +1919,65 @@ def main() -> None:
 
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
+    if hasattr(signal, "SIGUSR1"):
+        # `systemctl kill -s USR1 eink-client` profiles the next cycles in place.
+        signal.signal(
+            signal.SIGUSR1, lambda signum, frame: _profiler.request(config.PROFILE_CYCLES)
+        )
+    if config.PROFILE_ON_START:
+        _profiler.request(config.PROFILE_CYCLES)
 
-    # Initial setup: load driver and fetch config
+    _start_metrics_export()
+    _start_session_trace()
+    _start_timeline()
+
+    # Initial setup: bring the driver up while fetching config and preview
     _initial_display_done = False
-    load_display_driver(config.DISPLAY_DRIVER)
+    _startup.record_until_now("client import")
+    _start_driver_bringup(config.DISPLAY_DRIVER)
 
     # try/finally so cleanup() also runs when the E5.4 escalation raises
     # SystemExit(1) out of the poll loop.
     try:
-        display_config = fetch_display_config()
+        with _startup.span("settings"):
+            display_config = fetch_display_config()
         if not display_config:
             display_config = {}
 
         # Initial display update (always unconditional, spec E5.2 fact 8)
         logger.info("Performing initial display update...")
+        _timer.begin_cycle()
+        _start_playlist()
+        with _startup.span("preview"):
+            frame = _take_playlist_frame() if _playlist_active() else None
+            img = frame[0] if frame else fetch_preview(
+                display_config.get("panel_image_mode", "dithered")
+            )
+        _join_driver_bringup()
         if epd is None and _hw_recovery_pending:
             # Driver load failed hard at startup (non-ImportError): counts as
             # one hardware failure cycle; the poll loop retries the load.
             _register_hw_failure()
-        else:
-            img = fetch_preview(display_config.get("panel_image_mode", "dithered"))
-            if img:
-                if display_image(img, display_config):
-                    _initial_display_done = True
-                    _record_panel_write(_last_fetch_hash)
-                    send_heartbeat()
-                else:
-                    _register_hw_failure()
+        elif img:
+            with _startup.span("display"):
+                shown = display_image(img, display_config)
+            if shown:
+                _startup.mark_first_frame()
+                _initial_display_done = True
+                _record_panel_write(_last_fetch_hash, img)
+                _m_refreshes.inc(result="refreshed")
+                send_heartbeat("refreshed", "startup")
             else:
-                logger.warning("No image on startup - will retry on next poll")
+                _m_refreshes.inc(result="failed")
+                _register_hw_failure()
+        else:
+            _m_refreshes.inc(result="no_preview")
+            logger.warning("No image on startup - will retry on next poll")
+        _log_cycle_timings()
+        logger.info("Startup: %s", _startup.summary())
+        if startup_profile:
+            print(_startup.format_report())
+            return
 
         # Main long-poll loop: the server holds GET /api/refresh_status open
         # and answers the moment a manual trigger fires (or after its bounded
@@ -588,7 +1993,10 @@ def main() -> None:
         logger.info("Entering long-poll loop (reconnect backoff %ds)", poll_interval)
 
         while running:
-            repoll_now = process_refresh_cycle()
+            if _profiler.pending:
+                repoll_now = _profiler.run(process_refresh_cycle, _profile_dir())
+            else:
+                repoll_now = process_refresh_cycle()
 
             if not running:
                 break
@@ -598,7 +2006,7 @@ def main() -> None:
                 # POLL_INTERVAL seconds (checked once per second for a
                 # responsive shutdown) instead of hammering the server.
                 for _ in range(poll_interval):
-                    if not running:
+                    if not running or _timeline_due() or _playlist_due():
                         break
                     time.sleep(1)
     finally:
@@ -607,4 +2015,10 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--startup-profile", action="store_true",
+        help="run the startup path up to the first frame, print a per-phase "
+             "timing report and exit",
+    )
+    main(startup_profile=parser.parse_args().startup_profile)
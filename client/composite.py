@@ -0,0 +1,248 @@
+"""Local compositing: dynamic regions drawn by the client on a cached base frame.
+
+A design whose only moving part is a clock or a date costs a full server
+render, a PNG download and a decode every time it changes. With
+EINK_COMPOSITE the client asks for a description of the frame instead:
+
+    GET /preview/overlay?<the /preview query: raw=true, name=...>
+
+    {"base": "<frame_digest of the base frame>",
+     "palette": ["#000000", "#FFFFFF", ...],
+     "regions": [
+       {"kind": "text", "box": [x, y, w, h], "format": "%HH%:%MM%",
+        "font": "Inter-Bold.ttf", "size": 140, "fg": 0, "bg": 1,
+        "align": "center"},
+       {"kind": "progress", "box": [x, y, w, h], "period": "year",
+        "fg": 0, "bg": 1}
+     ],
+     "timezone": "Europe/Berlin"}
+
+The base frame is the design rendered without those regions,
+
+    GET /preview/base?<same query>
+
+a PNG with the frame_digest() of its normalized frame in X-Frame-Digest.
+The client downloads it only when the descriptor names a new base and draws
+the regions itself (compose()). fg/bg are indices into palette - the
+server's driver palette - and text is rendered without anti-aliasing, so a
+composed frame contains no color the panel cannot show. format uses the
+clock widget's placeholders (%HH%, %MM%, %dd%, %MONTH_NAME%, ...) with the
+server's German names unless the descriptor carries its own ("names").
+font is a font file the server serves at GET /font/<name>; null means
+Pillow's default font.
+
+A descriptor without regions means the design has nothing to composite
+(the client fetches /preview); a server without the endpoints answers
+404/405 (401 behind its auth guard) and the client stops asking for the
+rest of the process (client._endpoint_unsupported).
+"""
+
+import calendar
+import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+import tile_delta
+
+KINDS = ("text", "progress")
+PERIODS = ("hour", "day", "week", "month", "year")
+
+# The Go server's clock names (services/locale.go), Sunday first.
+WEEKDAYS = ["Sonntag", "Montag", "Dienstag", "Mittwoch", "Donnerstag", "Freitag", "Samstag"]
+WEEKDAYS_SHORT = ["So", "Mo", "Di", "Mi", "Do", "Fr", "Sa"]
+MONTHS = ["Januar", "Februar", "März", "April", "Mai", "Juni", "Juli", "August",
+          "September", "Oktober", "November", "Dezember"]
+
+
+class CompositeError(ValueError):
+    """A descriptor the client cannot draw."""
+
+
+def check(descriptor: dict) -> dict:
+    """descriptor, validated; raises CompositeError naming the first problem."""
+    if not isinstance(descriptor, dict):
+        raise CompositeError("descriptor is not an object")
+    regions = descriptor.get("regions")
+    if not isinstance(regions, list):
+        raise CompositeError("regions missing")
+    if not regions:
+        return descriptor
+    palette = descriptor.get("palette")
+    if not isinstance(palette, list) or not palette:
+        raise CompositeError("palette missing")
+    for color in palette:
+        try:
+            ImageColor.getrgb(color)
+        except (ValueError, AttributeError):
+            raise CompositeError(f"bad palette color {color!r}") from None
+    if not isinstance(descriptor.get("base"), str):
+        raise CompositeError("base digest missing")
+    for i, region in enumerate(regions):
+        kind = region.get("kind") if isinstance(region, dict) else None
+        if kind not in KINDS:
+            raise CompositeError(f"region {i}: unknown kind {kind!r}")
+        box = region.get("box")
+        if not (isinstance(box, list) and len(box) == 4 and all(isinstance(v, int) for v in box)
+                and box[2] > 0 and box[3] > 0):
+            raise CompositeError(f"region {i}: box must be [x, y, w, h]")
+        for key in ("fg", "bg"):
+            index = region.get(key)
+            if not isinstance(index, int) or not 0 <= index < len(palette):
+                raise CompositeError(f"region {i}: {key} is not a palette index")
+        if kind == "text" and not isinstance(region.get("format"), str):
+            raise CompositeError(f"region {i}: format missing")
+        if kind == "progress" and region.get("period") not in PERIODS:
+            raise CompositeError(f"region {i}: unknown period {region.get('period')!r}")
+    return descriptor
+
+
+def fonts(descriptor: dict) -> List[str]:
+    """The server font files the text regions use."""
+    return sorted({r["font"] for r in descriptor["regions"]
+                   if r["kind"] == "text" and r.get("font")})
+
+
+def local_time(descriptor: dict, now: float) -> datetime.datetime:
+    """now (Unix seconds) in the descriptor's timezone, else the client's."""
+    name = descriptor.get("timezone")
+    if name:
+        try:
+            from zoneinfo import ZoneInfo
+            return datetime.datetime.fromtimestamp(now, ZoneInfo(name))
+        except Exception:
+            pass
+    return datetime.datetime.fromtimestamp(now)
+
+
+def format_text(template: str, t: datetime.datetime, names: Optional[dict] = None) -> str:
+    """template with the clock widget's placeholders filled in (applyClockPlaceholders)."""
+    names = names or {}
+    weekdays = names.get("weekdays") or WEEKDAYS
+    weekdays_short = names.get("weekdays_short") or WEEKDAYS_SHORT
+    months = names.get("months") or MONTHS
+    weekday = (t.weekday() + 1) % 7  # Sunday first, like Go's time.Weekday
+    h12 = t.hour % 12 or 12
+    values = {
+        "%HH%": f"{t.hour:02d}",
+        "%hh%": f"{h12:02d}",
+        "%MM%": f"{t.minute:02d}",
+        "%SS%": f"{t.second:02d}",
+        "%dd%": f"{t.day:02d}",
+        "%mm%": f"{t.month:02d}",
+        "%yyyy%": str(t.year),
+        "%WEEKDAY%": weekdays[weekday],
+        "%WEEKDAY_SHORT%": weekdays_short[weekday],
+        "%MONTH_NAME%": months[t.month - 1],
+        "%AMPM%": "AM" if t.hour < 12 else "PM",
+    }
+    out, i = [], 0
+    while i < len(template):
+        for token, value in values.items():
+            if template.startswith(token, i):
+                out.append(value)
+                i += len(token)
+                break
+        else:
+            out.append(template[i])
+            i += 1
+    return "".join(out)
+
+
+def progress(period: str, t: datetime.datetime) -> float:
+    """Elapsed fraction of the hour/day/week/month/year t is in."""
+    seconds = t.hour * 3600 + t.minute * 60 + t.second
+    if period == "hour":
+        return (t.minute * 60 + t.second) / 3600
+    if period == "day":
+        return seconds / 86400
+    if period == "week":
+        return (t.weekday() * 86400 + seconds) / (7 * 86400)
+    if period == "month":
+        days = calendar.monthrange(t.year, t.month)[1]
+        return ((t.day - 1) * 86400 + seconds) / (days * 86400)
+    days = 366 if calendar.isleap(t.year) else 365
+    return ((t.timetuple().tm_yday - 1) * 86400 + seconds) / (days * 86400)
+
+
+def _ink(palette: List[str], index: int, mode: str):
+    """A palette entry as a fill value for an image of mode."""
+    if mode == "1":
+        return 255 if ImageColor.getcolor(palette[index], "L") >= 128 else 0
+    return ImageColor.getcolor(palette[index], mode)
+
+
+def compose(
+    base: Image.Image,
+    descriptor: dict,
+    now: float,
+    load_font: Callable[[Optional[str], int], ImageFont.ImageFont],
+) -> Image.Image:
+    """base (normalized) with every region of descriptor drawn for Unix time now.
+
+    load_font(name, size) returns the font for a text region; the caller
+    caches font files.
+    """
+    frame = base.copy()
+    palette = descriptor["palette"]
+    t = local_time(descriptor, now)
+    draw = ImageDraw.Draw(frame)
+    for region in descriptor["regions"]:
+        x, y, w, h = region["box"]
+        fg = _ink(palette, region["fg"], frame.mode)
+        draw.rectangle((x, y, x + w - 1, y + h - 1), fill=_ink(palette, region["bg"], frame.mode))
+        if region["kind"] == "progress":
+            filled = round(w * min(1.0, max(0.0, progress(region["period"], t))))
+            if filled:
+                draw.rectangle((x, y, x + filled - 1, y + h - 1), fill=fg)
+            continue
+        text = format_text(region["format"], t, descriptor.get("names"))
+        font = load_font(region.get("font"), int(region.get("size") or 24))
+        # A 1-bit mask: no anti-aliasing, so no colors between fg and bg.
+        mask = Image.new("1", (w, h), 0)
+        mask_draw = ImageDraw.Draw(mask)
+        mask_draw.fontmode = "1"
+        align = region.get("align", "left")
+        left, top, right, bottom = mask_draw.multiline_textbbox((0, 0), text, font=font,
+                                                                align=align)
+        if align == "center":
+            tx = (w - (right - left)) // 2 - left
+        elif align == "right":
+            tx = w - right
+        else:
+            tx = -left
+        ty = (h - (bottom - top)) // 2 - top
+        mask_draw.multiline_text((tx, ty), text, fill=1, font=font, align=align)
+        frame.paste(fg, (x, y, x + w, y + h), mask)
+    return frame
+
+
+def font_loader(fetch: Callable[[str], bytes]) -> Callable[[Optional[str], int], ImageFont.ImageFont]:
+    """load_font for compose(): server font files fetched once via fetch(name)."""
+    files: Dict[str, bytes] = {}
+    faces: Dict[Tuple[Optional[str], int], ImageFont.ImageFont] = {}
+
+    def load(name: Optional[str], size: int) -> ImageFont.ImageFont:
+        key = (name, size)
+        if key not in faces:
+            if name is None:
+                faces[key] = ImageFont.load_default(size)
+            else:
+                if name not in files:
+                    files[name] = fetch(name)
+                faces[key] = ImageFont.truetype(BytesIO(files[name]), size)
+        return faces[key]
+
+    return load
+
+
+def render_base(frame: Image.Image, descriptor: dict) -> Image.Image:
+    """Server side (stand-in): frame with the region boxes blanked to their bg."""
+    frame = tile_delta.normalize(frame).copy()
+    draw = ImageDraw.Draw(frame)
+    for region in descriptor.get("regions", []):
+        x, y, w, h = region["box"]
+        draw.rectangle((x, y, x + w - 1, y + h - 1),
+                       fill=_ink(descriptor["palette"], region["bg"], frame.mode))
+    return frame
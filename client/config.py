@@ -2,7 +2,21 @@
 import os
 
 SERVER_URL = os.getenv("EINK_SERVER_URL", "http://localhost:5000")
+# Server failover (endpoints.py): comma-separated server base URLs in order
+# of preference, each optionally "URL;weight=N" (N > 0, default 1; higher is
+# preferred at equal request times). Empty = EINK_SERVER_URL alone. Requests
+# go to the fastest healthy endpoint and fail over on connection errors,
+# timeouts and 5xx. EINK_SERVER_FAILURE_LIMIT consecutive failures open an
+# endpoint's circuit for EINK_SERVER_COOLDOWN seconds (doubling per failed
+# retry, at most 300s).
+SERVER_URLS = os.getenv("EINK_SERVER_URLS", "")
+SERVER_FAILURE_LIMIT = int(os.getenv("EINK_SERVER_FAILURE_LIMIT", "3"))
+SERVER_COOLDOWN = float(os.getenv("EINK_SERVER_COOLDOWN", "30"))
 DISPLAY_DRIVER = os.getenv("EINK_DISPLAY_DRIVER", "epd7in3e")
+# Autonomous offline schedule: while the server does not answer, the client
+# re-evaluates the frame on the panel every EINK_REFRESH_INTERVAL seconds on
+# its own (content skip and the MAX_SKIP_HOURS panel-care write apply).
+# 0 = stay passive while offline.
 REFRESH_INTERVAL = int(os.getenv("EINK_REFRESH_INTERVAL", "3600"))
 POLL_INTERVAL = int(os.getenv("EINK_POLL_INTERVAL", "30"))
 # Read timeout (seconds) for the long-polling /api/refresh_status request.
@@ -10,9 +24,26 @@ POLL_INTERVAL = int(os.getenv("EINK_POLL_INTERVAL", "30"))
 # responds before the client's read times out; otherwise the client keeps
 # reconnecting needlessly (no missed trigger, just churn).
 LONGPOLL_TIMEOUT = int(os.getenv("EINK_LONGPOLL_TIMEOUT", "30"))
+# Adaptive long-poll hold (longpoll.py): the client asks the server for a
+# hold between EINK_LONGPOLL_HOLD_MIN and EINK_LONGPOLL_HOLD_MAX seconds,
+# grows it while holds survive and shrinks it below the point where a NAT
+# or proxy cut one off; the read timeout follows the hold. Needs a server
+# that honors ?hold= (others are detected, keep their fixed hold and
+# EINK_LONGPOLL_TIMEOUT). Only "true" enables it.
+LONGPOLL_ADAPTIVE = os.getenv("EINK_LONGPOLL_ADAPTIVE", "").lower() == "true"
+LONGPOLL_HOLD_MIN = float(os.getenv("EINK_LONGPOLL_HOLD_MIN", "10"))
+LONGPOLL_HOLD_MAX = float(os.getenv("EINK_LONGPOLL_HOLD_MAX", "300"))
 DEPLOYMENT_MODE = os.getenv("EINK_DEPLOYMENT_MODE", "local")
 LOG_LEVEL = os.getenv("EINK_LOG_LEVEL", "INFO")
 LAST_SENT_PATH = os.getenv("EINK_LAST_SENT_PATH", "/tmp/eink_last_sent.png")
+# Last-sent artifact encoding: "png" (default, zlib level 6), "png-fast"
+# (zlib level 1, ~3x faster encode) or "raw" (uncompressed PNM dump: PPM for
+# the 6-color RGB frame, packed 1-bit PBM for B/W). Unknown values => "png".
+LAST_SENT_FORMAT = os.getenv("EINK_LAST_SENT_FORMAT", "png").lower()
+# Write the artifact from a background thread instead of inside
+# display_image(). Default off (E1.2: artifact on disk before epd.display());
+# only the string "true" (case-insensitive) enables it.
+LAST_SENT_ASYNC = os.getenv("EINK_LAST_SENT_ASYNC", "").lower() == "true"
 CLIENT_TOKEN = os.getenv("EINK_CLIENT_TOKEN", "")
 # Content skip (E5.2): default enabled; only the literal string "false"
 # (case-insensitive) disables it.
@@ -24,3 +55,138 @@ MAX_SKIP_HOURS = int(os.getenv("EINK_MAX_SKIP_HOURS", "24"))
 # consecutive hardware failure cycles so systemd restarts the process with a
 # freshly imported driver stack. 0 = never escalate (per-cycle recovery only).
 HW_FAILURE_LIMIT = int(os.getenv("EINK_HW_FAILURE_LIMIT", "3"))
+# Per-stage latency spans (poll, download, decode, convert, init, display, ...)
+# with a one-line summary per refresh cycle. Default off (zero-cost no-op
+# spans); only the string "true" (case-insensitive) enables it.
+STAGE_TIMING = os.getenv("EINK_STAGE_TIMING", "").lower() == "true"
+# Prometheus metrics export (both optional, both off by default):
+# EINK_METRICS_PORT > 0 serves GET /metrics on EINK_METRICS_ADDR (default
+# loopback only); EINK_METRICS_TEXTFILE is a path for node_exporter's textfile
+# collector, rewritten atomically every EINK_METRICS_TEXTFILE_INTERVAL seconds.
+METRICS_PORT = int(os.getenv("EINK_METRICS_PORT", "0"))
+METRICS_ADDR = os.getenv("EINK_METRICS_ADDR", "127.0.0.1")
+METRICS_TEXTFILE = os.getenv("EINK_METRICS_TEXTFILE", "")
+METRICS_TEXTFILE_INTERVAL = int(os.getenv("EINK_METRICS_TEXTFILE_INTERVAL", "15"))
+# Heartbeat telemetry: attach a compact "telemetry" block (wire bytes, skip
+# reason, displayed digest, failure counter, RSS) to every heartbeat. Default
+# enabled (older servers ignore unknown fields); only the literal string
+# "false" (case-insensitive) disables it. Those fields cost nothing to
+# collect; stage timings are only included when the stage timer runs anyway
+# (EINK_STAGE_TIMING or a metrics export) - telemetry never turns it on.
+HEARTBEAT_TELEMETRY = os.getenv("EINK_HEARTBEAT_TELEMETRY", "").lower() != "false"
+# Panel emulator (hardware-free testing/profiling): serve the waveshare_epd
+# driver imports from epd_emulator.py, which blocks like the real panels.
+# Only the string "true" (case-insensitive) enables it. SCALE multiplies the
+# modelled durations (1.0 = real hardware); OUTPUT, when set, is a PNG path
+# the emulator renders every received frame buffer to.
+PANEL_EMULATOR = os.getenv("EINK_PANEL_EMULATOR", "").lower() == "true"
+PANEL_EMULATOR_SCALE = float(os.getenv("EINK_PANEL_EMULATOR_SCALE", "1.0"))
+PANEL_EMULATOR_OUTPUT = os.getenv("EINK_PANEL_EMULATOR_OUTPUT", "")
+# Session trace (record-and-replay, see session_trace.py / trace_replay.py):
+# a non-empty EINK_TRACE_PATH records every server request and hardware call
+# as compact JSON lines, rotated at EINK_TRACE_MAX_BYTES with
+# EINK_TRACE_BACKUPS old files kept. Off by default.
+TRACE_PATH = os.getenv("EINK_TRACE_PATH", "")
+TRACE_MAX_BYTES = int(os.getenv("EINK_TRACE_MAX_BYTES", "1048576"))
+TRACE_BACKUPS = int(os.getenv("EINK_TRACE_BACKUPS", "3"))
+# Profiling hooks (profiling.py): SIGUSR1 profiles the next
+# EINK_PROFILE_CYCLES refresh cycles with cProfile + tracemalloc snapshots;
+# EINK_PROFILE_ON_START=true does the same for the first cycles after start
+# (only "true" enables it). Output goes to EINK_PROFILE_DIR, default: the
+# directory of EINK_LAST_SENT_PATH.
+PROFILE_CYCLES = int(os.getenv("EINK_PROFILE_CYCLES", "5"))
+PROFILE_ON_START = os.getenv("EINK_PROFILE_ON_START", "").lower() == "true"
+PROFILE_DIR = os.getenv("EINK_PROFILE_DIR", "")
+# Logging pipeline (logpipe.py): records are queued and written by a
+# background thread, so SD-card latency never reaches the refresh loop. The
+# last EINK_LOG_RING client debug lines below EINK_LOG_LEVEL stay in memory
+# and are written only right before an ERROR (0 disables the ring). A
+# non-empty EINK_LOG_FILE is written directly and rotated at
+# EINK_LOG_MAX_BYTES with EINK_LOG_BACKUPS old files; empty = stderr (the
+# systemd unit appends that to logs/client.log). Only the string "false"
+# (case-insensitive) makes EINK_LOG_ASYNC write synchronously again.
+LOG_FILE = os.getenv("EINK_LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("EINK_LOG_MAX_BYTES", "1048576"))
+LOG_BACKUPS = int(os.getenv("EINK_LOG_BACKUPS", "3"))
+LOG_RING = int(os.getenv("EINK_LOG_RING", "200"))
+LOG_ASYNC = os.getenv("EINK_LOG_ASYNC", "").lower() != "false"
+# Cold start (startup.py): load the display driver on a background thread
+# while the first settings and preview are fetched. Default enabled; only the
+# string "false" (case-insensitive) makes startup load the driver first.
+PARALLEL_STARTUP = os.getenv("EINK_PARALLEL_STARTUP", "").lower() != "false"
+# Out-of-process display driver (driver_proc.py): only the string "true"
+# (case-insensitive) enables it. Every driver call must answer within
+# EINK_DRIVER_CALL_TIMEOUT seconds (longer than the slowest full refresh,
+# ~35s on the 6-color panel), the driver import + EPD() in the child within
+# EINK_DRIVER_SPAWN_TIMEOUT; otherwise the child is killed and the cycle
+# counts as a hardware failure (E5.4).
+DRIVER_PROCESS = os.getenv("EINK_DRIVER_PROCESS", "").lower() == "true"
+DRIVER_CALL_TIMEOUT = float(os.getenv("EINK_DRIVER_CALL_TIMEOUT", "90"))
+DRIVER_SPAWN_TIMEOUT = float(os.getenv("EINK_DRIVER_SPAWN_TIMEOUT", "120"))
+# Bulk SPI transport (spi_transport.py): back the Waveshare driver's
+# send_command/send_data/send_data2 with spidev-buffer-sized bulk transfers
+# and minimal DC toggling. Only the string "true" (case-insensitive) enables
+# it; drivers without a hardware spidev keep the vendor path.
+SPI_TRANSPORT = os.getenv("EINK_SPI_TRANSPORT", "").lower() == "true"
+# Multi-panel mode (panels.py): several displays from one client process,
+# each with its driver in its own driver_proc.py child. Empty = the single
+# EINK_DISPLAY_DRIVER panel. Otherwise panels separated by ";", each a
+# comma-separated key=value list: name, driver, spi (BUS.DEVICE, default
+# 0.0), design (a saved design; default the active one) and rst/dc/busy/pwr
+# (BCM pins, when the panel is not wired to the HAT defaults).
+PANELS = os.getenv("EINK_PANELS", "")
+# LAN caching gateway (gateway.py, run as its own process): serves the
+# client API to the site's panels on EINK_GATEWAY_ADDR:EINK_GATEWAY_PORT and
+# talks to EINK_SERVER_URL for all of them. Local long-polls are parked up to
+# EINK_GATEWAY_HOLD seconds (keep it below the panels' EINK_LONGPOLL_TIMEOUT);
+# cached /preview and /settings responses are fetched again for every
+# refresh round or after EINK_GATEWAY_CACHE_TTL seconds.
+GATEWAY_ADDR = os.getenv("EINK_GATEWAY_ADDR", "0.0.0.0")
+GATEWAY_PORT = int(os.getenv("EINK_GATEWAY_PORT", "5000"))
+GATEWAY_HOLD = float(os.getenv("EINK_GATEWAY_HOLD", "25"))
+GATEWAY_CACHE_TTL = float(os.getenv("EINK_GATEWAY_CACHE_TTL", "60"))
+# Tile-delta preview transfer (tile_delta.py) for metered links: after the
+# first frame the client sends the server its last frame's tile digests and
+# downloads only the changed tiles; any mismatch falls back to the full PNG.
+# Needs a server with POST /preview/delta (older ones are detected and get
+# full downloads). Only the string "true" (case-insensitive) enables it.
+PREVIEW_DELTA = os.getenv("EINK_PREVIEW_DELTA", "").lower() == "true"
+# Resumable preview downloads for flaky Wi-Fi: a /preview body cut off
+# mid-transfer is continued with an HTTP Range request (validated by the
+# response's ETag) up to this many times per frame instead of being thrown
+# away; the assembled frame is checked against the response's Repr-Digest.
+# Needs a server that sends ETag and Accept-Ranges (others are downloaded
+# in one piece). 0 (default) turns it off.
+PREVIEW_RESUME = int(os.getenv("EINK_PREVIEW_RESUME", "0"))
+# Capability handshake (capabilities.py): the client announces its panel
+# (driver, size, palette, the image modes its driver takes as they are,
+# digest and delta support) once per connection and asks for previews
+# rendered to exactly that, so frames reach the driver without the resize
+# guard or a mode conversion. Needs a server with POST
+# /api/client_capabilities (older ones are detected). Only the string
+# "true" (case-insensitive) enables it.
+CAPABILITIES = os.getenv("EINK_CAPABILITIES", "").lower() == "true"
+# Local compositing (composite.py) for clock-style designs: the server
+# describes the frame as a static base plus dynamic text/progress regions
+# and the client draws those itself with the panel palette, downloading the
+# base only when it changes. Needs a server with GET /preview/overlay
+# (older ones are detected). Only the string "true" (case-insensitive)
+# enables it.
+COMPOSITE = os.getenv("EINK_COMPOSITE", "").lower() == "true"
+# Playlist mode (playlist.py) for photo frames and rotating designs: the
+# server's playlist is downloaded as one bundle of pre-rendered frames with
+# their dwell times, kept in EINK_PLAYLIST_DIR (at most EINK_PLAYLIST_MAX_MB;
+# frames of the current playlist are never evicted) and rotated locally,
+# re-synced only when its version changes. Needs a server with POST
+# /playlist/bundle (others are detected). Only "true" enables it.
+PLAYLIST = os.getenv("EINK_PLAYLIST", "").lower() == "true"
+PLAYLIST_DIR = os.getenv("EINK_PLAYLIST_DIR", "/var/tmp/eink-playlist")
+PLAYLIST_MAX_MB = int(os.getenv("EINK_PLAYLIST_MAX_MB", "64"))
+# Render-ahead timeline (timeline.py) for time-driven designs (clocks,
+# countdowns, calendars): the frames for the next EINK_TIMELINE_AHEAD seconds,
+# one per EINK_TIMELINE_STEP seconds on the clock (60 = every full minute),
+# are fetched ahead (GET /preview?at=<unix time>) and written so the panel
+# has flipped when the slot begins - also while the server is unreachable.
+# 0 = off (default). Needs a server that renders ahead; others are detected.
+TIMELINE_STEP = int(os.getenv("EINK_TIMELINE_STEP", "0"))
+TIMELINE_AHEAD = int(os.getenv("EINK_TIMELINE_AHEAD", "900"))
@@ -0,0 +1,351 @@
+"""Out-of-process display driver with a hard deadline on every call.
+
+With EINK_DRIVER_PROCESS=true the client never imports waveshare_epd itself.
+load_display_driver() starts a long-lived child (`python driver_proc.py
+--serve <driver> <fd>`) that imports the driver, constructs EPD() and then
+executes one call at a time for the RemoteEPD proxy in the client:
+
+    client                          child
+    RemoteEPD.init()        -->     epd.init()
+    RemoteEPD.getbuffer(img) -->    epd.getbuffer(img)   (pickled PIL image in,
+    RemoteEPD.display(buf)  -->     epd.display(buf)      packed buffer out/in)
+
+Requests and replies travel as pickles over a socketpair
+(multiprocessing.connection framing). Every call has a deadline; when the
+child does not answer in time - a stuck BUSY pin, a hung SPI transfer - it
+is killed and the call raises DriverTimeout. The client treats that like any
+other hardware exception: E5.4 driver reset, counted towards
+EINK_HW_FAILURE_LIMIT, and the next load spawns a fresh child with a fresh
+driver import. A killed process has released its GPIO lines, so the
+GPIOPinInUse trap of re-importing inside one process does not apply.
+
+ImportError in the child (no driver libraries installed) is re-raised as
+ImportError, so preview-only mode works as before. Other child exceptions
+arrive as RemoteDriverError carrying the original type name and message.
+
+Several panels (panels.py) run one child each: the vendor epdconfig is a
+per-process singleton (one SpiDev, one set of gpiozero pins). spi/pins move
+a child's panel to another SPI chip select and other RST/DC/BUSY/PWR lines:
+the pin numbers are remapped while the child imports epdconfig (which claims
+the pins at import time), and module_init() opens the panel's SPI device.
+"""
+
+import argparse
+import importlib
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+from contextlib import contextmanager
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+DRIVERS = ("epd7in3e", "epd7in5_V2")
+# Calls the child executes on the EPD object (everything else is rejected).
+EPD_CALLS = ("init", "getbuffer", "display", "sleep", "Clear")
+# Deadline for module_exit() and for the child to exit afterwards.
+EXIT_TIMEOUT = 10.0
+# The vendor epdconfig's (RaspberryPi) BCM pin numbers a panel can move.
+DEFAULT_PINS = {"rst": 17, "dc": 25, "busy": 24, "pwr": 18}
+
+
+class RemoteDriverError(Exception):
+    """A driver call failed in the child; remote_type is the original exception name."""
+
+    def __init__(self, remote_type: str, message: str) -> None:
+        super().__init__(f"{remote_type}: {message}")
+        self.remote_type = remote_type
+
+
+class DriverTimeout(RemoteDriverError):
+    """A driver call missed its deadline; the child has been killed."""
+
+    def __init__(self, call: str, timeout: float) -> None:
+        super().__init__(
+            "DriverTimeout", f"{call}() did not return within {timeout:g}s - driver process killed"
+        )
+
+
+class RemoteEPD:
+    """EPD proxy for a driver running in a child process.
+
+    Constructing it spawns the child and waits (up to spawn_timeout) for the
+    driver import and EPD(); width/height come from the child's EPD object.
+    env: EINK_* overrides for the child, which reads config.py from its
+    environment (the client passes its effective emulator/log settings).
+    spi: (bus, device) to open instead of the driver's (0, 0); pins: moved
+    DEFAULT_PINS lines, e.g. {"rst": 5, "busy": 6}.
+    """
+
+    def __init__(
+        self,
+        driver: str,
+        call_timeout: float,
+        spawn_timeout: float,
+        env: Optional[Dict[str, str]] = None,
+        spi: Optional[Tuple[int, int]] = None,
+        pins: Optional[Dict[str, int]] = None,
+    ) -> None:
+        if driver not in DRIVERS:
+            raise ValueError(f"unknown display driver {driver!r}")
+        self.driver = driver
+        self.call_timeout = call_timeout
+        wiring = []
+        if spi is not None:
+            wiring += ["--spi", f"{spi[0]}.{spi[1]}"]
+        for name, pin in sorted((pins or {}).items()):
+            wiring += ["--pin", f"{name}={pin}"]
+        parent_sock, child_sock = socket.socketpair()
+        try:
+            self._proc: Optional[subprocess.Popen] = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--serve", driver,
+                 str(child_sock.fileno()), *wiring],
+                pass_fds=(child_sock.fileno(),),
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env={**os.environ, **(env or {})},
+            )
+        finally:
+            child_sock.close()
+        self._conn = Connection(parent_sock.detach())
+        self.width, self.height = self._reply("EPD", spawn_timeout)
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._proc.pid if self._proc is not None else None
+
+    def init(self):
+        return self._call("init")
+
+    def getbuffer(self, image):
+        return self._call("getbuffer", image)
+
+    def display(self, *buffers):
+        return self._call("display", *buffers)
+
+    def sleep(self):
+        return self._call("sleep")
+
+    def Clear(self, *args):  # noqa: N802 (vendor API)
+        return self._call("Clear", *args)
+
+    def inject(self, call: str, kind: str = "raise", **kwargs) -> None:
+        """Inject an epd_emulator fault in the child (EINK_PANEL_EMULATOR only)."""
+        self._call("inject", call, kind, kwargs)
+
+    def module_exit(self) -> None:
+        """epdconfig.module_exit() in the child, then let it exit.
+
+        Idempotent; kills the child when it does not finish within
+        EXIT_TIMEOUT. Errors from module_exit() itself are raised after the
+        child is gone.
+        """
+        if self._proc is None:
+            return
+        try:
+            self._call("module_exit", timeout=EXIT_TIMEOUT)
+        finally:
+            self._stop()
+
+    def kill(self) -> None:
+        """Kill the child immediately (no module_exit)."""
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        proc.kill()
+        proc.wait()
+        self._conn.close()
+
+    def _stop(self) -> None:
+        proc = self._proc
+        if proc is None:
+            return
+        try:
+            proc.wait(timeout=EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            pass
+        self.kill()
+
+    def _call(self, call: str, *args: Any, timeout: Optional[float] = None) -> Any:
+        if self._proc is None:
+            raise RemoteDriverError("DriverProcessGone", f"{call}(): driver process not running")
+        try:
+            self._conn.send((call, args))
+        except OSError as e:
+            code = self._proc.poll()
+            self.kill()
+            raise RemoteDriverError(
+                "DriverProcessDied", f"{call}(): driver process gone ({e}, code {code})"
+            )
+        return self._reply(call, self.call_timeout if timeout is None else timeout)
+
+    def _reply(self, call: str, timeout: float) -> Any:
+        try:
+            ready = self._conn.poll(timeout)
+            reply = self._conn.recv() if ready else None
+        except (EOFError, OSError):
+            code = self._proc.poll() if self._proc is not None else None
+            self.kill()
+            raise RemoteDriverError(
+                "DriverProcessDied", f"{call}(): driver process exited (code {code})"
+            )
+        if not ready:
+            self.kill()
+            raise DriverTimeout(call, timeout)
+        if reply[0] == "ok":
+            return reply[1]
+        _, remote_type, message = reply
+        if call == "EPD":
+            self.kill()  # the child exits after a failed construct
+        if remote_type in ("ImportError", "ModuleNotFoundError"):
+            raise ImportError(message)
+        raise RemoteDriverError(remote_type, message)
+
+
+# --- child side ---
+
+
+def _error(e: BaseException) -> Tuple[str, str, str]:
+    return ("err", type(e).__name__, str(e))
+
+
+class _SpiDevice:
+    """The epdconfig SpiDev, opening the panel's bus/device whatever module_init() asks."""
+
+    def __init__(self, spi, bus: int, device: int) -> None:
+        object.__setattr__(self, "_spi", spi)
+        object.__setattr__(self, "_target", (bus, device))
+
+    def open(self, bus: int, device: int) -> None:
+        self._spi.open(*self._target)
+
+    def __getattr__(self, name: str):
+        return getattr(self._spi, name)
+
+    def __setattr__(self, name: str, value) -> None:
+        setattr(self._spi, name, value)  # max_speed_hz, mode
+
+
+@contextmanager
+def _remapped_gpio(pins: Dict[str, int]) -> Iterator[None]:
+    """Construct gpiozero devices on the panel's pins instead of DEFAULT_PINS."""
+    remap = {DEFAULT_PINS[name]: pin for name, pin in pins.items()}
+    try:
+        import gpiozero
+    except ImportError:
+        yield  # no GPIO stack (emulator, non-Pi): nothing claims pins
+        return
+    original = gpiozero.GPIODevice.__init__
+
+    def init(self, pin=None, **kwargs):
+        original(self, remap.get(pin, pin), **kwargs)
+
+    gpiozero.GPIODevice.__init__ = init
+    try:
+        yield
+    finally:
+        gpiozero.GPIODevice.__init__ = original
+
+
+def _import_driver(
+    driver: str, spi: Optional[Tuple[int, int]] = None, pins: Optional[Dict[str, int]] = None
+):
+    """Import waveshare_epd.<driver> with the panel's SPI device and pins applied."""
+    pins = pins or {}
+    with _remapped_gpio(pins):
+        module = importlib.import_module(f"waveshare_epd.{driver}")
+    if spi is None and not pins:
+        return module
+    epdconfig = module.epdconfig
+    implementation = getattr(epdconfig, "implementation", None)
+    if implementation is None or not hasattr(implementation, "SPI"):
+        logging.getLogger("eink-client").warning(
+            "Driver %s has no Raspberry Pi epdconfig - SPI device/pin wiring ignored", driver
+        )
+        return module
+    for name, pin in pins.items():
+        # EPD() reads the module constants, digital_write() the instance ones.
+        setattr(implementation, f"{name.upper()}_PIN", pin)
+        setattr(epdconfig, f"{name.upper()}_PIN", pin)
+    if spi is not None:
+        implementation.SPI = _SpiDevice(implementation.SPI, *spi)
+        epdconfig.SPI = implementation.SPI
+    return module
+
+
+def serve(
+    conn: Connection,
+    driver: str,
+    spi: Optional[Tuple[int, int]] = None,
+    pins: Optional[Dict[str, int]] = None,
+) -> int:
+    """Child main loop: construct the driver, then answer calls until EOF/module_exit."""
+    import config
+    # Shutdown is the client's job (sleep + module_exit, or EOF below): a
+    # Ctrl-C or systemd's SIGTERM to the whole group must not cut it short.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    logging.basicConfig(
+        level=getattr(logging, config.LOG_LEVEL),
+        format=f"%(asctime)s [%(levelname)s] [driver {os.getpid()}] %(message)s",
+    )
+    if config.PANEL_EMULATOR:
+        import epd_emulator
+        epd_emulator.install(config.PANEL_EMULATOR_SCALE, config.PANEL_EMULATOR_OUTPUT)
+    try:
+        module = _import_driver(driver, spi, pins)
+        epd = module.EPD()
+        if config.SPI_TRANSPORT:
+            import spi_transport
+            spi_transport.attach(epd, module.epdconfig)
+    except BaseException as e:
+        conn.send(_error(e))
+        return 1
+    conn.send(("ok", (epd.width, epd.height)))
+    while True:
+        try:
+            call, args = conn.recv()
+        except (EOFError, OSError):
+            # The client is gone without a module_exit(): power the panel off.
+            try:
+                module.epdconfig.module_exit()
+            except Exception:
+                pass
+            return 0
+        try:
+            if call == "module_exit":
+                module.epdconfig.module_exit()
+                conn.send(("ok", None))
+                return 0
+            if call == "inject":
+                import epd_emulator
+                emulator = epd_emulator.current()
+                if emulator is None:
+                    raise RuntimeError("fault injection needs EINK_PANEL_EMULATOR=true")
+                target, kind, kwargs = args
+                emulator.inject(target, kind, **kwargs)
+                result = None
+            elif call in EPD_CALLS:
+                result = getattr(epd, call)(*args)
+            else:
+                raise ValueError(f"unknown driver call {call!r}")
+        except Exception as e:
+            conn.send(_error(e))
+            continue
+        conn.send(("ok", result))
+
+
+def _spi_arg(value: str) -> Tuple[int, int]:
+    bus, device = value.split(".")
+    return int(bus), int(device)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Display driver child (started by the client)")
+    parser.add_argument("--serve", nargs=2, metavar=("DRIVER", "FD"), required=True)
+    parser.add_argument("--spi", type=_spi_arg, metavar="BUS.DEVICE")
+    parser.add_argument("--pin", action="append", default=[], metavar="NAME=BCM")
+    args = parser.parse_args()
+    wired = {name: int(pin) for name, pin in (p.split("=", 1) for p in args.pin)}
+    sys.exit(serve(Connection(int(args.serve[1])), args.serve[0], args.spi, wired))
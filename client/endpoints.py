@@ -0,0 +1,206 @@
+"""Several server endpoints with health, latency and circuit breaking (EINK_SERVER_URLS).
+
+With a single EINK_SERVER_URL a slow or dead server means the client backs
+off and the panel goes stale. EINK_SERVER_URLS lists replicas instead,
+comma-separated and in order of preference, each optionally weighted:
+
+    http://eink-a:5000,http://eink-b:5000;weight=2
+
+client.py sends every request through EndpointPool.call():
+
+- the candidates are the healthy endpoints ordered by score, which is the
+  moving average of the measured request time divided by the weight (the
+  long-poll is not sampled; it is held open by design). Endpoints without a
+  sample score 0, so each one is tried once and measured; ties keep the
+  list order. The current endpoint is only left for one that is at least
+  SWITCH_MARGIN faster, so similar replicas do not flap;
+- a connection error, timeout or 5xx fails over to the next candidate
+  within the same call. After failure_limit consecutive failures an
+  endpoint's circuit opens: it is skipped for cooldown seconds (doubled on
+  every failed retry, up to max_cooldown), then gets one trial request.
+  When every circuit is open they are all tried anyway, soonest retry
+  first - a stale panel is worse than a wasted connect;
+- 4xx answers are the server's verdict on the request, not on its health.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, List, Optional
+
+logger = logging.getLogger("eink-client")
+
+# Weight of a new sample in the request-time moving average.
+EWMA_ALPHA = 0.3
+# A better endpoint replaces the current one only when its score is below
+# current * SWITCH_MARGIN.
+SWITCH_MARGIN = 0.8
+MAX_COOLDOWN = 300.0
+
+
+class Endpoint:
+    """One server base URL and its health."""
+
+    __slots__ = ("url", "weight", "index", "latency", "failures", "cooldown", "open_until")
+
+    def __init__(self, url: str, weight: float = 1.0, index: int = 0) -> None:
+        self.url = url
+        self.weight = weight
+        self.index = index
+        self.latency: Optional[float] = None  # moving average in seconds
+        self.failures = 0  # consecutive
+        self.cooldown = 0.0  # current circuit-open duration
+        self.open_until = 0.0  # monotonic time the circuit opens again; 0 = closed
+
+    def score(self) -> float:
+        return (self.latency or 0.0) / self.weight
+
+    def state(self, now: float) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+
+def parse_endpoints(spec: str) -> List[Endpoint]:
+    """Parse EINK_SERVER_URLS; ValueError names the offending entry."""
+    endpoints: List[Endpoint] = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        url, _, options = entry.partition(";")
+        url = url.strip().rstrip("/")
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"EINK_SERVER_URLS: {entry!r} is not an http(s) URL")
+        weight = 1.0
+        if options:
+            key, sep, value = options.partition("=")
+            try:
+                if key.strip().lower() != "weight" or not sep:
+                    raise ValueError
+                weight = float(value)
+                if weight <= 0:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(
+                    f"EINK_SERVER_URLS: {entry!r}: expected URL;weight=N with N > 0"
+                ) from None
+        if any(e.url == url for e in endpoints):
+            raise ValueError(f"EINK_SERVER_URLS: duplicate endpoint {url!r}")
+        endpoints.append(Endpoint(url, weight, len(endpoints)))
+    return endpoints
+
+
+class EndpointPool:
+    """Endpoint selection and failover; safe to share between threads."""
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        failure_limit: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = MAX_COOLDOWN,
+        on_failover: Optional[Callable[[], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("EINK_SERVER_URLS names no endpoint")
+        self.endpoints = endpoints
+        self.failure_limit = max(1, failure_limit)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.on_failover = on_failover
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.current: Endpoint = endpoints[0]
+
+    def __str__(self) -> str:
+        return ", ".join(e.url for e in self.endpoints)
+
+    def candidates(self) -> List[Endpoint]:
+        """Endpoints in the order the next request tries them."""
+        with self._lock:
+            now = self._clock()
+            ready = [e for e in self.endpoints if e.state(now) != "open"]
+            if not ready:
+                return sorted(self.endpoints, key=lambda e: (e.open_until, e.index))
+            ready.sort(key=lambda e: (e.score(), e.index))
+            current = self.current
+            if current in ready and current.latency is not None \
+                    and ready[0].latency is not None \
+                    and ready[0].score() >= current.score() * SWITCH_MARGIN:
+                ready.remove(current)
+                ready.insert(0, current)
+            return ready
+
+    def record(self, endpoint: Endpoint, ok: bool, seconds: Optional[float] = None) -> None:
+        """Account one request: seconds is its duration when it is a latency sample."""
+        with self._lock:
+            now = self._clock()
+            if ok:
+                if endpoint.open_until:
+                    logger.info("Server %s recovered", endpoint.url)
+                endpoint.failures = 0
+                endpoint.cooldown = 0.0
+                endpoint.open_until = 0.0
+                if seconds is not None:
+                    endpoint.latency = seconds if endpoint.latency is None else (
+                        EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * endpoint.latency
+                    )
+                self.current = endpoint
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_limit:
+                endpoint.cooldown = min(
+                    self.max_cooldown, endpoint.cooldown * 2 or self.base_cooldown
+                )
+                endpoint.open_until = now + endpoint.cooldown
+                logger.warning(
+                    "Server %s failed %d times in a row - skipping it for %.0fs",
+                    endpoint.url, endpoint.failures, endpoint.cooldown,
+                )
+
+    def call(self, send: Callable, sample: bool = True):
+        """send(base_url) on the candidates until one answers below 500.
+
+        Returns the first such response, or the last 5xx response when no
+        endpoint did better; re-raises the last exception when none answered.
+        """
+        candidates = self.candidates()
+        error: Optional[BaseException] = None
+        for position, endpoint in enumerate(candidates):
+            last = position == len(candidates) - 1
+            start = time.monotonic()
+            try:
+                resp = send(endpoint.url)
+            except Exception as e:
+                self.record(endpoint, ok=False)
+                error, outcome = e, type(e).__name__
+            else:
+                if resp.status_code < 500:
+                    self.record(endpoint, ok=True,
+                                seconds=time.monotonic() - start if sample else None)
+                    return resp
+                self.record(endpoint, ok=False)
+                if last:
+                    return resp
+                outcome = f"HTTP {resp.status_code}"
+            if not last:
+                logger.warning("Server %s failed (%s) - trying %s", endpoint.url, outcome,
+                               candidates[position + 1].url)
+                if self.on_failover is not None:
+                    self.on_failover()
+        raise error
+
+    def snapshot(self) -> List[dict]:
+        """Per-endpoint state for the heartbeat telemetry."""
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "url": e.url,
+                    "state": e.state(now),
+                    "latency_ms": round(e.latency * 1000) if e.latency is not None else None,
+                    "failures": e.failures,
+                }
+                for e in self.endpoints
+            ]
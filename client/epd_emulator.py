@@ -0,0 +1,445 @@
+"""Timing-accurate stand-in for the waveshare_epd driver modules.
+
+install() registers fake ``waveshare_epd``, ``waveshare_epd.epdconfig``,
+``waveshare_epd.epd7in3e`` and ``waveshare_epd.epd7in5_V2`` modules in
+sys.modules, so load_display_driver() and the E5.4 module_exit() path run
+unchanged against them (config.PANEL_EMULATOR does this on driver load).
+
+What is modelled, per driver (DRIVER_PROFILES):
+
+* init / display / partial / sleep durations, and the SPI transfer of the
+  frame buffer at the epdconfig bus speed (4 MHz);
+* the BUSY pin: low while the controller works (epdconfig.digital_read),
+  which the driver's ReadBusy loops wait on - a "busy_stuck" fault keeps it
+  low for a while, like a panel that stops answering;
+* getbuffer() exactly like the vendor code (6-color nibble packing for
+  epd7in3e, inverted 1-bit for epd7in5_V2) and a size check of every buffer
+  handed to display();
+* sleep() ending in module_exit(), and init() returning -1 when
+  module_init() fails;
+* injectable faults (PanelEmulator.inject);
+* rendering the received buffer back to an image (last_frame, optionally
+  written to a PNG on every refresh).
+
+time_scale multiplies every modelled duration (1.0 = real hardware, 0 = no
+waiting at all).
+"""
+
+import os
+import sys
+import threading
+import time
+import types
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+SPI_HZ = 4_000_000  # epdconfig: SPI.max_speed_hz = 4000000
+
+# Busy times in seconds. init = reset pulses + power-on busy wait; display =
+# full refresh waveform; sleep includes the vendor's 2s delay before
+# module_exit(). partial/fast only exist on epd7in5_V2.
+DRIVER_PROFILES: Dict[str, dict] = {
+    "epd7in3e": {
+        "size": (800, 480), "buffer_bytes": 800 * 480 // 2,
+        "init": 1.2, "display": 30.0, "sleep": 2.0, "clear": 30.0,
+    },
+    "epd7in5_V2": {
+        "size": (800, 480), "buffer_bytes": 800 * 480 // 8,
+        "init": 0.3, "display": 4.0, "sleep": 2.0, "clear": 4.0,
+        "init_fast": 0.3, "display_fast": 1.6, "init_part": 0.1, "partial": 0.4,
+    },
+}
+
+# Vendor epd7in3e palette (index 4 is unused black).
+EPD7IN3E_PALETTE = (
+    (0, 0, 0), (255, 255, 255), (255, 255, 0), (255, 0, 0),
+    (0, 0, 0), (0, 0, 255), (0, 255, 0),
+)
+
+FAULT_KINDS = ("raise", "init_minus_one", "busy_stuck", "construct")
+
+
+class EmulatedHardwareError(OSError):
+    """Raised by an injected "raise"/"construct" fault (looks like an SPI/GPIO error)."""
+
+
+def _palette_image() -> Image.Image:
+    pal = Image.new("P", (1, 1))
+    flat = [c for rgb in EPD7IN3E_PALETTE for c in rgb]
+    pal.putpalette(flat + [0, 0, 0] * (256 - len(EPD7IN3E_PALETTE)))
+    return pal
+
+
+class PanelEmulator:
+    """Shared state of all emulated panels: timing, faults, call log, last frame.
+
+    events holds (call, driver, start, end) on the time.monotonic() clock for
+    every driver call; writes holds (init start, display end) per completed
+    full refresh. Thread-safe; one instance per install().
+    """
+
+    def __init__(self, time_scale: float = 1.0, output: str = "",
+                 spi_hz: int = SPI_HZ) -> None:
+        self.time_scale = time_scale
+        self.output = output
+        self.spi_hz = spi_hz
+        self.last_frame: Optional[Image.Image] = None
+        self.events: List[Tuple[str, str, float, float]] = []
+        self.writes: List[Tuple[float, float]] = []
+        self.counts: Dict[str, int] = {}
+        self.module_inits = 0
+        self.module_exits = 0
+        self._faults: List[dict] = []
+        self._busy_until = 0.0
+        self._pending_init: Optional[float] = None
+        self._lock = threading.Lock()
+
+    # --- faults ---
+
+    def inject(self, call: str, kind: str = "raise", after: int = 0, count: int = 1,
+               seconds: float = 60.0, exc: Optional[BaseException] = None) -> None:
+        """Fail the driver call `call` ("EPD", "init", "getbuffer", "display", ...).
+
+        after: let this many calls succeed first; count: how many calls fail
+        (0 = forever). kinds: "raise" (exc or EmulatedHardwareError),
+        "init_minus_one" (init returns -1 like a failed module_init),
+        "busy_stuck" (BUSY stays low for `seconds` before the call goes on),
+        "construct" (EPD() raises, e.g. GPIOPinInUse on a re-import).
+        """
+        if kind not in FAULT_KINDS:
+            raise ValueError(f"unknown fault kind {kind!r}")
+        with self._lock:
+            self._faults.append({
+                "call": call, "kind": kind, "after": after, "count": count,
+                "seconds": seconds, "exc": exc,
+            })
+
+    def clear_faults(self) -> None:
+        with self._lock:
+            self._faults = []
+
+    def _take_fault(self, call: str) -> Optional[dict]:
+        with self._lock:
+            for fault in self._faults:
+                if fault["call"] != call:
+                    continue
+                if fault["after"] > 0:
+                    fault["after"] -= 1
+                    return None
+                if fault["count"] != 0:
+                    fault["count"] -= 1
+                    if fault["count"] == 0:
+                        self._faults.remove(fault)
+                return fault
+        return None
+
+    # --- timing ---
+
+    def _wait(self, seconds: float) -> None:
+        seconds *= self.time_scale
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _busy(self, seconds: float) -> None:
+        """Drive BUSY low for `seconds` (scaled) and block like ReadBusy does."""
+        seconds *= self.time_scale
+        with self._lock:
+            self._busy_until = time.monotonic() + seconds
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def busy_pin(self) -> int:
+        """Level of the BUSY pin: 0 while the controller is busy, else 1."""
+        return 0 if time.monotonic() < self._busy_until else 1
+
+    def spi_seconds(self, nbytes: int) -> float:
+        return nbytes * 8 / self.spi_hz
+
+    def _record(self, call: str, driver: str, start: float) -> None:
+        end = time.monotonic()
+        with self._lock:
+            self.events.append((call, driver, start, end))
+            self.counts[call] = self.counts.get(call, 0) + 1
+            if call in ("init", "init_fast"):
+                self._pending_init = start
+            elif call == "display":
+                self.writes.append((self._pending_init if self._pending_init is not None else start, end))
+                self._pending_init = None
+
+    # --- frames ---
+
+    def render(self, driver: str, buf, region: Optional[Tuple[int, int, int, int]] = None) -> Image.Image:
+        """Decode a driver buffer back into an image (and save it when output is set)."""
+        width, height = DRIVER_PROFILES[driver]["size"]
+        data = bytes(buf)
+        if driver == "epd7in3e":
+            indices = bytearray(len(data) * 2)
+            indices[0::2] = bytes(b >> 4 for b in data)
+            indices[1::2] = bytes(b & 0x0F for b in data)
+            frame = Image.frombytes("P", (width, height), bytes(indices))
+            frame.putpalette(_palette_image().getpalette())
+            frame = frame.convert("RGB")
+        else:
+            # Vendor getbuffer() inverts: a set bit is black on the panel.
+            if region is None:
+                frame = Image.frombytes("1", (width, height), bytes(b ^ 0xFF for b in data))
+            else:
+                x0, y0, x1, y1 = region
+                base = self.last_frame.convert("1") if self.last_frame is not None \
+                    else Image.new("1", (width, height), 1)
+                full = Image.frombytes("1", (width, height), bytes(b ^ 0xFF for b in data))
+                base.paste(full.crop(region), (x0, y0))
+                frame = base
+        with self._lock:
+            self.last_frame = frame
+        if self.output:
+            tmp_path = f"{self.output}.tmp"
+            frame.save(tmp_path, format="PNG")
+            os.replace(tmp_path, self.output)
+        return frame
+
+
+class _EPDBase:
+    """Common part of the emulated EPD classes (vendor attribute names)."""
+
+    DRIVER = ""
+
+    def __init__(self) -> None:
+        emu = _emulator()
+        fault = emu._take_fault("EPD")
+        if fault is not None:
+            raise fault["exc"] or EmulatedHardwareError("GPIO busy: pin already in use")
+        profile = DRIVER_PROFILES[self.DRIVER]
+        self.width, self.height = profile["size"]
+        self._profile = profile
+        self._emu = emu
+        self._display_key = "display"  # init_fast() switches to the fast waveform
+
+    def _enter(self, call: str) -> Optional[dict]:
+        fault = self._emu._take_fault(call)
+        if fault is None:
+            return None
+        if fault["kind"] == "busy_stuck":
+            self._emu._busy(fault["seconds"])
+            return None
+        if fault["kind"] == "raise":
+            raise fault["exc"] or EmulatedHardwareError(f"{call}: SPI transfer failed")
+        return fault
+
+    def init(self):
+        start = time.monotonic()
+        fault = self._enter("init")
+        try:
+            if (fault is not None and fault["kind"] == "init_minus_one") \
+                    or _epdconfig.module_init() != 0:
+                return -1
+            self._display_key = "display"
+            self._emu._busy(self._profile["init"])
+            return 0
+        finally:
+            self._emu._record("init", self.DRIVER, start)
+
+    def _check_buffer(self, buf) -> None:
+        expected = self._profile["buffer_bytes"]
+        if len(buf) != expected:
+            raise ValueError(
+                f"{self.DRIVER}: display buffer has {len(buf)} bytes, expected {expected}"
+            )
+
+    def display(self, image):
+        start = time.monotonic()
+        self._enter("display")
+        self._check_buffer(image)
+        self._emu._wait(self._emu.spi_seconds(len(image)))
+        self._emu._busy(self._profile[self._display_key])
+        self._emu.render(self.DRIVER, image)
+        self._emu._record("display", self.DRIVER, start)
+
+    def Clear(self, *args):  # noqa: N802 (vendor API)
+        start = time.monotonic()
+        self._enter("Clear")
+        self._emu._wait(self._emu.spi_seconds(self._profile["buffer_bytes"]))
+        self._emu._busy(self._profile["clear"])
+        self._emu._record("Clear", self.DRIVER, start)
+
+    def sleep(self):
+        start = time.monotonic()
+        self._enter("sleep")
+        self._emu._wait(self._profile["sleep"])
+        _epdconfig.module_exit()
+        self._emu._record("sleep", self.DRIVER, start)
+
+    def _fit(self, image: Image.Image) -> Image.Image:
+        if image.size == (self.width, self.height):
+            return image
+        if image.size == (self.height, self.width):
+            return image.rotate(90, expand=True)
+        raise ValueError(
+            f"Wrong image dimensions: must be {self.width}x{self.height}, got "
+            f"{image.size[0]}x{image.size[1]}"
+        )
+
+
+class EPD7in3e(_EPDBase):
+    """Emulated Waveshare 7.3" 6-color panel (full refresh only)."""
+
+    DRIVER = "epd7in3e"
+    BLACK, WHITE, YELLOW, RED, BLUE, GREEN = (
+        0x000000, 0xFFFFFF, 0x00FFFF, 0x0000FF, 0xFF0000, 0x00FF00,
+    )
+
+    def getbuffer(self, image):
+        self._enter("getbuffer")
+        image = self._fit(image).convert("RGB")
+        indices = image.quantize(palette=_palette_image()).tobytes("raw")
+        # Two pixels per byte, high nibble first (vendor packing).
+        return [(indices[i] << 4) + indices[i + 1] for i in range(0, len(indices), 2)]
+
+
+class EPD7in5V2(_EPDBase):
+    """Emulated Waveshare 7.5" V2 B/W panel, with fast and partial refresh."""
+
+    DRIVER = "epd7in5_V2"
+
+    def getbuffer(self, image):
+        self._enter("getbuffer")
+        buf = bytearray(self._fit(image).convert("1").tobytes("raw"))
+        for i in range(len(buf)):
+            buf[i] ^= 0xFF
+        return buf
+
+    def init_fast(self):
+        start = time.monotonic()
+        self._enter("init_fast")
+        try:
+            if _epdconfig.module_init() != 0:
+                return -1
+            self._display_key = "display_fast"
+            self._emu._busy(self._profile["init_fast"])
+            return 0
+        finally:
+            self._emu._record("init_fast", self.DRIVER, start)
+
+    def init_part(self):
+        start = time.monotonic()
+        self._enter("init_part")
+        try:
+            if _epdconfig.module_init() != 0:
+                return -1
+            self._emu._busy(self._profile["init_part"])
+            return 0
+        finally:
+            self._emu._record("init_part", self.DRIVER, start)
+
+    def display_Partial(self, Image, Xstart, Ystart, Xend, Yend):  # noqa: N802,N803 (vendor API)
+        start = time.monotonic()
+        self._enter("display_Partial")
+        self._check_buffer(Image)
+        region_bytes = (Xend - Xstart) * (Yend - Ystart) // 8
+        self._emu._wait(self._emu.spi_seconds(region_bytes))
+        self._emu._busy(self._profile["partial"])
+        self._emu.render(self.DRIVER, Image, region=(Xstart, Ystart, Xend, Yend))
+        self._emu._record("display_Partial", self.DRIVER, start)
+
+
+# --- fake module objects ---
+
+_state_lock = threading.Lock()
+_current: Optional[PanelEmulator] = None
+_saved_modules: Dict[str, Optional[types.ModuleType]] = {}
+_MODULE_NAMES = (
+    "waveshare_epd", "waveshare_epd.epdconfig", "waveshare_epd.epd7in3e",
+    "waveshare_epd.epd7in5_V2",
+)
+
+
+def _emulator() -> PanelEmulator:
+    if _current is None:
+        raise RuntimeError("panel emulator is not installed")
+    return _current
+
+
+class _EpdConfig:
+    """The subset of waveshare_epd.epdconfig the client and drivers touch."""
+
+    @staticmethod
+    def module_init(*args) -> int:
+        emu = _emulator()
+        with emu._lock:
+            emu.module_inits += 1
+        return 0
+
+    @staticmethod
+    def module_exit(*args) -> None:
+        emu = _emulator()
+        with emu._lock:
+            emu.module_exits += 1
+
+    @staticmethod
+    def delay_ms(ms: float) -> None:
+        _emulator()._wait(ms / 1000.0)
+
+    @staticmethod
+    def digital_read(pin) -> int:
+        return _emulator().busy_pin()
+
+    @staticmethod
+    def digital_write(pin, value) -> None:
+        pass
+
+
+_epdconfig = _EpdConfig
+
+
+def _build_modules() -> Dict[str, types.ModuleType]:
+    package = types.ModuleType("waveshare_epd")
+    package.__path__ = []  # a package, so "from waveshare_epd import x" works
+    epdconfig = types.ModuleType("waveshare_epd.epdconfig")
+    for name in ("module_init", "module_exit", "delay_ms", "digital_read", "digital_write"):
+        setattr(epdconfig, name, getattr(_EpdConfig, name))
+    modules = {"waveshare_epd": package, "waveshare_epd.epdconfig": epdconfig}
+    for name, cls in (("epd7in3e", EPD7in3e), ("epd7in5_V2", EPD7in5V2)):
+        module = types.ModuleType(f"waveshare_epd.{name}")
+        module.EPD = cls
+        module.EPD_WIDTH, module.EPD_HEIGHT = DRIVER_PROFILES[name]["size"]
+        module.epdconfig = epdconfig
+        setattr(package, name, module)
+        modules[f"waveshare_epd.{name}"] = module
+    package.epdconfig = epdconfig
+    return modules
+
+
+def install(time_scale: float = 1.0, output: str = "") -> PanelEmulator:
+    """Register the emulated driver modules; returns the (new) shared emulator.
+
+    Replaces any real waveshare_epd in sys.modules until uninstall(). Calling
+    install() again swaps in a fresh emulator and keeps the first saved
+    originals.
+    """
+    global _current
+    with _state_lock:
+        if not _saved_modules:
+            for name in _MODULE_NAMES:
+                _saved_modules[name] = sys.modules.get(name)
+        _current = PanelEmulator(time_scale, output)
+        sys.modules.update(_build_modules())
+        return _current
+
+
+def uninstall() -> None:
+    """Restore whatever waveshare_epd modules were present before install()."""
+    global _current
+    with _state_lock:
+        for name, module in _saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        _saved_modules.clear()
+        _current = None
+
+
+def current() -> Optional[PanelEmulator]:
+    """The installed emulator, or None."""
+    return _current
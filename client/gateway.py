@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""LAN caching gateway: one upstream connection for every panel on a site.
+
+Every client normally long-polls the central server itself and fetches
+/settings and /preview from it, over the site's WAN link. `python3
+gateway.py` runs one process on the LAN that talks to the server
+(EINK_SERVER_URL) for all of them and serves the client-facing API to the
+local panels, which point their EINK_SERVER_URL at the gateway instead:
+
+- GET /api/refresh_status: the gateway holds ONE upstream long-poll. Every
+  should_refresh=true it sees starts a new refresh round; each local client
+  is answered should_refresh=true (with the upstream reason) until it has
+  sent its own heartbeat for that round, and otherwise parked for up to
+  EINK_GATEWAY_HOLD seconds like on the server.
+- POST /api/client_heartbeat: the first local heartbeat of a round goes
+  upstream (that is what clears the server's should_refresh); the others
+  are absorbed. A heartbeat with telemetry gets a "gateway" block with the
+  number of local clients and how many have acknowledged the round.
+- GET /preview (any query) and GET /settings: served from a frame cache.
+  Entries are fetched again for a new refresh round or once older than
+  EINK_GATEWAY_CACHE_TTL seconds. Concurrent requests for the same path
+  while it is being fetched wait for that single upstream request
+  (coalescing). Bodies carry their SHA-256 as ETag: an unchanged re-fetch
+  keeps the cached bytes, and If-None-Match is answered with 304.
+
+Upstream load per site drops from one long-poll and one preview per panel
+to one of each. Local clients authenticate with EINK_CLIENT_TOKEN, which
+the gateway also uses upstream. GET /gateway/status (token required too)
+reports the counters. Any other route is a plain-text 404, like a server
+without that endpoint.
+"""
+
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import signal
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import config
+import logpipe
+
+logger = logging.getLogger("eink-client")
+
+# Routes served from the cache; everything else but the two API calls and
+# /gateway/status is 404.
+CACHED_ROUTES = ("/preview", "/settings")
+# Upstream request timeouts in seconds (connect, read) for cached routes.
+FETCH_TIMEOUT = (5, 30)
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # a site's panels all reconnect at once
+
+
+class _Entry:
+    """One cached upstream response."""
+
+    __slots__ = ("status", "content_type", "body", "digest", "fetched", "round")
+
+    def __init__(self, status: int, content_type: str, body: bytes, round_: int) -> None:
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.fetched = time.monotonic()
+        self.round = round_
+
+
+class _Flight:
+    """An upstream fetch other requests for the same path are waiting on."""
+
+    __slots__ = ("done", "entry", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.entry: Optional[_Entry] = None
+        self.error: Optional[BaseException] = None
+
+
+class Gateway:
+    """Upstream long-poll, frame cache and the local HTTP server.
+
+    upstream: the central server's base URL. hold: how long a local
+    refresh_status request is parked while nothing is due. cache_ttl:
+    maximum age of a cached /preview or /settings response. longpoll_timeout
+    and backoff: read timeout of the upstream long-poll and the pause after a
+    failed one (EINK_LONGPOLL_TIMEOUT / EINK_POLL_INTERVAL).
+    """
+
+    def __init__(
+        self,
+        upstream: str,
+        hold: float = 25.0,
+        cache_ttl: float = 60.0,
+        token: str = "",
+        host: str = "0.0.0.0",
+        port: int = 5000,
+        longpoll_timeout: float = 30.0,
+        backoff: float = 10.0,
+    ) -> None:
+        import requests
+        self.upstream = upstream.rstrip("/")
+        self.hold = hold
+        self.cache_ttl = cache_ttl
+        self.token = token
+        self.longpoll_timeout = longpoll_timeout
+        self.backoff = backoff
+        self._session = requests.Session()
+        if token:
+            self._session.headers["X-Client-Token"] = token
+        self._cond = threading.Condition()
+        self._running = False
+        # Upstream refresh state: the last status body (None until the first
+        # successful poll or after a failed one) and the refresh rounds.
+        self._status: Optional[dict] = None
+        self._polled = False  # the first upstream poll has completed
+        self._round = 0
+        self._round_reason: Optional[str] = None
+        self._round_open = False  # upstream still waits for a heartbeat
+        self._acked: Dict[str, int] = {}  # local client -> last acknowledged round
+        self._cache: Dict[str, _Entry] = {}
+        self._flights: Dict[str, _Flight] = {}
+        self.stats: Dict[str, int] = {
+            "upstream_polls": 0, "upstream_fetches": 0, "upstream_heartbeats": 0,
+            "cache_hits": 0, "coalesced": 0, "unchanged": 0, "not_modified": 0,
+            "heartbeats_absorbed": 0,
+        }
+        self._httpd = _HTTPServer((host, port), self._handler_class())
+        self._threads = [
+            threading.Thread(target=self._httpd.serve_forever, kwargs={"poll_interval": 0.2},
+                             name="eink-gateway-http", daemon=True),
+            threading.Thread(target=self._poll_loop, name="eink-gateway-poll", daemon=True),
+        ]
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "Gateway":
+        self._running = True
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._session.close()
+
+    def status(self) -> dict:
+        """Counters and state for GET /gateway/status."""
+        with self._cond:
+            return dict(
+                self.stats,
+                upstream_ok=self._status is not None,
+                round=self._round,
+                round_open=self._round_open,
+                clients=len(self._acked),
+                cached=sorted(self._cache),
+            )
+
+    def _count(self, name: str) -> None:
+        with self._cond:
+            self.stats[name] += 1
+
+    # --- upstream long-poll ---
+
+    def _poll_loop(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+            try:
+                resp = self._session.get(
+                    f"{self.upstream}/api/refresh_status", timeout=(5, self.longpoll_timeout)
+                )
+                self._count("upstream_polls")
+                resp.raise_for_status()
+                body = resp.json()
+                if not isinstance(body, dict):
+                    raise ValueError("refresh_status is not a JSON object")
+            except Exception as e:
+                logger.warning("Gateway: upstream refresh_status failed: %s", e)
+                with self._cond:
+                    self._status = None
+                    self._polled = True
+                    self._cond.notify_all()
+                    self._cond.wait_for(lambda: not self._running, self.backoff)
+                continue
+            with self._cond:
+                self._status = body
+                self._polled = True
+                if body.get("should_refresh"):
+                    if not self._round_open:
+                        self._round += 1
+                        self._round_open = True
+                        self._round_reason = body.get("reason")
+                        logger.info("Gateway: refresh round %d (%s)", self._round,
+                                    self._round_reason or "no reason")
+                    self._cond.notify_all()
+                    # The server answers a due refresh at once: wait for the
+                    # first local heartbeat instead of re-polling in a loop.
+                    self._cond.wait_for(
+                        lambda: not self._round_open or not self._running, self.backoff
+                    )
+                else:
+                    self._round_open = False
+                    self._cond.notify_all()
+
+    # --- local API (runs on the HTTP worker threads) ---
+
+    def refresh_status(self, client: str) -> Tuple[int, dict]:
+        """A local long-poll: due when the client has not acknowledged the round."""
+        deadline = time.monotonic() + self.hold
+        with self._cond:
+            # A client seen for the first time has just done its startup write.
+            self._acked.setdefault(client, self._round)
+
+            def answer() -> bool:
+                if not self._running:
+                    return True
+                if self._status is None:
+                    return self._polled
+                return self._acked[client] < self._round
+
+            while not answer():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._status is None:
+                return 502, {"error": "upstream server unreachable"}
+            body = {k: v for k, v in self._status.items() if k != "reason"}
+            body["should_refresh"] = self._acked[client] < self._round
+            if body["should_refresh"] and self._round_reason:
+                body["reason"] = self._round_reason
+            return 200, body
+
+    def heartbeat(self, client: str, payload: dict) -> Tuple[int, dict]:
+        """Acknowledge the round for this client; the first one of a round goes upstream."""
+        with self._cond:
+            self._acked[client] = self._round
+            forward = self._round_open
+            clients = len(self._acked)
+            acked = sum(1 for r in self._acked.values() if r == self._round)
+        if not forward:
+            self._count("heartbeats_absorbed")
+            return 200, {"ok": True}
+        if isinstance(payload.get("telemetry"), dict):
+            payload = dict(payload, telemetry=dict(
+                payload["telemetry"], gateway={"clients": clients, "acked": acked}
+            ))
+        try:
+            resp = self._session.post(
+                f"{self.upstream}/api/client_heartbeat", json=payload, timeout=5
+            )
+        except Exception as e:
+            logger.warning("Gateway: upstream heartbeat failed: %s", e)
+            return 502, {"error": "upstream server unreachable"}
+        self._count("upstream_heartbeats")
+        if resp.ok:
+            with self._cond:
+                self._round_open = False
+                self._cond.notify_all()
+        try:
+            body = resp.json()
+        except ValueError:
+            body = {}
+        return resp.status_code, body if isinstance(body, dict) else {}
+
+    def fetch(self, path: str) -> _Entry:
+        """Cached upstream GET of path (route plus query), coalescing concurrent misses."""
+        with self._cond:
+            entry = self._cache.get(path)
+            if entry is not None and entry.round == self._round \
+                    and time.monotonic() - entry.fetched < self.cache_ttl:
+                self.stats["cache_hits"] += 1
+                return entry
+            flight = self._flights.get(path)
+            leader = flight is None
+            if leader:
+                flight = self._flights[path] = _Flight()
+            else:
+                self.stats["coalesced"] += 1
+            round_ = self._round
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+        try:
+            resp = self._session.get(f"{self.upstream}{path}", timeout=FETCH_TIMEOUT)
+            new = _Entry(resp.status_code, resp.headers.get("Content-Type", ""),
+                         resp.content, round_)
+            with self._cond:
+                self.stats["upstream_fetches"] += 1
+                if resp.status_code == 200:
+                    if entry is not None and entry.digest == new.digest:
+                        new.body = entry.body  # keep one copy of an unchanged frame
+                        self.stats["unchanged"] += 1
+                    self._cache[path] = new
+            flight.entry = new
+            return new
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._cond:
+                del self._flights[path]
+            flight.done.set()
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _client(self) -> str:
+                return self.headers.get("X-Client-Id") or self.client_address[0]
+
+            def _authorized(self) -> bool:
+                # Constant-time, like the server's subtle.ConstantTimeCompare:
+                # the gateway answers the whole LAN.
+                sent = self.headers.get("X-Client-Token", "").encode("utf-8")
+                if gateway.token and not hmac.compare_digest(sent, gateway.token.encode("utf-8")):
+                    self._send_json(401, {"error": "Unauthorized"})
+                    return False
+                return True
+
+            def do_GET(self):  # noqa: N802 (http.server API)
+                route = urlsplit(self.path).path
+                if not self._authorized():
+                    return
+                if route == "/gateway/status":
+                    self._send_json(200, gateway.status())
+                elif route == "/api/refresh_status":
+                    self._send_json(*gateway.refresh_status(self._client()))
+                elif route in CACHED_ROUTES:
+                    try:
+                        entry = gateway.fetch(self.path)
+                    except Exception as e:
+                        logger.warning("Gateway: upstream %s failed: %s", route, e)
+                        self._send_json(502, {"error": "upstream server unreachable"})
+                        return
+                    etag = f'"{entry.digest}"'
+                    if entry.status == 200 and self.headers.get("If-None-Match") == etag:
+                        gateway._count("not_modified")
+                        self._send(304, entry.content_type, b"", etag)
+                    else:
+                        self._send(entry.status, entry.content_type, entry.body, etag)
+                else:
+                    self._not_found()
+
+            def do_POST(self):  # noqa: N802 (http.server API)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if not self._authorized():
+                    return
+                if urlsplit(self.path).path != "/api/client_heartbeat":
+                    self._not_found()
+                    return
+                try:
+                    payload = json.loads(raw or b"{}")
+                except ValueError:
+                    payload = None
+                if not isinstance(payload, dict):
+                    self._send_json(400, {"error": "invalid JSON body"})
+                    return
+                self._send_json(*gateway.heartbeat(self._client(), payload))
+
+            def _not_found(self) -> None:
+                # Plain text, not JSON: clients take a JSON 404 for an
+                # endpoint's own answer and would keep probing for it.
+                self._send(404, "text/plain", b"not found")
+
+            def _send_json(self, code: int, body: dict) -> None:
+                self._send(code, "application/json", json.dumps(body).encode("utf-8"))
+
+            def _send(self, code: int, content_type: str, body: bytes,
+                      etag: Optional[str] = None) -> None:
+                self.send_response(code)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa: A002 (http.server API)
+                pass
+
+        return Handler
+
+
+def main() -> None:
+    logpipe.install(
+        level=config.LOG_LEVEL,
+        log_file=config.LOG_FILE,
+        max_bytes=config.LOG_MAX_BYTES,
+        backups=config.LOG_BACKUPS,
+        ring=config.LOG_RING,
+        async_=config.LOG_ASYNC,
+    )
+    gateway = Gateway(
+        config.SERVER_URL,
+        hold=config.GATEWAY_HOLD,
+        cache_ttl=config.GATEWAY_CACHE_TTL,
+        token=config.CLIENT_TOKEN,
+        host=config.GATEWAY_ADDR,
+        port=config.GATEWAY_PORT,
+        longpoll_timeout=config.LONGPOLL_TIMEOUT,
+        backoff=config.POLL_INTERVAL,
+    ).start()
+    logger.info("Gateway for %s listening on %s", config.SERVER_URL, gateway.url)
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        stopped.wait()
+    finally:
+        logger.info("Gateway stopping")
+        gateway.stop()
+        logpipe.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""End-to-end trigger-to-panel latency harness (B3).
+
+Runs the real client main() loop - long-poll, settings, /preview download
+and decode, conversion, artifact, heartbeat - against the in-process stand-in
+server and the panel emulator (epd_emulator, loaded through the real
+load_display_driver), fires manual triggers on a schedule and reports, per
+trigger:
+
+* begin: trigger -> epd.init() starts (the B3 AC22 measure, target < 2s)
+* panel: trigger -> epd.display() returns (new content physically on screen)
+
+    python3 latency_harness.py                                 # baseline, 10 triggers
+    python3 latency_harness.py --scenario slow-server --count 20 --interval 40
+    python3 latency_harness.py --scenario flapping --panel-scale 0.05 --json out.json
+
+Scenarios: baseline, slow-server (per-route response delays), blackhole
+(requests around every other trigger hang until the outage ends),
+flapping (the network drops for --outage/3 s every --outage s).
+
+A trigger is served by the first write whose /preview was fetched after it. A
+trigger that fires while an earlier write is still in flight is cleared by
+that write's heartbeat, like on the Go server: it counts as "absorbed" and its
+latency runs until the next such write, if any.
+
+--panel-scale shrinks the panel timings (1.0 = real: ~30s for a 6-color
+refresh); client log output is suppressed unless -v is given.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import client
+import config
+import epd_emulator
+import standin_server
+import timing
+from bench import _png_bytes, make_dithered_preview
+
+
+def _scenario_baseline(server, start, end, args):
+    pass
+
+
+def _scenario_slow_server(server, start, end, args):
+    server.delays.update({
+        "/api/refresh_status": 0.3,
+        "/settings": 0.5,
+        "/preview": 1.5,
+        "/api/client_heartbeat": 0.3,
+    })
+
+
+def _scenario_blackhole(server, start, end, args):
+    # An outage starting just before every other trigger: the trigger lands
+    # while the client's requests hang, recovery is read-timeout bound.
+    for i, at in enumerate(args.schedule):
+        if i % 2 == 1:
+            server.add_outage(start + at - 0.5, start + at - 0.5 + args.outage, "blackhole")
+
+
+def _scenario_flapping(server, start, end, args):
+    down = args.outage / 3
+    t = start
+    while t < end:
+        server.add_outage(t + args.outage - down, t + args.outage, "drop")
+        t += args.outage
+
+
+SCENARIOS: Dict[str, Callable] = {
+    "baseline": _scenario_baseline,
+    "slow-server": _scenario_slow_server,
+    "blackhole": _scenario_blackhole,
+    "flapping": _scenario_flapping,
+}
+
+
+def trigger_schedule(count: int, interval: float, jitter: float, seed: int) -> List[float]:
+    """Trigger offsets in seconds from the run start; jitter is +/- a fraction of interval."""
+    rng = random.Random(seed)
+    return [
+        i * interval + (rng.uniform(-jitter, jitter) * interval if i else 0.0)
+        for i in range(count)
+    ]
+
+
+def match_latencies(
+    triggers: List[float],
+    writes: List[tuple],
+    heartbeats: List[float] = (),
+    fetches: List[float] = (),
+) -> List[dict]:
+    """Pair every trigger with the first write showing content fetched after it.
+
+    A write's content was fetched by the last /preview request (fetches,
+    server arrival times) before its init; without fetches the init time
+    itself is used. Per trigger: begin/panel latency in seconds (None when no
+    such write happened) and absorbed - a heartbeat cleared the trigger
+    before that write's fetch (or at all, when there is no such write).
+    """
+    fetched = [
+        max((f for f in fetches if f <= init), default=init)
+        for init, _ in writes
+    ]
+    matched = []
+    for t in triggers:
+        index = next((i for i, at in enumerate(fetched) if at >= t), None)
+        write = writes[index] if index is not None else None
+        served_at = fetched[index] if index is not None else float("inf")
+        absorbed = any(t < h < served_at for h in heartbeats)
+        matched.append({
+            "begin": write[0] - t if write else None,
+            "panel": write[1] - t if write else None,
+            "absorbed": absorbed,
+        })
+    return matched
+
+
+def summarize(values: List[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "min_ms": round(ordered[0] * 1000, 1),
+        "p50_ms": round(timing.percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(timing.percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(timing.percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+class _ClientSandbox:
+    """Point the real client at the stand-in server; restore everything after."""
+
+    _CLIENT_STATE = (
+        "epd", "driver_name", "_timer", "_last_artifact",
+        "_last_fetch_hash", "_last_fetch_bytes", "_last_displayed_hash",
+        "_last_panel_write_monotonic", "_consecutive_hw_failures",
+        "_initial_display_done", "_hw_recovery_pending", "_preview_only",
+        "_offline_since", "_offline_refreshes", "_offline_written_hash",
+        "_last_refresh_monotonic", "_last_frame",
+    )
+
+    def __init__(self, server, driver: str, args) -> None:
+        self._scale = args.panel_scale
+        self._overrides = {
+            "SERVER_URL": server.url,
+            "CLIENT_TOKEN": "",
+            "DISPLAY_DRIVER": driver,
+            "POLL_INTERVAL": 1,
+            "LONGPOLL_TIMEOUT": args.hold + 2,
+            "HW_FAILURE_LIMIT": 0,
+            "METRICS_PORT": 0,
+            "METRICS_TEXTFILE": "",
+            "STAGE_TIMING": False,
+            "LAST_SENT_ASYNC": False,
+            "PANEL_EMULATOR": True,
+            "DRIVER_PROCESS": False,
+            "PANEL_EMULATOR_SCALE": args.panel_scale,
+            "PANEL_EMULATOR_OUTPUT": "",
+            "SERVER_URLS": "",
+            "PREVIEW_DELTA": False,
+            "PREVIEW_RESUME": 0,
+            "COMPOSITE": False,
+            "CAPABILITIES": False,
+            "PLAYLIST": False,
+            "TIMELINE_STEP": 0,
+            "LONGPOLL_ADAPTIVE": False,
+        }
+
+    def __enter__(self):
+        self._saved_client = {name: getattr(client, name) for name in self._CLIENT_STATE}
+        self._saved_config = {name: getattr(config, name) for name in self._overrides}
+        self._saved_signals = {
+            sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1)
+        }
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self._saved_config["LAST_SENT_PATH"] = config.LAST_SENT_PATH
+        config.LAST_SENT_PATH = os.path.join(self._tmpdir.name, "eink_last_sent.png")
+        for name, value in self._overrides.items():
+            setattr(config, name, value)
+        self.emulator = epd_emulator.install(self._scale)
+        client._timer = timing.StageTimer(enabled=False)
+        client._last_artifact = None
+        client._last_displayed_hash = None
+        return self
+
+    def __exit__(self, *exc_info):
+        epd_emulator.uninstall()
+        for sig, handler in self._saved_signals.items():
+            signal.signal(sig, handler)
+        for name, value in self._saved_client.items():
+            setattr(client, name, value)
+        for name, value in self._saved_config.items():
+            setattr(config, name, value)
+        self._tmpdir.cleanup()
+
+
+def run(args) -> dict:
+    """Run one scenario; must be called from the main thread (main() installs
+    signal handlers). Returns the JSON report."""
+    width, height = epd_emulator.DRIVER_PROFILES[args.driver]["size"]
+    server = standin_server.StandinServer(
+        _png_bytes(make_dithered_preview(width, height)),
+        settings={"display": {
+            "driver": args.driver,
+            "width": width,
+            "height": height,
+            "colors": standin_server.COLOR_SETTINGS["display"]["colors"]
+            if args.driver == "epd7in3e" else ["#000000", "#FFFFFF"],
+        }},
+        hold=args.hold,
+    ).start()
+    triggers: List[float] = []
+    errors: List[BaseException] = []
+    sandbox = _ClientSandbox(server, args.driver, args)
+
+    def drive():
+        try:
+            # The unconditional startup write (and its heartbeat) comes first;
+            # triggers start after it.
+            profile = epd_emulator.DRIVER_PROFILES[args.driver]
+            deadline = time.monotonic() + 60 + profile["display"] * args.panel_scale
+            while not server.heartbeat_times and time.monotonic() < deadline:
+                time.sleep(0.01)
+            start = time.monotonic()
+            end = start + args.schedule[-1] + args.settle
+            SCENARIOS[args.scenario](server, start, end, args)
+            for offset in args.schedule:
+                time.sleep(max(0.0, start + offset - time.monotonic()))
+                triggers.append(server.trigger("manual"))
+            # Stop main() once the last trigger is served, or once a heartbeat
+            # cleared it without a write starting after it (absorbed), or at
+            # the settle deadline.
+            deadline = time.monotonic() + args.settle
+            while time.monotonic() < deadline:
+                last = match_latencies(
+                    triggers[-1:], list(sandbox.emulator.writes),
+                    fetches=list(server.preview_times),
+                )[0]
+                if last["begin"] is not None or not server.should_refresh:
+                    break
+                time.sleep(0.05)
+        except BaseException as e:  # reported, never swallowed
+            errors.append(e)
+        finally:
+            handler = signal.getsignal(signal.SIGTERM)
+            if callable(handler):
+                handler(signal.SIGTERM, None)
+            server.release()
+
+    logger = logging.getLogger("eink-client")
+    level = logger.level
+    if not args.verbose:
+        logger.setLevel(logging.CRITICAL)
+    try:
+        with sandbox:
+            driver_thread = threading.Thread(target=drive, name="eink-latency-driver", daemon=True)
+            driver_thread.start()
+            client.main()
+            driver_thread.join(timeout=5)
+    finally:
+        logger.setLevel(level)
+        server.stop()
+    if errors:
+        raise errors[0]
+
+    matched = match_latencies(
+        triggers, list(sandbox.emulator.writes), list(server.heartbeat_times),
+        list(server.preview_times),
+    )
+    served = [m for m in matched if m["begin"] is not None]
+    return {
+        "scenario": args.scenario,
+        "driver": args.driver,
+        "panel_scale": args.panel_scale,
+        "triggers": len(triggers),
+        "served": len(served),
+        "absorbed": sum(m["absorbed"] for m in matched),
+        "unserved": len(triggers) - len(served),
+        "begin": summarize([m["begin"] for m in served]),
+        "panel": summarize([m["panel"] for m in served]),
+        "requests": dict(server.requests),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"scenario {report['scenario']} ({report['driver']}, panel x{report['panel_scale']:g}): "
+        f"{report['served']}/{report['triggers']} triggers served "
+        f"({report['absorbed']} absorbed by an in-flight write, {report['unserved']} unserved)"
+    ]
+    for key, label in (("begin", "trigger -> init  "), ("panel", "trigger -> panel ")):
+        s = report[key]
+        if s:
+            lines.append(
+                f"  {label} p50={s['p50_ms']:.0f}ms p95={s['p95_ms']:.0f}ms "
+                f"p99={s['p99_ms']:.0f}ms max={s['max_ms']:.0f}ms"
+            )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Trigger-to-panel latency harness")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="baseline")
+    parser.add_argument("--driver", choices=sorted(epd_emulator.DRIVER_PROFILES), default="epd7in3e")
+    parser.add_argument("--count", type=int, default=10, help="number of triggers")
+    parser.add_argument("--interval", type=float, default=45.0,
+                        help="seconds between triggers (default %(default)s)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="random +/- fraction of the interval per trigger")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--panel-scale", type=float, default=1.0,
+                        help="multiplier on the panel timings (1.0 = real hardware)")
+    parser.add_argument("--hold", type=float, default=5.0,
+                        help="stand-in long-poll hold in seconds (Go server: 25)")
+    parser.add_argument("--outage", type=float, default=3.0,
+                        help="outage length (blackhole) / flap period (flapping) in seconds")
+    parser.add_argument("--settle", type=float, default=None,
+                        help="max wait for the last trigger's write (default: interval + 10s)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show client logs")
+    args = parser.parse_args(argv)
+    if args.count < 1:
+        parser.error("--count must be >= 1")
+    if args.settle is None:
+        args.settle = args.interval + 10
+    args.schedule = trigger_schedule(args.count, args.interval, args.jitter, args.seed)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    args = parse_args(argv)
+    report = run(args)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
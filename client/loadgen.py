@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""Virtual fleet load generator for server capacity planning.
+
+Simulates hundreds to thousands of panels against one server with the
+client's own request code - get_refresh_status(), fetch_display_config(),
+fetch_preview() and send_heartbeat(), i.e. the same paths, auth header,
+timeouts and long-poll read timeout as client.py - and reports what the
+server delivered: per-endpoint latency percentiles (request sent -> response
+body read) and error rates.
+
+    python3 loadgen.py --panels 200 --duration 120                # local stand-in server
+    python3 loadgen.py --url http://eink-server:5000 --token "$EINK_CLIENT_TOKEN" \\
+        --panels 1000 --processes 8 --duration 600 --storm-every 300
+
+Each virtual panel behaves like main(): an unconditional startup fetch,
+write and heartbeat, then back-to-back long-polls. A due refresh fetches
+/settings and /preview, "writes" the panel - the think time is the driver's
+real busy time (epd_emulator.DRIVER_PROFILES, init + display + sleep) times
+--panel-scale, +/-10% - and sends the heartbeat; an interval refresh with
+unchanged content skips the write like the content skip (E5.2). A failed
+poll or a due refresh without progress backs off --backoff seconds.
+
+Reconnect storms (--storm-every): the whole fleet reboots at once, as after
+a power or network outage. Every panel abandons its session (a parked
+long-poll stays open until the server answers it, like a half-open
+connection) and starts over with the startup sequence within
+--storm-spread seconds.
+
+Panels are threads; --processes spreads them over worker processes so PNG
+decoding in the generator (GIL) does not distort the latencies at scale.
+Without --url an in-process stand-in server is started and triggered every
+--trigger-every seconds (reason "interval"); against a real server, trigger
+refreshes from the web UI or let the server's interval do it.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import client
+import config
+import epd_emulator
+import standin_server
+from bench import _png_bytes, make_dithered_preview
+from latency_harness import summarize
+
+REFRESH_STATUS = "/api/refresh_status"
+
+# A worker process needs time to import the client stack before the
+# synchronized start.
+PROCESS_START_DELAY = 3.0
+
+
+class _Recorder:
+    """Times every server request of the virtual panels.
+
+    Wraps client._server_get/_server_post, so the measured span is exactly
+    the client's request (connect, server time, body read). Samples are
+    (endpoint, code, seconds); code is the HTTP status or the exception type
+    name, like the client's eink_client_http_errors_total labels. Long-polls
+    are split into "held" (nothing due - the server's hold) and "due" (a
+    parked poll woken by a trigger includes its time parked).
+    """
+
+    def __init__(self) -> None:
+        self.samples: List[Tuple[str, str, float]] = []
+        self.local = threading.local()  # preview_digest of this panel's last fetch
+        self._lock = threading.Lock()
+
+    def _add(self, endpoint: str, code: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.append((endpoint, code, seconds))
+
+    def wrap_get(self, original):
+        def timed_get(path, *args, **kwargs):
+            endpoint = path.split("?", 1)[0]
+            start = time.monotonic()
+            try:
+                resp = original(path, *args, **kwargs)
+            except Exception as e:
+                self._add(endpoint, type(e).__name__, time.monotonic() - start)
+                raise
+            elapsed = time.monotonic() - start
+            if endpoint == REFRESH_STATUS and resp.ok:
+                try:
+                    due = bool(resp.json().get("should_refresh"))
+                except Exception:
+                    due = False
+                endpoint += " (due)" if due else " (held)"
+            elif endpoint == "/preview" and resp.ok:
+                self.local.preview_digest = hashlib.sha256(resp.content).hexdigest()
+            self._add(endpoint, str(resp.status_code), elapsed)
+            return resp
+        return timed_get
+
+    def wrap_post(self, original):
+        def timed_post(path, *args, **kwargs):
+            start = time.monotonic()
+            try:
+                resp = original(path, *args, **kwargs)
+            except Exception as e:
+                self._add(path, type(e).__name__, time.monotonic() - start)
+                raise
+            self._add(path, str(resp.status_code), time.monotonic() - start)
+            return resp
+        return timed_post
+
+
+class _ClientPatch:
+    """Route the client's request layer through a _Recorder; restore on exit.
+
+    The fleet has no hardware: load_display_driver() only records the driver
+    name, so a /settings driver change never touches waveshare_epd.
+    """
+
+    _CLIENT_STATE = (
+        "_server_get", "_server_post", "load_display_driver", "driver_name",
+        "_heartbeat_telemetry_accepted", "_auth_error_logged",
+    )
+
+    def __init__(self, spec: dict, recorder: _Recorder) -> None:
+        self._recorder = recorder
+        self._overrides = {
+            "SERVER_URL": spec["url"],
+            "CLIENT_TOKEN": spec["token"],
+            "LONGPOLL_TIMEOUT": spec["longpoll_timeout"],
+        }
+        self._driver = spec["driver"]
+
+    def __enter__(self) -> "_ClientPatch":
+        self._saved_client = {name: getattr(client, name) for name in self._CLIENT_STATE}
+        self._saved_config = {name: getattr(config, name) for name in self._overrides}
+        for name, value in self._overrides.items():
+            setattr(config, name, value)
+        client._server_get = self._recorder.wrap_get(client._server_get)
+        client._server_post = self._recorder.wrap_post(client._server_post)
+        client.load_display_driver = lambda name: setattr(client, "driver_name", name)
+        client.driver_name = self._driver
+        self._logger = logging.getLogger("eink-client")
+        self._log_level = self._logger.level
+        self._logger.setLevel(logging.CRITICAL)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._logger.setLevel(self._log_level)
+        for name, value in self._saved_client.items():
+            setattr(client, name, value)
+        for name, value in self._saved_config.items():
+            setattr(config, name, value)
+
+
+class _Shard:
+    """The virtual panels of one process, each a thread per boot ("generation")."""
+
+    def __init__(self, spec: dict, recorder: _Recorder) -> None:
+        self.spec = spec
+        self.recorder = recorder
+        self.generation = 0
+        self.outcomes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        profile = epd_emulator.DRIVER_PROFILES[spec["driver"]]
+        self._write_seconds = (
+            profile["init"] + profile["display"] + profile["sleep"]
+        ) * spec["panel_scale"]
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def _alive(self, generation: int) -> bool:
+        return generation == self.generation and time.monotonic() < self.stop_at
+
+    def _sleep(self, seconds: float, generation: int) -> None:
+        end = time.monotonic() + seconds
+        while self._alive(generation) and time.monotonic() < end:
+            time.sleep(min(0.25, max(0.0, end - time.monotonic())))
+
+    def _refresh(
+        self, rng: random.Random, last: List[Optional[str]], reason: Optional[str], generation: int
+    ) -> bool:
+        """One fetch + write + heartbeat; True when a heartbeat was sent.
+
+        A storm during the write abandons it: a rebooted panel sends no
+        heartbeat for the old session.
+        """
+        display_config = client.fetch_display_config()
+        self.recorder.local.preview_digest = None
+        if client.fetch_preview(display_config.get("panel_image_mode", "dithered")) is None:
+            self._count("no_preview")
+            return False
+        digest = self.recorder.local.preview_digest
+        if self.spec["content_skip"] and reason == "interval" and digest == last[0]:
+            self._count("skipped")
+            client.send_heartbeat("skipped", reason, skip_reason="content_unchanged")
+            return True
+        self._sleep(self._write_seconds * rng.uniform(0.9, 1.1), generation)
+        if generation != self.generation:
+            return False
+        last[0] = digest
+        self._count("refreshed")
+        client.send_heartbeat("refreshed", reason)
+        return True
+
+    def _panel(self, index: int, generation: int, delay: float) -> None:
+        rng = random.Random(self.spec["seed"] * 100003 + index * 101 + generation)
+        last: List[Optional[str]] = [None]  # digest on the (virtual) panel
+        self._sleep(delay, generation)
+        initial_done = False
+        while self._alive(generation):
+            if not initial_done:
+                initial_done = self._refresh(rng, last, "startup", generation)
+                if not initial_done:
+                    self._sleep(self.spec["backoff"], generation)
+                continue
+            status = client.get_refresh_status()
+            if not self._alive(generation):
+                break
+            repoll = bool(status)
+            if status.get("should_refresh", False):
+                repoll = self._refresh(rng, last, status.get("reason"), generation) and repoll
+            if not repoll:
+                self._count("backoff")
+                self._sleep(self.spec["backoff"], generation)
+
+    def _boot(self, delays: List[float]) -> None:
+        generation = self.generation
+        for index, delay in zip(self.spec["panel_ids"], delays):
+            thread = threading.Thread(
+                target=self._panel, args=(index, generation, delay),
+                name=f"eink-vpanel-{index}", daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def run(self) -> None:
+        spec = self.spec
+        rng = random.Random(spec["seed"])
+        start = time.monotonic() + max(0.0, spec["start"] - time.time())
+        self.stop_at = start + spec["duration"]
+        time.sleep(max(0.0, start - time.monotonic()))
+        self._boot([rng.uniform(0, spec["ramp"]) for _ in spec["panel_ids"]])
+        for offset in spec["storms"]:
+            time.sleep(max(0.0, start + offset - time.monotonic()))
+            self.generation += 1
+            self._count("storm")
+            self._boot([rng.uniform(0, spec["storm_spread"]) for _ in spec["panel_ids"]])
+        time.sleep(max(0.0, self.stop_at - time.monotonic()))
+        # In-flight requests finish (and are recorded) within their timeouts.
+        drain_until = time.monotonic() + spec["drain"]
+        for thread in self._threads:
+            thread.join(max(0.0, drain_until - time.monotonic()))
+
+
+def _run_shard(spec: dict) -> dict:
+    """Run one shard of the fleet (in-process or as a pool worker)."""
+    recorder = _Recorder()
+    shard = _Shard(spec, recorder)
+    with _ClientPatch(spec, recorder):
+        shard.run()
+    return {"samples": list(recorder.samples), "outcomes": dict(shard.outcomes)}
+
+
+def storm_schedule(duration: float, every: float) -> List[float]:
+    """Storm offsets from the run start: every `every` seconds, none at 0."""
+    if every <= 0:
+        return []
+    count = int(duration // every)
+    return [i * every for i in range(1, count + 1) if i * every < duration]
+
+
+def run_fleet(
+    url: str,
+    panels: int,
+    duration: float,
+    processes: int = 0,
+    token: str = "",
+    driver: str = "epd7in3e",
+    panel_scale: float = 1.0,
+    ramp: float = 10.0,
+    storm_every: float = 0.0,
+    storm_spread: float = 2.0,
+    backoff: float = 30.0,
+    longpoll_timeout: float = 30.0,
+    content_skip: bool = True,
+    seed: int = 1,
+) -> dict:
+    """Run the fleet and return the JSON report.
+
+    processes=0 runs every panel as a thread of this process (tests, small
+    fleets); otherwise the panels are split round-robin over that many
+    worker processes that start in sync.
+    """
+    storms = storm_schedule(duration, storm_every)
+    start = time.time() + (PROCESS_START_DELAY if processes > 0 else 0.0)
+    base = {
+        "url": url, "token": token, "driver": driver, "panel_scale": panel_scale,
+        "duration": duration, "ramp": ramp, "storms": storms,
+        "storm_spread": storm_spread, "backoff": backoff,
+        "longpoll_timeout": longpoll_timeout, "content_skip": content_skip,
+        "seed": seed, "start": start, "drain": longpoll_timeout + 5,
+    }
+    shards = max(1, processes)
+    specs = [
+        dict(base, panel_ids=list(range(i, panels, shards)), seed=seed + i)
+        for i in range(shards)
+    ]
+    if processes > 0:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_run_shard, specs))
+    else:
+        results = [_run_shard(specs[0])]
+    return build_report(results, panels, processes, duration, storms)
+
+
+def build_report(
+    results: List[dict], panels: int, processes: int, duration: float, storms: List[float],
+) -> dict:
+    """Merge shard results into per-endpoint latency percentiles and error rates."""
+    by_endpoint: Dict[str, List[Tuple[str, float]]] = {}
+    outcomes: Dict[str, int] = {}
+    for result in results:
+        for endpoint, code, seconds in result["samples"]:
+            by_endpoint.setdefault(endpoint, []).append((code, seconds))
+        for outcome, count in result["outcomes"].items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+    # Storms are counted once per shard; report them once per fleet.
+    if "storm" in outcomes:
+        outcomes["storm"] = len(storms)
+
+    endpoints = {}
+    total = failed = 0
+    for endpoint, samples in sorted(by_endpoint.items()):
+        errors: Dict[str, int] = {}
+        for code, _ in samples:
+            if not code.startswith("2"):
+                errors[code] = errors.get(code, 0) + 1
+        ok = [seconds for code, seconds in samples if code.startswith("2")]
+        n_errors = sum(errors.values())
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "errors": errors,
+            "error_rate": round(n_errors / len(samples), 4),
+            "latency": summarize(ok),
+        }
+        total += len(samples)
+        failed += n_errors
+    return {
+        "panels": panels,
+        "processes": processes,
+        "duration": duration,
+        "storms": len(storms),
+        "requests": total,
+        "throughput_rps": round(total / duration, 2) if duration > 0 else 0.0,
+        "error_rate": round(failed / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+        "outcomes": outcomes,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['panels']} panels x {report['duration']:g}s "
+        f"({report['processes'] or 'in-process'} processes, {report['storms']} storms): "
+        f"{report['requests']} requests, {report['throughput_rps']:g} req/s, "
+        f"{report['error_rate'] * 100:.1f}% errors"
+    ]
+    width = max((len(name) for name in report["endpoints"]), default=0)
+    for name, row in report["endpoints"].items():
+        s = row["latency"]
+        latency = (
+            f"p50={s['p50_ms']:.0f}ms p95={s['p95_ms']:.0f}ms "
+            f"p99={s['p99_ms']:.0f}ms max={s['max_ms']:.0f}ms" if s else "no successful requests"
+        )
+        lines.append(
+            f"  {name:<{width}}  n={row['requests']:<6} err={row['error_rate'] * 100:.1f}%  {latency}"
+        )
+        if row["errors"]:
+            lines.append("  " + " " * width + "  errors: " + ", ".join(
+                f"{code} x{count}" for code, count in sorted(row["errors"].items())
+            ))
+    if report["outcomes"]:
+        lines.append("  panels: " + ", ".join(
+            f"{count} {outcome}" for outcome, count in sorted(report["outcomes"].items())
+        ))
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Virtual fleet load generator")
+    parser.add_argument("--url", help="server base URL (default: in-process stand-in server)")
+    parser.add_argument("--token", default=config.CLIENT_TOKEN,
+                        help="X-Client-Token (default: EINK_CLIENT_TOKEN)")
+    parser.add_argument("--panels", type=int, default=100)
+    parser.add_argument("--processes", type=int, default=0,
+                        help="worker processes (0 = all panels as threads of this process)")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds")
+    parser.add_argument("--driver", choices=sorted(epd_emulator.DRIVER_PROFILES), default="epd7in3e")
+    parser.add_argument("--panel-scale", type=float, default=1.0,
+                        help="multiplier on the panel write think time (1.0 = real hardware)")
+    parser.add_argument("--ramp", type=float, default=10.0,
+                        help="panels boot spread over this many seconds")
+    parser.add_argument("--storm-every", type=float, default=0.0,
+                        help="reboot the whole fleet every N seconds (0 = off)")
+    parser.add_argument("--storm-spread", type=float, default=2.0,
+                        help="reboots of one storm spread over this many seconds")
+    parser.add_argument("--backoff", type=float, default=float(config.POLL_INTERVAL),
+                        help="reconnect backoff in seconds (default: EINK_POLL_INTERVAL)")
+    parser.add_argument("--longpoll-timeout", type=float, default=float(config.LONGPOLL_TIMEOUT),
+                        help="long-poll read timeout (default: EINK_LONGPOLL_TIMEOUT)")
+    parser.add_argument("--no-content-skip", action="store_true",
+                        help="always write, like EINK_CONTENT_SKIP=false")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--hold", type=float, default=25.0,
+                        help="stand-in only: long-poll hold in seconds")
+    parser.add_argument("--trigger-every", type=float, default=30.0,
+                        help="stand-in only: trigger an interval refresh every N seconds (0 = never)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+    if args.panels < 1:
+        parser.error("--panels must be >= 1")
+    if args.processes < 0:
+        parser.error("--processes must be >= 0")
+    return args
+
+
+def _trigger_loop(server, every: float, stop: threading.Event) -> None:
+    while not stop.wait(every):
+        server.trigger("interval")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    args = parse_args(argv)
+    server = None
+    stop = threading.Event()
+    url = args.url
+    if url is None:
+        width, height = epd_emulator.DRIVER_PROFILES[args.driver]["size"]
+        server = standin_server.StandinServer(
+            _png_bytes(make_dithered_preview(width, height)), hold=args.hold
+        ).start()
+        server.settings = {"display": dict(server.settings["display"], driver=args.driver)}
+        url = server.url
+        if args.trigger_every > 0:
+            threading.Thread(
+                target=_trigger_loop, args=(server, args.trigger_every, stop),
+                name="eink-loadgen-trigger", daemon=True,
+            ).start()
+    try:
+        report = run_fleet(
+            url, args.panels, args.duration, processes=args.processes,
+            token=args.token, driver=args.driver, panel_scale=args.panel_scale,
+            ramp=args.ramp, storm_every=args.storm_every,
+            storm_spread=args.storm_spread, backoff=args.backoff,
+            longpoll_timeout=args.longpoll_timeout,
+            content_skip=not args.no_content_skip, seed=args.seed,
+        )
+    finally:
+        stop.set()
+        if server is not None:
+            server.stop()
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
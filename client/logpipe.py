@@ -0,0 +1,188 @@
+"""Non-blocking logging for SD-card deployments.
+
+install() replaces the synchronous logging.basicConfig() setup. Logging calls
+only append the unformatted LogRecord to an in-memory queue; a listener
+thread formats and writes them, so a slow or contended SD card never stalls
+the refresh loop:
+
+    caller --QueueHandler--> SimpleQueue --QueueListener thread-->
+        RingBufferHandler --> RotatingFileHandler (EINK_LOG_FILE) or stderr
+
+- Lazy formatting: "msg % args" runs on the listener thread, and only for
+  records that are actually written. Pass arguments, never pre-formatted
+  strings (test_logpipe.py enforces this for the client modules); arguments
+  must not be mutated after the call.
+- Ring buffer: records below EINK_LOG_LEVEL (debug lines of the
+  "eink-client" logger) are kept in memory only, the last EINK_LOG_RING of
+  them. They reach the disk only when an ERROR (or worse) is logged, written
+  right before it - full context for a failure, no wear in normal operation.
+- Bounded queue: when the writer falls more than QUEUE_SIZE records behind,
+  new records are dropped (never blocking the caller) and a single warning
+  with the drop count is logged once the queue has room again.
+- Rotation: with EINK_LOG_FILE set, the file is rotated at EINK_LOG_MAX_BYTES
+  keeping EINK_LOG_BACKUPS old files. Without it the records go to stderr,
+  which the systemd unit appends to logs/client.log (rotated by logrotate).
+
+SimpleQueue.put() is reentrant, so logging from a signal handler (shutdown,
+SIGUSR1) cannot deadlock against a logging call it interrupted.
+"""
+
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import List, Optional, Tuple
+
+FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+QUEUE_SIZE = 10000
+CLIENT_LOGGER = "eink-client"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handlers: List[logging.Handler] = []  # [queue handler, ring] or [ring] while installed
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never formats in the caller and never blocks it."""
+
+    def __init__(self, log_queue: queue.SimpleQueue, maxsize: int = QUEUE_SIZE) -> None:
+        super().__init__(log_queue)
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() runs format() here; the listener does it instead.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= self.maxsize:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.queue.put_nowait(logging.getLogger(CLIENT_LOGGER).makeRecord(
+                CLIENT_LOGGER, logging.WARNING, __file__, 0,
+                "Logging queue full: %d log records dropped", (dropped,), None,
+            ))
+        self.queue.put_nowait(record)
+
+
+class RingBufferHandler(logging.Handler):
+    """Writes records at/above `threshold` to `target`; keeps the rest in a ring.
+
+    The ring (the last `capacity` records below the threshold) is written to
+    `target` right before any record at/above `flush_level`, then cleared.
+    """
+
+    def __init__(
+        self,
+        target: logging.Handler,
+        threshold: int,
+        capacity: int,
+        flush_level: int = logging.ERROR,
+    ) -> None:
+        super().__init__()
+        self.target = target
+        self.threshold = threshold
+        self.flush_level = flush_level
+        self.ring: collections.deque = collections.deque(maxlen=max(capacity, 0))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.levelno < self.threshold:
+            if self.ring.maxlen:
+                self.ring.append(record)
+            return
+        if record.levelno >= self.flush_level and self.ring:
+            buffered = list(self.ring)
+            self.ring.clear()
+            for earlier in buffered:
+                self.target.handle(earlier)
+        self.target.handle(record)
+
+    def flush(self) -> None:
+        self.target.flush()
+
+    def close(self) -> None:
+        self.target.close()
+        super().close()
+
+
+def _sink(log_file: str, max_bytes: int, backups: int) -> Tuple[logging.Handler, Optional[str]]:
+    """The writing handler, plus an error to log once logging is up."""
+    if not log_file:
+        return logging.StreamHandler(sys.stderr), None
+    try:
+        return logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        ), None
+    except OSError as e:
+        return logging.StreamHandler(sys.stderr), f"{log_file}: {e}"
+
+
+def install(
+    level: str = "INFO",
+    log_file: str = "",
+    max_bytes: int = 1048576,
+    backups: int = 3,
+    ring: int = 200,
+    async_: bool = True,
+) -> None:
+    """Configure the root logger; a no-op when it already has handlers.
+
+    Like logging.basicConfig(), so entry points that configured logging
+    before importing client keep their setup.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    threshold = getattr(logging, level.upper())
+    sink, error = _sink(log_file, max_bytes, backups)
+    sink.setFormatter(logging.Formatter(FORMAT))
+    handler: logging.Handler = RingBufferHandler(sink, threshold, ring)
+    _handlers[:] = [handler]
+    if async_:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        atexit.register(stop)
+        handler = NonBlockingQueueHandler(log_queue)
+        _handlers.insert(0, handler)
+    root.addHandler(handler)
+    root.setLevel(threshold)
+    if ring > 0 and threshold > logging.DEBUG:
+        # Only the client's own debug lines feed the ring; third-party
+        # loggers (PIL, urllib3) stay at the configured level.
+        logging.getLogger(CLIENT_LOGGER).setLevel(logging.DEBUG)
+    if error:
+        logging.getLogger(CLIENT_LOGGER).error("EINK_LOG_FILE not usable, logging to stderr: %s", error)
+
+
+def stop() -> None:
+    """Drain the queue (written in order) and stop the listener thread.
+
+    Later records (shutdown, atexit, uncaught exceptions) are written
+    synchronously through the same ring and sink.
+    """
+    global _listener
+    listener, _listener = _listener, None
+    if listener is None:
+        return
+    root = logging.getLogger()
+    queued, ring = _handlers
+    root.addHandler(ring)
+    root.removeHandler(queued)
+    _handlers[:] = [ring]
+    listener.stop()
+    ring.flush()
+
+
+def uninstall() -> None:
+    """stop() and remove what install() added (tests)."""
+    stop()
+    if _handlers:
+        logging.getLogger().removeHandler(_handlers[0])
+        _handlers[0].close()
+        _handlers.clear()
+        logging.getLogger(CLIENT_LOGGER).setLevel(logging.NOTSET)
@@ -0,0 +1,156 @@
+"""Adaptive long-poll hold (EINK_LONGPOLL_ADAPTIVE).
+
+The Go server holds GET /api/refresh_status for a fixed 25s, the client's
+read timeout (EINK_LONGPOLL_TIMEOUT) is tuned against that by hand, and a
+NAT or proxy that drops idle connections sooner silently breaks every poll.
+With adaptive holds the client asks for the hold instead:
+
+    GET /api/refresh_status?hold=<seconds>
+
+A server that honors the parameter clamps it to its own bounds and reports
+the hold it used as "hold" in the answer; the client's read timeout is the
+requested hold plus MARGIN. An answer without "hold" comes from a server
+with a fixed hold, and the client stops asking for the rest of the process.
+Until the first answer with "hold" the read timeout stays at least
+EINK_LONGPOLL_TIMEOUT, so a fixed-hold server gets to give that answer
+even when the hold asked for is shorter than its own.
+
+HoldTuner picks the hold within [min_hold, max_hold]:
+
+- GROW_AFTER polls in a row that the server held to the end (nothing was
+  due) grow the hold by GROW, up to just below the ceiling;
+- a poll that broke off after it was accepted (connection reset, read
+  timeout once the server has proven it honors the hold) means something
+  on the path drops idle connections sooner: the
+  time it survived becomes the ceiling and the hold drops to half of it.
+  The client re-polls at once, so a trigger is late by one reconnect at
+  most. The ceiling is forgotten after CEILING_TTL, so a network that
+  changed is probed again;
+- answers cut short by a trigger, refused connections and connect timeouts
+  say nothing about the path.
+
+Every poll is one reconnect of the long-poll; reconnects_per_hour() is the
+churn over the last hour, the figure the tuner drives down.
+"""
+
+import collections
+import logging
+import time
+from typing import Callable, Deque, Optional
+
+logger = logging.getLogger("eink-client")
+
+# Read timeout on top of the requested hold.
+MARGIN = 5.0
+# The Go server's fixed hold: the first hold asked for.
+START_HOLD = 25.0
+GROW_AFTER = 3
+GROW = 1.5
+# A grown hold stays this far below the ceiling.
+HEADROOM = 0.9
+CEILING_TTL = 6 * 3600.0
+# A poll failing sooner than this never got to be held.
+MIN_BREAK = 1.0
+
+
+class HoldTuner:
+    """The hold to ask the server for, learned from how polls end."""
+
+    def __init__(
+        self,
+        min_hold: float,
+        max_hold: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_hold = min_hold
+        self.max_hold = max(min_hold, max_hold)
+        self.clock = clock
+        self.hold = round(min(self.max_hold, max(self.min_hold, START_HOLD)), 1)
+        self.supported = True
+        self.proven = False  # an answer carried "hold"
+        self.ceiling: Optional[float] = None
+        self.ceiling_at = 0.0
+        self.streak = 0
+        self.broken = 0
+        self._polls: Deque[float] = collections.deque()
+
+    def request(self, limit: Optional[float] = None) -> Optional[float]:
+        """The hold for the next poll, at most limit; None once the server ignores it."""
+        if not self.supported:
+            return None
+        now = self.clock()
+        self._trim(now)
+        self._polls.append(now)
+        if self.ceiling is not None and now - self.ceiling_at > CEILING_TTL:
+            self.ceiling = None
+        hold = self.hold if limit is None else max(self.min_hold, min(self.hold, limit))
+        return round(hold, 1)
+
+    def answered(self, hold: float, status: dict) -> None:
+        """A poll for hold got status."""
+        granted = status.get("hold")
+        if not isinstance(granted, (int, float)) or isinstance(granted, bool):
+            self.supported = False
+            logger.info("Server has a fixed long-poll hold - adaptive hold off")
+            return
+        self.proven = True
+        if granted < hold:  # the server's own bound
+            self._set(max(self.min_hold, float(granted)), f"server allows {granted:g}s")
+        if status.get("should_refresh") or hold < self.hold:
+            return  # cut short by a trigger, or capped by the caller: nothing learned
+        self.streak += 1
+        if self.streak < GROW_AFTER:
+            return
+        self.streak = 0
+        target = self.hold * GROW
+        if self.ceiling is not None:
+            target = min(target, self.ceiling * HEADROOM)
+        if target > self.hold:
+            self._set(min(self.max_hold, target), "holds survive")
+
+    def read_timeout(self, hold: float, floor: float) -> float:
+        """The read timeout of a poll for hold; at least floor until proven."""
+        return hold + MARGIN if self.proven else max(hold + MARGIN, floor)
+
+    def failed(self, hold: float, elapsed: float, timed_out: bool = False) -> bool:
+        """A poll for hold failed after elapsed seconds (not a connect timeout);
+        True when it broke while held.
+
+        A read timeout before the server proved it honors the hold may just
+        be a server holding longer than asked: nothing is learned from it.
+        """
+        if not self.supported or elapsed < MIN_BREAK or (timed_out and not self.proven):
+            return False
+        self.broken += 1
+        self.streak = 0
+        survived = min(elapsed, hold)
+        self.ceiling = survived if self.ceiling is None else min(self.ceiling, survived)
+        self.ceiling_at = self.clock()
+        self._set(max(self.min_hold, min(self.hold, survived) / 2),
+                  f"poll broke after {elapsed:.0f}s")
+        return True
+
+    def reconnects_per_hour(self) -> int:
+        self._trim(self.clock())
+        return len(self._polls)
+
+    def _trim(self, now: float) -> None:
+        """Drop polls older than an hour (also when nobody reads the rate)."""
+        cutoff = now - 3600.0
+        while self._polls and self._polls[0] < cutoff:
+            self._polls.popleft()
+
+    def snapshot(self) -> dict:
+        """Heartbeat telemetry."""
+        return {
+            "hold": self.hold if self.supported else None,
+            "ceiling": None if self.ceiling is None else round(self.ceiling, 1),
+            "broken": self.broken,
+            "reconnects_per_hour": self.reconnects_per_hour(),
+        }
+
+    def _set(self, hold: float, why: str) -> None:
+        hold = round(hold, 1)
+        if hold != self.hold:
+            logger.info("Long-poll hold %gs -> %gs (%s)", self.hold, hold, why)
+            self.hold = hold
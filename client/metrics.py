@@ -0,0 +1,298 @@
+"""Prometheus-compatible metrics for the E-Ink client.
+
+A tiny, dependency-free registry (counters, gauges, histograms) rendered in
+the Prometheus text exposition format 0.0.4, plus two optional exports:
+
+* MetricsServer - a local HTTP endpoint (GET /metrics) on its own daemon
+  thread; a scrape never runs on the refresh loop.
+* TextfileWriter - periodically writes the exposition atomically (temp file +
+  os.replace) for node_exporter's textfile collector.
+
+Updates take one short registry lock; rendering copies the values under that
+lock and formats outside it, and callback gauges are evaluated on the
+scraping thread.
+"""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("eink-client")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Default latency buckets (seconds): long-poll holds and the ~30s 6-color
+# refresh need the upper range, hashes and conversions the lower one.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "Registry", name: str, help_text: str,
+                 labels: Sequence[str] = ()) -> None:
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {sorted(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally labelled."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._registry.lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.label_names, key), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly or computed by a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, fn: Optional[Callable[[], Optional[float]]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._fn = fn
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = float(value)
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, _format_labels(self.label_names, key), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram, optionally labelled."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = SECONDS_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [per-bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._registry.lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels: str) -> float:
+        with self._registry.lock:
+            state = self._values.get(self._key(labels))
+            return state[-1] if state else 0.0
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        for key, state in sorted(self._values.items()):
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets, state):
+                cumulative += hits
+                samples.append((
+                    f"{self.name}_bucket",
+                    _format_labels(self.label_names + ("le",), key + (_format_value(bound),)),
+                    cumulative,
+                ))
+            labels = _format_labels(self.label_names, key)
+            samples.append((f"{self.name}_sum", labels, state[-2]))
+            samples.append((f"{self.name}_count", labels, state[-1]))
+        return samples
+
+
+class Registry:
+    """Ordered collection of metrics sharing one update lock."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self, name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str] = (),
+              fn: Optional[Callable[[], Optional[float]]] = None) -> Gauge:
+        return self._add(Gauge(self, name, help_text, labels, fn=fn))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Iterable[float] = SECONDS_BUCKETS) -> Histogram:
+        return self._add(Histogram(self, name, help_text, labels, buckets=buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition of all metrics.
+
+        Callback gauges run first, outside the lock; a failing or None-returning
+        callback simply omits its sample.
+        """
+        computed: Dict[str, float] = {}
+        for metric in self._metrics:
+            if isinstance(metric, Gauge) and metric._fn is not None:
+                try:
+                    value = metric._fn()
+                except Exception:
+                    value = None
+                if value is not None:
+                    computed[metric.name] = float(value)
+        with self.lock:
+            blocks = [
+                (metric, metric._samples())
+                for metric in self._metrics
+            ]
+        lines = []
+        for metric, samples in blocks:
+            if metric.name in computed:
+                samples = samples + [(metric.name, "", computed[metric.name])]
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes() -> Optional[float]:
+    """Current resident set size from /proc/self/statm (Linux); None elsewhere."""
+    try:
+        with open("/proc/self/statm") as fh:
+            resident_pages = int(fh.read().split()[1])
+        return float(resident_pages * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def write_textfile(registry: Registry, path: str) -> None:
+    """Atomically write the exposition for node_exporter's textfile collector."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+class TextfileWriter:
+    """Daemon thread rewriting the textfile every `interval` seconds."""
+
+    def __init__(self, registry: Registry, path: str, interval: float) -> None:
+        self._registry = registry
+        self.path = path
+        self._interval = max(1.0, float(interval))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="eink-metrics-textfile", daemon=True)
+
+    def start(self) -> "TextfileWriter":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the thread; it writes one final snapshot on the way out."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            stopping = self._stop.wait(self._interval)
+            try:
+                write_textfile(self._registry, self.path)
+            except Exception as e:
+                logger.warning("Failed to write metrics textfile %s: %s", self.path, e)
+            if stopping:
+                return
+
+
+class MetricsServer:
+    """GET /metrics on a ThreadingHTTPServer in a daemon thread."""
+
+    def __init__(self, registry: Registry, host: str, port: int) -> None:
+        import http.server  # only when the endpoint is configured (cold start)
+        registry_ref = registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 (http.server API)
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa: A002 (http.server API)
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="eink-metrics-http", daemon=True
+        )
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,402 @@
+"""Several panels driven from one client process (EINK_PANELS).
+
+A wall of panels used to need one client process per panel: its own
+interpreter with requests and Pillow, its own HTTP connections and its own
+long-poll, because client.py keeps the driver and the refresh state in
+module globals. With EINK_PANELS set, main() hands over to this module
+instead:
+
+- the network layer is shared: one long-poll of /api/refresh_status, one
+  /settings fetch and one heartbeat per cycle, through client.py's request
+  helpers; the previews (one per panel, /preview?name=<design> for panels
+  showing a saved design) are fetched on the main thread;
+- every panel has a Panel object with its own state (driver, content hash,
+  E5.4 failure counter) and its own hardware worker thread, which starts
+  writing as soon as its preview is decoded, so the slow refreshes (~35s on
+  the 6-color panel) of all panels run at the same time;
+- every panel's driver runs in its own driver_proc.py child, moved to the
+  panel's SPI chip select and GPIO lines. The vendor epdconfig is a
+  per-process singleton (one SpiDev, one set of gpiozero pins), so two
+  drivers cannot share one interpreter; the children also give every driver
+  call the EINK_DRIVER_CALL_TIMEOUT deadline.
+
+A cycle writes every panel when the server says a refresh is due, and
+retries only the panels whose last write failed (or that never showed a
+frame) otherwise; the content skip (E5.2) and the E5.4 escalation apply per
+panel. The heartbeat telemetry carries one entry per panel.
+"""
+
+import logging
+import os
+import signal
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import capabilities
+import client
+import config
+
+logger = logging.getLogger("eink-client")
+
+DRIVERS = ("epd7in3e", "epd7in5_V2")
+PIN_KEYS = ("rst", "dc", "busy", "pwr")
+SPEC_KEYS = ("name", "driver", "spi", "design") + PIN_KEYS
+# Panel palette per driver; it picks the mode conversion in display().
+DRIVER_COLORS = capabilities.DRIVER_COLORS
+# Outcomes of one panel's share of a cycle (PanelSet.write/refresh).
+REFRESHED, SKIPPED, FAILED, NO_PREVIEW = "refreshed", "skipped", "failed", "no_preview"
+
+
+class PanelSpec:
+    """One entry of EINK_PANELS."""
+
+    __slots__ = ("name", "driver", "spi", "pins", "design")
+
+    def __init__(
+        self,
+        name: str,
+        driver: str,
+        spi: Optional[Tuple[int, int]] = None,
+        pins: Optional[Dict[str, int]] = None,
+        design: str = "",
+    ) -> None:
+        self.name = name
+        self.driver = driver
+        self.spi = spi
+        self.pins = pins or {}
+        self.design = design
+
+    def __repr__(self) -> str:
+        return f"PanelSpec({self.name!r}, {self.driver!r}, spi={self.spi}, design={self.design!r})"
+
+
+def parse_panels(spec: str) -> List[PanelSpec]:
+    """Parse EINK_PANELS; ValueError names the offending panel and key.
+
+        name=left,driver=epd7in3e,spi=0.0;name=right,driver=epd7in5_V2,spi=0.1,rst=5,busy=6
+    """
+    panels: List[PanelSpec] = []
+    for index, entry in enumerate(part.strip() for part in spec.split(";")):
+        if not entry:
+            continue
+        fields: Dict[str, str] = {}
+        for item in entry.split(","):
+            key, sep, value = item.partition("=")
+            key = key.strip().lower()
+            if not sep or key not in SPEC_KEYS:
+                raise ValueError(f"EINK_PANELS panel {index + 1}: unknown field {item.strip()!r}")
+            fields[key] = value.strip()
+        name = fields.get("name") or f"panel{index + 1}"
+        driver = fields.get("driver", config.DISPLAY_DRIVER)
+        if driver not in DRIVERS:
+            raise ValueError(f"EINK_PANELS {name}: unknown driver {driver!r}")
+        spi = None
+        if fields.get("spi"):
+            try:
+                bus, device = (int(n) for n in fields["spi"].split("."))
+            except ValueError:
+                raise ValueError(f"EINK_PANELS {name}: spi must be BUS.DEVICE, e.g. 0.1") from None
+            spi = (bus, device)
+        pins = {}
+        for key in PIN_KEYS:
+            if key in fields:
+                try:
+                    pins[key] = int(fields[key])
+                except ValueError:
+                    raise ValueError(f"EINK_PANELS {name}: {key} must be a BCM pin number") from None
+        if any(p.name == name for p in panels):
+            raise ValueError(f"EINK_PANELS: duplicate panel name {name!r}")
+        panels.append(PanelSpec(name, driver, spi, pins, fields.get("design", "")))
+    return panels
+
+
+class Panel:
+    """One panel's driver and refresh state - client.py's globals, per panel.
+
+    Written by the panel's worker thread while a job runs and read by the
+    main thread only after the job's future has completed.
+    """
+
+    __slots__ = (
+        "spec", "epd", "preview_only", "hw_recovery_pending", "consecutive_hw_failures",
+        "last_displayed_hash", "last_panel_write_monotonic", "write_pending", "worker",
+    )
+
+    def __init__(self, spec: PanelSpec) -> None:
+        self.spec = spec
+        self.epd = None
+        self.preview_only = False
+        self.hw_recovery_pending = False
+        self.consecutive_hw_failures = 0
+        self.last_displayed_hash: Optional[str] = None
+        self.last_panel_write_monotonic: Optional[float] = None
+        # No frame since process start, or the last write failed: written
+        # by the next cycle whether or not the server says a refresh is due.
+        self.write_pending = True
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"panel-{spec.name}")
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    def telemetry(self) -> dict:
+        return {
+            "name": self.name,
+            "driver": self.spec.driver,
+            "digest": self.last_displayed_hash,
+            "hw_failures": self.consecutive_hw_failures,
+        }
+
+
+def spawn_remote_epd(spec: PanelSpec):
+    """EPD() for one panel: its driver in a driver_proc child on the panel's wiring."""
+    import driver_proc
+    output = config.PANEL_EMULATOR_OUTPUT
+    if output:
+        root, ext = os.path.splitext(output)
+        output = f"{root}-{spec.name}{ext}"
+    return driver_proc.RemoteEPD(
+        spec.driver,
+        call_timeout=config.DRIVER_CALL_TIMEOUT,
+        spawn_timeout=config.DRIVER_SPAWN_TIMEOUT,
+        env=client._driver_process_env(output),
+        spi=spec.spi,
+        pins=spec.pins,
+    )
+
+
+class PanelSet:
+    """The panels of one process and their refresh cycles.
+
+    epd_factory(spec) constructs a panel's EPD (default: spawn_remote_epd);
+    it runs on the panel's worker thread.
+    """
+
+    def __init__(
+        self, specs: List[PanelSpec], epd_factory: Optional[Callable[[PanelSpec], object]] = None
+    ) -> None:
+        self.panels = [Panel(spec) for spec in specs]
+        self.epd_factory = epd_factory or spawn_remote_epd
+
+    # --- hardware side (runs on each panel's worker thread) ---
+
+    def load(self, panel: Panel) -> None:
+        """Construct the panel's driver; ImportError => preview-only like client.py."""
+        logger.info("panel %s: loading display driver %s", panel.name, panel.spec.driver)
+        try:
+            panel.epd = self.epd_factory(panel.spec)
+            panel.preview_only = False
+            panel.hw_recovery_pending = False
+        except ImportError:
+            logger.warning(
+                "panel %s: Waveshare EPD library not found - preview-only", panel.name
+            )
+            panel.epd = None
+            panel.preview_only = True
+            panel.hw_recovery_pending = False
+        except Exception:
+            logger.exception("panel %s: display recovery: driver reset after error", panel.name)
+            self.reset(panel)
+
+    def reset(self, panel: Panel) -> None:
+        """E5.4 driver reset: module_exit() (the child exits), next write re-spawns."""
+        epd, panel.epd = panel.epd, None
+        panel.hw_recovery_pending = True
+        if epd is not None:
+            try:
+                epd.module_exit()
+            except Exception:
+                pass
+
+    def should_skip(self, panel: Panel, content_hash: Optional[str], reason: Optional[str]) -> bool:
+        """client._should_skip_panel_write() for one panel."""
+        if not config.CONTENT_SKIP or panel.epd is None or reason != "interval":
+            return False
+        if content_hash is None or content_hash != panel.last_displayed_hash:
+            return False
+        if config.MAX_SKIP_HOURS <= 0:
+            return True
+        last = panel.last_panel_write_monotonic
+        return last is not None and time.monotonic() - last <= config.MAX_SKIP_HOURS * 3600
+
+    def display(self, panel: Panel, img, display_config: dict) -> bool:
+        """client.display_image() for one panel; False after a driver reset."""
+        epd = panel.epd
+        if epd is None:
+            path = f"preview_output-{panel.name}.png"
+            img.save(path)
+            logger.info("panel %s: no display hardware - preview saved to %s", panel.name, path)
+            return True
+        try:
+            if epd.init() == -1:
+                raise RuntimeError("display init() returned -1 (module_init failed)")
+            img = client._convert_for_panel(img, display_config, (epd.width, epd.height))
+            epd.display(epd.getbuffer(img))
+            epd.sleep()
+            logger.info("panel %s: display updated successfully", panel.name)
+            return True
+        except Exception:
+            logger.exception("panel %s: display recovery: driver reset after error", panel.name)
+            self.reset(panel)
+            return False
+
+    def write(
+        self, panel: Panel, img, content_hash: Optional[str], display_config: dict,
+        reason: Optional[str],
+    ) -> str:
+        """One panel's share of a cycle; returns REFRESHED, SKIPPED or FAILED."""
+        if panel.epd is None and not panel.preview_only:
+            if panel.hw_recovery_pending:
+                client._m_driver_reloads.inc()
+            self.load(panel)
+            if panel.epd is None and panel.hw_recovery_pending:
+                return FAILED
+        if self.should_skip(panel, content_hash, reason):
+            logger.info("panel %s: skipping panel refresh (content unchanged)", panel.name)
+            return SKIPPED
+        display_config = dict(display_config, colors=DRIVER_COLORS[panel.spec.driver])
+        if not self.display(panel, img, display_config):
+            return FAILED
+        if panel.epd is not None:
+            panel.last_displayed_hash = content_hash
+            panel.last_panel_write_monotonic = time.monotonic()
+            panel.consecutive_hw_failures = 0
+        return REFRESHED
+
+    # --- network side (main thread) ---
+
+    def refresh(self, display_config: dict, reason: Optional[str], panels: List[Panel]) -> Dict[str, str]:
+        """Fetch each panel's preview and hand it to the panel's worker; wait for all.
+
+        Returns {panel name: outcome}. Failed panels are counted here, on the
+        main thread, so the E5.4 escalation (SystemExit) leaves main().
+        """
+        mode = display_config.get("panel_image_mode", "dithered")
+        jobs: List[Tuple[Panel, Future]] = []
+        outcomes: Dict[str, str] = {}
+        for panel in panels:
+            img = client.fetch_preview(mode, design=panel.spec.design or None)
+            if img is None:
+                logger.warning("panel %s: failed to fetch preview", panel.name)
+                outcomes[panel.name] = NO_PREVIEW
+                continue
+            future = panel.worker.submit(
+                self.write, panel, img, client._last_fetch_hash, display_config, reason
+            )
+            jobs.append((panel, future))
+        for panel, future in jobs:
+            try:
+                outcomes[panel.name] = future.result()
+            except Exception:
+                logger.exception("panel %s: write failed", panel.name)
+                outcomes[panel.name] = FAILED
+        for panel in panels:
+            outcome = outcomes[panel.name]
+            client._m_refreshes.inc(result=outcome)
+            panel.write_pending = outcome in (FAILED, NO_PREVIEW)
+        for panel in panels:
+            if outcomes[panel.name] == FAILED:
+                self._register_hw_failure(panel)
+        return outcomes
+
+    def _register_hw_failure(self, panel: Panel) -> None:
+        panel.consecutive_hw_failures += 1
+        client._m_hw_failures.inc()
+        logger.warning(
+            "panel %s: hardware failure cycle %d (limit %d, 0 = never escalate)",
+            panel.name, panel.consecutive_hw_failures, config.HW_FAILURE_LIMIT,
+        )
+        if 0 < config.HW_FAILURE_LIMIT <= panel.consecutive_hw_failures:
+            logger.critical(
+                "panel %s: too many consecutive display failures (%d) - exiting for systemd restart",
+                panel.name, panel.consecutive_hw_failures,
+            )
+            raise SystemExit(1)
+
+    def run_cycle(self, status: Optional[dict] = None) -> bool:
+        """One long-poll cycle; True when the caller may re-poll immediately.
+
+        status: an already fetched /api/refresh_status answer (startup passes
+        {} with every panel pending). Like client._run_refresh_cycle(), a
+        cycle that had work but left a panel without progress backs off.
+        """
+        poll_ok = True
+        if status is None:
+            status = client.get_refresh_status()
+            poll_ok = bool(status)
+        due = bool(status.get("should_refresh", False))
+        targets = [p for p in self.panels if due or p.write_pending]
+        if not targets:
+            return poll_ok
+        if due:
+            logger.info("Server says: refresh needed")
+        reason = status.get("reason") if due else None
+        outcomes = self.refresh(client.fetch_display_config(load_driver=False), reason, targets)
+        progress = [o for o in outcomes.values() if o in (REFRESHED, SKIPPED)]
+        if progress:
+            status_text = REFRESHED if REFRESHED in progress else SKIPPED
+            client.send_heartbeat(
+                status_text, reason,
+                skip_reason="content_unchanged" if status_text == SKIPPED else None,
+                extra={"panels": [p.telemetry() for p in self.panels]},
+            )
+        return poll_ok and len(progress) == len(outcomes)
+
+    def close(self) -> None:
+        """Finish running writes, then deep sleep and module_exit() every panel."""
+        for panel in self.panels:
+            panel.worker.shutdown(wait=True)
+            epd, panel.epd = panel.epd, None
+            if epd is None:
+                continue
+            try:
+                epd.sleep()
+            except Exception:
+                pass
+            try:
+                epd.module_exit()
+            except Exception:
+                pass
+
+
+def main() -> None:
+    """client.main() for EINK_PANELS: startup write of every panel, then the long-poll loop."""
+    specs = parse_panels(config.PANELS)
+    if not specs:
+        raise SystemExit("EINK_PANELS is set but names no panel")
+    logger.info(
+        "E-Ink Client starting - Server: %s, panels: %s", client._server_label(),
+        ", ".join(f"{s.name} ({s.driver})" for s in specs),
+    )
+    running = True
+
+    def shutdown(signum, frame):
+        nonlocal running
+        logger.info("Shutting down...")
+        running = False
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+    client._start_metrics_export()
+    if config.HEARTBEAT_TELEMETRY:
+        client._timer.enabled = True
+
+    panel_set = PanelSet(specs)
+    try:
+        logger.info("Performing initial display update...")
+        repoll_now = panel_set.run_cycle(status={})
+        logger.info("Entering long-poll loop (reconnect backoff %ds)", config.POLL_INTERVAL)
+        while running:
+            if not repoll_now:
+                for _ in range(config.POLL_INTERVAL):
+                    if not running:
+                        break
+                    time.sleep(1)
+                if not running:
+                    break
+            repoll_now = panel_set.run_cycle()
+    finally:
+        panel_set.close()
+        client.cleanup()
+        logger.info("Client stopped")
@@ -0,0 +1,187 @@
+"""Playlist mode: a bundle of pre-rendered frames rotated by the client.
+
+Photo frames and rotating-design installations used to fetch a freshly
+rendered frame for every rotation step. With EINK_PLAYLIST the client syncs
+the whole playlist once per change
+
+    POST /playlist/bundle?<the /preview query: raw=true>
+    {"version": "<version the client has, or null>", "have": ["<digest>", ...]}
+
+and the server answers with one of
+
+- 204 No Content: the client's version is current;
+- Content-Type application/x-eink-playlist: one line of JSON
+  {"version": "...", "frames": [{"digest": "<sha256 of the PNG>",
+  "dwell": <seconds>, "name": "...", "length": n}, ...]}, a newline, then
+  the n bytes of each PNG in order - frames listed in have are sent with
+  length 0 and no bytes;
+
+and 404/405 (401 behind its auth guard) when it has no playlists (the
+client then stops asking for the rest of the process). The long-poll status may carry "playlist_version";
+the client re-syncs when it differs from its own.
+
+Frames are stored by digest in a directory (Cache) next to the manifest of
+the current playlist, so a restarted client - even one that cannot reach
+the server - resumes the rotation from disk. Frames of earlier playlists
+stay until the directory exceeds its byte bound; the current playlist's
+frames are never evicted.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "application/x-eink-playlist"
+MANIFEST = "playlist.json"
+# Shortest dwell honored: longer than a long-poll, so the client polls the
+# server (triggers, playlist changes) between rotation steps.
+MIN_DWELL = 60.0
+
+
+class PlaylistError(ValueError):
+    """A bundle that does not match its header or the client's cache."""
+
+
+def digest(frame: bytes) -> str:
+    return hashlib.sha256(frame).hexdigest()
+
+
+def encode(
+    version: str, frames: Sequence[Tuple[str, bytes, float]], have: Sequence[str] = ()
+) -> bytes:
+    """Server side: the bundle for (name, PNG bytes, dwell seconds) frames."""
+    known = set(have)
+    entries, blobs = [], []
+    for name, frame, dwell in frames:
+        entry = {"digest": digest(frame), "dwell": dwell, "name": name}
+        send = entry["digest"] not in known
+        entry["length"] = len(frame) if send else 0
+        entries.append(entry)
+        if send:
+            blobs.append(frame)
+    header = json.dumps({"version": version, "frames": entries},
+                        separators=(",", ":")).encode("utf-8")
+    return header + b"\n" + b"".join(blobs)
+
+
+def decode(body: bytes) -> Tuple[str, List[dict], Dict[str, bytes]]:
+    """Client side: (version, frame entries, PNG bytes by digest) of a bundle.
+
+    Every sent frame is checked against its digest.
+    """
+    newline = body.find(b"\n")
+    try:
+        header = json.loads(body[:newline]) if newline > 0 else None
+        version = str(header["version"])
+        entries = [
+            {"digest": str(e["digest"]), "dwell": float(e["dwell"]),
+             "name": str(e.get("name", "")), "length": int(e["length"])}
+            for e in header["frames"]
+        ]
+    except (ValueError, KeyError, TypeError) as e:
+        raise PlaylistError(f"malformed bundle header: {e}") from None
+    if not entries:
+        raise PlaylistError("bundle without frames")
+    frames: Dict[str, bytes] = {}
+    offset = newline + 1
+    for entry in entries:
+        length = entry.pop("length")
+        if length:
+            frame = body[offset:offset + length]
+            if len(frame) != length or digest(frame) != entry["digest"]:
+                raise PlaylistError(f"frame {entry['name'] or entry['digest'][:12]} "
+                                    "does not match its digest")
+            frames[entry["digest"]] = frame
+            offset += length
+    if offset != len(body):
+        raise PlaylistError("bundle length does not match its header")
+    return version, entries, frames
+
+
+class Cache:
+    """Frames by digest plus the current playlist's manifest, in directory."""
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version: Optional[str] = None
+        self.entries: List[dict] = []
+
+    def load(self) -> bool:
+        """Read the stored playlist; False when there is none (or it is incomplete)."""
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+            version, entries = str(manifest["version"]), list(manifest["frames"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not entries or any(e["digest"] not in self.have() for e in entries):
+            return False
+        self.version, self.entries = version, entries
+        return True
+
+    def have(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(n[:-4] for n in names if n.endswith(".png"))
+
+    def frame(self, frame_digest: str) -> bytes:
+        with open(self._path(frame_digest), "rb") as f:
+            return f.read()
+
+    def store(self, version: str, entries: List[dict], frames: Dict[str, bytes]) -> int:
+        """Make version current: write the new frames, then the manifest. Returns bytes written."""
+        missing = {e["digest"] for e in entries} - set(self.have()) - set(frames)
+        if missing:
+            raise PlaylistError(f"{len(missing)} frames neither sent nor cached")
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+        for frame_digest, frame in frames.items():
+            self._write(self._path(frame_digest), frame)
+            written += len(frame)
+        self._write(os.path.join(self.directory, MANIFEST),
+                    json.dumps({"version": version, "frames": entries}).encode("utf-8"))
+        self.version, self.entries = version, entries
+        self._evict()
+        return written
+
+    def _evict(self) -> None:
+        """Drop frames of earlier playlists, oldest first, down to max_bytes."""
+        current = {e["digest"] for e in self.entries}
+        files = []
+        for frame_digest in self.have():
+            path = self._path(frame_digest)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((frame_digest not in current, stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, _, size, _ in files)
+        for evictable, _, size, path in sorted(files, key=lambda f: f[1]):
+            if total <= self.max_bytes:
+                break
+            if evictable:
+                os.unlink(path)
+                total -= size
+
+    def _path(self, frame_digest: str) -> str:
+        if len(frame_digest) != 64 or not all(c in "0123456789abcdef" for c in frame_digest):
+            raise PlaylistError(f"bad frame digest {frame_digest!r}")
+        return os.path.join(self.directory, frame_digest + ".png")
+
+    def _write(self, path: str, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,149 @@
+"""On-demand cProfile + tracemalloc capture of refresh cycles.
+
+A CycleProfiler is armed for the next N cycles - by SIGUSR1 or
+EINK_PROFILE_ON_START - without restarting the service. Each armed cycle runs
+under cProfile with tracemalloc snapshots taken right before and right after
+it, and leaves four files in the output directory (by default the directory
+of the last-sent artifact):
+
+    eink_profile_<stamp>_<n>.prof                 pstats input (snakeviz, python -m pstats)
+    eink_profile_<stamp>_<n>.before.tracemalloc   tracemalloc.Snapshot.load() input
+    eink_profile_<stamp>_<n>.after.tracemalloc
+    eink_profile_<stamp>_<n>.txt                  top functions + top allocation growth
+
+Every file is written to a .tmp sibling and os.replace()d into place, so a
+concurrent scp never copies a half-written profile. tracemalloc is started
+for the armed cycles only (when it was not already tracing) and stopped
+afterwards; allocations from before it started are not attributed.
+
+Disarmed, the main loop pays one attribute check per cycle (pending); the
+profilers are imported on the first armed cycle, not at client start.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Callable, Optional, TypeVar
+
+if TYPE_CHECKING:
+    import cProfile
+    import tracemalloc
+
+logger = logging.getLogger("eink-client")
+
+TRACEMALLOC_FRAMES = 10
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+
+T = TypeVar("T")
+
+
+def _write_atomic(path: str, write: Callable[[str], None]) -> None:
+    tmp_path = f"{path}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CycleProfiler:
+    """Profiles the next N calls of run(); request() is safe in a signal handler."""
+
+    def __init__(self) -> None:
+        self.pending = False
+        self._remaining = 0
+        self._index = 0
+        self._stamp: Optional[str] = None
+        self._owns_tracemalloc = False
+
+    def request(self, cycles: int) -> None:
+        """Arm (or extend) profiling for the next `cycles` cycles; <= 0 is a no-op."""
+        if cycles <= 0:
+            return
+        self._remaining = max(self._remaining, cycles)
+        self.pending = True
+
+    def run(self, cycle: Callable[[], T], out_dir: str) -> T:
+        """Run one cycle under the profiler and write its files to out_dir.
+
+        The cycle's result or exception (also SystemExit from the E5.4
+        escalation) passes through; failing to write a profile is logged and
+        never breaks the client.
+        """
+        import cProfile
+        import tracemalloc
+        if self._stamp is None:
+            self._stamp = time.strftime("%Y%m%d-%H%M%S")
+            self._index = 0
+            logger.info(
+                "Profiling the next %d refresh cycles (cProfile + tracemalloc) -> %s",
+                self._remaining, out_dir,
+            )
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._owns_tracemalloc = True
+        self._index += 1
+        base = os.path.join(out_dir, f"eink_profile_{self._stamp}_{self._index:02d}")
+        profile = cProfile.Profile()
+        before = tracemalloc.take_snapshot()
+        try:
+            return profile.runcall(cycle)
+        finally:
+            after = tracemalloc.take_snapshot()
+            self._remaining -= 1
+            self.pending = self._remaining > 0
+            try:
+                self._write(base, profile, before, after)
+                logger.info("Profile written: %s.{prof,txt,before/after.tracemalloc}", base)
+            except Exception as e:
+                logger.error("Could not write profile %s: %s", base, e)
+            if not self.pending:
+                self._stamp = None
+                if self._owns_tracemalloc:
+                    tracemalloc.stop()
+                    self._owns_tracemalloc = False
+
+    def _write(
+        self,
+        base: str,
+        profile: cProfile.Profile,
+        before: tracemalloc.Snapshot,
+        after: tracemalloc.Snapshot,
+    ) -> None:
+        _write_atomic(f"{base}.prof", profile.dump_stats)
+        _write_atomic(f"{base}.before.tracemalloc", before.dump)
+        _write_atomic(f"{base}.after.tracemalloc", after.dump)
+        summary = format_summary(profile, before, after)
+
+        def write_text(path: str) -> None:
+            with open(path, "w", encoding="utf-8") as fh:
+                fh.write(summary)
+        _write_atomic(f"{base}.txt", write_text)
+
+
+def format_summary(
+    profile: cProfile.Profile, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot
+) -> str:
+    """Top functions by cumulative time and top allocation growth over the cycle."""
+    import pstats
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    before_total = sum(stat.size for stat in before.statistics("filename"))
+    after_total = sum(stat.size for stat in after.statistics("filename"))
+    out.write(
+        f"\ntraced memory: {before_total} -> {after_total} bytes "
+        f"({after_total - before_total:+d})\n"
+        f"top {TOP_ALLOCATIONS} allocation changes (lineno):\n"
+    )
+    for diff in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+        out.write(f"  {diff}\n")
+    return out.getvalue()
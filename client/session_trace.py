@@ -0,0 +1,235 @@
+"""Session trace recorder: the client's server and hardware calls as JSON lines.
+
+Opt-in via EINK_TRACE_PATH: every server request (method, path, duration,
+status or exception type, body size and SHA-256 prefix, small JSON bodies,
+PNG dimensions) and every hardware call (EPD(), init, getbuffer, display,
+sleep, module_exit - duration, init's return value, exception) is appended
+to a JSON-lines file, one compact event per line. Each refresh cycle starts
+with a "cycle" event carrying the client state the cycle begins with, so a
+replay can start at any cycle. When the content skip compares decoded pixels
+(EINK_SERVER_URLS pools, EINK_PREVIEW_DELTA, EINK_COMPOSITE), the marker also
+pairs the preview bodies of the previous cycle with their pixel digests. Files rotate at the first cycle boundary past
+EINK_TRACE_MAX_BYTES, keeping EINK_TRACE_BACKUPS old files (path.1 is the
+newest) - every file starts with a complete cycle and replays on its own.
+
+trace_replay.py drives process_refresh_cycle() from such a trace.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+import config
+
+logger = logging.getLogger("eink-client")
+
+FORMAT_VERSION = 1
+DIGEST_CHARS = 16  # SHA-256 prefix kept per body
+MAX_BODY_BYTES = 4096  # JSON bodies up to this size are stored verbatim
+
+# Calls recorded on the epd object (the rest of its attributes pass through).
+HW_CALLS = ("init", "init_fast", "init_part", "getbuffer", "display", "display_Partial",
+            "Clear", "sleep")
+
+# Config values a replay restores from the trace (they steer the cycle logic).
+TRACE_CONFIG = ("CONTENT_SKIP", "MAX_SKIP_HOURS", "HW_FAILURE_LIMIT", "HEARTBEAT_TELEMETRY",
+                "PREVIEW_DELTA", "COMPOSITE", "SERVER_URLS")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:DIGEST_CHARS]
+
+
+def _png_size(data: bytes) -> Optional[List[int]]:
+    """Width/height from the IHDR chunk, without decoding."""
+    if data[:8] != _PNG_SIGNATURE or len(data) < 24:
+        return None
+    return list(struct.unpack(">II", data[16:24]))
+
+
+def _error_name(error: BaseException) -> str:
+    return type(error).__name__
+
+
+class TraceWriter:
+    """Append-only JSON-lines file with size-based rotation (path.1 .. path.N).
+
+    Rotation only happens in rotate_if_full(), which the tracer calls at cycle
+    boundaries; a file can exceed max_bytes by one cycle's events.
+
+    A failing write (disk full, read-only media) disables the writer after
+    one warning; tracing never breaks the client.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1048576, backups: int = 3) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fresh = True  # nothing written to the current file yet
+        self._lock = threading.Lock()
+        self._fh = None
+        self._failed = False
+
+    def _open(self) -> None:
+        if self._fh is None:
+            self._fh = open(self.path, "a", encoding="utf-8")
+            self.fresh = self._fh.tell() == 0
+
+    def _disable(self, error: OSError) -> None:
+        self._failed = True
+        logger.warning("Session trace disabled - cannot write %s: %s", self.path, error)
+
+    def rotate_if_full(self) -> bool:
+        """Start a new file once the current one reached max_bytes; True when
+        the next event is the first of its file."""
+        with self._lock:
+            if self._failed:
+                return False
+            try:
+                self._open()
+                if self.max_bytes > 0 and self._fh.tell() >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                self._disable(e)
+            return self.fresh
+
+    def write(self, event: dict) -> None:
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._failed:
+                return
+            try:
+                self._open()
+                self._fh.write(line)
+                self._fh.flush()
+                self.fresh = False
+            except OSError as e:
+                self._disable(e)
+
+    def _rotate(self) -> None:
+        self._fh.close()
+        self._fh = None
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._fh = open(self.path, "a", encoding="utf-8")
+        self.fresh = True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class Tracer:
+    """Turns client calls into trace events; "t" is seconds since the tracer started."""
+
+    def __init__(self, path: str, max_bytes: int = 1048576, backups: int = 3) -> None:
+        self.writer = TraceWriter(path, max_bytes, backups)
+        self._t0 = time.monotonic()
+        self._frames: Dict[str, str] = {}  # body digest -> pixel digest, until the next cycle
+        self._cycles = 0
+
+    def now(self) -> float:
+        return time.monotonic()
+
+    def _t(self, start: float) -> float:
+        return round(start - self._t0, 4)
+
+    def cycle(self, state: dict) -> None:
+        """Cycle marker with the client state it starts in; the first cycle and
+        the first event of every file also carry the format version and the
+        TRACE_CONFIG values."""
+        event = {"t": self._t(time.monotonic()), "k": "cycle", "st": state}
+        if self.writer.rotate_if_full() or not self._cycles:
+            event["v"] = FORMAT_VERSION
+            event["cfg"] = {name: getattr(config, name) for name in TRACE_CONFIG}
+        if self._frames:
+            event["px"], self._frames = self._frames, {}
+        self._cycles += 1
+        self.writer.write(event)
+
+    def frame(self, body: bytes, content_hash: str) -> None:
+        """A preview body whose content-skip hash is over its pixels: the next
+        cycle marker pairs the body digest with it (its state's "hash")."""
+        self._frames[_digest(body)] = content_hash[:DIGEST_CHARS]
+
+    def http(self, method: str, path: str, start: float,
+             resp: Optional[requests.Response] = None,
+             error: Optional[BaseException] = None, body: Optional[bytes] = None) -> None:
+        """One request; body is what a streamed response delivered (resp.content is
+        not read then)."""
+        event = {"t": self._t(start), "k": method, "p": path, "d": round(time.monotonic() - start, 4)}
+        if error is not None:
+            event["e"] = _error_name(error)
+        else:
+            body = (resp.content if body is None else body) or b""
+            event.update(s=resp.status_code, n=len(body), h=_digest(body))
+            size = _png_size(body)
+            if size is not None:
+                event["wh"] = size
+            elif len(body) <= MAX_BODY_BYTES:
+                try:
+                    event["b"] = json.loads(body)
+                except ValueError:
+                    pass
+        self.writer.write(event)
+
+    def hw(self, call: str, start: float, result=None,
+           error: Optional[BaseException] = None, **extra) -> None:
+        event = {"t": self._t(start), "k": "hw", "c": call, "d": round(time.monotonic() - start, 4)}
+        if error is not None:
+            event["e"] = f"{_error_name(error)}: {error}"
+        elif isinstance(result, int) and not isinstance(result, bool):
+            event["r"] = result
+        event.update(extra)
+        self.writer.write(event)
+
+    def wrap_epd(self, epd) -> "TracedEPD":
+        return TracedEPD(epd, self)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class TracedEPD:
+    """Proxy around a driver's EPD object that traces the HW_CALLS."""
+
+    def __init__(self, epd, tracer: Tracer) -> None:
+        self._epd = epd
+        self._tracer = tracer
+
+    def __getattr__(self, name):
+        attr = getattr(self._epd, name)
+        if name not in HW_CALLS or not callable(attr):
+            return attr
+        tracer = self._tracer
+
+        def traced(*args, **kwargs):
+            start = tracer.now()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                tracer.hw(name, start, error=e)
+                raise
+            if name == "getbuffer":
+                tracer.hw(name, start, n=len(result) if result is not None else 0)
+            else:
+                tracer.hw(name, start, result)
+            return result
+        return traced
@@ -0,0 +1,105 @@
+"""Bulk SPI transport behind the loaded Waveshare driver.
+
+The vendor drivers talk to the panel through three EPD methods:
+
+    send_command(c)  DC low, CS low, spi_writebyte([c]), CS high
+    send_data(d)     DC high, CS low, spi_writebyte([d]), CS high
+    send_data2(buf)  DC high, CS low, spi_writebyte2(buf), CS high
+
+Every call costs two to three gpiozero pin writes plus one ioctl, and
+send_data2 hands spidev a Python list of ints. attach() replaces the three
+methods on the EPD instance with an SpiTransport that:
+
+- drives DC only when the level changes. A command always writes DC low,
+  the first data byte after it writes DC high, and data runs pay no pin
+  writes at all;
+- never writes the CS GPIO: on the Raspberry Pi, spidev drives CE0 in
+  hardware for every transfer, and the vendor epdconfig ignores CS_PIN;
+- converts a frame buffer to bytes once and sends it as memoryview slices
+  of the spidev buffer size (/sys/module/spidev/parameters/bufsiz, 4096 by
+  default), so there is no per-byte Python loop and no list marshalling.
+
+The bytes on the wire and their DC level are the same as with the vendor
+methods (test_spi_transport.py checks this against a recording fake
+spidev). attach() does nothing, and returns False, when the epdconfig has no
+spidev with writebytes2 (Jetson/Sunrise software SPI, the panel emulator)
+or the EPD lacks the vendor methods.
+"""
+
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger("eink-client")
+
+BUFSIZ_PATH = "/sys/module/spidev/parameters/bufsiz"
+DEFAULT_BUFSIZ = 4096
+VENDOR_METHODS = ("send_command", "send_data", "send_data2")
+
+
+def spidev_bufsiz(path: str = BUFSIZ_PATH) -> int:
+    """Largest single spidev transfer in bytes (kernel module parameter)."""
+    try:
+        with open(path, encoding="ascii") as fh:
+            value = int(fh.read().strip())
+    except (OSError, ValueError):
+        return DEFAULT_BUFSIZ
+    return value if value > 0 else DEFAULT_BUFSIZ
+
+
+class SpiTransport:
+    """send_command/send_data/send_data2 for one EPD over a spidev.SpiDev."""
+
+    def __init__(
+        self,
+        spi,
+        digital_write: Callable[[int, int], None],
+        dc_pin: int,
+        chunk: Optional[int] = None,
+    ) -> None:
+        self.spi = spi
+        self.digital_write = digital_write
+        self.dc_pin = dc_pin
+        self.chunk = chunk or spidev_bufsiz()
+        self._dc_high = False
+
+    def send_command(self, command: int) -> None:
+        # Always explicit: module_exit() between refreshes resets the pin.
+        self.digital_write(self.dc_pin, 0)
+        self._dc_high = False
+        self.spi.writebytes([command])
+
+    def send_data(self, data: int) -> None:
+        if not self._dc_high:
+            self.digital_write(self.dc_pin, 1)
+            self._dc_high = True
+        self.spi.writebytes([data])
+
+    def send_data2(self, data) -> None:
+        if not self._dc_high:
+            self.digital_write(self.dc_pin, 1)
+            self._dc_high = True
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)  # one C-level pass over the getbuffer() list
+        view = memoryview(data).cast("B")
+        write, chunk = self.spi.writebytes2, self.chunk
+        for offset in range(0, len(view), chunk):
+            write(view[offset:offset + chunk])
+
+
+def attach(epd, epdconfig, chunk: Optional[int] = None) -> bool:
+    """Back `epd`'s SPI methods with an SpiTransport; False when not applicable."""
+    spi = getattr(epdconfig, "SPI", None)
+    digital_write = getattr(epdconfig, "digital_write", None)
+    dc_pin = getattr(epd, "dc_pin", None)
+    if (
+        spi is None or not hasattr(spi, "writebytes2") or digital_write is None
+        or dc_pin is None or not all(hasattr(epd, name) for name in VENDOR_METHODS)
+    ):
+        logger.info("SPI transport not applicable to this driver - using the vendor SPI path")
+        return False
+    transport = SpiTransport(spi, digital_write, dc_pin, chunk)
+    for name in VENDOR_METHODS:
+        setattr(epd, name, getattr(transport, name))
+    epd.spi_transport = transport
+    logger.info("SPI transport attached (bulk transfers of %d bytes)", transport.chunk)
+    return True
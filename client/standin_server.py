@@ -0,0 +1,466 @@
+"""Scriptable local stand-in for the server's client-facing API.
+
+Serves the four endpoints the client talks to - GET /api/refresh_status
+(long-poll with a bounded hold, like the Go server's WaitForRefresh),
+GET /settings, GET /preview and POST /api/client_heartbeat - from a
+ThreadingHTTPServer on a daemon thread, so the real client code (requests,
+Pillow decode, heartbeat) runs end to end without the Go server.
+
+Fault injection for latency scenarios: per-route response delays (slow
+server) and outage windows during which requests are either dropped (the
+connection closes without a response - a refused/flapping network) or
+blackholed (the request hangs until the window ends, then drops - the
+client only notices through its read timeout) - and /preview bodies cut
+off mid-transfer at random (a weak Wi-Fi link).
+
+Protocol extensions the Go server does not have yet: POST /preview/delta
+(tile_delta.py; set delta = False to stand in for a server without it),
+GET /preview?at=<unix time> with render_at set (timeline.py) and
+GET /preview/overlay + /preview/base with overlay set (composite.py),
+POST /playlist/bundle with playlist set (playlist.py), byte ranges of
+/preview (ETag, Accept-Ranges, Range/If-Range, Repr-Digest),
+GET /api/refresh_status?hold=<seconds> (longpoll.py) and
+POST /api/client_capabilities + GET /preview?caps=<id> (capabilities.py).
+
+Used by the benchmark suite and the latency harness; never by the client
+itself.
+"""
+
+import base64
+import hashlib
+import http.server
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+COLOR_SETTINGS = {
+    "display": {
+        "driver": "epd7in3e",
+        "width": 800,
+        "height": 480,
+        "colors": ["#000000", "#FFFFFF", "#FF0000", "#00FF00", "#0000FF", "#FFFF00"],
+    }
+}
+
+
+# The routes the Go server's auth guard accepts the client token on.
+CLIENT_ROUTES = ("GET /settings", "GET /preview", "GET /api/refresh_status",
+                 "POST /api/client_heartbeat")
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    # socketserver's default listen backlog of 5 turns a burst of virtual
+    # panels (loadgen) into SYN retransmits: 1s+ of latency the Go server
+    # would not have.
+    request_queue_size = 1024
+
+
+class StandinServer:
+    """In-process stand-in server with mutable, thread-safe state.
+
+    png_bytes is what /preview returns (also for ?raw=true); designs maps a
+    saved design name to what /preview?name=<name> returns (404 for any
+    other name, like the Go server); POST /preview/delta serves the same
+    frames as tile deltas unless delta is False. render_at(at) returns the
+    frame for a ?at= request (confirmed with X-Render-At); None ignores the
+    parameter like a server without render-ahead. overlay is the
+    /preview/overlay descriptor (palette and regions; the base digest is
+    added) for every frame, its base being the frame with the region boxes
+    blanked; None answers 404 like a server without compositing. fonts maps
+    a font file name to what GET /font/<name> returns. playlist lists the
+    (name, PNG bytes, dwell) frames POST /playlist/bundle serves as
+    playlist_version, which /api/refresh_status then reports; None answers
+    404 like a server without playlists. ranges serves /preview with an
+    ETag and Repr-Digest and answers Range requests (If-Range on that ETag)
+    with 206; False stands in for a server without them. hold is the
+    long-poll hold in seconds while nothing is due (the Go server holds 25s;
+    tests and benchmarks use far less); a ?hold= request is held that long
+    instead, clamped to hold_range and reported as "hold" (None ignores the
+    parameter like the Go server). idle_limit drops a parked long-poll's
+    connection after that many seconds, like a NAT or proxy idle timeout.
+    capabilities maps the ids of the announcements received to their
+    capabilities; a /preview?caps=<known id> is rendered to fit them
+    (X-Panel-Fit: <mode>), an unknown id is ignored like after a restart
+    (clear the dict), and None answers 404 like a server without the
+    handshake. guarded stands in for the Go server with a password set: its
+    deny-by-default guard answers every route but the four client routes
+    with a JSON 401, whether the server has the route or not. A heartbeat
+    clears should_refresh,
+    like RecordClientRefresh advancing LastClientRefresh - a trigger that
+    fires while a panel write is in flight is absorbed by that write's
+    heartbeat, exactly as on the Go server.
+
+    delays maps a route ("/preview", ...) or "*" to extra seconds before the
+    response; outages (see add_outage) are (start, end, kind) windows on the
+    time.monotonic() clock. cut is the probability that a /preview body is
+    cut off after a random number of bytes (drawn from self.random; cuts
+    counts them).
+    """
+
+    def __init__(
+        self,
+        png_bytes: bytes = b"",
+        settings: Optional[dict] = None,
+        hold: float = 0.5,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.png_bytes = png_bytes
+        self.designs: Dict[str, bytes] = {}
+        self.delta = True
+        self.render_at: Optional[Callable[[int], bytes]] = None
+        self.overlay: Optional[dict] = None
+        self.fonts: Dict[str, bytes] = {}
+        self.playlist: Optional[List[Tuple[str, bytes, float]]] = None
+        self.playlist_version = "1"
+        self.ranges = True
+        self.cut = 0.0
+        self.cuts = 0
+        self.random = random.Random(0)
+        self.settings = settings if settings is not None else COLOR_SETTINGS
+        self.hold = hold
+        self.hold_range: Optional[Tuple[float, float]] = (0.1, 300.0)
+        self.idle_limit: Optional[float] = None
+        self.capabilities: Optional[Dict[str, dict]] = {}
+        self.guarded = False
+        self.should_refresh = False
+        self.reason: Optional[str] = None
+        self.heartbeats: List[dict] = []
+        self.requests: Dict[str, int] = {}
+        self.delays: Dict[str, float] = {}
+        self.outages: List[Tuple[float, float, str]] = []
+        self.triggers: List[float] = []
+        self.heartbeat_times: List[float] = []
+        self.preview_times: List[float] = []  # arrival of each /preview request
+        self._released = False
+        self._cond = threading.Condition()
+        self._httpd = _HTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        # Short shutdown poll: tests start and stop a server per case.
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05},
+            name="eink-standin-server", daemon=True,
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandinServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.release()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def trigger(self, reason: str = "manual") -> float:
+        """Mark a refresh as due and wake every parked long-poll at once.
+
+        Returns the trigger's time.monotonic() timestamp (also kept in
+        self.triggers).
+        """
+        with self._cond:
+            self.should_refresh = True
+            self.reason = reason
+            now = time.monotonic()
+            self.triggers.append(now)
+            self._cond.notify_all()
+        return now
+
+    def release(self) -> None:
+        """Answer every parked and future long-poll at once (shutdown helper)."""
+        with self._cond:
+            self._released = True
+            self._cond.notify_all()
+
+    def add_outage(self, start: float, end: float, kind: str = "drop") -> None:
+        """Fail requests arriving in [start, end) (monotonic): "drop" or "blackhole"."""
+        if kind not in ("drop", "blackhole"):
+            raise ValueError(f"unknown outage kind {kind!r}")
+        with self._cond:
+            self.outages.append((start, end, kind))
+
+    def _fault(self) -> Tuple[Optional[str], float]:
+        """(outage kind or None, its end) for a request arriving now."""
+        now = time.monotonic()
+        with self._cond:
+            return self._active_outage(now)
+
+    def _active_outage(self, now: float) -> Tuple[Optional[str], float]:
+        for start, end, kind in self.outages:
+            if start <= now < end:
+                return kind, end
+        return None, 0.0
+
+    def _next_outage_start(self, now: float) -> float:
+        return min((start for start, _, _ in self.outages if start > now), default=float("inf"))
+
+    def _delay(self, route: str) -> float:
+        return self.delays.get(route, self.delays.get("*", 0.0))
+
+    # --- request handling (runs on the server's worker threads) ---
+
+    def _refresh_status(self, requested: Optional[float] = None) -> Optional[dict]:
+        """Long-poll body; None when an outage began while the request was parked
+        (the connection is then dropped/blackholed like a fresh request) or the
+        idle limit cut it off."""
+        hold = self.hold
+        if requested is not None and self.hold_range is not None:
+            hold = min(self.hold_range[1], max(self.hold_range[0], requested))
+        start = time.monotonic()
+        deadline = start + hold
+        cut_at = start + self.idle_limit if self.idle_limit is not None else float("inf")
+        if cut_at >= deadline:
+            cut_at = float("inf")  # answered before the idle limit, however late the wakeup
+        with self._cond:
+            while not self.should_refresh and not self._released:
+                now = time.monotonic()
+                if self._active_outage(now)[0] is not None or now >= cut_at:
+                    return None
+                remaining = deadline - now
+                if remaining <= 0:
+                    break
+                self._cond.wait(min(remaining, self._next_outage_start(now) - now, cut_at - now))
+            if self._active_outage(time.monotonic())[0] is not None:
+                return None
+            body = {"should_refresh": self.should_refresh, "refresh_interval": 3600}
+            if requested is not None and self.hold_range is not None:
+                body["hold"] = hold
+            if self.should_refresh and self.reason:
+                body["reason"] = self.reason
+            if self.playlist is not None:
+                body["playlist_version"] = self.playlist_version
+            return body
+
+    def _heartbeat(self, payload: dict) -> dict:
+        with self._cond:
+            self.heartbeats.append(payload)
+            self.heartbeat_times.append(time.monotonic())
+            self.should_refresh = False
+            self.reason = None
+        return {"ok": True}
+
+    def _frame(self, path: str) -> Optional[bytes]:
+        """What /preview answers for path's query; None = unknown design."""
+        name = parse_qs(urlsplit(path).query).get("name", [""])[0]
+        if not name:
+            return self.png_bytes
+        return self.designs.get(name)
+
+    def _count(self, route: str) -> None:
+        with self._cond:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _guarded(self, route: str) -> bool:
+                """The auth guard's answer for route; True when it was rejected."""
+                if server.guarded and f"{self.command} {route}" not in CLIENT_ROUTES:
+                    self._send(401, "application/json", b'{"error": "authentication required"}')
+                    return True
+                return False
+
+            def _faulted(self, route: str) -> bool:
+                """Apply outage/delay for this request; True when it must not be answered."""
+                kind, end = server._fault()
+                if kind == "blackhole":
+                    time.sleep(max(0.0, end - time.monotonic()))
+                if kind is not None:
+                    self.close_connection = True
+                    return True
+                delay = server._delay(route)
+                if delay > 0:
+                    time.sleep(delay)
+                return False
+
+            def do_GET(self):  # noqa: N802 (http.server API)
+                arrived = time.monotonic()
+                route = self.path.split("?", 1)[0]
+                server._count(route)
+                if self._faulted(route) or self._guarded(route):
+                    return
+                if route == "/api/refresh_status":
+                    hold = parse_qs(urlsplit(self.path).query).get("hold", [""])[0]
+                    try:
+                        requested = float(hold) if hold else None
+                    except ValueError:
+                        requested = None
+                    body = server._refresh_status(requested)
+                    if body is None:
+                        self._faulted(route)
+                        self.close_connection = True
+                        return
+                    self._send_json(body)
+                elif route == "/settings":
+                    self._send_json(server.settings)
+                elif route == "/preview":
+                    with server._cond:
+                        server.preview_times.append(arrived)
+                    frame = server._frame(self.path)
+                    query = parse_qs(urlsplit(self.path).query)
+                    at = query.get("at", [""])[0]
+                    headers = {}
+                    if frame is not None and at and server.render_at is not None:
+                        frame, headers = server.render_at(int(at)), {"X-Render-At": at}
+                    if frame is not None:
+                        caps = (server.capabilities or {}).get(query.get("caps", [""])[0])
+                        if caps is not None:
+                            frame, headers["X-Panel-Fit"] = self._fit(frame, caps)
+                        self._send_frame(frame, headers)
+                    else:
+                        self._send(404, "application/json", b'{"error": "Design not found"}')
+                elif route in ("/preview/overlay", "/preview/base") and server.overlay is not None:
+                    self._preview_overlay(route)
+                elif route.startswith("/font/"):
+                    font = server.fonts.get(unquote(route[6:]))
+                    if font is not None:
+                        self._send(200, "font/ttf", font)
+                    else:
+                        self._send(404, "application/json", b'{"error": "Font not found"}')
+                else:
+                    self._send(404, "text/plain", b"not found")
+
+            def do_POST(self):  # noqa: N802 (http.server API)
+                route = self.path.split("?", 1)[0]
+                server._count(route)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if self._faulted(route) or self._guarded(route):
+                    return
+                try:
+                    payload = json.loads(raw or b"{}")
+                except ValueError:
+                    payload = {}
+                if route == "/api/client_heartbeat":
+                    self._send_json(server._heartbeat(payload))
+                elif route == "/preview/delta" and server.delta:
+                    self._preview_delta(payload)
+                elif route == "/playlist/bundle" and server.playlist is not None:
+                    self._playlist_bundle(payload)
+                elif route == "/api/client_capabilities" and server.capabilities is not None:
+                    import capabilities
+                    caps_id = capabilities.caps_id(payload)
+                    with server._cond:
+                        server.capabilities[caps_id] = payload
+                    self._send_json({"caps": caps_id})
+                else:
+                    self._send(404, "text/plain", b"not found")
+
+            def _preview_delta(self, manifest: dict) -> None:
+                from io import BytesIO
+
+                from PIL import Image
+
+                import tile_delta
+                frame = server._frame(self.path)
+                if frame is None:
+                    self._send(404, "application/json", b'{"error": "Design not found"}')
+                    return
+                img = tile_delta.normalize(Image.open(BytesIO(frame)))
+                content_type, body = tile_delta.encode(img, manifest)
+                self._send(200, content_type, body,
+                           {tile_delta.DIGEST_HEADER: tile_delta.frame_digest(img)})
+
+            def _fit(self, frame: bytes, caps: dict) -> Tuple[bytes, str]:
+                from io import BytesIO
+
+                from PIL import Image
+
+                import capabilities
+                img, mode = capabilities.render(Image.open(BytesIO(frame)), caps)
+                buf = BytesIO()
+                img.save(buf, format="PNG")
+                return buf.getvalue(), mode
+
+            def _playlist_bundle(self, request: dict) -> None:
+                import playlist
+                with server._cond:
+                    version, frames = server.playlist_version, list(server.playlist)
+                if request.get("version") == version:
+                    self._send(204, "text/plain", b"")
+                    return
+                self._send(200, playlist.CONTENT_TYPE,
+                           playlist.encode(version, frames, request.get("have") or ()))
+
+            def _preview_overlay(self, route: str) -> None:
+                from io import BytesIO
+
+                from PIL import Image
+
+                import composite
+                import tile_delta
+                frame = server._frame(self.path)
+                if frame is None:
+                    self._send(404, "application/json", b'{"error": "Design not found"}')
+                    return
+                overlay = server.overlay
+                base = composite.render_base(Image.open(BytesIO(frame)), overlay)
+                digest = tile_delta.frame_digest(base)
+                if route == "/preview/overlay":
+                    self._send_json(dict(overlay, base=digest))
+                    return
+                buf = BytesIO()
+                base.save(buf, format="PNG")
+                self._send(200, "image/png", buf.getvalue(), {tile_delta.DIGEST_HEADER: digest})
+
+            def _send_frame(self, frame: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+                """A /preview answer: the frame or, for a matching Range request, its rest."""
+                headers = dict(headers or {})
+                code, body = 200, frame
+                if server.ranges:
+                    etag = f'"{hashlib.sha256(frame).hexdigest()}"'
+                    digest = base64.b64encode(hashlib.sha256(frame).digest()).decode("ascii")
+                    headers.update({"ETag": etag, "Accept-Ranges": "bytes",
+                                    "Repr-Digest": f"sha-256=:{digest}:"})
+                    match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+                    if (match and int(match.group(1)) < len(frame)
+                            and self.headers.get("If-Range", etag) == etag):
+                        start = int(match.group(1))
+                        code, body = 206, frame[start:]
+                        headers["Content-Range"] = f"bytes {start}-{len(frame) - 1}/{len(frame)}"
+                with server._cond:
+                    cut = len(body) > 1 and server.random.random() < server.cut
+                    keep = server.random.randrange(1, len(body)) if cut else len(body)
+                    server.cuts += cut
+                self._send(code, "image/png", body, headers, keep=keep)
+
+            def _send_json(self, body) -> None:
+                self._send(200, "application/json", json.dumps(body).encode("utf-8"))
+
+            def _send(self, code: int, content_type: str, body: bytes,
+                      headers: Optional[Dict[str, str]] = None,
+                      keep: Optional[int] = None) -> None:
+                """Send a response; keep < len(body) closes the connection after that many bytes."""
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if keep is not None and keep < len(body):
+                    self.wfile.write(body[:keep])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa: A002 (http.server API)
+                pass
+
+        return Handler
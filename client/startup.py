@@ -0,0 +1,143 @@
+"""Cold-start support: deferred heavy imports and the startup profile.
+
+On a Pi Zero, importing requests and Pillow costs seconds before the first
+line of client code runs, and the waveshare_epd import (gpiozero/lgpio, GPIO
+setup at import time) costs more. client.py therefore binds `requests` and
+`Image` to DeferredModule stand-ins that import on first attribute access,
+and main() brings the display driver up on a background thread while the
+main thread fetches /settings and the first preview. The panel write waits
+for whichever finishes last; after power loss and after every E5.4 systemd
+restart the first frame arrives sooner by roughly the shorter of the two.
+
+StartupProfile records every startup phase (with its thread) relative to
+the client import and renders the `client.py --startup-profile` report.
+"""
+
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Seconds per jiffy for /proc/self/stat (USER_HZ is 100 on every Linux target).
+_CLOCK_TICKS = 100
+# Phase label of the main thread blocking on the driver bring-up thread.
+WAIT_LABEL = "wait for driver"
+
+
+class DeferredModule:
+    """Stands in for a module that is imported on the first attribute access.
+
+    Tests keep patching the name (patch("client.requests")) as before;
+    annotations that mention it must not be evaluated at import time.
+    """
+
+    def __init__(
+        self, name: str, on_import: Optional[Callable[[str, float, float], None]] = None
+    ) -> None:
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._on_import = on_import
+
+    def load(self) -> ModuleType:
+        """Import (once) and return the real module."""
+        module = self._module
+        if module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            self._module = module
+            if self._on_import is not None:
+                self._on_import(f"import {self._name}", start, time.perf_counter())
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "deferred"
+        return f"<DeferredModule {self._name} ({state})>"
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process started (Linux /proc), None elsewhere."""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as fh:
+            # Field 22 (starttime); split after the ")" of the comm field.
+            start_ticks = int(fh.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="ascii") as fh:
+            uptime = float(fh.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(uptime - start_ticks / _CLOCK_TICKS, 0.0)
+
+
+class StartupProfile:
+    """Timeline of the startup phases; safe to record from several threads."""
+
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        # Interpreter start and the imports before client.py's own code.
+        self.before_t0 = process_age()
+        self.phases: List[Tuple[str, float, float, str]] = []
+        self.first_frame: Optional[float] = None
+
+    def record(self, label: str, start: float, end: float) -> None:
+        """One phase from perf_counter() start/end, attributed to this thread."""
+        self.phases.append(
+            (label, start - self.t0, end - self.t0, threading.current_thread().name)
+        )
+
+    def record_until_now(self, label: str) -> None:
+        """A phase from the client import until now (e.g. the import itself)."""
+        self.record(label, self.t0, time.perf_counter())
+
+    @contextmanager
+    def span(self, label: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(label, start, time.perf_counter())
+
+    def mark_first_frame(self) -> None:
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.t0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def summary(self) -> str:
+        """One log line: time to first frame and the driver overlap."""
+        end = self.first_frame if self.first_frame is not None else self.elapsed()
+        what = "first frame" if self.first_frame is not None else "startup done (no frame)"
+        parts = [f"{what} {end:.2f}s after client import"]
+        if self.before_t0 is not None:
+            parts.append(f"{self.before_t0 + end:.2f}s after process start")
+        overlap = self.overlap()
+        if overlap > 0:
+            parts.append(f"{overlap:.2f}s of driver bring-up overlapped with the network")
+        return ", ".join(parts)
+
+    def overlap(self) -> float:
+        """Seconds of background work the main thread did not have to wait for."""
+        main = threading.main_thread().name
+        background = sum(end - start for _, start, end, thread in self.phases if thread != main)
+        waited = sum(end - start for label, start, end, _ in self.phases if label == WAIT_LABEL)
+        return max(background - waited, 0.0)
+
+    def format_report(self) -> str:
+        lines = ["startup profile (seconds since the client import)"]
+        if self.before_t0 is not None:
+            lines.append(f"  interpreter start and stdlib imports before that: {self.before_t0:.2f}s")
+        lines.append(f"  {'start':>7} {'end':>7} {'took':>7}  {'thread':<16} phase")
+        for label, start, end, thread in sorted(self.phases, key=lambda p: (p[1], p[2])):
+            lines.append(
+                f"  {start:7.3f} {end:7.3f} {end - start:7.3f}  {thread:<16} {label}"
+            )
+        lines.append(self.summary())
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Tests for the benchmark runner and the baseline comparison."""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import bench
+import client
+import config
+
+
+class TestCompare(unittest.TestCase):
+    """Regression detection on the median against a stored baseline."""
+
+    @staticmethod
+    def doc(**medians):
+        return {"results": {name: {"median_ms": ms} for name, ms in medians.items()}}
+
+    def test_regression_beyond_threshold_is_flagged(self):
+        rows = bench.compare(self.doc(a=13.0, b=10.5), self.doc(a=10.0, b=10.0), threshold=20)
+        by_name = {row["name"]: row for row in rows}
+        self.assertTrue(by_name["a"]["regression"])
+        self.assertEqual(by_name["a"]["change_pct"], 30.0)
+        self.assertFalse(by_name["b"]["regression"])
+
+    def test_speedup_is_never_a_regression(self):
+        rows = bench.compare(self.doc(a=2.0), self.doc(a=10.0), threshold=0)
+        self.assertFalse(rows[0]["regression"])
+        self.assertEqual(rows[0]["change_pct"], -80.0)
+
+    def test_benchmarks_missing_on_either_side_are_skipped(self):
+        rows = bench.compare(self.doc(new=1.0, a=1.0), self.doc(a=1.0, gone=1.0, zero=0.0))
+        self.assertEqual([row["name"] for row in rows], ["a"])
+
+    def test_select_by_substring(self):
+        self.assertEqual(bench.select([]), list(bench.BENCHMARKS))
+        self.assertEqual(
+            bench.select(["sha256"]),
+            ["sha256_preview_png", "sha256_rgb_frame", "sha256_bw_frame"],
+        )
+
+
+class TestRunSuite(unittest.TestCase):
+    """One pass over every benchmark: runs, is JSON-serializable, leaves no trace."""
+
+    def test_full_suite_smoke_run_and_cli_compare(self):
+        before = {name: getattr(config, name) for name in ("SERVER_URL", "LAST_SENT_PATH")}
+        epd_before = client.epd
+
+        doc = bench.run_suite(repeat=1, warmup=0)
+
+        self.assertEqual(list(doc["results"]), list(bench.BENCHMARKS))
+        for result in doc["results"].values():
+            self.assertEqual(result["runs"], 1)
+            self.assertGreaterEqual(result["median_ms"], 0)
+        self.assertEqual({n: getattr(config, n) for n in before}, before)
+        self.assertIs(client.epd, epd_before)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            baseline = os.path.join(tmpdir, "baseline.json")
+            doc["results"]["sha256_bw_frame"]["median_ms"] = 1e-9  # force a "regression"
+            with open(baseline, "w") as fh:
+                json.dump(doc, fh)
+            with open(os.devnull, "w") as devnull, \
+                    patch("sys.stdout", devnull):
+                self.assertEqual(bench.main(["-k", "sha256_bw", "--repeat", "2",
+                                             "--compare", baseline]), 1)
+                self.assertEqual(bench.main(["-k", "sha256_rgb", "--repeat", "2",
+                                             "--compare", baseline, "--threshold", "1e9"]), 0)
+
+    def test_environment_fetches_from_the_standin_only(self):
+        with patch.object(config, "SERVER_URLS", "http://a.invalid,http://b.invalid"), \
+                patch.object(config, "PREVIEW_DELTA", True):
+            with bench.BenchEnvironment() as env:
+                self.assertIsNotNone(client.fetch_preview("dithered"))
+                self.assertEqual(env.server.requests["/preview"], 1)
+            self.assertEqual(config.SERVER_URLS, "http://a.invalid,http://b.invalid")
+
+
+if __name__ == "__main__":
+    unittest.main()
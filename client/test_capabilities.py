@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Tests for the capability handshake."""
+
+import importlib
+import os
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+import capabilities
+import standin_server
+from test_client import ArtifactSandboxMixin
+from test_timeline import ImageEPD
+
+
+def png_round_trip(img):
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    decoded = Image.open(BytesIO(buf.getvalue()))
+    decoded.load()
+    return decoded
+
+
+def dithered(size=(800, 480)):
+    """A frame already dithered to the 6-color palette: stripes of each color."""
+    img = Image.new("RGB", size)
+    colors = capabilities.palette_rgb(capabilities.announcement("epd7in3e", 1, 1, False))
+    for x in range(size[0]):
+        for y in range(0, size[1], 40):
+            img.putpixel((x, y), colors[(x // 7 + y) % len(colors)])
+    return img
+
+
+class TestAnnouncement(unittest.TestCase):
+
+    def test_announcement_and_id(self):
+        caps = capabilities.announcement("epd7in3e", 800, 480, delta=False)
+        self.assertEqual(caps["formats"], ["image/png;mode=P", "image/png;mode=RGB"])
+        self.assertEqual((caps["digest"], caps["palette"][5]), ("sha256", "#FFFF00"))
+        self.assertEqual(capabilities.modes(caps), ["P", "RGB"])
+        same = capabilities.announcement("epd7in3e", 800, 480, delta=False)
+        self.assertEqual(capabilities.caps_id(caps), capabilities.caps_id(same))
+        self.assertNotEqual(capabilities.caps_id(caps), capabilities.caps_id(
+            capabilities.announcement("epd7in3e", 800, 480, delta=True)))
+        with self.assertRaises(KeyError):
+            capabilities.announcement("epd2in13", 250, 122, delta=False)
+
+    def test_color_frames_fit_as_a_palette_png(self):
+        caps = capabilities.announcement("epd7in3e", 800, 480, delta=False)
+        source = dithered((640, 400))
+        img, mode = capabilities.render(source, caps)
+        self.assertEqual(mode, "P")
+        decoded = png_round_trip(img)
+        self.assertTrue(capabilities.fits(decoded, caps))
+        expected = source.resize((800, 480), Image.Resampling.NEAREST)
+        self.assertEqual(decoded.convert("RGB").tobytes(), expected.tobytes())
+
+    def test_bw_frames_fit_as_a_1bit_png(self):
+        caps = capabilities.announcement("epd7in5_V2", 800, 480, delta=False)
+        img, mode = capabilities.render(Image.new("RGB", (800, 480), (200, 200, 200)), caps)
+        self.assertEqual(mode, "1")
+        self.assertTrue(capabilities.fits(png_round_trip(img), caps))
+
+    def test_what_does_not_fit(self):
+        caps = capabilities.announcement("epd7in3e", 800, 480, delta=False)
+        self.assertTrue(capabilities.fits(Image.new("RGB", (800, 480)), caps))
+        self.assertFalse(capabilities.fits(Image.new("RGB", (480, 800)), caps))
+        self.assertFalse(capabilities.fits(Image.new("L", (800, 480)), caps))
+        self.assertFalse(capabilities.fits(Image.new("P", (800, 480)), caps))  # grayscale palette
+
+
+class TestClientCapabilities(ArtifactSandboxMixin, unittest.TestCase):
+    """The client's announcement and exact-fit writes against the stand-in server."""
+
+    def setUp(self):
+        super().setUp()
+        import config
+        client = self.client
+        self.source = BytesIO()
+        dithered((640, 400)).save(self.source, format="PNG")
+        self.server = standin_server.StandinServer(self.source.getvalue()).start()
+        self.addCleanup(self.server.stop)
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("SERVER_URLS", ""), ("CLIENT_TOKEN", ""),
+            ("PREVIEW_DELTA", False), ("COMPOSITE", False), ("PREVIEW_RESUME", 0),
+            ("CAPABILITIES", True),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("_capabilities", "_capabilities_supported", "driver_name",
+                     "_offline_since", "_last_fetch_hash", "_last_fetch_bytes"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        client._capabilities = None
+        client._capabilities_supported = True
+        client.driver_name = "epd7in3e"
+        client.epd = self.epd = ImageEPD()
+        self.display_config = dict(standin_server.COLOR_SETTINGS["display"])
+
+    def fetch_and_write(self):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            img = self.client.fetch_preview()
+            self.assertTrue(self.client.display_image(img, self.display_config))
+        return img, logs.output
+
+    def test_frames_rendered_to_fit_skip_the_conversion(self):
+        exact = self.client._m_panel_fit.value(result="exact")
+        img, logs = self.fetch_and_write()
+        caps_id = self.client._capabilities[0]
+        self.assertTrue(any(f"Announced panel epd7in3e 800x480 (P, RGB) as {caps_id}" in line
+                            for line in logs))
+        self.assertEqual((img.size, img.mode), ((800, 480), "P"))
+        self.assertEqual(self.epd.images[-1].mode, "P")
+        self.assertFalse(any("does not match display" in line for line in logs))
+        self.assertTrue(any("Sending exact-fit P frame" in line for line in logs))
+        self.assertEqual(list(self.server.capabilities), [caps_id])
+        self.fetch_and_write()
+        self.assertEqual(self.server.requests[capabilities.ENDPOINT], 1)  # once per connection
+        self.assertEqual(self.client._m_panel_fit.value(result="exact") - exact, 2)
+
+    def test_announces_again_after_a_server_restart_and_a_reconnect(self):
+        self.fetch_and_write()
+        self.server.capabilities.clear()  # restarted: ?caps= unknown
+        img, logs = self.fetch_and_write()
+        self.assertEqual(img.size, (640, 400))
+        self.assertTrue(any("announcing again" in line for line in logs))
+        self.assertTrue(any("does not match display" in line for line in logs))
+        img, _ = self.fetch_and_write()
+        self.assertEqual(img.mode, "P")
+        self.assertEqual(self.server.requests[capabilities.ENDPOINT], 2)
+        self.client._offline_since = time.monotonic()
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client._server_reachable()
+        self.fetch_and_write()
+        self.assertEqual(self.server.requests[capabilities.ENDPOINT], 3)
+
+    def test_changed_announcement_is_sent_again(self):
+        import config
+        self.fetch_and_write()
+        with patch.object(config, "PREVIEW_DELTA", True):
+            with self.assertLogs("eink-client", level="INFO"):
+                self.client._announce_capabilities()
+        self.assertEqual(self.server.requests[capabilities.ENDPOINT], 2)
+        self.assertEqual(len(self.server.capabilities), 2)
+
+    def test_bw_panel(self):
+        self.client.driver_name = "epd7in5_V2"
+        self.display_config["colors"] = ["#000000", "#FFFFFF"]
+        img, logs = self.fetch_and_write()
+        self.assertEqual((img.size, img.mode), ((800, 480), "1"))
+        self.assertTrue(any("Sending exact-fit 1 frame" in line for line in logs))
+
+    def test_server_without_the_handshake(self):
+        self.server.capabilities = None
+        img, logs = self.fetch_and_write()
+        self.assertTrue(any(f"no {capabilities.ENDPOINT} (HTTP 404)" in line for line in logs))
+        self.assertFalse(self.client._capabilities_supported)
+        self.assertEqual(img.size, (640, 400))
+        self.assertTrue(any("does not match display" in line for line in logs))
+        self.fetch_and_write()
+        self.assertEqual(self.server.requests[capabilities.ENDPOINT], 1)
+
+    def test_no_announcement_without_a_driver(self):
+        self.client.epd = None
+        self.assertIsNone(self.client._announce_capabilities())
+        self.assertNotIn(capabilities.ENDPOINT, self.server.requests)
+
+
+class TestCapabilitiesConfig(unittest.TestCase):
+    """config.CAPABILITIES."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_CAPABILITIES", None)
+            importlib.reload(config)
+            self.assertFalse(config.CAPABILITIES)
+        with patch.dict(os.environ, {"EINK_CAPABILITIES": "True"}):
+            importlib.reload(config)
+            self.assertTrue(config.CAPABILITIES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Tests for E-Ink Picture Client with mock display."""
 
+import base64
 import hashlib
 import importlib
 import json
@@ -8,6 +9,7 @@ import logging
 import os
 import sys
 import tempfile
+import threading
 import time
 import unittest
 from io import BytesIO
@@ -164,6 +166,19 @@ class FailingEPD(CountingEPD):
         super().display(buffer)
 
 
+def use_real_config_defaults(mock_config):
+    """Copy every real config value onto a patched client.config mock.
+
+    main() reads more settings than a test cares about; with this the test
+    overrides only what it exercises and everything else keeps its real
+    default instead of becoming a MagicMock attribute.
+    """
+    import config
+    for name in dir(config):
+        if name.isupper():
+            setattr(mock_config, name, getattr(config, name))
+
+
 def make_test_png(width=800, height=480, color=(255, 255, 255)):
     """Create a test PNG image in memory."""
     img = Image.new("RGB", (width, height), color)
@@ -242,8 +257,13 @@ class ArtifactSandboxMixin:
         self.addCleanup(patcher.stop)
         self.addCleanup(setattr, client, "epd", client.epd)
         for attr in ("_preview_only", "_hw_recovery_pending",
-                     "_consecutive_hw_failures", "_initial_display_done"):
+                     "_consecutive_hw_failures", "_initial_display_done",
+                     "_last_artifact"):
             self.addCleanup(setattr, client, attr, getattr(client, attr))
+        client._last_artifact = None
+        # Runs before the temp dir cleanup (LIFO): no background write may
+        # land after the sandbox is gone.
+        self.addCleanup(client._artifact_writer.flush, 5)
 
 
 class TestFetchPreview(unittest.TestCase):
@@ -253,6 +273,13 @@ class TestFetchPreview(unittest.TestCase):
     @patch("client.config")
     def test_fetch_preview_success(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         png_data = make_test_png()
         mock_resp = MagicMock()
         mock_resp.ok = True
@@ -273,6 +300,13 @@ class TestFetchPreview(unittest.TestCase):
     def test_fetch_preview_server_down(self, mock_config, mock_requests):
         import requests as real_requests
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_requests.ConnectionError = real_requests.ConnectionError
         mock_requests.get.side_effect = real_requests.ConnectionError("Connection refused")
 
@@ -286,6 +320,13 @@ class TestFetchPreview(unittest.TestCase):
     def test_fetch_preview_server_error(self, mock_config, mock_requests):
         import requests as real_requests
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_resp = MagicMock()
         mock_resp.raise_for_status.side_effect = real_requests.HTTPError("500 Server Error")
         mock_requests.get.return_value = mock_resp
@@ -309,6 +350,13 @@ class TestFetchPreview(unittest.TestCase):
     def test_fetch_preview_original_appends_raw(self, mock_config, mock_requests):
         """F10 AC5: mode=original requests /preview?raw=true."""
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         self._mock_ok_png(mock_requests)
 
         import client
@@ -322,6 +370,13 @@ class TestFetchPreview(unittest.TestCase):
     def test_fetch_preview_dithered_no_raw(self, mock_config, mock_requests):
         """F10 AC5: mode=dithered requests /preview unchanged."""
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         self._mock_ok_png(mock_requests)
 
         import client
@@ -336,6 +391,13 @@ class TestFetchPreview(unittest.TestCase):
     def test_fetch_preview_default_no_raw(self, mock_config, mock_requests):
         """F10 AC5: default (no arg) stays dithered — /preview, no raw."""
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         self._mock_ok_png(mock_requests)
 
         import client
@@ -344,11 +406,40 @@ class TestFetchPreview(unittest.TestCase):
         url = mock_requests.get.call_args.args[0]
         self.assertEqual(url, "http://localhost:5000/preview")
 
+    @patch("client.requests")
+    @patch("client.config")
+    def test_fetch_preview_design_by_name(self, mock_config, mock_requests):
+        """Multi-panel: a saved design is requested by name, raw stays combinable."""
+        mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
+        self._mock_ok_png(mock_requests)
+
+        import client
+        client.fetch_preview("original", design="Küche & Flur")
+
+        url = mock_requests.get.call_args.args[0]
+        self.assertEqual(
+            url, "http://localhost:5000/preview?raw=true&name=K%C3%BCche%20%26%20Flur"
+        )
+
     @patch("client.requests")
     @patch("client.config")
     def test_fetch_preview_unknown_mode_no_raw(self, mock_config, mock_requests):
         """F10 robustness: an unexpected mode value behaves as dithered."""
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         self._mock_ok_png(mock_requests)
 
         import client
@@ -595,6 +686,128 @@ class TestLastSentArtifact(ArtifactSandboxMixin, unittest.TestCase):
         self.assertEqual(os.listdir(self.artifact_dir), [])
 
 
+class TestArtifactWriter(ArtifactSandboxMixin, unittest.TestCase):
+    """Last-sent artifact: digest dedup, fast encodings, background writer."""
+
+    def _display(self, img, display_config=COLOR_DISPLAY_CONFIG):
+        mock_epd = RecordingEPD(artifact_path=self.artifact_path)
+        self.client.epd = mock_epd
+        self.assertTrue(self.client.display_image(img, display_config))
+        return mock_epd
+
+    def test_identical_frame_is_not_rewritten(self):
+        """Same driver image twice => one encode/replace, file untouched."""
+        img = make_gradient_image()
+        with patch("client.os.replace", wraps=os.replace) as replace_spy:
+            self._display(img)
+            mtime_ns = os.stat(self.artifact_path).st_mtime_ns
+            self._display(img)
+
+        replace_spy.assert_called_once()
+        self.assertEqual(os.stat(self.artifact_path).st_mtime_ns, mtime_ns)
+
+    def test_changed_frame_is_written(self):
+        """A different frame replaces the artifact (dedup keys on pixels)."""
+        self._display(make_gradient_image())
+        mock_epd = self._display(make_rgb_panel_image(800, 480))
+
+        with Image.open(self.artifact_path) as artifact:
+            artifact.load()
+            self.assertEqual(artifact.tobytes(), mock_epd.getbuffer_image.tobytes())
+
+    def test_deleted_artifact_is_rewritten(self):
+        """Dedup never trusts memory alone: a removed file is written again."""
+        img = make_gradient_image()
+        self._display(img)
+        os.remove(self.artifact_path)
+
+        self._display(img)
+
+        self.assertTrue(os.path.exists(self.artifact_path))
+
+    def test_png_fast_format(self):
+        """png-fast: still a lossless PNG, pixel-identical to the driver image."""
+        with patch.object(self.client.config, "LAST_SENT_FORMAT", "png-fast"):
+            mock_epd = self._display(make_gradient_image())
+
+        with Image.open(self.artifact_path) as artifact:
+            artifact.load()
+            self.assertEqual(artifact.format, "PNG")
+            self.assertEqual(artifact.tobytes(), mock_epd.getbuffer_image.tobytes())
+
+    def test_raw_format_both_panel_paths(self):
+        """raw: PPM for the RGB frame, packed PBM for B/W - both pixel-identical."""
+        cases = ((COLOR_DISPLAY_CONFIG, "RGB"), (BW_DISPLAY_CONFIG, "1"))
+        for display_config, mode in cases:
+            with self.subTest(mode=mode), \
+                    patch.object(self.client.config, "LAST_SENT_FORMAT", "raw"):
+                mock_epd = self._display(make_gradient_image(), display_config)
+                with Image.open(self.artifact_path) as artifact:
+                    artifact.load()
+                    self.assertEqual(artifact.format, "PPM")
+                    self.assertEqual(artifact.mode, mode)
+                    self.assertEqual(
+                        artifact.tobytes(), mock_epd.getbuffer_image.tobytes()
+                    )
+        self.assertEqual(os.listdir(self.artifact_dir), ["eink_last_sent.png"])
+
+    def test_unknown_format_falls_back_to_png(self):
+        with patch.object(self.client.config, "LAST_SENT_FORMAT", "webp"):
+            self._display(make_gradient_image())
+
+        with Image.open(self.artifact_path) as artifact:
+            self.assertEqual(artifact.format, "PNG")
+
+    def test_async_writer_off_the_critical_path(self):
+        """LAST_SENT_ASYNC: display() runs before the artifact lands; flush()
+        then delivers the same atomic, pixel-identical file."""
+        with patch.object(self.client.config, "LAST_SENT_ASYNC", True), \
+                patch("client.os.replace", wraps=os.replace) as replace_spy:
+            mock_epd = self._display(make_gradient_image())
+            self.assertTrue(self.client._artifact_writer.flush(5))
+
+        self.assertIsNotNone(mock_epd.displayed_buffer)
+        src, dst = replace_spy.call_args.args
+        self.assertEqual(dst, self.artifact_path)
+        self.assertEqual(os.path.dirname(src), self.artifact_dir)
+        with Image.open(self.artifact_path) as artifact:
+            artifact.load()
+            self.assertEqual(artifact.tobytes(), mock_epd.getbuffer_image.tobytes())
+        self.assertEqual(os.listdir(self.artifact_dir), ["eink_last_sent.png"])
+
+    def test_async_writer_latest_frame_wins(self):
+        """Frames queued behind a slow write collapse to the newest one."""
+        release = threading.Event()
+        real_save = self.client.save_last_sent_artifact
+        written = []
+
+        def slow_save(img):
+            release.wait(5)
+            written.append(img)
+            real_save(img)
+
+        first, second, third = (make_test_png(color=c) for c in
+                                ((1, 2, 3), (4, 5, 6), (7, 8, 9)))
+        with patch.object(self.client, "save_last_sent_artifact", side_effect=slow_save):
+            for png in (first, second, third):
+                self.client._artifact_writer.submit(Image.open(BytesIO(png)))
+            release.set()
+            self.assertTrue(self.client._artifact_writer.flush(5))
+
+        self.assertLessEqual(len(written), 2)
+        with Image.open(self.artifact_path) as artifact:
+            self.assertEqual(artifact.getpixel((0, 0)), (7, 8, 9))
+
+    def test_cleanup_flushes_async_writer(self):
+        """cleanup() waits for a pending background write before exiting."""
+        self.client.epd = None
+        with patch.object(self.client.config, "LAST_SENT_ASYNC", True):
+            self.client._submit_last_sent_artifact(make_gradient_image())
+            self.client.cleanup()
+
+        self.assertTrue(os.path.exists(self.artifact_path))
+
+
 class TestResizeGuard(ArtifactSandboxMixin, unittest.TestCase):
     """E1.4 AC1-AC6: size mismatch must never destroy server-side dithering."""
 
@@ -775,11 +988,18 @@ class ContentSkipSandbox(ArtifactSandboxMixin):
         self.config = config
         client = self.client
         for attr in ("_last_fetch_hash", "_last_displayed_hash",
-                     "_last_panel_write_monotonic", "driver_name"):
+                     "_last_panel_write_monotonic", "driver_name",
+                     "_offline_since", "_offline_refreshes", "_offline_written_hash",
+                     "_last_refresh_monotonic", "_last_frame"):
             self.addCleanup(setattr, client, attr, getattr(client, attr))
         client._last_fetch_hash = None
         client._last_displayed_hash = None
         client._last_panel_write_monotonic = None
+        client._offline_since = None
+        client._offline_refreshes = 0
+        client._offline_written_hash = None
+        client._last_refresh_monotonic = None
+        client._last_frame = None
         client.driver_name = "epd7in3e"
         # E5.4 state: post-startup semantics by default (initial write done),
         # no pending recovery, counter at zero.
@@ -999,6 +1219,243 @@ class TestContentSkipGuardsAndSwitches(ContentSkipSandbox, unittest.TestCase):
         self.assertFalse(os.path.exists(self.artifact_path))
 
 
+class TestStageTiming(ContentSkipSandbox, unittest.TestCase):
+    """Per-stage spans across process_refresh_cycle/handle_refresh/fetch_preview/display_image."""
+
+    def setUp(self):
+        super().setUp()
+        import timing
+        self.timer = timing.StageTimer()
+        for patcher in (patch.object(self.client, "_timer", self.timer),
+                        patch.object(self.config, "STAGE_TIMING", True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_refresh_cycle_times_every_pipeline_stage(self):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.client.process_refresh_cycle()
+
+        cycle = self.timer.last_cycle
+        for stage in ("poll", "settings", "download", "hash", "decode", "convert",
+                      "artifact", "init", "getbuffer", "display", "sleep",
+                      "heartbeat", "total"):
+            self.assertIn(stage, cycle)
+        summaries = [r.getMessage() for r in logs.records
+                     if r.getMessage().startswith("cycle timings: ")]
+        self.assertEqual(len(summaries), 1, logs.output)
+        self.assertIn(" display=", summaries[0])
+        self.assertIn(" total=", summaries[0])
+
+    def test_skip_cycle_has_no_panel_stages(self):
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()
+            self.client.process_refresh_cycle()  # identical bytes -> content skip
+
+        cycle = self.timer.last_cycle
+        self.assertIn("download", cycle)
+        self.assertNotIn("init", cycle)
+        self.assertNotIn("display", cycle)
+        self.assertEqual(self.timer.stats()["display"]["count"], 1)
+
+    def test_idle_poll_summary_is_debug_only(self):
+        self.server.should_refresh = False
+        with self.assertNoLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()
+        self.assertEqual(set(self.timer.last_cycle), {"poll", "total"})
+
+    def test_disabled_timer_logs_no_summary(self):
+        import timing
+        with patch.object(self.client, "_timer", timing.StageTimer(enabled=False)), \
+                self.assertLogs("eink-client", level="DEBUG") as logs:
+            self.client.process_refresh_cycle()
+        self.assertFalse(
+            any("cycle timings" in r.getMessage() for r in logs.records)
+        )
+
+
+class TestClientMetrics(ContentSkipSandbox, unittest.TestCase):
+    """Refresh/skip/failure counters, HTTP errors, gauges and the textfile export."""
+
+    def setUp(self):
+        import client as client_module
+        import metrics
+        self.original_server_get = client_module._server_get
+        self.module_registry = client_module._metrics
+        super().setUp()
+        client = self.client
+        self.registry = metrics.Registry()
+        # Fresh metric objects per test, wired into the client module.
+        replacements = {
+            "_metrics": self.registry,
+            "_m_refreshes": self.registry.counter("r_total", "r", labels=("result",)),
+            "_m_http_errors": self.registry.counter(
+                "e_total", "e", labels=("endpoint", "code")
+            ),
+            "_m_hw_failures": self.registry.counter("f_total", "f"),
+            "_m_driver_reloads": self.registry.counter("d_total", "d"),
+            "_m_preview_bytes": self.registry.histogram(
+                "b", "b", buckets=metrics.BYTES_BUCKETS
+            ),
+        }
+        for name, value in replacements.items():
+            patcher = patch.object(client, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def results(self, result):
+        return self.client._m_refreshes.value(result=result)
+
+    def test_refresh_and_skip_counters(self):
+        self.client.process_refresh_cycle()
+        self.client.process_refresh_cycle()
+
+        self.assertEqual(self.results("refreshed"), 1)
+        self.assertEqual(self.results("skipped"), 1)
+        self.assertEqual(self.client._m_preview_bytes.count(), 2)
+
+    def test_failure_and_reload_counters(self):
+        self.install_epd(FailingEPD(fail_on="display"))
+        with patch.object(self.client, "_module_exit_best_effort"):
+            self.client.process_refresh_cycle()
+            self.epd = CountingEPD(artifact_path=self.artifact_path)
+            self.client.process_refresh_cycle()
+
+        self.assertEqual(self.results("failed"), 1)
+        self.assertEqual(self.results("refreshed"), 1)
+        self.assertEqual(self.client._m_hw_failures.value(), 1)
+        self.assertEqual(self.client._m_driver_reloads.value(), 1)
+
+    def test_http_errors_by_endpoint(self):
+        """Real _server_get: non-2xx and exceptions counted, query string dropped."""
+        import requests as real_requests
+        bad = MagicMock(ok=False, status_code=503)
+        with patch("client.requests") as mock_requests:
+            mock_requests.get.side_effect = [bad, real_requests.ConnectionError("down")]
+            resp = self.original_server_get("/preview?raw=true", timeout=5)
+            with self.assertRaises(real_requests.ConnectionError):
+                self.original_server_get("/settings", timeout=5)
+
+        self.assertIs(resp, bad)
+        errors = self.client._m_http_errors
+        self.assertEqual(errors.value(endpoint="/preview", code="503"), 1)
+        self.assertEqual(errors.value(endpoint="/settings", code="ConnectionError"), 1)
+
+    def test_module_registry_exposes_gauges(self):
+        text = self.module_registry.render()
+        for name in ("eink_client_refreshes_total", "eink_client_http_errors_total",
+                     "eink_client_hw_failures_total", "eink_client_driver_reloads_total",
+                     "eink_client_stage_seconds", "eink_client_preview_bytes",
+                     "eink_client_frame_age_seconds"):
+            self.assertIn(f"# TYPE {name} ", text)
+        self.assertIn("\neink_client_consecutive_hw_failures 0\n", text)
+        if os.path.exists("/proc/self/statm"):
+            self.assertIn("\neink_client_process_resident_bytes ", text)
+
+    def test_frame_age_gauge(self):
+        self.assertIsNone(self.client._frame_age_seconds())
+        with patch("client.time.monotonic", side_effect=[100.0, 160.0]):
+            self.client._record_panel_write("abc")
+            self.assertEqual(self.client._frame_age_seconds(), 60.0)
+
+    def test_textfile_export_started_and_stopped(self):
+        path = os.path.join(self.artifact_dir, "eink_client.prom")
+        self.addCleanup(setattr, self.client._timer, "enabled", self.client._timer.enabled)
+        self.addCleanup(setattr, self.client._timer, "observer", self.client._timer.observer)
+        with patch.object(self.config, "METRICS_TEXTFILE", path), \
+                patch.object(self.config, "METRICS_PORT", 0):
+            self.client._start_metrics_export()
+            self.assertTrue(self.client._timer.enabled)
+            self.client.process_refresh_cycle()
+            self.client._stop_metrics_export()
+
+        with open(path) as fh:
+            text = fh.read()
+        self.assertIn('r_total{result="refreshed"} 1', text)
+        self.assertEqual(self.client._metrics_exports, [])
+
+
+class TestHeartbeatTelemetry(ContentSkipSandbox, unittest.TestCase):
+    """Telemetry block in the heartbeat body and the fallback for strict servers."""
+
+    def setUp(self):
+        super().setUp()
+        import timing
+        self.timer = timing.StageTimer()
+        self.addCleanup(setattr, self.client, "_heartbeat_telemetry_accepted",
+                        self.client._heartbeat_telemetry_accepted)
+        self.client._heartbeat_telemetry_accepted = True
+        for patcher in (patch.object(self.client, "_timer", self.timer),
+                        patch.object(self.config, "HEARTBEAT_TELEMETRY", True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_refresh_heartbeat_carries_telemetry(self):
+        self.client.process_refresh_cycle()
+
+        telemetry = self.server.heartbeats[0]["telemetry"]
+        self.assertEqual(telemetry["wire_bytes"], len(self.server.png_bytes))
+        self.assertEqual(telemetry["digest"], hashlib.sha256(self.server.png_bytes).hexdigest())
+        self.assertEqual(telemetry["reason"], "interval")
+        self.assertIsNone(telemetry["skip_reason"])
+        self.assertEqual(telemetry["hw_failures"], 0)
+        self.assertEqual(telemetry["driver"], "epd7in3e")
+        # Stages up to the panel write are in; the heartbeat span is still open.
+        for stage in ("poll", "download", "decode", "display", "total"):
+            self.assertIsInstance(telemetry["stages_ms"][stage], int)
+        self.assertNotIn("heartbeat", telemetry["stages_ms"])
+        if telemetry["rss_bytes"] is not None:
+            self.assertGreater(telemetry["rss_bytes"], 0)
+        json.dumps(self.server.heartbeats[0])  # wire-serializable as-is
+
+    def test_skip_heartbeat_names_the_skip_reason(self):
+        self.client.process_refresh_cycle()
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()
+
+        self.assertEqual(self.heartbeat_statuses(), ["refreshed", "skipped"])
+        telemetry = self.server.heartbeats[1]["telemetry"]
+        self.assertEqual(telemetry["skip_reason"], "content_unchanged")
+        self.assertNotIn("display", telemetry["stages_ms"])
+
+    def test_disabled_timer_sends_empty_stages(self):
+        import timing
+        with patch.object(self.client, "_timer", timing.StageTimer(enabled=False)):
+            self.client.process_refresh_cycle()
+        self.assertEqual(self.server.heartbeats[0]["telemetry"]["stages_ms"], {})
+
+    def test_telemetry_off_sends_plain_heartbeat(self):
+        with patch.object(self.config, "HEARTBEAT_TELEMETRY", False):
+            self.client.process_refresh_cycle()
+        self.assertEqual(set(self.server.heartbeats[0]), {"status", "timestamp"})
+
+    def test_rejecting_server_gets_plain_heartbeats(self):
+        """A server that answers 400 to the extended body still gets its
+        heartbeat (re-sent plain) and no telemetry from then on."""
+        accept_post = self.server.post
+
+        def strict_post(path, payload, timeout=None):
+            if "telemetry" in payload:
+                self.server.heartbeats.append(dict(payload))
+                resp = MagicMock()
+                resp.ok = False
+                resp.status_code = 400
+                return resp
+            return accept_post(path, payload, timeout)
+
+        with patch.object(self.client, "_server_post", side_effect=strict_post), \
+                self.assertLogs("eink-client", level="INFO") as logs:
+            self.client.send_heartbeat("refreshed", "manual")
+            self.client.send_heartbeat("refreshed", "manual")
+
+        self.assertEqual(
+            ["telemetry" in hb for hb in self.server.heartbeats], [True, False, False]
+        )
+        self.assertFalse(self.client._heartbeat_telemetry_accepted)
+        self.assertEqual(
+            sum("rejected heartbeat telemetry" in r.getMessage() for r in logs.records), 1
+        )
+
+
 class TestDriverRecovery(ContentSkipSandbox, unittest.TestCase):
     """E5.4 AC1/AC2: driver exceptions => logger.exception + full driver reset."""
 
@@ -1262,6 +1719,225 @@ class TestInitialRetryAndServerDown(ContentSkipSandbox, unittest.TestCase):
         self.assertEqual(get_paths.count("/preview"), 2)
 
 
+class TestOfflineSchedule(ContentSkipSandbox, unittest.TestCase):
+    """config.REFRESH_INTERVAL: autonomous refreshes while the server is unreachable."""
+
+    def setUp(self):
+        super().setUp()
+        self.now = [1000.0]
+        for patcher in (
+            patch("client.time.monotonic", side_effect=lambda: self.now[0]),
+            patch.object(self.config, "REFRESH_INTERVAL", 600),
+            patch.object(self.config, "MAX_SKIP_HOURS", 24),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()  # online: first frame written
+        self.assertEqual(self.epd.display_calls, 1)
+
+    def server_down(self):
+        import requests as real_requests
+
+        def refuse(*args, **kwargs):
+            raise real_requests.ConnectionError("server down")
+
+        self.client._server_get.side_effect = refuse
+        self.client._server_post.side_effect = refuse
+
+    def server_up(self):
+        self.client._server_get.side_effect = self.server.get
+        self.client._server_post.side_effect = self.server.post
+
+    def test_own_schedule_while_offline(self):
+        self.server_down()
+        self.now[0] += 599
+        self.assertFalse(self.client.process_refresh_cycle())  # not due yet
+        self.now[0] += 1
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertFalse(self.client.process_refresh_cycle())
+        self.assertTrue(any("offline refresh of the last frame" in line
+                            for line in logs.output))
+        self.assertTrue(any("content unchanged" in line for line in logs.output))
+        self.assertEqual(self.epd.display_calls, 1)
+        # The skip restarted the schedule.
+        self.now[0] += 300
+        self.client.process_refresh_cycle()
+        self.assertEqual(self.client._offline_refreshes, 1)
+
+    def test_panel_care_runs_offline_and_reconnect_does_not_write_twice(self):
+        self.server_down()
+        self.now[0] += 24 * 3600 + 1
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()  # panel-care write, no server
+        self.assertEqual(self.epd.display_calls, 2)
+        self.now[0] += 60
+        self.server_up()
+        with patch.object(self.config, "CONTENT_SKIP", False), \
+                self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertTrue(self.client.process_refresh_cycle())
+        self.assertTrue(any("reachable again after 60s offline (1 offline refreshes)" in line
+                            for line in logs.output))
+        self.assertTrue(any("already written while offline" in line for line in logs.output))
+        self.assertEqual(self.epd.display_calls, 2)
+        self.assertEqual(self.heartbeat_statuses(), ["refreshed", "skipped"])
+        self.assertIsNone(self.client._offline_written_hash)
+
+    def test_manual_trigger_after_reconnect_still_writes(self):
+        self.server_down()
+        self.now[0] += 24 * 3600 + 1
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()
+        self.server_up()
+        self.server.reason = "manual"
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.process_refresh_cycle()
+        self.assertEqual(self.epd.display_calls, 3)
+        self.assertEqual(self.heartbeat_statuses(), ["refreshed", "refreshed"])
+
+    def test_zero_interval_stays_passive(self):
+        self.server_down()
+        with patch.object(self.config, "REFRESH_INTERVAL", 0):
+            self.now[0] += 48 * 3600
+            self.client.process_refresh_cycle()
+        self.assertEqual(self.epd.display_calls, 1)
+        self.assertEqual(self.client._offline_refreshes, 0)
+
+
+class TestResumableDownload(unittest.TestCase):
+    """EINK_PREVIEW_RESUME against a stand-in server that cuts /preview bodies off."""
+
+    def setUp(self):
+        import random
+
+        import client
+        import config
+        import standin_server
+        self.client = client
+        noise = random.Random(1).randbytes(800 * 480 * 3)
+        buf = BytesIO()
+        Image.frombytes("RGB", (800, 480), noise).save(buf, format="PNG")
+        self.png = buf.getvalue()
+        self.server = standin_server.StandinServer(self.png).start()
+        self.addCleanup(self.server.stop)
+        for name, value in (("SERVER_URL", self.server.url), ("SERVER_URLS", ""),
+                            ("CLIENT_TOKEN", ""), ("PREVIEW_DELTA", False),
+                            ("COMPOSITE", False), ("PREVIEW_RESUME", 3)):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("_last_fetch_hash", "_last_fetch_bytes"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+
+    def fetch(self, level="INFO", design=None):
+        with self.assertLogs("eink-client", level=level) as logs:
+            img = self.client.fetch_preview(design=design)
+        return img, logs.output
+
+    def test_random_cuts_resume_to_the_same_frame(self):
+        self.server.cut = 0.5
+        with patch.object(self.client.config, "PREVIEW_RESUME", 20):
+            for _ in range(8):
+                img, _ = self.fetch()
+                self.assertIsNotNone(img)
+                self.assertEqual(self.client._last_fetch_hash,
+                                 hashlib.sha256(self.png).hexdigest())
+        self.assertGreater(self.server.cuts, 0)
+        self.assertEqual(self.server.requests["/preview"], 8 + self.server.cuts)
+
+    def test_resume_downloads_only_the_rest(self):
+        self.server.cut = 1.0
+        seen = []
+        real_get = self.client._server_get
+
+        def get(path, timeout, headers=None, stream=False):
+            seen.append((headers or {}).get("Range"))
+            if headers:
+                self.server.cut = 0.0
+            return real_get(path, timeout, headers=headers, stream=stream)
+
+        with patch.object(self.client, "_server_get", side_effect=get):
+            img, logs = self.fetch()
+        self.assertIsNotNone(img)
+        self.assertEqual(seen[0], None)
+        self.assertRegex(seen[1], r"^bytes=[1-9]\d*-$")
+        self.assertTrue(any("broke off after" in line for line in logs))
+        self.assertEqual(self.client._last_fetch_bytes, len(self.png))
+
+    def test_changed_frame_starts_over(self):
+        self.server.cut = 1.0
+        changed = make_test_png(color=(1, 2, 3))
+        real_get = self.client._server_get
+
+        def get(path, timeout, headers=None, stream=False):
+            if headers:  # the resume: the frame changed meanwhile
+                self.server.cut = 0.0
+                self.server.png_bytes = changed
+            return real_get(path, timeout, headers=headers, stream=stream)
+
+        with patch.object(self.client, "_server_get", side_effect=get):
+            self.fetch()
+        self.assertEqual(self.client._last_fetch_hash, hashlib.sha256(changed).hexdigest())
+
+    def test_every_streamed_response_is_closed(self):
+        self.server.cut = 1.0
+        responses = []
+        real_get = self.client._server_get
+
+        def get(path, timeout, headers=None, stream=False):
+            resp = real_get(path, timeout, headers=headers, stream=stream)
+            if headers:  # a resume answered with the wrong range
+                self.server.cut = 0.0
+                resp.headers["Content-Range"] = "bytes 0-9/10"
+            resp.close = MagicMock(wraps=resp.close)
+            responses.append(resp)
+            return resp
+
+        with patch.object(self.client, "_server_get", side_effect=get):
+            img, logs = self.fetch()
+            self.assertIsNone(img)
+            self.assertIn("unexpected Content-Range", logs[-1])
+            img, logs = self.fetch()  # full download, not cut
+            self.assertIsNotNone(img)
+            img, logs = self.fetch(design="Missing")
+            self.assertIsNone(img)
+        self.assertEqual([r.status_code for r in responses], [200, 206, 200, 404])
+        for resp in responses:
+            resp.close.assert_called()
+
+    def test_limits_and_servers_without_ranges(self):
+        self.server.cut = 1.0
+        img, logs = self.fetch()
+        self.assertIsNone(img)
+        self.assertEqual(self.server.requests["/preview"], 4)  # 1 + 3 resumes
+        self.server.ranges = False
+        img, logs = self.fetch()
+        self.assertIsNone(img)
+        self.assertEqual(self.server.requests["/preview"], 5)
+        self.assertIn("Failed to fetch preview", logs[-1])
+
+    def test_digest_mismatch_is_a_failed_fetch(self):
+        with patch.object(self.client, "_repr_digest", return_value=b"\0" * 32):
+            img, logs = self.fetch()
+        self.assertIsNone(img)
+        self.assertIn("does not match its Repr-Digest", logs[-1])
+
+    def test_repr_digest_header(self):
+        digest = hashlib.sha256(b"frame").digest()
+        header = "sha-512=:AAAA:, sha-256=:" + base64.b64encode(digest).decode() + ":"
+        self.assertEqual(self.client._repr_digest(header), digest)
+        for header in ("", "sha-256=abc", "sha-256=:not base64!:"):
+            self.assertIsNone(self.client._repr_digest(header))
+
+    def test_off_by_default(self):
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_PREVIEW_RESUME", None)
+            import config
+            importlib.reload(config)
+            self.addCleanup(importlib.reload, config)
+            self.assertEqual(config.PREVIEW_RESUME, 0)
+
+
 class TestMainLoopRecovery(unittest.TestCase):
     """E5.4: main() runs cleanup() even when the escalation raises SystemExit."""
 
@@ -1284,8 +1960,16 @@ class TestMainLoopRecovery(unittest.TestCase):
                                          mock_load, mock_fetch_config,
                                          mock_fetch_preview, mock_heartbeat,
                                          mock_cycle, mock_cleanup):
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 1
 
         import client
@@ -1297,6 +1981,77 @@ class TestMainLoopRecovery(unittest.TestCase):
         mock_cleanup.assert_called_once()
 
 
+class TestLastSentWriterConfig(unittest.TestCase):
+    """config.LAST_SENT_FORMAT / config.LAST_SENT_ASYNC defaults and overrides."""
+
+    def tearDown(self):
+        # Restore module state from the real environment after reload tests.
+        import config
+        importlib.reload(config)
+
+    def test_defaults_keep_synchronous_png(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_LAST_SENT_FORMAT", None)
+            os.environ.pop("EINK_LAST_SENT_ASYNC", None)
+            importlib.reload(config)
+            self.assertEqual(config.LAST_SENT_FORMAT, "png")
+            self.assertFalse(config.LAST_SENT_ASYNC)
+
+    def test_env_overrides(self):
+        import config
+        with patch.dict(os.environ, {"EINK_LAST_SENT_FORMAT": "RAW",
+                                     "EINK_LAST_SENT_ASYNC": "True"}):
+            importlib.reload(config)
+            self.assertEqual(config.LAST_SENT_FORMAT, "raw")
+            self.assertTrue(config.LAST_SENT_ASYNC)
+        with patch.dict(os.environ, {"EINK_LAST_SENT_ASYNC": "1"}):
+            importlib.reload(config)
+            self.assertFalse(config.LAST_SENT_ASYNC)
+
+
+class TestStageTimingConfig(unittest.TestCase):
+    """config.STAGE_TIMING default and override."""
+
+    def tearDown(self):
+        # Restore module state from the real environment after reload tests.
+        import config
+        importlib.reload(config)
+
+    def test_stage_timing_default_off_only_true_enables(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_STAGE_TIMING", None)
+            importlib.reload(config)
+            self.assertFalse(config.STAGE_TIMING)
+        for value, expected in (("true", True), ("TRUE", True), ("1", False)):
+            with self.subTest(value=value):
+                with patch.dict(os.environ, {"EINK_STAGE_TIMING": value}):
+                    importlib.reload(config)
+                    self.assertEqual(config.STAGE_TIMING, expected)
+
+
+class TestHeartbeatTelemetryConfig(unittest.TestCase):
+    """config.HEARTBEAT_TELEMETRY default and override."""
+
+    def tearDown(self):
+        # Restore module state from the real environment after reload tests.
+        import config
+        importlib.reload(config)
+
+    def test_heartbeat_telemetry_default_on_only_false_disables(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_HEARTBEAT_TELEMETRY", None)
+            importlib.reload(config)
+            self.assertTrue(config.HEARTBEAT_TELEMETRY)
+        for value, expected in (("false", False), ("FALSE", False), ("0", True)):
+            with self.subTest(value=value):
+                with patch.dict(os.environ, {"EINK_HEARTBEAT_TELEMETRY": value}):
+                    importlib.reload(config)
+                    self.assertEqual(config.HEARTBEAT_TELEMETRY, expected)
+
+
 class TestHwFailureLimitConfig(unittest.TestCase):
     """E5.4 AC8: config.HW_FAILURE_LIMIT default value and env override."""
 
@@ -1385,6 +2140,13 @@ class TestRefreshStatus(unittest.TestCase):
     @patch("client.config")
     def test_should_refresh_true(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_resp = MagicMock()
         mock_resp.ok = True
         mock_resp.json.return_value = {"should_refresh": True}
@@ -1399,6 +2161,13 @@ class TestRefreshStatus(unittest.TestCase):
     @patch("client.config")
     def test_should_refresh_false(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_resp = MagicMock()
         mock_resp.ok = True
         mock_resp.json.return_value = {"should_refresh": False}
@@ -1413,6 +2182,13 @@ class TestRefreshStatus(unittest.TestCase):
     @patch("client.config")
     def test_should_refresh_server_error(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_requests.get.side_effect = Exception("timeout")
 
         import client
@@ -1428,6 +2204,13 @@ class TestHeartbeat(unittest.TestCase):
     @patch("client.config")
     def test_send_heartbeat(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
 
         import client
         client.send_heartbeat()
@@ -1444,6 +2227,13 @@ class TestHeartbeat(unittest.TestCase):
     def test_send_heartbeat_skipped_status(self, mock_config, mock_requests):
         """E5.2: heartbeat carries an explicit "skipped" status on content skip."""
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
 
         import client
         client.send_heartbeat("skipped")
@@ -1457,6 +2247,13 @@ class TestHeartbeat(unittest.TestCase):
     @patch("client.config")
     def test_send_heartbeat_server_down(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_requests.post.side_effect = Exception("Connection refused")
 
         import client
@@ -1471,6 +2268,13 @@ class TestFetchDisplayConfig(unittest.TestCase):
     @patch("client.config")
     def test_fetch_config_success(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.DISPLAY_DRIVER = "epd7in3e"
 
         import client
@@ -1497,6 +2301,13 @@ class TestFetchDisplayConfig(unittest.TestCase):
     @patch("client.config")
     def test_fetch_config_server_down(self, mock_config, mock_requests):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_requests.get.side_effect = Exception("Connection refused")
 
         import client
@@ -1506,6 +2317,13 @@ class TestFetchDisplayConfig(unittest.TestCase):
 
     def _mock_settings(self, mock_config, mock_requests, settings):
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         import client
         client.driver_name = "epd7in3e"
@@ -1580,8 +2398,16 @@ class TestMainLoop(unittest.TestCase):
                             mock_load, mock_fetch_config, mock_fetch_preview,
                             mock_display, mock_heartbeat, mock_cycle):
         """Main loop performs initial display update on startup."""
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 30
 
         test_img = Image.new("RGB", (800, 480), (255, 255, 255))
@@ -1624,8 +2450,16 @@ class TestMainLoop(unittest.TestCase):
                                   mock_load, mock_fetch_config, mock_fetch_preview,
                                   mock_display, mock_heartbeat, mock_cycle):
         """Main loop handles missing image gracefully."""
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 30
 
         # Stub the poll to "failed" so the loop backs off; fake_sleep then
@@ -1899,6 +2733,74 @@ class TestClientTokenAuth(unittest.TestCase):
             self.assertNotIn(secret, record.getMessage())
 
 
+class TestOptionalEndpoints(unittest.TestCase):
+    """Optional protocol extensions behind the server's deny-by-default auth guard."""
+
+    def setUp(self):
+        import client
+        import config
+        import standin_server
+        self.client = client
+        self.server = standin_server.StandinServer(make_test_png()).start()
+        self.addCleanup(self.server.stop)
+        self.server.guarded = True
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("SERVER_URLS", ""), ("CLIENT_TOKEN", "site-token"),
+            ("PREVIEW_DELTA", True), ("COMPOSITE", True), ("CAPABILITIES", True),
+            ("PREVIEW_RESUME", 0),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("epd", "driver_name", "_auth_error_logged", "_preview_delta_supported",
+                     "_composite_supported", "_capabilities_supported", "_capabilities",
+                     "_last_fetch_hash", "_last_fetch_bytes", "_playlist"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        for state in (client._probe_misses, client._delta_bases, client._composite_bases):
+            self.addCleanup(state.clear)
+            state.clear()
+        client.epd, client.driver_name = MockEPD(), "epd7in3e"
+        client._auth_error_logged = False
+        client._preview_delta_supported = client._composite_supported = True
+        client._capabilities_supported, client._capabilities = True, None
+
+    def test_probes_stop_without_token_errors(self):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            for _ in range(6):
+                self.assertIsNotNone(self.client.fetch_preview())
+        for route in ("/preview/overlay", "/preview/delta", "/api/client_capabilities"):
+            self.assertEqual(self.server.requests[route], self.client.PROBE_LIMIT, route)
+            self.assertTrue(any(f"Server has no {route} (HTTP 401)" in line
+                                for line in logs.output))
+        self.assertEqual(self.server.requests["/preview"], 6)
+        self.assertFalse(self.client._auth_error_logged)
+        self.assertEqual([r for r in logs.records if r.levelno >= logging.WARNING], [])
+
+    def test_playlist_mode_turns_off(self):
+        import playlist
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.client._playlist = playlist.Cache(tmp.name, 1024)
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            while self.client._playlist is not None:
+                self.client._sync_playlist()
+        self.assertEqual(self.server.requests["/playlist/bundle"], self.client.PROBE_LIMIT)
+        self.assertIn("playlist mode off", logs.output[-1])
+
+    def test_other_answers_reset_the_count(self):
+        def answer(status, content_type="application/json"):
+            resp = MagicMock(status_code=status)
+            resp.headers = {"Content-Type": content_type}
+            return resp
+
+        unsupported = self.client._endpoint_unsupported
+        for status in (401, 403, 200, 404, 401):
+            self.assertFalse(unsupported("/preview/delta", answer(status), "x"))
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(unsupported("/preview/delta", answer(403), "x"))
+            self.assertTrue(unsupported("/preview/base", answer(405, "text/plain"), "x"))
+
+
 class TestLongPollManualRefresh(ContentSkipSandbox, unittest.TestCase):
     """B3 AC19: a manual refresh status triggers exactly one non-skipped write."""
 
@@ -1957,8 +2859,16 @@ class TestLongPollLoop(unittest.TestCase):
                                                    mock_cleanup):
         """AC20: a failed poll (network error / timeout / non-2xx) makes the
         loop back off POLL_INTERVAL one-second sleeps instead of busy-looping."""
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 3
 
         cycles = [0]
@@ -1996,8 +2906,16 @@ class TestLongPollLoop(unittest.TestCase):
                                                      mock_cleanup):
         """AC15: a successful poll re-polls immediately - no happy-path sleep
         (the server's long-poll hold provides the pacing)."""
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 30
 
         cycles = [0]
@@ -2118,8 +3036,16 @@ class TestLongPollNoProgressBackoff(unittest.TestCase):
         turns this into a 0ms spin: time.sleep never fires and the safety cap
         trips. With the fix the loop backs off POLL_INTERVAL between polls ->
         bounded polls, no spin, no heartbeat."""
+        use_real_config_defaults(mock_config)
         mock_config.DISPLAY_DRIVER = "epd7in3e"
         mock_config.SERVER_URL = "http://localhost:5000"
+        mock_config.SERVER_URLS = ""
+        mock_config.PREVIEW_DELTA = False
+        mock_config.COMPOSITE = False
+        mock_config.PLAYLIST = False
+        mock_config.PREVIEW_RESUME = 0
+        mock_config.LONGPOLL_ADAPTIVE = False
+        mock_config.CAPABILITIES = False
         mock_config.POLL_INTERVAL = 3
 
         status_calls = [0]
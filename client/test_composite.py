@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Tests for local compositing of dynamic regions."""
+
+import datetime
+import importlib
+import os
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image, ImageFont
+
+import composite
+import standin_server
+
+PALETTE = standin_server.COLOR_SETTINGS["display"]["colors"]
+DEJAVU = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+# Sat 2026-10-17 09:41:05 UTC
+NOW = datetime.datetime(2026, 10, 17, 9, 41, 5, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def clock_overlay(**region):
+    text = dict(kind="text", box=[100, 112, 600, 172], format="%HH%:%MM%", font=None,
+                size=96, fg=0, bg=1, align="center")
+    text.update(region)
+    return {
+        "palette": PALETTE,
+        "timezone": "UTC",
+        "regions": [
+            text,
+            {"kind": "progress", "box": [100, 400, 600, 8], "period": "day", "fg": 2, "bg": 1},
+        ],
+    }
+
+
+def default_font(name, size):
+    return ImageFont.load_default(size)
+
+
+def png(img):
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def photo():
+    """A base frame in panel colors with content around the regions."""
+    img = Image.new("RGB", (800, 480), "#FFFFFF")
+    img.paste((0, 0, 255), (0, 0, 800, 60))
+    img.paste((255, 255, 0), (0, 300, 400, 380))
+    return img
+
+
+class TestFormatting(unittest.TestCase):
+
+    def test_clock_placeholders_like_the_server(self):
+        t = datetime.datetime(2026, 3, 1, 0, 7, 9)  # a Sunday
+        self.assertEqual(
+            composite.format_text("%WEEKDAY%, %dd%. %MONTH_NAME% %yyyy%", t),
+            "Sonntag, 01. März 2026")
+        self.assertEqual(composite.format_text("%HH%:%MM%:%SS% %hh% %AMPM% %WEEKDAY_SHORT%"
+                                               " %mm% 100%", t),
+                         "00:07:09 12 AM So 03 100%")
+        names = {"weekdays": ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday",
+                              "Friday", "Saturday"]}
+        self.assertEqual(composite.format_text("%WEEKDAY%", t, names), "Sunday")
+
+    def test_progress_periods(self):
+        t = datetime.datetime(2024, 12, 31, 12, 0, 0)  # a Tuesday in a leap year
+        self.assertAlmostEqual(composite.progress("day", t), 0.5)
+        self.assertAlmostEqual(composite.progress("hour", t), 0.0)
+        self.assertAlmostEqual(composite.progress("week", t), 1.5 / 7)
+        self.assertAlmostEqual(composite.progress("month", t), 30.5 / 31)
+        self.assertAlmostEqual(composite.progress("year", t), 365.5 / 366)
+
+    def test_timezone(self):
+        t = composite.local_time({"timezone": "Europe/Berlin"}, NOW)
+        self.assertEqual((t.hour, t.minute), (11, 41))
+        self.assertEqual(composite.local_time({"timezone": "Nowhere/Else"}, NOW).timestamp(),
+                         NOW)
+
+
+class TestCompose(unittest.TestCase):
+
+    def test_only_palette_colors_and_only_inside_the_regions(self):
+        base = composite.render_base(photo(), clock_overlay())
+        frame = composite.compose(base, clock_overlay(), NOW, default_font)
+        allowed = {Image.new("RGB", (1, 1), c).getpixel((0, 0)) for c in PALETTE}
+        self.assertLessEqual({color for _, color in frame.getcolors()}, allowed)
+        outside = (0, 0, 800, 100)
+        self.assertEqual(frame.crop(outside).tobytes(), photo().crop(outside).tobytes())
+        # The day is 40% through: that much of the bar is red.
+        self.assertEqual(frame.getpixel((100 + 239, 404)), (255, 0, 0))
+        self.assertEqual(frame.getpixel((100 + 245, 404)), (255, 255, 255))
+        later = composite.compose(base, clock_overlay(), NOW + 60, default_font)
+        self.assertNotEqual(later.tobytes(), frame.tobytes())
+        same_minute = composite.compose(base, clock_overlay(), NOW + 30, default_font)
+        self.assertEqual(same_minute.tobytes(), frame.tobytes())
+
+    def test_bw_and_gray_bases(self):
+        overlay = dict(clock_overlay(), palette=["#000000", "#FFFFFF", "#FF0000"])
+        for mode, ink in (("1", {0, 255}), ("L", {0, 76, 255})):
+            base = Image.new(mode, (800, 480), 255)
+            frame = composite.compose(base, overlay, NOW, default_font)
+            self.assertEqual(frame.mode, mode)
+            self.assertLessEqual({color for _, color in frame.getcolors()}, ink)
+            self.assertEqual(len(frame.getcolors()), 2 if mode == "1" else 3)
+
+    def test_alignment_moves_the_text(self):
+        base = Image.new("L", (800, 480), 255)
+        edges = []
+        for align in ("left", "center", "right"):
+            frame = composite.compose(base, clock_overlay(align=align), NOW, default_font)
+            edges.append(frame.crop((100, 112, 700, 284)).point(lambda v: v < 128 and 255)
+                         .getbbox())
+        # Aligned by advance width like the server: ink ends within the
+        # glyphs' side bearings of the box edges.
+        self.assertLess(edges[0][0], 20)
+        self.assertGreater(edges[2][2], 580)
+        self.assertLess(abs((edges[1][0] + edges[1][2]) - 600), 20)
+        self.assertEqual(len({box[2] - box[0] for box in edges}), 1)
+
+    @unittest.skipUnless(os.path.exists(DEJAVU), "DejaVu fonts not installed")
+    def test_server_fonts_are_fetched_once(self):
+        fetched = []
+
+        def fetch(name):
+            fetched.append(name)
+            with open(DEJAVU, "rb") as f:
+                return f.read()
+
+        load = composite.font_loader(fetch)
+        overlay = clock_overlay(font="DejaVuSans.ttf")
+        self.assertEqual(composite.fonts(overlay), ["DejaVuSans.ttf"])
+        for now in (NOW, NOW + 60):
+            composite.compose(Image.new("RGB", (800, 480), "white"), overlay, now, load)
+        load("DejaVuSans.ttf", 12)
+        self.assertEqual(fetched, ["DejaVuSans.ttf"])
+
+    def test_bad_descriptors_name_the_problem(self):
+        ok = dict(clock_overlay(), base="0" * 64)
+        self.assertIs(composite.check(ok), ok)
+        self.assertEqual(composite.check({"regions": []}), {"regions": []})
+        for descriptor, message in (
+            ([], "not an object"),
+            ({}, "regions missing"),
+            (dict(ok, palette=["#000000", "purple-ish"]), "bad palette color"),
+            (dict(ok, base=None), "base digest missing"),
+            (clock_overlay(kind="video") | {"base": ""}, "unknown kind 'video'"),
+            (clock_overlay(box=[0, 0, 0, 10]) | {"base": ""}, "box must be"),
+            (clock_overlay(fg=6) | {"base": ""}, "fg is not a palette index"),
+            (clock_overlay(format=None) | {"base": ""}, "format missing"),
+        ):
+            with self.assertRaises(composite.CompositeError) as cm:
+                composite.check(descriptor)
+            self.assertIn(message, str(cm.exception))
+
+
+class TestClientComposite(unittest.TestCase):
+    """fetch_preview() with EINK_COMPOSITE against the stand-in server."""
+
+    def setUp(self):
+        import client
+        import config
+        self.client = client
+        self.server = standin_server.StandinServer(png(photo()), hold=0.1).start()
+        self.addCleanup(self.server.stop)
+        self.server.overlay = clock_overlay()
+        for name, value in (("SERVER_URL", self.server.url), ("SERVER_URLS", ""),
+                            ("CLIENT_TOKEN", ""), ("PREVIEW_DELTA", False),
+                            ("COMPOSITE", True)):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("_last_fetch_hash", "_last_fetch_bytes", "_composite_supported",
+                     "_composite_fonts"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        self.addCleanup(client._composite_bases.clear)
+        client._composite_bases.clear()
+        client._composite_fonts = None
+        self.now = NOW
+        patcher = patch("client.time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fetch(self):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            img = self.client.fetch_preview()
+        self.assertIsNotNone(img)
+        return img, logs.output
+
+    def test_regions_are_drawn_locally_on_a_cached_base(self):
+        first, _ = self.fetch()
+        first_hash = self.client._last_fetch_hash
+        self.assertLess(self.client._last_fetch_bytes, 20_000)
+        self.now += 20
+        self.fetch()
+        self.assertEqual(self.client._last_fetch_hash, first_hash)  # same minute
+        self.assertLess(self.client._last_fetch_bytes, 1_000)  # descriptor only
+        self.now += 60
+        self.fetch()
+        self.assertNotEqual(self.client._last_fetch_hash, first_hash)
+        self.assertEqual((self.server.requests.get("/preview"),
+                          self.server.requests["/preview/base"],
+                          self.server.requests["/preview/overlay"]), (None, 1, 3))
+        base = composite.render_base(photo(), self.server.overlay)
+        self.assertEqual(first.tobytes(),
+                         composite.compose(base, self.server.overlay, NOW, default_font).tobytes())
+
+    def test_new_base_is_downloaded(self):
+        self.fetch()
+        changed = photo()
+        changed.paste((0, 255, 0), (0, 420, 800, 480))
+        self.server.png_bytes = png(changed)
+        img, _ = self.fetch()
+        self.assertEqual(img.getpixel((5, 470)), (0, 255, 0))
+        self.assertEqual(self.server.requests["/preview/base"], 2)
+
+    def test_server_without_compositing_is_asked_once(self):
+        self.server.overlay = None
+        self.fetch()
+        _, logs = self.fetch()
+        self.assertEqual(self.server.requests["/preview/overlay"], 1)
+        self.assertEqual(self.server.requests["/preview"], 2)
+        self.assertFalse(self.client._composite_supported)
+
+    def test_designs_without_regions_use_the_rendered_frame(self):
+        self.server.overlay = {"regions": []}
+        img, _ = self.fetch()
+        self.assertEqual(img.tobytes(), photo().tobytes())
+        self.assertEqual(self.server.requests["/preview"], 1)
+        self.assertTrue(self.client._composite_supported)
+
+    def test_missing_font_falls_back_to_the_rendered_frame(self):
+        self.server.overlay = clock_overlay(font="Missing.ttf")
+        img, logs = self.fetch()
+        self.assertTrue(any("Local compositing failed" in line for line in logs))
+        self.assertEqual(img.tobytes(), photo().tobytes())
+
+    @unittest.skipUnless(os.path.exists(DEJAVU), "DejaVu fonts not installed")
+    def test_server_font(self):
+        with open(DEJAVU, "rb") as f:
+            self.server.fonts["DejaVu Sans.ttf"] = f.read()
+        self.server.overlay = clock_overlay(font="DejaVu Sans.ttf")
+        self.fetch()
+        self.now += 60
+        self.fetch()
+        self.assertEqual(self.server.requests["/font/DejaVu%20Sans.ttf"], 1)
+        self.assertNotIn("/preview", self.server.requests)
+
+
+class TestCompositeConfig(unittest.TestCase):
+    """config.COMPOSITE default and override."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_COMPOSITE", None)
+            importlib.reload(config)
+            self.assertFalse(config.COMPOSITE)
+        with patch.dict(os.environ, {"EINK_COMPOSITE": "True"}):
+            importlib.reload(config)
+            self.assertTrue(config.COMPOSITE)
+
+
+if __name__ == "__main__":
+    unittest.main()
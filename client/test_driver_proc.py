@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Tests for the out-of-process display driver."""
+
+import importlib
+import importlib.util
+import os
+import signal
+import sys
+import time
+import types
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+import driver_proc
+import epd_emulator
+from test_client import ArtifactSandboxMixin
+
+EMULATOR_ENV = {"EINK_PANEL_EMULATOR": "true", "EINK_PANEL_EMULATOR_SCALE": "0.01",
+                "EINK_PANEL_EMULATOR_OUTPUT": "", "EINK_LOG_LEVEL": "WARNING"}
+
+
+def white(size=(800, 480)):
+    return Image.new("RGB", size, (255, 255, 255))
+
+
+class RemoteTestCase(unittest.TestCase):
+
+    def spawn(self, driver="epd7in3e", call_timeout=10.0, env=EMULATOR_ENV):
+        remote = driver_proc.RemoteEPD(driver, call_timeout, 30.0, env=env)
+        self.addCleanup(remote.kill)
+        return remote
+
+
+class TestRemoteEPD(RemoteTestCase):
+
+    def test_driver_calls_round_trip(self):
+        remote = self.spawn("epd7in5_V2")
+        self.assertEqual((remote.width, remote.height), (800, 480))
+        self.assertEqual(remote.init(), 0)
+        buf = remote.getbuffer(white())
+        self.assertEqual(len(buf), 800 * 480 // 8)
+        remote.display(buf)
+        remote.sleep()
+        proc = remote._proc
+        remote.module_exit()
+        self.assertIsNone(remote.pid)
+        self.assertEqual(proc.returncode, 0)
+        remote.module_exit()  # idempotent
+
+    def test_driver_exception_keeps_the_child(self):
+        remote = self.spawn()
+        remote.inject("display", "raise")
+        buf = remote.getbuffer(white())
+        with self.assertRaises(driver_proc.RemoteDriverError) as cm:
+            remote.display(buf)
+        self.assertEqual(cm.exception.remote_type, "EmulatedHardwareError")
+        self.assertIsNotNone(remote.pid)
+        self.assertEqual(remote.init(), 0)
+
+    def test_hung_call_is_killed_at_the_deadline(self):
+        remote = self.spawn(call_timeout=0.5)
+        proc = remote._proc
+        remote.inject("init", "busy_stuck", seconds=3000)  # 30s at scale 0.01
+        start = time.monotonic()
+        with self.assertRaises(driver_proc.DriverTimeout):
+            remote.init()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertIsNone(remote.pid)
+        self.assertIsNotNone(proc.returncode)
+        with self.assertRaises(driver_proc.RemoteDriverError):
+            remote.sleep()
+
+    def test_dead_child_is_reported(self):
+        remote = self.spawn()
+        os.kill(remote.pid, signal.SIGKILL)
+        with self.assertRaises(driver_proc.RemoteDriverError) as cm:
+            remote.init()
+        self.assertEqual(cm.exception.remote_type, "DriverProcessDied")
+        self.assertIsNone(remote.pid)
+
+    def test_construct_failures(self):
+        if importlib.util.find_spec("waveshare_epd") is None:
+            with self.assertRaises(ImportError):
+                self.spawn(env={**EMULATOR_ENV, "EINK_PANEL_EMULATOR": "false"})
+        with self.assertRaises(ValueError):
+            self.spawn(driver="epd2in13")
+
+
+class FakeSpiDev:
+
+    def __init__(self):
+        self.opened = None
+        self.max_speed_hz = 0
+
+    def open(self, bus, device):
+        self.opened = (bus, device)
+
+    def writebytes2(self, data):
+        pass
+
+
+class TestPanelWiring(unittest.TestCase):
+    """A panel's SPI device and pins (multi-panel mode) in the child."""
+
+    def fake_modules(self):
+        """gpiozero + waveshare_epd stand-ins shaped like the vendor epdconfig."""
+        claimed = []
+
+        class GPIODevice:
+            def __init__(self, pin=None, *, pin_factory=None):
+                claimed.append(pin)
+
+        gpiozero = types.ModuleType("gpiozero")
+        gpiozero.GPIODevice = GPIODevice
+
+        class RaspberryPi:
+            RST_PIN, DC_PIN, BUSY_PIN, PWR_PIN = 17, 25, 24, 18
+
+            def __init__(self):
+                self.SPI = FakeSpiDev()
+                self.GPIO_RST_PIN = GPIODevice(self.RST_PIN)
+                self.GPIO_BUSY_PIN = GPIODevice(self.BUSY_PIN)
+
+            def module_init(self):
+                self.SPI.open(0, 0)
+                self.SPI.max_speed_hz = 4000000
+
+        package = types.ModuleType("waveshare_epd")
+        package.__path__ = []
+        epdconfig = types.ModuleType("waveshare_epd.epdconfig")
+        driver = types.ModuleType("waveshare_epd.epd7in3e")
+        driver.epdconfig = epdconfig
+        modules = {"gpiozero": gpiozero, "waveshare_epd": package,
+                   "waveshare_epd.epdconfig": epdconfig}
+
+        def exec_driver():
+            # What importing the vendor module does: build the implementation.
+            epdconfig.implementation = RaspberryPi()
+            for name in ("RST_PIN", "DC_PIN", "BUSY_PIN", "PWR_PIN", "SPI", "module_init"):
+                setattr(epdconfig, name, getattr(epdconfig.implementation, name))
+            return driver
+        return modules, exec_driver, claimed
+
+    def test_pins_are_remapped_while_the_driver_imports(self):
+        modules, exec_driver, claimed = self.fake_modules()
+        with patch.dict(sys.modules, modules), \
+                patch("importlib.import_module", side_effect=lambda name: exec_driver()):
+            module = driver_proc._import_driver("epd7in3e", spi=(0, 1), pins={"rst": 5, "busy": 6})
+            gpio_init = sys.modules["gpiozero"].GPIODevice.__init__
+        self.assertEqual(claimed, [5, 6])
+        self.assertEqual(gpio_init.__name__, "__init__")  # restored after the import
+        epdconfig = module.epdconfig
+        self.assertEqual((epdconfig.RST_PIN, epdconfig.implementation.BUSY_PIN), (5, 6))
+        self.assertEqual(epdconfig.DC_PIN, 25)
+        epdconfig.module_init()
+        self.assertEqual(epdconfig.implementation.SPI.opened, (0, 1))
+        self.assertEqual(epdconfig.implementation.SPI.max_speed_hz, 4000000)
+        self.assertTrue(hasattr(epdconfig.SPI, "writebytes2"))  # spi_transport still applies
+
+    def test_wiring_is_ignored_without_a_pi_epdconfig(self):
+        epd_emulator.install(time_scale=0.0)
+        self.addCleanup(epd_emulator.uninstall)
+        with self.assertLogs("eink-client", level="WARNING") as logs:
+            module = driver_proc._import_driver("epd7in3e", spi=(0, 1), pins={"rst": 5})
+        self.assertIn("wiring ignored", logs.output[0])
+        self.assertTrue(hasattr(module, "EPD"))
+
+    def test_wiring_reaches_the_child(self):
+        env = {**EMULATOR_ENV, "EINK_LOG_LEVEL": "ERROR"}  # the emulator ignores the wiring
+        remote = driver_proc.RemoteEPD("epd7in3e", 10.0, 30.0, env=env,
+                                       spi=(0, 1), pins={"rst": 5})
+        self.addCleanup(remote.kill)
+        self.assertIn("--spi", remote._proc.args)
+        self.assertEqual(remote._proc.args[-4:], ["--spi", "0.1", "--pin", "rst=5"])
+        self.assertEqual(remote.init(), 0)
+
+
+class TestClientDriverProcess(ArtifactSandboxMixin, unittest.TestCase):
+    """E5.4 with the driver out of process: a hang is a counted hardware failure."""
+
+    def setUp(self):
+        super().setUp()
+        import config
+        client = self.client
+        for name, value in (
+            ("DRIVER_PROCESS", True), ("DRIVER_CALL_TIMEOUT", 0.5), ("PANEL_EMULATOR", True),
+            ("PANEL_EMULATOR_SCALE", 0.01), ("PANEL_EMULATOR_OUTPUT", ""),
+            ("LAST_SENT_ASYNC", False), ("HW_FAILURE_LIMIT", 0), ("CONTENT_SKIP", False),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for attr in ("driver_name", "_driver_process", "_last_displayed_hash",
+                     "_last_panel_write_monotonic"):
+            self.addCleanup(setattr, client, attr, getattr(client, attr))
+        self.addCleanup(client._module_exit_best_effort)
+
+    def test_hang_is_killed_counted_and_recovered_with_a_fresh_child(self):
+        client = self.client
+        with self.assertLogs("eink-client", level="INFO") as logs, \
+                patch("client.fetch_preview", return_value=white()), \
+                patch("client.send_heartbeat"):
+            client.load_display_driver("epd7in3e")
+            self.assertIsInstance(client.epd, driver_proc.RemoteEPD)
+            first_pid = client._driver_process.pid
+            self.assertTrue(client.handle_refresh({}, "manual"))
+
+            client._driver_process.inject("display", "busy_stuck", seconds=3000)
+            self.assertFalse(client.handle_refresh({}, "manual"))
+            self.assertEqual(client._consecutive_hw_failures, 1)
+            self.assertIsNone(client.epd)
+            self.assertTrue(client._hw_recovery_pending)
+
+            self.assertTrue(client.handle_refresh({}, "manual"))  # re-spawn + write
+            self.assertNotEqual(client._driver_process.pid, first_pid)
+        self.assertTrue(any("DriverTimeout" in line for line in logs.output))
+        self.assertIsNone(epd_emulator.current())  # the emulator ran in the children only
+
+
+class TestDriverProcessConfig(unittest.TestCase):
+    """config.DRIVER_* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_DRIVER_PROCESS", "EINK_DRIVER_CALL_TIMEOUT",
+                         "EINK_DRIVER_SPAWN_TIMEOUT"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertFalse(config.DRIVER_PROCESS)
+            self.assertEqual(config.DRIVER_CALL_TIMEOUT, 90)
+            self.assertEqual(config.DRIVER_SPAWN_TIMEOUT, 120)
+        with patch.dict(os.environ, {"EINK_DRIVER_PROCESS": "True",
+                                     "EINK_DRIVER_CALL_TIMEOUT": "45.5"}):
+            importlib.reload(config)
+            self.assertTrue(config.DRIVER_PROCESS)
+            self.assertEqual(config.DRIVER_CALL_TIMEOUT, 45.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Tests for server endpoint selection, circuit breaking and client failover."""
+
+import hashlib
+import importlib
+import os
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+import endpoints
+import standin_server
+from test_client import make_gradient_image
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Resp:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def pool_of(*urls, **kwargs):
+    clock = FakeClock()
+    pool = endpoints.EndpointPool(endpoints.parse_endpoints(",".join(urls)), clock=clock,
+                                  **kwargs)
+    return pool, clock
+
+
+def urls(candidates):
+    return [e.url for e in candidates]
+
+
+class TestParseEndpoints(unittest.TestCase):
+
+    def test_order_and_weights(self):
+        a, b = endpoints.parse_endpoints(" http://a:5000/ , https://b;weight=2.5 ,")
+        self.assertEqual((a.url, a.weight, a.index), ("http://a:5000", 1.0, 0))
+        self.assertEqual((b.url, b.weight, b.index), ("https://b", 2.5, 1))
+        self.assertEqual(endpoints.parse_endpoints(""), [])
+
+    def test_errors_name_the_entry(self):
+        for spec, message in (
+            ("eink-a:5000", "'eink-a:5000' is not an http(s) URL"),
+            ("http://a;weight=0", "expected URL;weight=N"),
+            ("http://a;prio=2", "expected URL;weight=N"),
+            ("http://a,http://a/", "duplicate endpoint 'http://a'"),
+        ):
+            with self.assertRaises(ValueError) as cm:
+                endpoints.parse_endpoints(spec)
+            self.assertIn(message, str(cm.exception))
+        with self.assertRaises(ValueError):
+            endpoints.EndpointPool([])
+
+
+class TestSelection(unittest.TestCase):
+
+    def test_unmeasured_endpoints_are_tried_in_order(self):
+        pool, _ = pool_of("http://a", "http://b", "http://c")
+        self.assertEqual(urls(pool.candidates()), ["http://a", "http://b", "http://c"])
+        pool.record(pool.endpoints[0], ok=True, seconds=0.2)
+        self.assertEqual(urls(pool.candidates())[0], "http://b")  # measured next
+
+    def test_fastest_weighted_endpoint_wins_with_hysteresis(self):
+        pool, _ = pool_of("http://a", "http://b;weight=2")
+        a, b = pool.endpoints
+        pool.record(b, ok=True, seconds=0.5)  # score 0.25
+        pool.record(a, ok=True, seconds=0.22)  # current, score 0.22
+        # b is slightly better but not by the switch margin: stay on a.
+        pool.record(b, ok=True, seconds=0.38)
+        pool.current = a
+        self.assertEqual(urls(pool.candidates()), ["http://a", "http://b"])
+        pool.record(a, ok=True, seconds=2.0)
+        self.assertEqual(urls(pool.candidates()), ["http://b", "http://a"])
+
+    def test_latency_is_a_moving_average(self):
+        pool, _ = pool_of("http://a")
+        (a,) = pool.endpoints
+        pool.record(a, ok=True, seconds=1.0)
+        pool.record(a, ok=True, seconds=2.0)
+        pool.record(a, ok=True)  # not a sample (long-poll)
+        self.assertAlmostEqual(a.latency, 1.3)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_opens_half_opens_and_backs_off(self):
+        pool, clock = pool_of("http://a", "http://b", failure_limit=2, cooldown=10)
+        a, _ = pool.endpoints
+        pool.record(a, ok=False)
+        self.assertEqual(a.state(clock.now), "closed")
+        with self.assertLogs("eink-client", level="WARNING"):
+            pool.record(a, ok=False)
+        self.assertEqual(urls(pool.candidates()), ["http://b"])
+        clock.now += 10
+        self.assertEqual(a.state(clock.now), "half-open")
+        self.assertIn("http://a", urls(pool.candidates()))
+        with self.assertLogs("eink-client", level="WARNING"):
+            pool.record(a, ok=False)  # failed trial: twice as long
+        self.assertEqual(a.open_until, clock.now + 20)
+        clock.now += 20
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            pool.record(a, ok=True, seconds=0.1)
+        self.assertIn("recovered", logs.output[0])
+        self.assertEqual((a.failures, a.cooldown, a.state(clock.now)), (0, 0.0, "closed"))
+
+    def test_cooldown_is_capped(self):
+        pool, _ = pool_of("http://a", failure_limit=1, cooldown=100, max_cooldown=300)
+        (a,) = pool.endpoints
+        with self.assertLogs("eink-client", level="WARNING"):
+            for _ in range(4):
+                pool.record(a, ok=False)
+        self.assertEqual(a.cooldown, 300)
+
+    def test_all_open_still_tries_soonest_first(self):
+        pool, clock = pool_of("http://a", "http://b", failure_limit=1, cooldown=10)
+        a, b = pool.endpoints
+        with self.assertLogs("eink-client", level="WARNING"):
+            pool.record(b, ok=False)
+            clock.now += 1
+            pool.record(a, ok=False)
+        self.assertEqual(urls(pool.candidates()), ["http://b", "http://a"])
+
+
+class TestCall(unittest.TestCase):
+
+    def test_fails_over_on_errors_and_5xx_but_not_4xx(self):
+        failovers = []
+        pool, _ = pool_of("http://a", "http://b", "http://c",
+                          on_failover=lambda: failovers.append(1))
+        answers = {"http://a": ConnectionError("refused"), "http://b": Resp(503),
+                   "http://c": Resp(404)}
+        tried = []
+
+        def send(base):
+            tried.append(base)
+            answer = answers[base]
+            if isinstance(answer, Exception):
+                raise answer
+            return answer
+
+        with self.assertLogs("eink-client", level="WARNING") as logs:
+            self.assertEqual(pool.call(send).status_code, 404)
+        self.assertEqual(tried, ["http://a", "http://b", "http://c"])
+        self.assertEqual(len(failovers), 2)
+        self.assertIn("http://b failed (HTTP 503) - trying http://c", logs.output[1])
+        self.assertEqual([e.failures for e in pool.endpoints], [1, 1, 0])
+        self.assertIs(pool.current, pool.endpoints[2])
+
+    def test_last_answer_or_error_is_returned(self):
+        pool, _ = pool_of("http://a", "http://b")
+        with self.assertLogs("eink-client", level="WARNING"):
+            self.assertEqual(pool.call(lambda base: Resp(500)).status_code, 500)
+
+        def refuse(base):
+            raise ConnectionError(base)
+
+        with self.assertLogs("eink-client", level="WARNING"), \
+                self.assertRaises(ConnectionError) as cm:
+            pool.call(refuse)
+        self.assertEqual(str(cm.exception), "http://b")
+
+    def test_snapshot(self):
+        pool, _ = pool_of("http://a", "http://b")
+        pool.record(pool.endpoints[0], ok=True, seconds=0.0123)
+        self.assertEqual(pool.snapshot(), [
+            {"url": "http://a", "state": "closed", "latency_ms": 12, "failures": 0},
+            {"url": "http://b", "state": "closed", "latency_ms": None, "failures": 0},
+        ])
+
+
+def png(img, **params):
+    buf = BytesIO()
+    img.save(buf, format="PNG", **params)
+    return buf.getvalue()
+
+
+class TestClientFailover(unittest.TestCase):
+    """client.py against two stand-in replicas."""
+
+    def setUp(self):
+        import client
+        import config
+        self.client = client
+        frame = make_gradient_image()
+        # The same frame, encoded differently by each replica.
+        self.a = standin_server.StandinServer(png(frame, compress_level=9), hold=0.1).start()
+        self.b = standin_server.StandinServer(png(frame, compress_level=1), hold=0.1).start()
+        for server in (self.a, self.b):
+            self.addCleanup(server.stop)
+        self.assertNotEqual(self.a.png_bytes, self.b.png_bytes)
+        for name, value in (
+            ("SERVER_URLS", f"{self.a.url},{self.b.url}"), ("CLIENT_TOKEN", ""),
+            ("SERVER_FAILURE_LIMIT", 1), ("SERVER_COOLDOWN", 60.0), ("LONGPOLL_TIMEOUT", 5),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, client, "_endpoint_pool", None)
+        self.addCleanup(setattr, client, "_last_fetch_hash", client._last_fetch_hash)
+        client._endpoint_pool = None
+
+    def test_node_loss_is_ridden_out_with_a_stable_digest(self):
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertIsNotNone(self.client.fetch_preview())  # a
+            digest = self.client._last_fetch_hash
+            self.assertIsNotNone(self.client.fetch_preview())  # b, measured once
+        self.assertEqual((self.a.requests["/preview"], self.b.requests["/preview"]), (1, 1))
+        self.assertEqual(self.client._last_fetch_hash, digest)
+        a, b = self.client._server_endpoints().endpoints
+        a.latency, b.latency = 0.5, 0.01
+        now = time.monotonic()
+        self.b.add_outage(now, now + 60, "drop")
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertIsNotNone(self.client.fetch_preview())
+            self.assertFalse(self.client.check_should_refresh())
+            self.client.send_heartbeat("refreshed")
+        self.assertEqual(self.client._last_fetch_hash, digest)
+        self.assertEqual((self.a.requests["/preview"], self.b.requests["/preview"]), (2, 2))
+        self.assertTrue(any("trying " + self.a.url in line for line in logs.output))
+        # b's circuit is open: later requests go straight to a.
+        self.assertNotIn("/api/refresh_status", self.b.requests)
+        self.assertEqual(len(self.a.heartbeats), 1)
+        states = [s["state"] for s in self.a.heartbeats[0]["telemetry"]["servers"]]
+        self.assertEqual(states, ["closed", "open"])
+
+    def test_slow_replica_is_avoided(self):
+        self.a.delays["*"] = 0.3
+        for _ in range(4):
+            self.client.fetch_display_config(load_driver=False)
+        self.assertEqual((self.a.requests["/settings"], self.b.requests["/settings"]), (1, 3))
+        self.assertEqual(self.client._server_label(), f"{self.a.url}, {self.b.url}")
+
+    def test_single_endpoint_hashes_wire_bytes(self):
+        import config
+        with patch.object(config, "SERVER_URLS", ""), \
+                patch.object(config, "SERVER_URL", self.b.url), \
+                self.assertLogs("eink-client", level="INFO"):
+            self.client.fetch_preview()
+        self.assertEqual(self.client._last_fetch_hash, hashlib.sha256(self.b.png_bytes).hexdigest())
+
+
+class TestEndpointsConfig(unittest.TestCase):
+    """config.SERVER_URLS / SERVER_FAILURE_LIMIT / SERVER_COOLDOWN."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_SERVER_URLS", "EINK_SERVER_FAILURE_LIMIT", "EINK_SERVER_COOLDOWN"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual((config.SERVER_URLS, config.SERVER_FAILURE_LIMIT,
+                              config.SERVER_COOLDOWN), ("", 3, 30))
+        with patch.dict(os.environ, {"EINK_SERVER_URLS": "http://a,http://b;weight=2",
+                                     "EINK_SERVER_COOLDOWN": "5"}):
+            importlib.reload(config)
+            self.assertEqual([e.weight for e in endpoints.parse_endpoints(config.SERVER_URLS)],
+                             [1.0, 2.0])
+            self.assertEqual(config.SERVER_COOLDOWN, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Tests for the timing-accurate panel emulator."""
+
+import importlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from PIL import Image, ImageChops
+
+import epd_emulator
+from test_client import (
+    COLOR_DISPLAY_CONFIG,
+    ArtifactSandboxMixin,
+    make_bw_rgb_image,
+    make_rgb_panel_image,
+)
+
+
+class EmulatorTestCase(unittest.TestCase):
+    """Installs a zero-latency emulator per test and restores sys.modules."""
+
+    time_scale = 0.0
+
+    def setUp(self):
+        super().setUp()
+        self.emu = epd_emulator.install(self.time_scale)
+        self.addCleanup(epd_emulator.uninstall)
+        from waveshare_epd import epd7in3e, epd7in5_V2
+        self.epd7in3e = epd7in3e
+        self.epd7in5_V2 = epd7in5_V2
+
+
+class TestModules(EmulatorTestCase):
+
+    def test_install_and_uninstall_restore_sys_modules(self):
+        self.assertIs(sys.modules["waveshare_epd.epd7in3e"], self.epd7in3e)
+        self.assertIs(self.epd7in3e.epdconfig, sys.modules["waveshare_epd.epdconfig"])
+        self.assertIs(epd_emulator.current(), self.emu)
+        epd_emulator.uninstall()
+        self.assertNotIn("waveshare_epd", sys.modules)
+        self.assertIsNone(epd_emulator.current())
+        with self.assertRaises(ImportError):
+            importlib.import_module("waveshare_epd")
+
+
+class TestFrames(EmulatorTestCase):
+    """getbuffer/display like the vendor drivers, rendered back to an image."""
+
+    def test_color_roundtrip_is_pixel_exact(self):
+        epd = self.epd7in3e.EPD()
+        src = make_rgb_panel_image(800, 480)
+        self.assertEqual(epd.init(), 0)
+        buf = epd.getbuffer(src)
+        self.assertEqual(len(buf), 800 * 480 // 2)
+        epd.display(buf)
+        epd.sleep()
+
+        self.assertIsNone(ImageChops.difference(self.emu.last_frame, src).getbbox())
+        self.assertEqual(self.emu.counts, {"init": 1, "display": 1, "sleep": 1})
+        self.assertEqual(self.emu.module_exits, 1)
+        self.assertEqual(len(self.emu.writes), 1)
+
+    def test_bw_roundtrip_and_partial_region(self):
+        epd = self.epd7in5_V2.EPD()
+        src = make_bw_rgb_image(800, 480)
+        epd.init()
+        epd.display(epd.getbuffer(src))
+        self.assertIsNone(
+            ImageChops.difference(self.emu.last_frame.convert("L"), src.convert("L")).getbbox()
+        )
+
+        black = Image.new("RGB", (800, 480), (0, 0, 0))
+        epd.init_part()
+        epd.display_Partial(epd.getbuffer(black), 0, 0, 400, 480)
+        frame = self.emu.last_frame.convert("L")
+        self.assertEqual(frame.crop((0, 0, 400, 480)).getextrema(), (0, 0))
+        self.assertEqual(frame.crop((400, 0, 800, 480)).getextrema(), (0, 255))
+
+    def test_portrait_input_is_rotated_and_wrong_size_rejected(self):
+        epd = self.epd7in5_V2.EPD()
+        self.assertEqual(len(epd.getbuffer(Image.new("RGB", (480, 800)))), 48000)
+        with self.assertRaises(ValueError):
+            epd.getbuffer(Image.new("RGB", (400, 240)))
+
+    def test_display_validates_buffer_size(self):
+        epd = self.epd7in3e.EPD()
+        epd.init()
+        with self.assertRaises(ValueError):
+            epd.display(bytearray(48000))  # a B/W buffer on the 6-color panel
+
+    def test_output_png_is_written(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.emu.output = os.path.join(tmpdir, "panel.png")
+            epd = self.epd7in5_V2.EPD()
+            epd.init()
+            epd.display(epd.getbuffer(make_bw_rgb_image(800, 480)))
+            with Image.open(self.emu.output) as img:
+                self.assertEqual(img.size, (800, 480))
+            self.assertFalse(os.path.exists(self.emu.output + ".tmp"))
+
+
+class TestTiming(EmulatorTestCase):
+    """Scaled durations, SPI transfer and the BUSY pin."""
+
+    time_scale = 0.01
+
+    def test_display_blocks_for_the_scaled_refresh_and_busy_is_low(self):
+        epd = self.epd7in3e.EPD()
+        epd.init()
+        buf = epd.getbuffer(make_rgb_panel_image(800, 480))
+        levels = []
+        worker = threading.Thread(target=epd.display, args=(buf,))
+        start = time.monotonic()
+        worker.start()
+        time.sleep(0.1)
+        levels.append(self.epd7in3e.epdconfig.digital_read(24))
+        worker.join()
+        elapsed = time.monotonic() - start
+
+        # 30s waveform x 0.01 plus 192000 bytes over 4 MHz SPI (x 0.01).
+        self.assertGreaterEqual(elapsed, 0.3 + self.emu.spi_seconds(len(buf)) * 0.01)
+        self.assertEqual(levels, [0])
+        self.assertEqual(self.epd7in3e.epdconfig.digital_read(24), 1)
+
+    def test_fast_init_uses_the_fast_waveform(self):
+        epd = self.epd7in5_V2.EPD()
+        buf = epd.getbuffer(make_bw_rgb_image(800, 480))
+        epd.init_fast()
+        start = time.monotonic()
+        epd.display(buf)
+        self.assertLess(time.monotonic() - start, 0.035)  # 1.6s x 0.01, not 4s x 0.01
+        self.assertEqual(len(self.emu.writes), 1)
+
+
+class TestFaults(EmulatorTestCase):
+
+    def test_raise_after_successful_calls(self):
+        epd = self.epd7in3e.EPD()
+        self.emu.inject("display", after=1)
+        buf = epd.getbuffer(make_rgb_panel_image(800, 480))
+        epd.display(buf)
+        with self.assertRaises(epd_emulator.EmulatedHardwareError):
+            epd.display(buf)
+        epd.display(buf)  # count=1: healed again
+
+    def test_init_minus_one_and_construct(self):
+        self.emu.inject("init", "init_minus_one")
+        self.assertEqual(self.epd7in3e.EPD().init(), -1)
+        self.emu.inject("EPD", "construct", exc=RuntimeError("GPIOPinInUse"))
+        with self.assertRaises(RuntimeError):
+            self.epd7in3e.EPD()
+
+    def test_busy_stuck_delays_the_call(self):
+        epd = self.epd7in5_V2.EPD()
+        self.emu.time_scale = 1.0
+        epd._profile = dict(epd._profile, init=0.0)  # only the stuck BUSY pin counts
+        self.emu.inject("init", "busy_stuck", seconds=0.2)
+        start = time.monotonic()
+        self.assertEqual(epd.init(), 0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_unknown_fault_kind(self):
+        with self.assertRaises(ValueError):
+            self.emu.inject("init", "gremlins")
+
+
+class TestClientWithEmulator(ArtifactSandboxMixin, unittest.TestCase):
+    """load_display_driver()/display_image()/E5.4 recovery against the emulator."""
+
+    def setUp(self):
+        super().setUp()
+        import config
+        self.addCleanup(epd_emulator.uninstall)
+        self.addCleanup(setattr, self.client, "driver_name", self.client.driver_name)
+        for name, value in (("PANEL_EMULATOR", True), ("PANEL_EMULATOR_SCALE", 0.0),
+                            ("PANEL_EMULATOR_OUTPUT", "")):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_driver_load_display_and_recovery(self):
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.load_display_driver("epd7in3e")
+        emu = epd_emulator.current()
+        self.assertIsInstance(self.client.epd, epd_emulator.EPD7in3e)
+
+        src = make_rgb_panel_image(800, 480)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(self.client.display_image(src, COLOR_DISPLAY_CONFIG))
+        self.assertIsNone(ImageChops.difference(emu.last_frame, src).getbbox())
+
+        emu.inject("display")
+        with self.assertLogs("eink-client", level="ERROR") as logs:
+            self.assertFalse(self.client.display_image(src, COLOR_DISPLAY_CONFIG))
+        self.assertIn("display recovery", logs.output[0])
+        self.assertIsNone(self.client.epd)
+        # E5.4: module_exit() after the error (on top of sleep()'s own one).
+        self.assertEqual(emu.module_exits, 2)
+
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.load_display_driver("epd7in3e")
+        self.assertIs(epd_emulator.current(), emu)  # installed once, re-used
+        self.assertIsInstance(self.client.epd, epd_emulator.EPD7in3e)
+
+
+class TestPanelEmulatorConfig(unittest.TestCase):
+    """config.PANEL_EMULATOR* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_PANEL_EMULATOR", "EINK_PANEL_EMULATOR_SCALE",
+                         "EINK_PANEL_EMULATOR_OUTPUT"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertFalse(config.PANEL_EMULATOR)
+            self.assertEqual(config.PANEL_EMULATOR_SCALE, 1.0)
+            self.assertEqual(config.PANEL_EMULATOR_OUTPUT, "")
+        with patch.dict(os.environ, {"EINK_PANEL_EMULATOR": "TRUE",
+                                     "EINK_PANEL_EMULATOR_SCALE": "0.1"}):
+            importlib.reload(config)
+            self.assertTrue(config.PANEL_EMULATOR)
+            self.assertEqual(config.PANEL_EMULATOR_SCALE, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Tests for the LAN caching gateway."""
+
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import gateway
+import standin_server
+from test_client import make_test_png
+
+
+class GatewayTestCase(unittest.TestCase):
+    """A Gateway in front of a stand-in upstream server."""
+
+    token = ""
+
+    def setUp(self):
+        self.upstream = standin_server.StandinServer(make_test_png(), hold=0.2).start()
+        self.addCleanup(self.upstream.stop)
+        self.gateway = gateway.Gateway(
+            self.upstream.url, hold=0.5, cache_ttl=60, token=self.token, host="127.0.0.1",
+            port=0, longpoll_timeout=5, backoff=0.2,
+        ).start()
+        self.addCleanup(self.gateway.stop)
+
+    def request(self, path, client="panel-1", body=None, headers=None):
+        """(status, headers, body bytes) of a local request to the gateway."""
+        headers = dict(headers or {}, **{"X-Client-Id": client})
+        if self.token:
+            headers.setdefault("X-Client-Token", self.token)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.gateway.url + path, data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=10) as resp:
+                return resp.status, resp.headers, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def poll(self, client="panel-1"):
+        status, _, body = self.request("/api/refresh_status", client)
+        return status, json.loads(body)
+
+    def wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.02)
+
+
+class TestRefreshFanOut(GatewayTestCase):
+
+    def test_one_upstream_round_reaches_every_panel_once(self):
+        clients = ("panel-1", "panel-2", "panel-3")
+        for client in clients:
+            self.assertEqual(self.poll(client), (200, {"should_refresh": False,
+                                                       "refresh_interval": 3600}))
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.upstream.trigger("manual")
+            for client in clients:
+                status, body = self.poll(client)
+                self.assertEqual((status, body["should_refresh"], body["reason"]),
+                                 (200, True, "manual"))
+        self.assertEqual(logs.output, ["INFO:eink-client:Gateway: refresh round 1 (manual)"])
+        pass_through = self.request("/api/client_heartbeat", "panel-1",
+                                    body={"status": "refreshed", "telemetry": {"x": 1}})
+        self.assertEqual(pass_through[0], 200)
+        self.assertEqual(len(self.upstream.heartbeats), 1)
+        self.assertEqual(self.upstream.heartbeats[0]["telemetry"],
+                         {"x": 1, "gateway": {"clients": 3, "acked": 1}})
+        # Acknowledged panels park again; the others are still due.
+        self.assertFalse(self.poll("panel-1")[1]["should_refresh"])
+        self.assertTrue(self.poll("panel-2")[1]["should_refresh"])
+        for client in ("panel-2", "panel-3"):
+            self.request("/api/client_heartbeat", client, body={"status": "skipped"})
+        self.assertEqual(len(self.upstream.heartbeats), 1)
+        self.assertEqual(self.gateway.status()["heartbeats_absorbed"], 2)
+        self.assertFalse(self.poll("panel-3")[1]["should_refresh"])
+
+    def test_parked_polls_wake_on_the_upstream_trigger(self):
+        self.poll("panel-1")  # registered before the round
+        self.gateway.hold = 5
+        answers = []
+        worker = threading.Thread(target=lambda: answers.append(self.poll("panel-1")))
+        worker.start()
+        time.sleep(0.2)
+        start = time.monotonic()
+        with self.assertLogs("eink-client", level="INFO"):
+            self.upstream.trigger("manual")
+            worker.join(5)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(answers[0][1]["should_refresh"])
+
+    def test_unreachable_upstream_is_a_bad_gateway(self):
+        self.wait_for(lambda: self.gateway.status()["upstream_ok"])
+        now = time.monotonic()
+        self.upstream.add_outage(now, now + 30, "drop")
+        with self.assertLogs("eink-client", level="WARNING"):
+            self.wait_for(lambda: not self.gateway.status()["upstream_ok"])
+        status, body = self.poll()
+        self.assertEqual(status, 502)
+        self.assertIn("unreachable", body["error"])
+
+
+class TestFrameCache(GatewayTestCase):
+
+    def test_concurrent_misses_share_one_upstream_fetch(self):
+        self.upstream.delays["/preview"] = 0.3
+        results = []
+        workers = [
+            threading.Thread(target=lambda: results.append(self.request("/preview?raw=true")))
+            for _ in range(8)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+        self.assertEqual(self.upstream.requests["/preview"], 1)
+        self.assertEqual({(status, body) for status, _, body in results},
+                         {(200, self.upstream.png_bytes)})
+        self.assertGreaterEqual(self.gateway.status()["coalesced"], 1)
+        etag = results[0][1]["ETag"]
+        status, _, body = self.request("/preview?raw=true", headers={"If-None-Match": etag})
+        self.assertEqual((status, body), (304, b""))
+
+    def test_new_round_refetches_and_keeps_unchanged_bytes(self):
+        self.poll()
+        self.request("/settings")
+        self.request("/preview")
+        self.request("/preview")
+        self.assertEqual(self.upstream.requests["/preview"], 1)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.upstream.trigger("interval")
+            self.wait_for(lambda: self.gateway.status()["round"] == 1)
+        self.request("/preview")
+        self.assertEqual(self.upstream.requests["/preview"], 2)
+        stats = self.gateway.status()
+        self.assertEqual((stats["unchanged"], stats["cache_hits"]), (1, 1))
+        self.assertEqual(stats["cached"], ["/preview", "/settings"])
+
+    def test_errors_are_passed_through_not_cached(self):
+        status, _, _ = self.request("/preview?name=Missing")
+        self.assertEqual(status, 404)
+        self.request("/preview?name=Missing")
+        self.assertEqual(self.upstream.requests["/preview"], 2)
+        self.assertEqual(self.request("/designs")[0], 404)
+
+    def test_ttl_expiry(self):
+        self.gateway.cache_ttl = 0
+        self.request("/settings")
+        self.request("/settings")
+        self.assertEqual(self.upstream.requests["/settings"], 2)
+
+
+class TestGatewayAuth(GatewayTestCase):
+
+    token = "site-secret"
+
+    def test_local_clients_need_the_token(self):
+        status, _, _ = self.request("/settings", headers={"X-Client-Token": "wrong"})
+        self.assertEqual(status, 401)
+        self.assertEqual(self.request("/settings")[0], 200)
+        same_length = "site-secreX"
+        self.assertEqual(len(same_length), len(self.token))
+        self.assertEqual(self.request("/preview", headers={"X-Client-Token": same_length})[0], 401)
+        self.assertEqual(self.request("/gateway/status", headers={"X-Client-Token": ""})[0], 401)
+        self.assertEqual(self.request("/gateway/status")[0], 200)
+
+    def test_unknown_routes_are_a_plain_404(self):
+        for path, body in (("/preview/overlay", None), ("/preview/delta", {"tiles": []})):
+            status, headers, _ = self.request(path, body=body)
+            self.assertEqual((status, headers["Content-Type"]), (404, "text/plain"))
+
+
+class TestClientThroughGateway(GatewayTestCase):
+    """The unchanged client pointed at the gateway."""
+
+    def test_client_fetches_and_heartbeats_via_the_gateway(self):
+        import client
+        import config
+        with patch.object(config, "SERVER_URL", self.gateway.url), \
+                patch.object(config, "CLIENT_TOKEN", ""), \
+                patch.object(config, "LONGPOLL_TIMEOUT", 5), \
+                self.assertLogs("eink-client", level="INFO"):
+            self.assertFalse(client.check_should_refresh())
+            self.upstream.trigger("manual")
+            self.assertTrue(client.check_should_refresh())
+            self.assertIsNotNone(client.fetch_preview())
+            self.assertEqual(client.fetch_display_config(load_driver=False)["driver"], "epd7in3e")
+            client.send_heartbeat("refreshed", "manual")
+        self.assertEqual([h["status"] for h in self.upstream.heartbeats], ["refreshed"])
+
+    def test_client_asks_once_for_extensions_the_gateway_lacks(self):
+        import client
+        import config
+        from test_client import MockEPD
+        for name in ("epd", "driver_name", "_preview_delta_supported", "_composite_supported",
+                     "_capabilities_supported", "_capabilities"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        for state in (client._probe_misses, client._delta_bases, client._composite_bases):
+            self.addCleanup(state.clear)
+            state.clear()
+        client.epd, client.driver_name = MockEPD(), "epd7in3e"
+        client._preview_delta_supported = client._composite_supported = True
+        client._capabilities_supported, client._capabilities = True, None
+        paths = []
+        real_get, real_post = client._server_get, client._server_post
+
+        def get(path, *args, **kwargs):
+            paths.append(path)
+            return real_get(path, *args, **kwargs)
+
+        def post(path, *args, **kwargs):
+            paths.append(path)
+            return real_post(path, *args, **kwargs)
+
+        with patch.object(config, "SERVER_URL", self.gateway.url), \
+                patch.object(config, "SERVER_URLS", ""), \
+                patch.object(config, "CLIENT_TOKEN", ""), \
+                patch.object(config, "PREVIEW_DELTA", True), \
+                patch.object(config, "COMPOSITE", True), \
+                patch.object(config, "CAPABILITIES", True), \
+                patch.object(config, "PREVIEW_RESUME", 0), \
+                patch.object(client, "_server_get", side_effect=get), \
+                patch.object(client, "_server_post", side_effect=post), \
+                self.assertLogs("eink-client", level="INFO") as logs:
+            for _ in range(3):
+                self.assertIsNotNone(client.fetch_preview())
+        self.assertEqual(sorted(p for p in paths if p != "/preview"),
+                         ["/api/client_capabilities", "/preview/delta", "/preview/overlay"])
+        self.assertFalse(any(r.levelno >= logging.WARNING for r in logs.records))
+
+
+class TestGatewayConfig(unittest.TestCase):
+    """config.GATEWAY_* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_GATEWAY_ADDR", "EINK_GATEWAY_PORT", "EINK_GATEWAY_HOLD",
+                         "EINK_GATEWAY_CACHE_TTL"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual((config.GATEWAY_ADDR, config.GATEWAY_PORT), ("0.0.0.0", 5000))
+            self.assertEqual((config.GATEWAY_HOLD, config.GATEWAY_CACHE_TTL), (25, 60))
+        with patch.dict(os.environ, {"EINK_GATEWAY_PORT": "8080", "EINK_GATEWAY_HOLD": "10"}):
+            importlib.reload(config)
+            self.assertEqual((config.GATEWAY_PORT, config.GATEWAY_HOLD), (8080, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Tests for the trigger-to-panel latency harness."""
+
+import signal
+import unittest
+from unittest.mock import patch
+
+import client
+import config
+import latency_harness
+
+
+class TestMatchLatencies(unittest.TestCase):
+    """Trigger -> write attribution by fetch time."""
+
+    def test_write_serves_triggers_fetched_after_them(self):
+        writes = [(1.2, 2.0), (3.5, 4.5)]
+        fetches = [1.1, 3.1]
+        matched = latency_harness.match_latencies([1.0, 2.5], writes, fetches=fetches)
+        self.assertAlmostEqual(matched[0]["begin"], 0.2)
+        self.assertAlmostEqual(matched[0]["panel"], 1.0)
+        self.assertAlmostEqual(matched[1]["begin"], 1.0)
+        self.assertFalse(any(m["absorbed"] for m in matched))
+
+    def test_content_fetched_before_the_trigger_does_not_serve_it(self):
+        # Trigger at 1.15 lands after the fetch (1.1) but before init (1.2).
+        matched = latency_harness.match_latencies(
+            [1.15], [(1.2, 2.0), (3.5, 4.5)], heartbeats=[2.05], fetches=[1.1, 3.1]
+        )
+        self.assertAlmostEqual(matched[0]["begin"], 3.5 - 1.15)
+        self.assertTrue(matched[0]["absorbed"])
+
+    def test_unserved_trigger(self):
+        matched = latency_harness.match_latencies([5.0], [(1.2, 2.0)], heartbeats=[2.1])
+        self.assertEqual(matched, [{"begin": None, "panel": None, "absorbed": False}])
+
+    def test_schedule_is_seeded(self):
+        a = latency_harness.trigger_schedule(5, 10.0, 0.2, seed=3)
+        self.assertEqual(a, latency_harness.trigger_schedule(5, 10.0, 0.2, seed=3))
+        self.assertEqual(a[0], 0.0)
+        for i, offset in enumerate(a[1:], start=1):
+            self.assertLessEqual(abs(offset - i * 10.0), 2.0)
+
+
+class TestHarnessRun(unittest.TestCase):
+    """The real main() loop against the stand-in server, with scaled panel timings."""
+
+    def run_scenario(self, scenario, count=3):
+        args = latency_harness.parse_args([
+            "--scenario", scenario, "--count", str(count), "--interval", "0.6",
+            "--panel-scale", "0.005", "--hold", "0.3", "--outage", "0.6", "--settle", "5",
+        ])
+        return latency_harness.run(args)
+
+    def test_baseline_serves_every_trigger_and_restores_state(self):
+        handler = signal.getsignal(signal.SIGTERM)
+        server_url, load = config.SERVER_URL, client.load_display_driver
+        epd = client.epd
+
+        with patch.object(config, "SERVER_URLS", "http://a.invalid,http://b.invalid"), \
+                patch.object(config, "COMPOSITE", True):
+            report = self.run_scenario("baseline")
+            self.assertTrue(config.COMPOSITE)
+
+        self.assertEqual(report["triggers"], 3)
+        self.assertEqual(report["served"], 3)
+        self.assertEqual(report["unserved"], 0)
+        # Long-poll wake-up: the panel begins far below the B3 2s budget.
+        self.assertLess(report["begin"]["max_ms"], 2000)
+        self.assertLessEqual(report["begin"]["p50_ms"], report["panel"]["p50_ms"])
+        self.assertIs(signal.getsignal(signal.SIGTERM), handler)
+        self.assertEqual(config.SERVER_URL, server_url)
+        self.assertIs(client.load_display_driver, load)
+        self.assertIs(client.epd, epd)
+
+    def test_slow_server_adds_preview_delay(self):
+        report = self.run_scenario("slow-server", count=2)
+        self.assertGreaterEqual(report["served"], 1)
+        # /preview alone is delayed 1.5s in this scenario.
+        self.assertGreaterEqual(report["begin"]["min_ms"], 1500)
+
+    def test_report_format(self):
+        text = latency_harness.format_report({
+            "scenario": "baseline", "driver": "epd7in3e", "panel_scale": 1.0,
+            "triggers": 2, "served": 1, "absorbed": 1, "unserved": 1,
+            "begin": latency_harness.summarize([0.5]),
+            "panel": latency_harness.summarize([30.5]),
+        })
+        self.assertIn("1/2 triggers served", text)
+        self.assertIn("p50=500ms", text)
+        self.assertIn("max=30500ms", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Tests for the virtual fleet load generator."""
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import client
+import config
+import loadgen
+import standin_server
+from bench import _png_bytes, make_dithered_preview
+
+
+class TestReport(unittest.TestCase):
+
+    def test_storm_schedule(self):
+        self.assertEqual(loadgen.storm_schedule(60, 0), [])
+        self.assertEqual(loadgen.storm_schedule(60, 20), [20, 40])
+        self.assertEqual(loadgen.storm_schedule(61, 20), [20, 40, 60])
+
+    def test_build_report_merges_shards(self):
+        results = [
+            {"samples": [("/preview", "200", 0.1), ("/preview", "503", 0.01)],
+             "outcomes": {"refreshed": 1, "storm": 1}},
+            {"samples": [("/preview", "200", 0.3), ("/settings", "ConnectionError", 5.0)],
+             "outcomes": {"refreshed": 2, "storm": 1}},
+        ]
+        report = loadgen.build_report(results, panels=4, processes=2, duration=10, storms=[5])
+        self.assertEqual(report["requests"], 4)
+        self.assertEqual(report["error_rate"], 0.5)
+        self.assertEqual(report["outcomes"], {"refreshed": 3, "storm": 1})
+        preview = report["endpoints"]["/preview"]
+        self.assertEqual(preview["errors"], {"503": 1})
+        self.assertAlmostEqual(preview["error_rate"], 1 / 3, places=3)
+        self.assertEqual(preview["latency"]["max_ms"], 300.0)  # errors excluded
+        self.assertEqual(report["endpoints"]["/settings"]["latency"], {})
+
+        text = loadgen.format_report(report)
+        self.assertIn("4 requests, 0.4 req/s, 50.0% errors", text)
+        self.assertIn("503 x1", text)
+        self.assertIn("no successful requests", text)
+
+
+class FleetTestCase(unittest.TestCase):
+    """A stand-in server with a short hold; triggers "interval" refreshes."""
+
+    def setUp(self):
+        self.server = standin_server.StandinServer(
+            _png_bytes(make_dithered_preview(80, 48)), hold=0.2
+        ).start()
+        self.addCleanup(self.server.stop)
+
+    def run_fleet(self, **kwargs):
+        options = dict(
+            panels=10, duration=1.5, ramp=0.1, panel_scale=0.001,
+            backoff=0.2, longpoll_timeout=2, storm_spread=0.1,
+        )
+        options.update(kwargs)
+        return loadgen.run_fleet(self.server.url, **options)
+
+    def trigger_at(self, *offsets):
+        def fire():
+            start = time.monotonic()
+            for offset in offsets:
+                time.sleep(max(0.0, start + offset - time.monotonic()))
+                self.server.trigger("interval")
+        thread = threading.Thread(target=fire, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+
+
+class TestFleetRun(FleetTestCase):
+
+    def test_fleet_polls_refreshes_and_restores_the_client(self):
+        server_get, load = client._server_get, client.load_display_driver
+        server_url = config.SERVER_URL
+        self.trigger_at(0.6)
+
+        report = self.run_fleet()
+
+        self.assertEqual(report["error_rate"], 0.0)
+        endpoints = report["endpoints"]
+        self.assertEqual(endpoints["/preview"]["requests"], self.server.requests["/preview"])
+        self.assertIn("/api/refresh_status (held)", endpoints)
+        self.assertIn("/api/refresh_status (due)", endpoints)
+        self.assertGreater(endpoints["/api/client_heartbeat"]["latency"]["p50_ms"], 0)
+        # Every panel wrote at startup; the interval trigger found unchanged
+        # content on at least one panel (the content skip).
+        self.assertGreaterEqual(report["outcomes"]["refreshed"], 10)
+        self.assertGreaterEqual(report["outcomes"]["skipped"], 1)
+
+        self.assertIs(client._server_get, server_get)
+        self.assertIs(client.load_display_driver, load)
+        self.assertEqual(config.SERVER_URL, server_url)
+
+    def test_resumable_previews(self):
+        # _download_resumable() streams with headers=/stream= through the recorder.
+        with patch.object(config, "PREVIEW_RESUME", 2):
+            report = self.run_fleet(panels=3, duration=1.0)
+        self.assertEqual(report["error_rate"], 0.0)
+        self.assertEqual(report["outcomes"]["refreshed"], 3)
+        self.assertEqual(report["endpoints"]["/preview"]["requests"], 3)
+
+    def test_storm_reboots_every_panel(self):
+        report = self.run_fleet(panels=5, storm_every=0.7)
+        self.assertEqual(report["storms"], 2)
+        self.assertEqual(report["outcomes"]["storm"], 2)
+        # A startup write per panel per boot (the last storm is 0.1s before the end).
+        self.assertGreaterEqual(self.server.requests["/preview"], 10)
+        self.assertLessEqual(self.server.requests["/preview"], 15)
+
+    def test_outage_is_reported_as_errors(self):
+        now = time.monotonic()
+        self.server.add_outage(now, now + 60, "drop")
+        report = self.run_fleet(panels=3, duration=0.6)
+        self.assertEqual(report["error_rate"], 1.0)
+        self.assertGreaterEqual(report["outcomes"]["no_preview"], 3)
+        errors = report["endpoints"]["/settings"]["errors"]
+        self.assertEqual(sum(errors.values()), report["endpoints"]["/settings"]["requests"])
+
+    def test_process_pool(self):
+        with patch.object(loadgen, "PROCESS_START_DELAY", 1.0):
+            report = self.run_fleet(panels=4, processes=2, duration=1.0)
+        self.assertEqual(report["processes"], 2)
+        self.assertEqual(report["error_rate"], 0.0)
+        self.assertEqual(report["endpoints"]["/preview"]["requests"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
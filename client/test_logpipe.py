@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Tests for the non-blocking logging pipeline."""
+
+import ast
+import glob
+import importlib
+import io
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import logpipe
+
+LOG_METHODS = {"debug", "info", "warning", "error", "exception", "critical", "log"}
+
+
+class ListHandler(logging.Handler):
+    """Formats on emit (like a real sink) and keeps the lines; can be held."""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        self.lines = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+
+    def emit(self, record):
+        self.unblocked.wait(5)
+        self.lines.append(self.format(record))
+
+
+class Traced:
+    """Argument that remembers which threads formatted it."""
+
+    def __init__(self):
+        self.formatted_in = []
+
+    def __str__(self):
+        self.formatted_in.append(threading.current_thread())
+        return "traced"
+
+
+class PipelineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = ListHandler()
+        self.ring = logpipe.RingBufferHandler(self.sink, logging.INFO, capacity=3)
+        self.queue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, self.ring)
+        self.handler = logpipe.NonBlockingQueueHandler(self.queue)
+        self.logger = logging.getLogger(f"test-logpipe-{self.id()}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def drain(self):
+        self.listener.start()
+        self.listener.stop()
+
+
+class TestNonBlockingQueueHandler(PipelineTestCase):
+
+    def test_a_stalled_writer_does_not_delay_the_caller(self):
+        self.sink.unblocked.clear()  # the "SD card" hangs
+        self.listener.start()
+        try:
+            start = time.perf_counter()
+            for i in range(200):
+                self.logger.warning("line %d", i)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            self.assertEqual(self.sink.lines, [])
+        finally:
+            self.sink.unblocked.set()
+            self.listener.stop()
+        self.assertEqual(self.sink.lines, [f"WARNING line {i}" for i in range(200)])
+
+    def test_formatting_happens_on_the_listener_thread_only_when_written(self):
+        written, buffered = Traced(), Traced()
+        self.logger.info("value %s", written)
+        self.logger.debug("value %s", buffered)
+        self.assertEqual(written.formatted_in, [])
+        self.drain()
+        self.assertEqual(self.sink.lines, ["INFO value traced"])
+        self.assertNotIn(threading.current_thread(), written.formatted_in)
+        self.assertEqual(buffered.formatted_in, [])  # stays in the ring, never formatted
+
+    def test_full_queue_drops_and_reports(self):
+        self.handler.maxsize = 2
+        for i in range(5):
+            self.logger.warning("line %d", i)
+        self.assertEqual(self.handler.dropped, 3)
+        self.drain()
+        self.logger.warning("after")
+        self.drain()
+        self.assertEqual(self.sink.lines, [
+            "WARNING line 0", "WARNING line 1",
+            "WARNING Logging queue full: 3 log records dropped", "WARNING after",
+        ])
+
+
+class TestRingBufferHandler(PipelineTestCase):
+
+    def test_debug_lines_are_flushed_only_before_an_error(self):
+        for i in range(5):
+            self.logger.debug("step %d", i)
+        self.logger.info("status")
+        self.drain()
+        self.assertEqual(self.sink.lines, ["INFO status"])
+
+        self.logger.error("failed")
+        self.logger.error("again")
+        self.drain()
+        self.assertEqual(self.sink.lines, [
+            "INFO status", "DEBUG step 2", "DEBUG step 3", "DEBUG step 4",
+            "ERROR failed", "ERROR again",
+        ])
+
+    def test_zero_capacity_discards(self):
+        self.ring = logpipe.RingBufferHandler(self.sink, logging.INFO, capacity=0)
+        self.ring.handle(self.logger.makeRecord("x", logging.DEBUG, __file__, 1, "d", (), None))
+        self.ring.handle(self.logger.makeRecord("x", logging.ERROR, __file__, 1, "e", (), None))
+        self.assertEqual(self.sink.lines, ["ERROR e"])
+
+
+class TestInstall(unittest.TestCase):
+    """install()/stop() on the real root logger (client's setup parked)."""
+
+    def setUp(self):
+        root = logging.getLogger()
+        client_logger = logging.getLogger(logpipe.CLIENT_LOGGER)
+        saved = (root.handlers[:], root.level, client_logger.level, logpipe._listener,
+                 logpipe._handlers[:])
+
+        def restore():
+            logpipe.uninstall()
+            root.handlers[:] = saved[0]
+            root.setLevel(saved[1])
+            client_logger.setLevel(saved[2])
+            logpipe._listener = saved[3]
+            logpipe._handlers[:] = saved[4]
+        self.addCleanup(restore)
+        root.handlers.clear()
+        logpipe._listener = None
+        logpipe._handlers.clear()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "client.log")
+        self.logger = client_logger
+
+    def read(self, path=None):
+        with open(path or self.path, encoding="utf-8") as fh:
+            return fh.read()
+
+    def test_rotating_file_with_ring_and_sync_after_stop(self):
+        logpipe.install("INFO", log_file=self.path, max_bytes=400, backups=2, ring=10)
+        self.assertIsNotNone(logpipe._listener)
+        self.logger.debug("context %d", 1)
+        for i in range(40):
+            self.logger.info("cycle %d done", i)
+        self.logger.error("display failed")
+        logpipe.stop()
+
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        tail = self.read(self.path + ".1") + self.read()
+        self.assertIn("[DEBUG] context 1", tail)
+        self.assertLess(tail.index("context 1"), tail.index("display failed"))
+        for path in (self.path + ".1", self.path + ".2"):
+            self.assertLessEqual(os.path.getsize(path), 400)
+
+        self.logger.warning("after stop")  # written synchronously now
+        self.assertIn("after stop", self.read())
+
+    def test_noop_when_logging_is_already_configured(self):
+        existing = logging.NullHandler()
+        logging.getLogger().addHandler(existing)
+        logpipe.install("INFO", log_file=self.path)
+        self.assertEqual(logging.getLogger().handlers, [existing])
+        self.assertIsNone(logpipe._listener)
+
+    def test_synchronous_mode_and_unusable_file(self):
+        stderr = io.StringIO()
+        with patch("sys.stderr", stderr):
+            logpipe.install("WARNING", log_file=os.path.join(self.path, "missing", "x.log"),
+                            async_=False)
+            self.logger.warning("still logged")
+        self.assertIsNone(logpipe._listener)
+        self.assertIn("EINK_LOG_FILE not usable", stderr.getvalue())
+        self.assertIn("still logged", stderr.getvalue())
+
+
+class TestLazyFormattingInClientModules(unittest.TestCase):
+    """Logging calls must pass arguments, not pre-formatted messages."""
+
+    def test_no_eager_formatting(self):
+        here = os.path.dirname(os.path.abspath(__file__))
+        offenders = []
+        for path in sorted(glob.glob(os.path.join(here, "*.py"))):
+            if os.path.basename(path).startswith("test_"):
+                continue
+            with open(path, encoding="utf-8") as fh:
+                tree = ast.parse(fh.read(), path)
+            for node in ast.walk(tree):
+                if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in LOG_METHODS and node.args
+                        and isinstance(node.func.value, ast.Name)
+                        and node.func.value.id in ("logger", "logging")):
+                    continue
+                msg = node.args[1] if node.func.attr == "log" and len(node.args) > 1 else node.args[0]
+                eager = (
+                    isinstance(msg, ast.JoinedStr)
+                    or (isinstance(msg, ast.BinOp) and isinstance(msg.op, (ast.Mod, ast.Add)))
+                    or (isinstance(msg, ast.Call) and isinstance(msg.func, ast.Attribute)
+                        and msg.func.attr == "format")
+                )
+                if eager:
+                    offenders.append(f"{os.path.basename(path)}:{node.lineno}")
+        self.assertEqual(offenders, [])
+
+
+class TestLogpipeConfig(unittest.TestCase):
+    """config.LOG_* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        names = ("EINK_LOG_FILE", "EINK_LOG_MAX_BYTES", "EINK_LOG_BACKUPS", "EINK_LOG_RING",
+                 "EINK_LOG_ASYNC")
+        with patch.dict(os.environ):
+            for name in names:
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual(config.LOG_FILE, "")
+            self.assertEqual(config.LOG_MAX_BYTES, 1048576)
+            self.assertEqual(config.LOG_BACKUPS, 3)
+            self.assertEqual(config.LOG_RING, 200)
+            self.assertTrue(config.LOG_ASYNC)
+        with patch.dict(os.environ, {"EINK_LOG_RING": "0", "EINK_LOG_ASYNC": "False"}):
+            importlib.reload(config)
+            self.assertEqual(config.LOG_RING, 0)
+            self.assertFalse(config.LOG_ASYNC)
+
+
+if __name__ == "__main__":
+    unittest.main()
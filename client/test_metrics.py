@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Tests for the Prometheus metrics registry and exporters (metrics.py)."""
+
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+
+import metrics
+
+
+class TestRegistryRender(unittest.TestCase):
+    """Text exposition format 0.0.4 for counters, gauges and histograms."""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_with_labels(self):
+        errors = self.registry.counter(
+            "eink_client_http_errors_total", "Failed requests", labels=("endpoint", "code")
+        )
+        errors.inc(endpoint="/preview", code="500")
+        errors.inc(endpoint="/preview", code="500")
+        errors.inc(endpoint="/settings", code="ConnectionError")
+
+        text = self.registry.render()
+
+        self.assertIn("# HELP eink_client_http_errors_total Failed requests\n", text)
+        self.assertIn("# TYPE eink_client_http_errors_total counter\n", text)
+        self.assertIn('eink_client_http_errors_total{endpoint="/preview",code="500"} 2\n', text)
+        self.assertIn(
+            'eink_client_http_errors_total{endpoint="/settings",code="ConnectionError"} 1\n',
+            text,
+        )
+        self.assertEqual(errors.value(endpoint="/preview", code="500"), 2)
+
+    def test_wrong_labels_rejected(self):
+        counter = self.registry.counter("c_total", "c", labels=("result",))
+        with self.assertRaises(ValueError):
+            counter.inc(status="x")
+
+    def test_label_values_are_escaped(self):
+        counter = self.registry.counter("c_total", "c", labels=("path",))
+        counter.inc(path='a"b\\c')
+        self.assertIn('c_total{path="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_histogram_cumulative_buckets(self):
+        hist = self.registry.histogram("h_seconds", "h", labels=("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            hist.observe(value, stage="display")
+
+        text = self.registry.render()
+
+        self.assertIn('h_seconds_bucket{stage="display",le="0.1"} 1\n', text)
+        self.assertIn('h_seconds_bucket{stage="display",le="1"} 3\n', text)
+        self.assertIn('h_seconds_bucket{stage="display",le="+Inf"} 4\n', text)
+        self.assertIn('h_seconds_sum{stage="display"} 4.25\n', text)
+        self.assertIn('h_seconds_count{stage="display"} 4\n', text)
+        self.assertEqual(hist.count(stage="display"), 4)
+
+    def test_callback_gauge(self):
+        value = [12.5]
+        self.registry.gauge("g", "g", fn=lambda: value[0])
+        self.assertIn("g 12.5\n", self.registry.render())
+
+        value[0] = None  # e.g. no panel write yet: sample omitted
+        text = self.registry.render()
+        self.assertIn("# TYPE g gauge\n", text)
+        self.assertNotIn("\ng ", text)
+
+    def test_failing_callback_gauge_does_not_break_render(self):
+        self.registry.gauge("g", "g", fn=lambda: 1 / 0)
+        self.registry.counter("c_total", "c").inc()
+        self.assertIn("c_total 1\n", self.registry.render())
+
+    def test_process_rss_bytes(self):
+        rss = metrics.process_rss_bytes()
+        if os.path.exists("/proc/self/statm"):
+            self.assertGreater(rss, 0)
+        else:
+            self.assertIsNone(rss)
+
+
+class TestExporters(unittest.TestCase):
+    """HTTP endpoint and textfile collector output."""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.registry.counter("eink_client_refreshes_total", "r", labels=("result",)).inc(
+            result="refreshed"
+        )
+
+    def test_http_endpoint_serves_exposition(self):
+        server = metrics.MetricsServer(self.registry, "127.0.0.1", 0).start()
+        self.addCleanup(server.stop)
+
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=5) as resp:
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(resp.headers["Content-Type"], metrics.CONTENT_TYPE)
+            body = resp.read().decode()
+        self.assertIn('eink_client_refreshes_total{result="refreshed"} 1', body)
+
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other", timeout=5)
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_scrape_never_waits_for_a_slow_callback_under_the_lock(self):
+        """Callback gauges run outside the registry lock: updates keep flowing."""
+        entered, release = threading.Event(), threading.Event()
+
+        def slow():
+            entered.set()
+            release.wait(5)
+            return 1.0
+
+        self.registry.gauge("slow", "slow", fn=slow)
+        counter = self.registry.counter("fast_total", "f")
+        scraper = threading.Thread(target=self.registry.render)
+        scraper.start()
+        self.assertTrue(entered.wait(5))
+        counter.inc()  # would deadlock/block if the lock were held
+        release.set()
+        scraper.join(5)
+        self.assertEqual(counter.value(), 1)
+
+    def test_textfile_written_atomically(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "eink_client.prom")
+
+        writer = metrics.TextfileWriter(self.registry, path, interval=60).start()
+        writer.stop()
+
+        with open(path) as fh:
+            self.assertIn('eink_client_refreshes_total{result="refreshed"} 1', fh.read())
+        self.assertEqual(os.listdir(tmpdir.name), ["eink_client.prom"])
+
+
+if __name__ == "__main__":
+    unittest.main()
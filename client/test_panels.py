@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Tests for multi-panel mode: several displays from one client process."""
+
+import importlib
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+import panels
+import standin_server
+from test_client import MockEPD, make_test_png
+
+
+def bw_png():
+    buf = BytesIO()
+    Image.new("L", (800, 480), 0).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class PanelEPD(MockEPD):
+    """MockEPD counting writes; display() can wait on a barrier shared by all panels."""
+
+    def __init__(self, spec, barrier=None, fail=False):
+        super().__init__()
+        self.spec = spec
+        self.barrier = barrier
+        self.fail = fail
+        self.images = []
+        self.module_exits = 0
+
+    def getbuffer(self, image):
+        self.images.append(image.copy())
+        return super().getbuffer(image)
+
+    def display(self, buffer):
+        if self.fail:
+            raise OSError("SPI transfer failed")
+        if self.barrier is not None:
+            self.barrier.wait()  # times out unless every panel is writing at once
+        super().display(buffer)
+
+    def module_exit(self):
+        self.module_exits += 1
+
+
+class TestParsePanels(unittest.TestCase):
+
+    def test_full_spec(self):
+        left, right = panels.parse_panels(
+            "name=left,driver=epd7in3e,spi=0.0; "
+            "name=right, driver=epd7in5_V2, spi=0.1, rst=5, busy=6, design=Weather;"
+        )
+        self.assertEqual((left.name, left.driver, left.spi, left.pins, left.design),
+                         ("left", "epd7in3e", (0, 0), {}, ""))
+        self.assertEqual((right.name, right.driver, right.spi, right.pins, right.design),
+                         ("right", "epd7in5_V2", (0, 1), {"rst": 5, "busy": 6}, "Weather"))
+
+    def test_defaults(self):
+        import config
+        with patch.object(config, "DISPLAY_DRIVER", "epd7in5_V2"):
+            (panel,) = panels.parse_panels("design=Kitchen")
+        self.assertEqual((panel.name, panel.driver, panel.spi), ("panel1", "epd7in5_V2", None))
+        self.assertEqual(panels.parse_panels(" ; "), [])
+
+    def test_errors_name_the_panel(self):
+        for spec, message in (
+            ("name=a,colour=red", "unknown field 'colour=red'"),
+            ("name=a,driver", "unknown field 'driver'"),
+            ("name=a,driver=epd2in13", "a: unknown driver"),
+            ("name=a,spi=1", "a: spi must be BUS.DEVICE"),
+            ("name=a,rst=GPIO5", "a: rst must be a BCM pin"),
+            ("name=a;name=a,spi=0.1", "duplicate panel name 'a'"),
+        ):
+            with self.assertRaises(ValueError) as cm:
+                panels.parse_panels(spec)
+            self.assertIn(message, str(cm.exception))
+
+    def test_state_objects_are_slotted(self):
+        panel = panels.Panel(panels.PanelSpec("left", "epd7in3e"))
+        self.addCleanup(panel.worker.shutdown)
+        for obj in (panel, panel.spec):
+            self.assertFalse(hasattr(obj, "__dict__"))
+            with self.assertRaises(AttributeError):
+                obj.typo = 1
+
+
+class PanelSetTestCase(unittest.TestCase):
+    """A PanelSet against the stand-in server, with MockEPD-based panels."""
+
+    def setUp(self):
+        import client
+        import config
+        self.client = client
+        self.server = standin_server.StandinServer(make_test_png(), hold=0.1).start()
+        self.addCleanup(self.server.stop)
+        self.server.designs["Weather"] = bw_png()
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("CLIENT_TOKEN", ""), ("CONTENT_SKIP", True),
+            ("MAX_SKIP_HOURS", 24.0), ("HW_FAILURE_LIMIT", 0), ("HEARTBEAT_TELEMETRY", True),
+            ("LONGPOLL_TIMEOUT", 5),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, client, "_heartbeat_telemetry_accepted",
+                        client._heartbeat_telemetry_accepted)
+        client._heartbeat_telemetry_accepted = True
+        self.specs = panels.parse_panels(
+            "name=left,driver=epd7in3e;name=right,driver=epd7in5_V2,spi=0.1,design=Weather"
+        )
+        self.epds = {}
+
+    def panel_set(self, **epd_kwargs):
+        def factory(spec):
+            epd = PanelEPD(spec, **epd_kwargs.get(spec.name, {}))
+            self.epds.setdefault(spec.name, []).append(epd)
+            return epd
+        panel_set = panels.PanelSet(self.specs, epd_factory=factory)
+        self.addCleanup(panel_set.close)
+        return panel_set
+
+
+class TestPanelSet(PanelSetTestCase):
+
+    def test_panels_write_concurrently_and_share_one_heartbeat(self):
+        barrier = threading.Barrier(2, timeout=5)
+        panel_set = self.panel_set(left={"barrier": barrier}, right={"barrier": barrier})
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(panel_set.run_cycle(status={}))
+        left, right = self.epds["left"][0], self.epds["right"][0]
+        self.assertEqual(left.images[0].mode, "RGB")  # 6-color panel
+        self.assertEqual(right.images[0].mode, "1")  # B/W panel, its own design
+        self.assertEqual(self.server.requests["/preview"], 2)
+        (heartbeat,) = self.server.heartbeats
+        self.assertEqual(heartbeat["status"], "refreshed")
+        self.assertEqual([p["name"] for p in heartbeat["telemetry"]["panels"]], ["left", "right"])
+        self.assertFalse(any(p.write_pending for p in panel_set.panels))
+        threads = {t.name for t in threading.enumerate()}
+        self.assertTrue(any(name.startswith("panel-left") for name in threads))
+
+    def test_unchanged_content_is_skipped_per_panel(self):
+        panel_set = self.panel_set()
+        with self.assertLogs("eink-client", level="INFO"):
+            panel_set.run_cycle(status={})
+            self.server.trigger("interval")
+            self.assertTrue(panel_set.run_cycle())
+            # Nothing due and nothing pending: poll only.
+            self.assertTrue(panel_set.run_cycle())
+        self.assertEqual([len(self.epds[n][0].images) for n in ("left", "right")], [1, 1])
+        self.assertEqual([h["status"] for h in self.server.heartbeats], ["refreshed", "skipped"])
+        self.assertEqual(self.server.requests["/preview"], 4)
+
+    def test_failed_panel_is_retried_alone_and_escalates(self):
+        import config
+        panel_set = self.panel_set(right={"fail": True})
+        left, right = panel_set.panels
+        with patch.object(config, "HW_FAILURE_LIMIT", 2), \
+                self.assertLogs("eink-client", level="INFO") as logs:
+            # The healthy panel's progress is reported; the cycle backs off.
+            self.assertFalse(panel_set.run_cycle(status={}))
+            self.assertEqual(len(self.server.heartbeats), 1)
+            self.assertTrue(right.write_pending)
+            self.assertIsNone(right.epd)
+            self.assertEqual(self.epds["right"][0].module_exits, 1)
+            self.assertEqual(right.consecutive_hw_failures, 1)
+            with self.assertRaises(SystemExit):
+                panel_set.run_cycle()  # nothing due: only the right panel is retried
+        self.assertEqual(len(self.epds["left"][0].images), 1)
+        self.assertEqual(len(self.epds["right"]), 2)  # re-spawned for the retry
+        self.assertTrue(any("right: too many consecutive" in line for line in logs.output))
+
+    def test_missing_driver_library_means_preview_only(self):
+        def factory(spec):
+            raise ImportError("No module named 'waveshare_epd'")
+        panel_set = panels.PanelSet(self.specs[:1], epd_factory=factory)
+        self.addCleanup(panel_set.close)
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                with self.assertLogs("eink-client", level="INFO"):
+                    self.assertTrue(panel_set.run_cycle(status={}))
+                self.assertTrue(os.path.exists("preview_output-left.png"))
+            finally:
+                os.chdir(cwd)
+        self.assertTrue(panel_set.panels[0].preview_only)
+
+
+class TestPanelsWithDriverProcesses(PanelSetTestCase):
+    """End to end: one driver_proc child per panel, on the panel emulator."""
+
+    def test_each_panel_runs_in_its_own_child(self):
+        import config
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        output = os.path.join(tmp.name, "panel.png")
+        for name, value in (("PANEL_EMULATOR", True), ("PANEL_EMULATOR_SCALE", 0.01),
+                            ("PANEL_EMULATOR_OUTPUT", output), ("LOG_LEVEL", "ERROR")):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        panel_set = panels.PanelSet(self.specs)
+        self.addCleanup(panel_set.close)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(panel_set.run_cycle(status={}))
+        pids = {panel.epd.pid for panel in panel_set.panels}
+        self.assertEqual(len(pids), 2)
+        self.assertNotIn(os.getpid(), pids)
+        for name, size in (("left", (800, 480)), ("right", (800, 480))):
+            with Image.open(os.path.join(tmp.name, f"panel-{name}.png")) as img:
+                self.assertEqual(img.size, size)
+        panel_set.close()
+        self.assertTrue(all(panel.epd is None for panel in panel_set.panels))
+
+
+class TestClientHandOver(unittest.TestCase):
+
+    def test_main_hands_over_to_panels(self):
+        import client
+        import config
+        with patch.object(config, "PANELS", "name=left"), \
+                patch("panels.main") as panels_main, \
+                patch("client.load_display_driver") as load:
+            client.main()
+        panels_main.assert_called_once_with()
+        load.assert_not_called()
+
+
+class TestPanelsConfig(unittest.TestCase):
+    """config.PANELS default and override."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_PANELS", None)
+            importlib.reload(config)
+            self.assertEqual(config.PANELS, "")
+        with patch.dict(os.environ, {"EINK_PANELS": "name=a;name=b"}):
+            importlib.reload(config)
+            self.assertEqual([p.name for p in panels.parse_panels(config.PANELS)], ["a", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""Tests for playlist bundles, the frame cache and local rotation."""
+
+import hashlib
+import importlib
+import os
+import tempfile
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+import playlist
+import standin_server
+from test_client import ArtifactSandboxMixin, make_test_png
+from test_timeline import ImageEPD
+
+
+def frame(shade):
+    buf = BytesIO()
+    Image.new("RGB", (800, 480), (shade, 255 - shade, 40)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+FRAMES = [("Beach", frame(10), 0.6), ("Forest", frame(120), 0.6), ("City", frame(230), 0.6)]
+
+
+class TestBundle(unittest.TestCase):
+
+    def test_round_trip_skips_frames_the_client_has(self):
+        body = playlist.encode("7", FRAMES, have=[playlist.digest(FRAMES[1][1])])
+        version, entries, frames = playlist.decode(body)
+        self.assertEqual(version, "7")
+        self.assertEqual([(e["name"], e["dwell"]) for e in entries],
+                         [("Beach", 0.6), ("Forest", 0.6), ("City", 0.6)])
+        self.assertEqual(set(frames), {playlist.digest(FRAMES[0][1]),
+                                       playlist.digest(FRAMES[2][1])})
+        self.assertNotIn("length", entries[0])
+
+    def test_broken_bundles_are_rejected(self):
+        body = playlist.encode("7", FRAMES)
+        header_end = body.index(b"\n") + 1
+        corrupt = body[:header_end + 100] + b"X" + body[header_end + 101:]
+        for data, message in (
+            (b"{not json}\n", "malformed"),
+            (playlist.encode("7", []), "without frames"),
+            (corrupt, "Beach does not match its digest"),
+            (body + b"x", "length"),
+            (body[:-1], "City does not match"),
+        ):
+            with self.assertRaises(playlist.PlaylistError) as cm:
+                playlist.decode(data)
+            self.assertIn(message, str(cm.exception))
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = os.path.join(tmp.name, "playlist")
+
+    def store(self, cache, version, frames):
+        _, entries, sent = playlist.decode(playlist.encode(version, frames, cache.have()))
+        return cache.store(version, entries, sent)
+
+    def test_store_and_resume(self):
+        cache = playlist.Cache(self.dir, 10 * 1024 * 1024)
+        self.assertFalse(cache.load())
+        written = self.store(cache, "1", FRAMES)
+        self.assertEqual(written, sum(len(f) for _, f, _ in FRAMES))
+        self.assertEqual(self.store(cache, "2", FRAMES[:2]), 0)  # all cached
+        resumed = playlist.Cache(self.dir, 10 * 1024 * 1024)
+        self.assertTrue(resumed.load())
+        self.assertEqual((resumed.version, [e["name"] for e in resumed.entries]),
+                         ("2", ["Beach", "Forest"]))
+        self.assertEqual(resumed.frame(resumed.entries[1]["digest"]), FRAMES[1][1])
+        self.assertEqual([n for n in os.listdir(self.dir) if n.startswith(".tmp-")], [])
+
+    def test_incomplete_cache_is_not_resumed(self):
+        cache = playlist.Cache(self.dir, 10 * 1024 * 1024)
+        self.store(cache, "1", FRAMES)
+        os.unlink(os.path.join(self.dir, cache.entries[0]["digest"] + ".png"))
+        self.assertFalse(playlist.Cache(self.dir, 10 * 1024 * 1024).load())
+        _, entries, _ = playlist.decode(playlist.encode("2", FRAMES))
+        with self.assertRaises(playlist.PlaylistError):
+            cache.store("2", entries, {})
+
+    def test_older_frames_are_evicted_but_never_the_current_ones(self):
+        size = len(FRAMES[0][1])
+        cache = playlist.Cache(self.dir, 2 * size + size // 2)
+        self.store(cache, "1", FRAMES[:1])
+        os.utime(cache._path(cache.entries[0]["digest"]), (1, 1))  # oldest
+        self.store(cache, "2", FRAMES[1:])
+        self.assertEqual(set(cache.have()), {e["digest"] for e in cache.entries})
+        cache.max_bytes = 1
+        self.store(cache, "3", FRAMES[1:])
+        self.assertEqual(len(cache.have()), 2)
+
+    def test_digests_are_checked_before_touching_paths(self):
+        with self.assertRaises(playlist.PlaylistError):
+            playlist.Cache(self.dir, 1).frame("../../etc/passwd")
+
+
+class TestClientPlaylist(ArtifactSandboxMixin, unittest.TestCase):
+    """The client's rotation against the stand-in server."""
+
+    def setUp(self):
+        super().setUp()
+        import config
+        client = self.client
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.server = standin_server.StandinServer(make_test_png(), hold=0.1).start()
+        self.addCleanup(self.server.stop)
+        self.server.playlist = list(FRAMES)
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("SERVER_URLS", ""), ("CLIENT_TOKEN", ""),
+            ("PREVIEW_DELTA", False), ("COMPOSITE", False), ("CONTENT_SKIP", True),
+            ("LONGPOLL_TIMEOUT", 0.3), ("PLAYLIST", True),
+            ("PLAYLIST_DIR", os.path.join(tmp.name, "playlist")), ("PLAYLIST_MAX_MB", 8),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(playlist, "MIN_DWELL", 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ("_playlist", "_playlist_index", "_playlist_next", "_last_display_config",
+                     "_last_fetch_hash", "_last_fetch_bytes", "_last_displayed_hash",
+                     "_last_panel_write_monotonic", "_last_refresh_monotonic", "_last_frame",
+                     "_offline_since", "_offline_written_hash"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        client.epd = self.epd = ImageEPD()
+        client._playlist = None
+        client._initial_display_done = True
+        client._last_display_config = dict(standin_server.COLOR_SETTINGS["display"])
+
+    def start(self):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.client._start_playlist()
+        return logs.output
+
+    def run_until(self, count, limit=40):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            for _ in range(limit):
+                if len(self.epd.images) >= count:
+                    break
+                self.client._run_refresh_cycle()
+        self.assertEqual(len(self.epd.images), count)
+        return logs.output
+
+    def shown(self):
+        return [hashlib.sha256(img.tobytes()).hexdigest() for img in self.epd.images]
+
+    def pixels(self, png):
+        return hashlib.sha256(Image.open(BytesIO(png)).convert("RGB").tobytes()).hexdigest()
+
+    def test_rotates_locally_and_resyncs_on_a_new_version(self):
+        logs = self.start()
+        self.assertTrue(any("Playlist 1: 3 frames, 3 downloaded" in line for line in logs))
+        started = time.monotonic()
+        self.run_until(4)
+        self.assertGreaterEqual(time.monotonic() - started, 3 * 0.6 - 0.1)
+        self.assertEqual(self.shown(), [self.pixels(f) for _, f, _ in FRAMES + FRAMES[:1]])
+        self.assertNotIn("/preview", self.server.requests)
+        self.assertEqual(self.server.requests["/playlist/bundle"], 1)
+        self.assertEqual([hb["status"] for hb in self.server.heartbeats], ["refreshed"] * 4)
+        # A new version: only the new frame travels, rotation starts over.
+        new = ("Desert", frame(60), 0.6)
+        with self.server._cond:
+            self.server.playlist = [new, FRAMES[2]]
+            self.server.playlist_version = "2"
+        logs = self.run_until(5)
+        self.assertTrue(any("Playlist 2: 2 frames, 1 downloaded" in line for line in logs))
+        self.assertEqual(self.shown()[-1], self.pixels(new[1]))
+
+    def test_manual_trigger_rewrites_the_current_frame(self):
+        self.start()
+        self.run_until(1)
+        self.server.trigger("manual")
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(self.client._run_refresh_cycle())
+        self.assertEqual(self.shown(), [self.pixels(FRAMES[0][1])] * 2)
+        self.assertEqual(self.server.requests["/playlist/bundle"], 2)  # 204
+        self.assertEqual(self.server.heartbeats[-1]["status"], "refreshed")
+
+    def test_restart_without_server_resumes_from_disk(self):
+        self.start()
+        self.client._playlist = None
+        now = time.monotonic()
+        self.server.add_outage(now, now + 60, "drop")
+        logs = self.start()
+        self.assertTrue(any("Playlist 1 from" in line for line in logs))
+        self.assertTrue(any("Playlist sync failed" in line for line in logs))
+        self.client._initial_display_done = False
+        logs = self.run_until(1)
+        self.assertTrue(any("Playlist frame 1/3: Beach" in line for line in logs))
+        self.assertTrue(self.client._initial_display_done)
+
+    def test_server_without_playlists(self):
+        self.server.playlist = None
+        logs = self.start()
+        self.assertTrue(any("no /playlist/bundle" in line for line in logs))
+        self.assertIsNone(self.client._playlist)
+        self.assertFalse(self.client._playlist_due())
+
+
+class TestPlaylistConfig(unittest.TestCase):
+    """config.PLAYLIST / PLAYLIST_DIR / PLAYLIST_MAX_MB."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_PLAYLIST", "EINK_PLAYLIST_DIR", "EINK_PLAYLIST_MAX_MB"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual((config.PLAYLIST, config.PLAYLIST_DIR, config.PLAYLIST_MAX_MB),
+                             (False, "/var/tmp/eink-playlist", 64))
+        with patch.dict(os.environ, {"EINK_PLAYLIST": "TRUE", "EINK_PLAYLIST_MAX_MB": "16"}):
+            importlib.reload(config)
+            self.assertEqual((config.PLAYLIST, config.PLAYLIST_MAX_MB), (True, 16))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Tests for the on-demand cycle profiler."""
+
+import glob
+import importlib
+import os
+import pstats
+import signal
+import tempfile
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+import profiling
+
+
+def busy_cycle():
+    """A cycle that allocates and keeps something, so both outputs have content."""
+    busy_cycle.kept.append([bytearray(1024) for _ in range(200)])
+    return True
+
+
+busy_cycle.kept = []
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.out_dir = tmpdir.name
+        self.profiler = profiling.CycleProfiler()
+        self.addCleanup(busy_cycle.kept.clear)
+
+    def run_cycle(self, cycle=busy_cycle):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            result = self.profiler.run(cycle, self.out_dir)
+        return result, logs.output
+
+
+class TestCycleProfiler(ProfilerTestCase):
+
+    def test_disarmed_by_default_and_request_arms(self):
+        self.assertFalse(self.profiler.pending)
+        self.profiler.request(0)
+        self.assertFalse(self.profiler.pending)
+        self.profiler.request(2)
+        self.assertTrue(self.profiler.pending)
+
+    def test_profiles_exactly_the_requested_cycles(self):
+        self.profiler.request(2)
+        self.assertTrue(self.run_cycle()[0])
+        self.assertTrue(self.profiler.pending)
+        self.run_cycle()
+        self.assertFalse(self.profiler.pending)
+        self.assertFalse(tracemalloc.is_tracing())  # started for the session only
+
+        files = sorted(os.listdir(self.out_dir))
+        self.assertEqual(len(files), 8)
+        self.assertFalse([name for name in files if name.endswith(".tmp")])
+        base = os.path.join(self.out_dir, files[0].split(".")[0])
+        self.assertTrue(base.endswith("_01"))
+
+        stats = pstats.Stats(f"{base}.prof")
+        self.assertTrue(any(func[2] == "busy_cycle" for func in stats.stats))
+        before = tracemalloc.Snapshot.load(f"{base}.before.tracemalloc")
+        after = tracemalloc.Snapshot.load(f"{base}.after.tracemalloc")
+        growth = sum(diff.size_diff for diff in after.compare_to(before, "filename"))
+        self.assertGreater(growth, 200 * 1024)
+        with open(f"{base}.txt", encoding="utf-8") as fh:
+            summary = fh.read()
+        self.assertIn("busy_cycle", summary)
+        self.assertIn("traced memory:", summary)
+        self.assertIn("test_profiling.py", summary)
+
+    def test_keeps_a_tracemalloc_session_it_did_not_start(self):
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        self.profiler.request(1)
+        self.run_cycle()
+        self.assertTrue(tracemalloc.is_tracing())
+
+    def test_exception_passes_through_and_is_still_profiled(self):
+        def failing():
+            raise SystemExit(1)
+
+        self.profiler.request(1)
+        with self.assertLogs("eink-client", level="INFO"):
+            with self.assertRaises(SystemExit):
+                self.profiler.run(failing, self.out_dir)
+        self.assertEqual(len(glob.glob(os.path.join(self.out_dir, "*.prof"))), 1)
+        self.assertFalse(self.profiler.pending)
+
+    def test_unwritable_directory_is_logged_not_raised(self):
+        self.profiler.request(1)
+        self.out_dir = os.path.join(self.out_dir, "missing")
+        result, logs = self.run_cycle()
+        self.assertTrue(result)
+        self.assertTrue(any("Could not write profile" in line for line in logs))
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class TestClientProfilingHooks(unittest.TestCase):
+
+    def setUp(self):
+        import client
+        self.client = client
+        self.addCleanup(setattr, client, "_profiler", client._profiler)
+        client._profiler = profiling.CycleProfiler()
+
+    def test_profile_dir_defaults_next_to_the_artifact(self):
+        import config
+        with patch.object(config, "PROFILE_DIR", ""), \
+                patch.object(config, "LAST_SENT_PATH", "/var/lib/eink/last.png"):
+            self.assertEqual(self.client._profile_dir(), "/var/lib/eink")
+        with patch.object(config, "PROFILE_DIR", "/srv/profiles"):
+            self.assertEqual(self.client._profile_dir(), "/srv/profiles")
+
+    @patch("client.cleanup")
+    @patch("client.load_display_driver")
+    @patch("client.fetch_display_config", return_value={})
+    @patch("client.fetch_preview", return_value=None)
+    def test_sigusr1_arms_the_profiler_for_the_next_cycles(self, *mocks):
+        import config
+        saved = signal.getsignal(signal.SIGUSR1)
+        self.addCleanup(signal.signal, signal.SIGUSR1, saved)
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        self.addCleanup(signal.signal, signal.SIGINT, signal.getsignal(signal.SIGINT))
+        runs = []
+
+        def cycle():
+            if not runs:
+                signal.raise_signal(signal.SIGUSR1)
+            runs.append(self.client._profiler.pending)
+            if len(runs) == 3:
+                signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+            return True
+
+        def profiled(fn, out_dir):
+            self.client._profiler.pending = False
+            return fn()
+
+        with patch.object(config, "PROFILE_CYCLES", 1), \
+                patch.object(config, "PROFILE_ON_START", False), \
+                patch.object(config, "HEARTBEAT_TELEMETRY", False), \
+                patch.object(self.client, "process_refresh_cycle", side_effect=cycle), \
+                patch.object(self.client._profiler, "run", side_effect=profiled) as run:
+            with self.assertLogs("eink-client", level="INFO"):
+                self.client.main()
+        # Cycle 1 armed it, cycle 2 ran under the profiler, cycle 3 did not.
+        self.assertEqual(run.call_count, 1)
+        self.assertEqual(runs, [True, False, False])
+
+
+class TestProfilingConfig(unittest.TestCase):
+    """config.PROFILE_* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_PROFILE_CYCLES", "EINK_PROFILE_ON_START", "EINK_PROFILE_DIR"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual(config.PROFILE_CYCLES, 5)
+            self.assertFalse(config.PROFILE_ON_START)
+            self.assertEqual(config.PROFILE_DIR, "")
+        with patch.dict(os.environ, {"EINK_PROFILE_CYCLES": "2", "EINK_PROFILE_ON_START": "True"}):
+            importlib.reload(config)
+            self.assertEqual(config.PROFILE_CYCLES, 2)
+            self.assertTrue(config.PROFILE_ON_START)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Tests for the session trace recorder."""
+
+import importlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, PropertyMock, patch
+
+import epd_emulator
+import session_trace
+import standin_server
+from bench import _png_bytes, make_dithered_preview
+from test_client import ArtifactSandboxMixin
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+class TraceDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "trace.jsonl")
+
+
+class TestTraceWriter(TraceDirTestCase):
+
+    def test_rotation_keeps_backups_and_marks_fresh_files(self):
+        tracer = session_trace.Tracer(self.path, max_bytes=300, backups=2)
+        self.addCleanup(tracer.close)
+        for _ in range(12):
+            tracer.cycle({"init": True})
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertTrue(os.path.exists(self.path + ".2"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+        for path in (self.path, self.path + ".1", self.path + ".2"):
+            self.assertLessEqual(os.path.getsize(path), 300 + 200)  # one cycle over at most
+            first = read_events(path)[0]
+            # Every file can be replayed on its own.
+            self.assertEqual(first["v"], session_trace.FORMAT_VERSION)
+            self.assertIn("CONTENT_SKIP", first["cfg"])
+        self.assertNotIn("cfg", read_events(self.path + ".2")[1])
+
+    def test_unwritable_path_disables_tracing(self):
+        tracer = session_trace.Tracer(os.path.join(self.path, "missing", "trace.jsonl"))
+        with self.assertLogs("eink-client", level="WARNING") as logs:
+            tracer.cycle({})
+            tracer.cycle({})
+        self.assertEqual(len(logs.output), 1)
+
+
+class TestTracer(TraceDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tracer = session_trace.Tracer(self.path)
+        self.addCleanup(self.tracer.close)
+
+    def response(self, status, content):
+        resp = MagicMock()
+        resp.status_code = status
+        resp.content = content
+        return resp
+
+    def test_http_events(self):
+        start = self.tracer.now()
+        png = _png_bytes(make_dithered_preview(80, 48))
+        self.tracer.http("get", "/preview", start, self.response(200, png))
+        self.tracer.http("get", "/api/refresh_status", start,
+                         self.response(200, b'{"should_refresh": true}'))
+        self.tracer.http("post", "/api/client_heartbeat", start, error=TimeoutError("slow"))
+        preview, status, heartbeat = read_events(self.path)
+
+        self.assertEqual(preview["k"], "get")
+        self.assertEqual(preview["wh"], [80, 48])
+        self.assertEqual(preview["n"], len(png))
+        self.assertEqual(len(preview["h"]), session_trace.DIGEST_CHARS)
+        self.assertNotIn("b", preview)
+        self.assertEqual(status["b"], {"should_refresh": True})
+        self.assertEqual(heartbeat["e"], "TimeoutError")
+        self.assertNotIn("s", heartbeat)
+
+    def test_streamed_body(self):
+        start = self.tracer.now()
+        resp = MagicMock(status_code=206)
+        type(resp).content = PropertyMock(side_effect=AssertionError("body read twice"))
+        self.tracer.http("get", "/preview", start, resp, body=b"rest")
+        (event,) = read_events(self.path)
+        self.assertEqual((event["s"], event["n"]), (206, 4))
+
+    def test_traced_epd(self):
+        panel = MagicMock(width=800, height=480)
+        panel.init.return_value = -1
+        panel.getbuffer.return_value = bytearray(10)
+        panel.display.side_effect = OSError("SPI")
+        epd = self.tracer.wrap_epd(panel)
+
+        self.assertEqual(epd.width, 800)
+        self.assertEqual(epd.init(), -1)
+        epd.getbuffer(None)
+        with self.assertRaises(OSError):
+            epd.display(b"")
+        init, getbuffer, display = read_events(self.path)
+        self.assertEqual((init["c"], init["r"]), ("init", -1))
+        self.assertEqual(getbuffer["n"], 10)
+        self.assertEqual(display["e"], "OSError: SPI")
+
+
+class RecordedSessionMixin(ArtifactSandboxMixin):
+    """The real client, traced, against the stand-in server and the emulator.
+
+    record_session() runs a scripted session: startup write, content skip,
+    manual write, display fault, recovery write, held poll.
+    """
+
+    def setUp(self):
+        super().setUp()
+        import config
+        client = self.client
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.trace_path = os.path.join(tmpdir.name, "trace.jsonl")
+        self.server = standin_server.StandinServer(
+            _png_bytes(make_dithered_preview(800, 480)), hold=0.05
+        ).start()
+        self.addCleanup(self.server.stop)
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("CLIENT_TOKEN", ""), ("PANEL_EMULATOR", True),
+            ("PANEL_EMULATOR_SCALE", 0.0), ("PANEL_EMULATOR_OUTPUT", ""),
+            ("LAST_SENT_ASYNC", False), ("HW_FAILURE_LIMIT", 0), ("CONTENT_SKIP", True),
+            ("SERVER_URLS", ""), ("PREVIEW_DELTA", False), ("COMPOSITE", False),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for attr in ("driver_name", "_tracer", "_last_displayed_hash",
+                     "_last_panel_write_monotonic", "_last_fetch_hash", "_last_fetch_bytes"):
+            self.addCleanup(setattr, client, attr, getattr(client, attr))
+        self.addCleanup(epd_emulator.uninstall)
+
+    def record_session(self):
+        client = self.client
+        client._tracer = session_trace.Tracer(self.trace_path)
+        self.addCleanup(client._tracer.close)
+        with self.assertLogs("eink-client", level="INFO"):
+            client.load_display_driver("epd7in3e")
+            client._initial_display_done = False
+            self.assertTrue(client.process_refresh_cycle())  # startup write
+            self.server.trigger("interval")
+            self.assertTrue(client.process_refresh_cycle())  # content skip
+            self.server.trigger("manual")
+            self.assertTrue(client.process_refresh_cycle())  # write
+            epd_emulator.current().inject("display")
+            self.server.trigger("manual")
+            self.assertFalse(client.process_refresh_cycle())  # hardware failure
+            self.assertTrue(client.process_refresh_cycle())  # reload + write
+            self.assertTrue(client.process_refresh_cycle())  # held poll
+        client._tracer.close()
+        return read_events(self.trace_path)
+
+
+class TestClientRecording(RecordedSessionMixin, unittest.TestCase):
+
+    def test_session_is_recorded(self):
+        events = self.record_session()
+        kinds = [e["k"] for e in events]
+        self.assertEqual(kinds.count("cycle"), 6)
+        self.assertEqual(events[0]["c"], "EPD")  # driver load before the first cycle
+        self.assertEqual(events[0]["wh"], [800, 480])
+        calls = [e["c"] for e in events if e["k"] == "hw"]
+        self.assertEqual(calls.count("EPD"), 2)  # load + E5.4 reload
+        self.assertIn("module_exit", calls)
+        failed = next(e for e in events if e.get("c") == "display" and "e" in e)
+        self.assertTrue(failed["e"].startswith("EmulatedHardwareError"))
+        cycles = [e for e in events if e["k"] == "cycle"]
+        self.assertFalse(cycles[0]["st"]["init"])
+        self.assertEqual(cycles[4]["st"]["hwf"], 1)
+        self.assertTrue(cycles[4]["st"]["rec"])
+        self.assertEqual(
+            len([e for e in events if e.get("p") == "/api/client_heartbeat"]),
+            len(self.server.heartbeats),
+        )
+
+
+class TestSessionTraceConfig(unittest.TestCase):
+    """config.TRACE_* defaults and overrides."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            for name in ("EINK_TRACE_PATH", "EINK_TRACE_MAX_BYTES", "EINK_TRACE_BACKUPS"):
+                os.environ.pop(name, None)
+            importlib.reload(config)
+            self.assertEqual(config.TRACE_PATH, "")
+            self.assertEqual(config.TRACE_MAX_BYTES, 1048576)
+            self.assertEqual(config.TRACE_BACKUPS, 3)
+        with patch.dict(os.environ, {"EINK_TRACE_PATH": "/var/log/eink/trace.jsonl",
+                                     "EINK_TRACE_BACKUPS": "5"}):
+            importlib.reload(config)
+            self.assertEqual(config.TRACE_PATH, "/var/log/eink/trace.jsonl")
+            self.assertEqual(config.TRACE_BACKUPS, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Tests for the bulk SPI transport against a recording fake spidev."""
+
+import importlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import epd_emulator
+import spi_transport
+
+DC_PIN, CS_PIN = 25, 8
+BUFSIZ = 4096
+
+
+class FakeSpiDev:
+    """spidev.SpiDev stand-in recording (DC level, payload) per transfer."""
+
+    def __init__(self, pins, bufsiz=BUFSIZ):
+        self.pins = pins
+        self.bufsiz = bufsiz
+        self.transfers = []
+
+    def writebytes(self, values):
+        if len(values) > self.bufsiz:
+            raise OSError(90, "Message too long")
+        self.transfers.append((self.pins.get(DC_PIN), bytes(values)))
+
+    def writebytes2(self, values):
+        # The real writebytes2 splits anything above bufsiz itself.
+        self.transfers.append((self.pins.get(DC_PIN), bytes(values)))
+
+
+class FakeEpdConfig:
+    """The parts of waveshare_epd.epdconfig the vendor send_* methods use."""
+
+    def __init__(self, bufsiz=BUFSIZ):
+        self.pins = {}
+        self.pin_writes = 0
+        self.SPI = FakeSpiDev(self.pins, bufsiz)
+
+    def digital_write(self, pin, value):
+        self.pin_writes += 1
+        self.pins[pin] = value
+
+    def spi_writebyte(self, data):
+        self.SPI.writebytes(data)
+
+    def spi_writebyte2(self, data):
+        self.SPI.writebytes2(data)
+
+
+class VendorEPD:
+    """The send_*/init/display shape of waveshare_epd.epd7in3e."""
+
+    width, height = 800, 480
+
+    def __init__(self, epdconfig):
+        self.epdconfig = epdconfig
+        self.dc_pin, self.cs_pin = DC_PIN, CS_PIN
+
+    def send_command(self, command):
+        self.epdconfig.digital_write(self.dc_pin, 0)
+        self.epdconfig.digital_write(self.cs_pin, 0)
+        self.epdconfig.spi_writebyte([command])
+        self.epdconfig.digital_write(self.cs_pin, 1)
+
+    def send_data(self, data):
+        self.epdconfig.digital_write(self.dc_pin, 1)
+        self.epdconfig.digital_write(self.cs_pin, 0)
+        self.epdconfig.spi_writebyte([data])
+        self.epdconfig.digital_write(self.cs_pin, 1)
+
+    def send_data2(self, data):
+        self.epdconfig.digital_write(self.dc_pin, 1)
+        self.epdconfig.digital_write(self.cs_pin, 0)
+        self.epdconfig.spi_writebyte2(data)
+        self.epdconfig.digital_write(self.cs_pin, 1)
+
+    def init(self):
+        for command, data in ((0xAA, (0x49, 0x55, 0x20, 0x08, 0x09, 0x18)),
+                              (0x01, (0x3F,)), (0x00, (0x5F, 0x69)), (0x06, (0x40, 0x1F))):
+            self.send_command(command)
+            for byte in data:
+                self.send_data(byte)
+        self.send_command(0x04)
+
+    def display(self, image):
+        self.send_command(0x10)
+        self.send_data2(image)
+        self.send_command(0x12)
+        self.send_data(0x00)
+
+    def display_bytewise(self, image):
+        """Older drivers: a send_data() per buffer byte."""
+        self.send_command(0x10)
+        for byte in image:
+            self.send_data(byte)
+        self.send_command(0x12)
+
+
+def frame(size=800 * 480 // 2):
+    return [(i * 7) & 0xFF for i in range(size)]
+
+
+def segments(transfers):
+    """The wire stream as (DC level, bytes) runs; transfer boundaries dropped."""
+    runs = []
+    for dc, payload in transfers:
+        if runs and runs[-1][0] == dc:
+            runs[-1] = (dc, runs[-1][1] + payload)
+        else:
+            runs.append((dc, payload))
+    return runs
+
+
+class TestSpiTransport(unittest.TestCase):
+
+    def drive(self, attach, display="display", bufsiz=BUFSIZ):
+        """init, a frame and init again; returns the epdconfig with the recording."""
+        epdconfig = FakeEpdConfig(bufsiz)
+        epd = VendorEPD(epdconfig)
+        if attach:
+            with self.assertLogs("eink-client", level="INFO"):
+                self.assertTrue(spi_transport.attach(epd, epdconfig, chunk=bufsiz))
+        epd.init()
+        getattr(epd, display)(frame())
+        epd.init()
+        return epdconfig
+
+    def test_byte_stream_matches_the_vendor_path(self):
+        vendor, bulk = self.drive(False), self.drive(True)
+        self.assertEqual(segments(bulk.SPI.transfers), segments(vendor.SPI.transfers))
+        self.assertIn((1, bytes(frame())), segments(bulk.SPI.transfers))
+
+    def test_fewer_pin_writes_and_no_cs_toggling(self):
+        vendor, bulk = self.drive(False), self.drive(True)
+        self.assertNotIn(CS_PIN, bulk.pins)
+        self.assertLess(bulk.pin_writes * 2, vendor.pin_writes)
+
+    def test_frame_goes_out_in_bufsiz_chunks(self):
+        bulk = self.drive(True, bufsiz=1024)
+        large = [payload for _, payload in bulk.SPI.transfers if len(payload) > 1]
+        self.assertEqual(len(large), len(frame()) // 1024 + 1)
+        self.assertTrue(all(len(payload) <= 1024 for payload in large))
+
+    def test_bytewise_driver_keeps_the_stream_without_pin_writes(self):
+        vendor = self.drive(False, "display_bytewise")
+        bulk = self.drive(True, "display_bytewise")
+        self.assertEqual(segments(bulk.SPI.transfers), segments(vendor.SPI.transfers))
+        # DC goes high once for the whole frame instead of 3 writes per byte.
+        self.assertLess(bulk.pin_writes, 40)
+
+    def test_buffers_of_every_kind(self):
+        epdconfig = FakeEpdConfig(bufsiz=3)
+        transport = spi_transport.SpiTransport(epdconfig.SPI, epdconfig.digital_write, DC_PIN)
+        self.assertEqual(transport.chunk, spi_transport.spidev_bufsiz())
+        transport.chunk = 3
+        for data in ([1, 2, 3, 4], bytearray(b"\x01\x02\x03\x04"), memoryview(b"\x01\x02\x03\x04")):
+            transport.send_data2(data)
+        self.assertEqual(
+            [payload for _, payload in epdconfig.SPI.transfers], [b"\x01\x02\x03", b"\x04"] * 3
+        )
+        self.assertEqual(epdconfig.pin_writes, 1)
+
+    def test_command_always_drives_dc(self):
+        epdconfig = FakeEpdConfig()
+        transport = spi_transport.SpiTransport(epdconfig.SPI, epdconfig.digital_write, DC_PIN)
+        transport.send_command(0x10)
+        transport.send_command(0x12)
+        self.assertEqual(epdconfig.pin_writes, 2)
+
+
+class TestAttach(unittest.TestCase):
+
+    def test_not_applicable_without_a_hardware_spidev(self):
+        epdconfig = FakeEpdConfig()
+        epd = VendorEPD(epdconfig)
+        del epdconfig.SPI
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertFalse(spi_transport.attach(epd, epdconfig))
+        self.assertIn("not applicable", logs.output[0])
+        self.assertEqual(epd.send_data2.__func__, VendorEPD.send_data2)
+
+    def test_not_applicable_to_the_emulator(self):
+        epd_emulator.install(time_scale=0.0, output="")
+        self.addCleanup(epd_emulator.uninstall)
+        from waveshare_epd import epd7in3e
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertFalse(spi_transport.attach(epd7in3e.EPD(), epd7in3e.epdconfig))
+
+    def test_spidev_bufsiz(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bufsiz")
+            with open(path, "w") as fh:
+                fh.write("65536\n")
+            self.assertEqual(spi_transport.spidev_bufsiz(path), 65536)
+            with open(path, "w") as fh:
+                fh.write("junk")
+            self.assertEqual(spi_transport.spidev_bufsiz(path), spi_transport.DEFAULT_BUFSIZ)
+        self.assertEqual(spi_transport.spidev_bufsiz("/nonexistent/bufsiz"),
+                         spi_transport.DEFAULT_BUFSIZ)
+
+
+class TestClientAttach(unittest.TestCase):
+    """load_display_driver() attaches the transport only with EINK_SPI_TRANSPORT."""
+
+    def test_attached_on_the_raw_panel(self):
+        import client
+        import config
+        epdconfig = FakeEpdConfig()
+        self.addCleanup(setattr, client, "_tracer", client._tracer)
+        client._tracer = None
+        with patch.object(config, "SPI_TRANSPORT", True):
+            epd = client._construct_epd(lambda: VendorEPD(epdconfig), epdconfig)
+        self.assertIsInstance(epd.spi_transport, spi_transport.SpiTransport)
+        with patch.object(config, "SPI_TRANSPORT", False):
+            epd = client._construct_epd(lambda: VendorEPD(epdconfig), epdconfig)
+        self.assertFalse(hasattr(epd, "spi_transport"))
+
+
+class TestSpiTransportConfig(unittest.TestCase):
+    """config.SPI_TRANSPORT default and override."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_SPI_TRANSPORT", None)
+            importlib.reload(config)
+            self.assertFalse(config.SPI_TRANSPORT)
+        with patch.dict(os.environ, {"EINK_SPI_TRANSPORT": "True"}):
+            importlib.reload(config)
+            self.assertTrue(config.SPI_TRANSPORT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Tests for the local stand-in server used by the benchmarks and harnesses."""
+
+import json
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+import standin_server
+
+
+class TestStandinServer(unittest.TestCase):
+    """Long-poll hold, trigger wake-up and heartbeat bookkeeping."""
+
+    def setUp(self):
+        self.server = standin_server.StandinServer(b"png-bytes", hold=0.2).start()
+        self.addCleanup(self.server.stop)
+
+    def get(self, path):
+        with urllib.request.urlopen(self.server.url + path, timeout=5) as resp:
+            return resp.read()
+
+    def test_idle_poll_holds_then_reports_nothing_due(self):
+        body = json.loads(self.get("/api/refresh_status"))
+        self.assertFalse(body["should_refresh"])
+        self.assertNotIn("reason", body)
+
+    def test_trigger_and_heartbeat(self):
+        self.server.trigger("manual")
+        body = json.loads(self.get("/api/refresh_status"))
+        self.assertEqual(body, {"should_refresh": True, "refresh_interval": 3600,
+                                "reason": "manual"})
+        self.assertEqual(self.get("/preview?raw=true"), b"png-bytes")
+
+        req = urllib.request.Request(
+            self.server.url + "/api/client_heartbeat",
+            data=json.dumps({"status": "refreshed"}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(req, timeout=5).close()
+        self.assertEqual(self.server.heartbeats, [{"status": "refreshed"}])
+        self.assertFalse(self.server.should_refresh)
+        self.assertEqual(self.server.requests["/preview"], 1)
+
+    def test_design_previews_by_name(self):
+        self.server.designs["Weather"] = b"weather-png"
+        self.assertEqual(self.get("/preview?name=Weather&raw=true"), b"weather-png")
+        self.assertEqual(self.get("/preview"), b"png-bytes")
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            self.get("/preview?name=Missing")
+        self.assertEqual(cm.exception.code, 404)
+
+    def test_route_delay(self):
+        self.server.delays["/settings"] = 0.2
+        start = time.monotonic()
+        self.get("/settings")
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_drop_outage_closes_without_response(self):
+        now = time.monotonic()
+        self.server.add_outage(now, now + 5, "drop")
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get("/preview")
+
+    def test_blackhole_hangs_until_the_outage_ends(self):
+        now = time.monotonic()
+        self.server.add_outage(now, now + 0.3, "blackhole")
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get("/settings")
+        self.assertGreaterEqual(time.monotonic() - now, 0.3)
+        self.get("/settings")  # answered normally after the window
+
+    def test_outage_starting_during_a_parked_poll_drops_it(self):
+        self.server.hold = 5
+        now = time.monotonic()
+        self.server.add_outage(now + 0.1, now + 5, "drop")
+        with self.assertRaises((urllib.error.URLError, ConnectionError)):
+            self.get("/api/refresh_status")
+        self.assertLess(time.monotonic() - now, 2)
+
+    def test_unknown_outage_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.server.add_outage(0, 1, "meteor")
+
+
+
+if __name__ == "__main__":
+    unittest.main()
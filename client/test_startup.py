@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Tests for the cold-start path: deferred imports, parallel driver bring-up."""
+
+import contextlib
+import importlib
+import io
+import os
+import signal
+import subprocess
+import sys
+import threading
+import unittest
+from unittest.mock import patch
+
+import startup
+
+
+class TestDeferredModule(unittest.TestCase):
+
+    def test_imports_once_on_first_attribute_access(self):
+        imports = []
+        deferred = startup.DeferredModule("json", on_import=lambda *a: imports.append(a))
+        self.assertFalse(deferred.loaded)
+        self.assertIn("deferred", repr(deferred))
+        self.assertEqual(deferred.dumps([1]), "[1]")
+        self.assertIs(deferred.JSONDecodeError, sys.modules["json"].JSONDecodeError)
+        self.assertTrue(deferred.loaded)
+        self.assertEqual(len(imports), 1)
+        label, start, end = imports[0]
+        self.assertEqual(label, "import json")
+        self.assertLessEqual(start, end)
+
+    def test_missing_module_raises_on_use(self):
+        deferred = startup.DeferredModule("no_such_module_xyz")
+        with self.assertRaises(ImportError):
+            deferred.anything
+
+    def test_client_import_does_not_import_requests_or_pillow(self):
+        # Nor the opt-in metrics endpoint and profilers.
+        code = ("import sys, client; print(sorted(m for m in "
+                "('requests', 'PIL.Image', 'http.server', 'cProfile', 'pstats', 'tracemalloc') "
+                "if m in sys.modules))")
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        self.assertEqual(out.strip(), "[]")
+
+
+class TestStartupProfile(unittest.TestCase):
+
+    def test_report_overlap_and_first_frame(self):
+        profile = startup.StartupProfile()
+        t0 = profile.t0
+        profile.record("settings", t0 + 0.1, t0 + 0.6)
+        worker = threading.Thread(
+            target=profile.record, args=("driver epd7in3e", t0 + 0.1, t0 + 2.1),
+            name="driver-bringup",
+        )
+        worker.start()
+        worker.join()
+        profile.record(startup.WAIT_LABEL, t0 + 0.8, t0 + 2.1)
+        self.assertAlmostEqual(profile.overlap(), 0.7)
+        self.assertIn("startup done (no frame)", profile.summary())
+        profile.mark_first_frame()
+        report = profile.format_report()
+        self.assertIn("driver-bringup", report)
+        self.assertLess(report.index("settings"), report.index(startup.WAIT_LABEL))
+        self.assertIn("first frame", report.splitlines()[-1])
+        self.assertIn("0.70s of driver bring-up overlapped", report)
+
+    def test_process_age(self):
+        age = startup.process_age()
+        if sys.platform.startswith("linux"):
+            self.assertIsNotNone(age)
+            self.assertGreaterEqual(age, 0.0)
+
+
+class TestParallelStartup(unittest.TestCase):
+    """main()'s startup path with the driver load on its own thread."""
+
+    def setUp(self):
+        import client
+        import config
+        self.client = client
+        for sig in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGUSR1", None)):
+            if sig is not None:
+                self.addCleanup(signal.signal, sig, signal.getsignal(sig))
+        for attr in ("_initial_display_done", "_driver_bringup", "_startup", "driver_name"):
+            self.addCleanup(setattr, client, attr, getattr(client, attr))
+        client._startup = startup.StartupProfile()
+        for name, value in (("PROFILE_ON_START", False), ("HEARTBEAT_TELEMETRY", False),
+                            ("DISPLAY_DRIVER", "epd7in3e")):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.events = []
+        self.fetched = threading.Event()
+
+    def slow_driver_load(self, name):
+        self.events.append(("load start", threading.current_thread().name))
+        # Only finishes once the main thread has fetched the preview.
+        self.assertTrue(self.fetched.wait(5))
+        self.events.append(("load done", threading.current_thread().name))
+
+    def fetch_preview(self, mode):
+        self.events.append(("preview", threading.current_thread().name))
+        self.fetched.set()
+        return "img"
+
+    def run_main(self, **kwargs):
+        out = io.StringIO()
+        with patch("client.load_display_driver", side_effect=self.slow_driver_load), \
+                patch("client.fetch_display_config", return_value={}), \
+                patch("client.fetch_preview", side_effect=self.fetch_preview), \
+                patch("client.display_image", return_value=True) as display, \
+                patch("client.send_heartbeat"), \
+                patch("client.cleanup"), \
+                patch("client.process_refresh_cycle", side_effect=KeyboardInterrupt), \
+                contextlib.redirect_stdout(out), \
+                self.assertLogs("eink-client", level="INFO") as logs:
+            display.side_effect = lambda *a: self.events.append(("display", None)) or True
+            try:
+                self.client.main(**kwargs)
+            except KeyboardInterrupt:
+                pass
+        return out.getvalue(), logs.output
+
+    def test_driver_loads_while_the_preview_is_fetched(self):
+        _, logs = self.run_main()
+        # The load cannot finish before the preview fetch: both ran at once.
+        self.assertEqual(self.events[-2:], [("load done", "driver-bringup"), ("display", None)])
+        self.assertIn(("load start", "driver-bringup"), self.events)
+        self.assertIn(("preview", "MainThread"), self.events)
+        self.assertIsNone(self.client._driver_bringup)
+        self.assertTrue(any("Startup: first frame" in line for line in logs))
+
+    def test_startup_profile_prints_the_report_and_skips_the_loop(self):
+        with patch("client.process_refresh_cycle") as cycle:
+            report, _ = self.run_main(startup_profile=True)
+        cycle.assert_not_called()
+        self.assertIn("startup profile", report)
+        for phase in ("client import", "driver epd7in3e", "settings", "preview",
+                      startup.WAIT_LABEL, "display"):
+            self.assertIn(phase, report)
+
+    def test_default_telemetry_leaves_the_stage_timer_off(self):
+        import config
+        import timing
+        with patch.object(config, "HEARTBEAT_TELEMETRY", True), \
+                patch.object(config, "STAGE_TIMING", False), \
+                patch.object(config, "METRICS_PORT", 0), \
+                patch.object(config, "METRICS_TEXTFILE", ""), \
+                patch.object(self.client, "_timer", timing.StageTimer(enabled=False)):
+            self.run_main()
+            self.assertFalse(self.client._timer.enabled)
+
+    def test_sequential_startup_when_disabled(self):
+        import config
+        self.fetched.set()  # the load must not wait for a fetch that comes after it
+        with patch.object(config, "PARALLEL_STARTUP", False):
+            self.run_main()
+        self.assertEqual([e[0] for e in self.events],
+                         ["load start", "load done", "preview", "display"])
+        self.assertEqual(self.events[0][1], "MainThread")
+
+
+class TestStartupConfig(unittest.TestCase):
+    """config.PARALLEL_STARTUP default and override."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_PARALLEL_STARTUP", None)
+            importlib.reload(config)
+            self.assertTrue(config.PARALLEL_STARTUP)
+        with patch.dict(os.environ, {"EINK_PARALLEL_STARTUP": "False"}):
+            importlib.reload(config)
+            self.assertFalse(config.PARALLEL_STARTUP)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Tests for tile-delta preview transfer."""
+
+import importlib
+import json
+import os
+import random
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw
+
+import standin_server
+import tile_delta
+
+
+def noisy_frame():
+    """A frame that compresses like a dithered photo, not like a flat test image."""
+    return Image.frombytes("RGB", (800, 480), random.Random(7).randbytes(800 * 480 * 3))
+
+
+def png(img):
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def with_clock(img, text="12:34"):
+    """img with a small region (a clock) repainted."""
+    img = img.copy()
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((700, 10, 790, 40), fill=(0, 0, 0))
+    draw.text((710, 18), text, fill=(255, 255, 255))
+    return img
+
+
+class TestTileDelta(unittest.TestCase):
+
+    def test_tiles_cover_the_frame_with_clipped_edges(self):
+        boxes = tile_delta.tile_boxes((800, 480))
+        self.assertEqual(len(boxes), 13 * 8)
+        self.assertEqual(boxes[12], (768, 0, 800, 64))
+        self.assertEqual(boxes[-1], (768, 448, 800, 480))
+        manifest = tile_delta.manifest(Image.new("L", (100, 70)))
+        self.assertEqual((manifest["size"], manifest["mode"], len(manifest["tiles"])),
+                         ([100, 70], "L", 4))
+
+    def test_changed_tiles_round_trip(self):
+        old = noisy_frame()
+        new = with_clock(old)
+        content_type, body = tile_delta.encode(new, tile_delta.manifest(old))
+        self.assertEqual(content_type, tile_delta.CONTENT_TYPE)
+        header = json.loads(body[:body.index(b"\n")])
+        self.assertEqual([(x, y) for x, y, _ in header["tiles"]], [(640, 0), (704, 0), (768, 0)])
+        self.assertLess(len(body) * 10, len(png(new)))
+        patched = tile_delta.apply(old, content_type, body)
+        self.assertEqual(tile_delta.frame_digest(patched), tile_delta.frame_digest(new))
+
+    def test_unchanged_frame_is_an_empty_patch(self):
+        frame = noisy_frame()
+        content_type, body = tile_delta.encode(frame, tile_delta.manifest(frame))
+        self.assertEqual((content_type, len(body) < 100), (tile_delta.CONTENT_TYPE, True))
+        self.assertEqual(tile_delta.apply(frame, content_type, body).tobytes(), frame.tobytes())
+
+    def test_full_frame_when_a_patch_cannot_help(self):
+        frame = noisy_frame()
+        for manifest in (
+            tile_delta.manifest(frame.resize((400, 240))),  # other geometry
+            tile_delta.manifest(frame.convert("L")),  # other mode
+            dict(tile_delta.manifest(frame), tiles=[]),
+            tile_delta.manifest(Image.new("RGB", frame.size)),  # everything changed
+        ):
+            content_type, body = tile_delta.encode(frame, manifest)
+            self.assertEqual(content_type, "image/png")
+            self.assertEqual(tile_delta.apply(None, content_type, body).tobytes(),
+                             frame.tobytes())
+
+    def test_broken_patches_are_rejected(self):
+        old = noisy_frame()
+        content_type, body = tile_delta.encode(with_clock(old), tile_delta.manifest(old))
+        for base, data, message in (
+            (None, body, "without a base"),
+            (old.convert("L"), body, "does not match"),
+            (old, b"{not json}\n", "malformed"),
+            (old, body + b"x", "length"),
+        ):
+            with self.assertRaises(tile_delta.DeltaError) as cm:
+                tile_delta.apply(base, content_type, data)
+            self.assertIn(message, str(cm.exception))
+
+    def test_normalize_and_digest(self):
+        palette = noisy_frame().convert("P")
+        self.assertEqual(tile_delta.normalize(palette).mode, "RGB")
+        bw = Image.new("1", (8, 8))
+        self.assertIs(tile_delta.normalize(bw), bw)
+        import client
+        self.assertEqual(tile_delta.frame_digest(bw), client._artifact_digest(bw))
+
+
+class TestClientDelta(unittest.TestCase):
+    """fetch_preview() with EINK_PREVIEW_DELTA against the stand-in server."""
+
+    def setUp(self):
+        import client
+        import config
+        self.client = client
+        self.frame = noisy_frame()
+        self.server = standin_server.StandinServer(png(self.frame), hold=0.1).start()
+        self.addCleanup(self.server.stop)
+        for name, value in (("SERVER_URL", self.server.url), ("SERVER_URLS", ""),
+                            ("CLIENT_TOKEN", ""), ("PREVIEW_DELTA", True)):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("_last_fetch_hash", "_last_fetch_bytes", "_preview_delta_supported"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        self.addCleanup(client._delta_bases.clear)
+        client._delta_bases.clear()
+
+    def fetch(self, design=None):
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            img = self.client.fetch_preview(design=design)
+        self.assertIsNotNone(img)
+        return img, logs.output
+
+    def test_changed_region_is_patched(self):
+        first, _ = self.fetch()
+        first_hash = self.client._last_fetch_hash
+        self.server.png_bytes = png(with_clock(self.frame))
+        img, _ = self.fetch()
+        self.assertEqual(img.tobytes(), with_clock(self.frame).tobytes())
+        self.assertLess(self.client._last_fetch_bytes * 10, len(self.server.png_bytes))
+        self.assertEqual((self.server.requests["/preview"],
+                          self.server.requests["/preview/delta"]), (1, 1))
+        self.assertNotEqual(self.client._last_fetch_hash, first_hash)
+        # Back to the first frame: same content hash as the full download.
+        self.server.png_bytes = png(self.frame)
+        self.fetch()
+        self.assertEqual(self.client._last_fetch_hash, first_hash)
+        self.assertEqual(first.tobytes(), self.frame.tobytes())
+
+    def test_bases_are_kept_per_design(self):
+        self.server.designs["Weather"] = png(Image.new("L", (800, 480), 200))
+        self.fetch()
+        self.fetch(design="Weather")
+        weather, _ = self.fetch(design="Weather")
+        self.assertEqual(weather.mode, "L")
+        self.assertEqual((self.server.requests["/preview"],
+                          self.server.requests["/preview/delta"]), (2, 1))
+
+    def test_digest_mismatch_falls_back_to_the_full_frame(self):
+        self.fetch()
+        self.server.png_bytes = png(with_clock(self.frame))
+        with patch.object(tile_delta, "frame_digest", return_value="0" * 64):
+            img, logs = self.fetch()
+        self.assertTrue(any("digest mismatch" in line for line in logs))
+        self.assertEqual(img.tobytes(), with_clock(self.frame).tobytes())
+        self.assertEqual(self.server.requests["/preview"], 2)
+
+    def test_server_without_delta_is_asked_once(self):
+        self.server.delta = False
+        self.fetch()
+        _, logs = self.fetch()
+        self.fetch()
+        self.assertTrue(any("no /preview/delta" in line for line in logs))
+        self.assertEqual((self.server.requests["/preview"],
+                          self.server.requests["/preview/delta"]), (3, 1))
+
+    def test_unknown_design_keeps_delta_enabled(self):
+        self.server.designs["Weather"] = png(self.frame)
+        self.fetch(design="Weather")
+        del self.server.designs["Weather"]
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertIsNone(self.client.fetch_preview(design="Weather"))
+        self.assertTrue(self.client._preview_delta_supported)
+
+
+class TestPreviewDeltaConfig(unittest.TestCase):
+    """config.PREVIEW_DELTA default and override."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_default_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_PREVIEW_DELTA", None)
+            importlib.reload(config)
+            self.assertFalse(config.PREVIEW_DELTA)
+        with patch.dict(os.environ, {"EINK_PREVIEW_DELTA": "TRUE"}):
+            importlib.reload(config)
+            self.assertTrue(config.PREVIEW_DELTA)
+
+
+if __name__ == "__main__":
+    unittest.main()
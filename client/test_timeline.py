@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""Tests for the render-ahead timeline."""
+
+import importlib
+import os
+import threading
+import time
+import unittest
+from io import BytesIO
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+import standin_server
+import timeline
+from test_client import ArtifactSandboxMixin, MockEPD, make_test_png
+
+
+class FakeClock:
+    def __init__(self, now=1000.5):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class ImageEPD(MockEPD):
+    """MockEPD keeping every image written."""
+
+    def __init__(self):
+        super().__init__()
+        self.images = []
+
+    def getbuffer(self, image):
+        self.images.append(image.copy())
+        return super().getbuffer(image)
+
+
+def slot_png(at):
+    """A distinct frame per slot."""
+    buf = BytesIO()
+    Image.new("RGB", (800, 480), (at % 256, (at // 256) % 256, 7)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class TestTimeline(unittest.TestCase):
+
+    def make(self, fetch=None, **kwargs):
+        clock = FakeClock()
+        fetched = []
+
+        def record(path, at):
+            fetched.append((path, at))
+            return slot_png(at)
+
+        tl = timeline.Timeline(fetch or record, clock=clock, **kwargs)
+        tl._running = True  # prefetch() without the thread
+        tl.set_path("/preview")
+        return tl, clock, fetched
+
+    def test_slots_are_aligned_to_the_clock(self):
+        tl, clock, _ = self.make(step=60, ahead=300)
+        self.assertEqual(tl.slots(), [1020, 1080, 1140, 1200, 1260])
+        self.assertEqual(tl.slots(1020.0), [1080, 1140, 1200, 1260, 1320])
+        capped, _, _ = self.make(step=1, ahead=10_000, max_frames=3)
+        self.assertEqual(len(capped.slots()), 3)
+        short, _, _ = self.make(step=60, ahead=10)
+        self.assertEqual(short.slots(), [1020])  # always at least the next slot
+
+    def test_prefetch_take_and_refill(self):
+        tl, clock, fetched = self.make(step=60, ahead=180)
+        self.assertTrue(tl.prefetch())
+        self.assertEqual(tl.frames(), [1020, 1080, 1140])
+        self.assertEqual(fetched[0], ("/preview", 1020))
+        self.assertAlmostEqual(tl.seconds_until_due(lead=10), 9.5)
+        self.assertIsNone(tl.take(lead=10))
+        clock.now = 1095.0  # 1020 was never taken: the latest due slot wins
+        self.assertEqual(tl.take(), (1080, slot_png(1080)))
+        self.assertEqual(tl.frames(), [1140])
+        tl.prefetch()
+        self.assertEqual(tl.frames(), [1140, 1200, 1260])
+        self.assertEqual(len(fetched), 5)
+
+    def test_path_change_and_invalidate_refetch(self):
+        tl, _, fetched = self.make(step=60, ahead=120)
+        tl.prefetch()
+        tl.set_path("/preview")
+        self.assertEqual(len(tl.frames()), 2)
+        tl.set_path("/preview?raw=true")
+        self.assertEqual(tl.frames(), [])
+        tl.prefetch()
+        self.assertEqual(fetched[-1], ("/preview?raw=true", 1080))
+
+    def test_frames_fetched_across_an_invalidate_are_dropped(self):
+        def fetch(path, at):
+            tl.invalidate()  # content changed while this frame rendered
+            fetch.calls += 1
+            if fetch.calls > 1:
+                raise ConnectionError("stop")
+            return slot_png(at)
+        fetch.calls = 0
+        tl, _, _ = self.make(fetch=fetch, step=60, ahead=60)
+        with self.assertLogs("eink-client", level="WARNING"):
+            self.assertFalse(tl.prefetch())
+        self.assertEqual(tl.frames(), [])
+
+    def test_failures_keep_what_was_fetched(self):
+        def fetch(path, at):
+            if at > 1020:
+                raise ConnectionError("offline")
+            return slot_png(at)
+        tl, _, _ = self.make(fetch=fetch, step=60, ahead=180)
+        with self.assertLogs("eink-client", level="WARNING") as logs:
+            self.assertFalse(tl.prefetch())
+        self.assertIn("Timeline prefetch for 1080 failed", logs.output[0])
+        self.assertEqual(tl.frames(), [1020])
+
+    def test_server_without_render_ahead_switches_it_off(self):
+        def fetch(path, at):
+            raise timeline.TimelineUnsupported()
+        tl, _, _ = self.make(fetch=fetch, step=60, ahead=180)
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertTrue(tl.prefetch())
+        self.assertIn("timeline off", logs.output[0])
+        self.assertFalse(tl.supported)
+
+    def test_thread_fetches_and_stops(self):
+        done = threading.Event()
+
+        def fetch(path, at):
+            done.set()
+            return b"frame"
+        tl = timeline.Timeline(fetch, step=60, ahead=120)
+        tl.set_path("/preview")
+        tl.start()
+        self.assertTrue(done.wait(5))
+        tl.stop()
+        self.assertFalse(tl._thread.is_alive())
+
+
+class TestClientTimeline(ArtifactSandboxMixin, unittest.TestCase):
+    """The client's refresh cycle with a running timeline against the stand-in server."""
+
+    def setUp(self):
+        super().setUp()
+        import config
+        client = self.client
+        self.server = standin_server.StandinServer(make_test_png(), hold=0.2).start()
+        self.addCleanup(self.server.stop)
+        self.server.render_at = slot_png
+        for name, value in (
+            ("SERVER_URL", self.server.url), ("SERVER_URLS", ""), ("CLIENT_TOKEN", ""),
+            ("PREVIEW_DELTA", False), ("CONTENT_SKIP", True), ("LONGPOLL_TIMEOUT", 5),
+        ):
+            patcher = patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("_timeline", "_last_display_config", "_last_write_seconds",
+                     "_last_fetch_hash", "_last_fetch_bytes", "_last_displayed_hash",
+                     "_last_panel_write_monotonic", "_last_refresh_monotonic", "_last_frame",
+                     "_offline_since", "_offline_written_hash"):
+            self.addCleanup(setattr, client, name, getattr(client, name))
+        client.epd = self.epd = ImageEPD()
+        client._initial_display_done = True
+        client._last_display_config = dict(standin_server.COLOR_SETTINGS["display"])
+        client._last_write_seconds = None
+
+    def start_timeline(self, **kwargs):
+        tl = timeline.Timeline(self.client._fetch_timeline_frame, **kwargs)
+        self.client._timeline = tl
+        tl.start()
+        self.addCleanup(tl.stop)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.client.fetch_preview()  # the timeline follows the fetched path
+        return tl
+
+    def wait_for(self, predicate, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.02)
+
+    def test_frames_are_written_on_schedule_without_polling(self):
+        tl = self.start_timeline(step=1, ahead=3)
+        self.wait_for(lambda: len(tl.frames()) >= 2)
+        slot = tl.frames()[0]
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertTrue(self.client._run_refresh_cycle())
+        written_at = time.time()
+        self.assertGreaterEqual(written_at, slot)
+        self.assertLess(written_at, slot + 1)
+        self.assertNotIn("/api/refresh_status", self.server.requests)
+        self.assertEqual(self.epd.images[-1].tobytes(),
+                         Image.open(BytesIO(slot_png(slot))).convert("RGB").tobytes())
+        self.assertTrue(any("Timeline frame for" in line for line in logs.output))
+        self.assertEqual(self.server.heartbeats[-1]["status"], "refreshed")
+        self.assertIsNotNone(self.client._last_write_seconds)
+        # Offline: the stored frames keep the panel current.
+        now = time.monotonic()
+        self.server.add_outage(now, now + 60, "drop")
+        self.wait_for(lambda: tl.frames() and tl.frames()[0] > slot)
+        with self.assertLogs("eink-client", level="INFO"):
+            self.assertTrue(self.client._run_refresh_cycle())
+        self.assertEqual(len(self.epd.images), 2)
+
+    def test_unchanged_timeline_frame_is_skipped(self):
+        self.server.render_at = lambda at: self.server.png_bytes
+        tl = self.start_timeline(step=1, ahead=2)
+        self.client._record_panel_write(self.client._last_fetch_hash)
+        self.wait_for(lambda: tl.frames())
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            self.assertTrue(self.client._run_refresh_cycle())
+        self.assertEqual(self.epd.images, [])
+        self.assertTrue(any("content unchanged" in line for line in logs.output))
+
+    def test_server_without_render_ahead(self):
+        self.server.render_at = None
+        with self.assertLogs("eink-client", level="INFO") as logs:
+            tl = timeline.Timeline(self.client._fetch_timeline_frame, step=60, ahead=120)
+            self.client._timeline = tl
+            tl.start()
+            self.addCleanup(tl.stop)
+            self.client.fetch_preview()
+            self.wait_for(lambda: not tl.supported)
+        self.assertTrue(any("timeline off" in line for line in logs.output))
+        self.assertFalse(self.client._timeline_due())
+
+    def test_content_change_invalidates(self):
+        self.client._timeline = tl = MagicMock()
+        tl.seconds_until_due.return_value = None
+        for reason, calls in (("interval", 0), ("manual", 1)):
+            with patch("client.get_refresh_status",
+                       return_value={"should_refresh": True, "reason": reason}), \
+                    patch("client.fetch_display_config", return_value={}), \
+                    patch("client.handle_refresh", return_value=True), \
+                    self.assertLogs("eink-client", level="INFO"):
+                self.client._run_refresh_cycle()
+            self.assertEqual(tl.invalidate.call_count, calls)
+
+
+class TestTimelineConfig(unittest.TestCase):
+    """config.TIMELINE_STEP / TIMELINE_AHEAD."""
+
+    def tearDown(self):
+        import config
+        importlib.reload(config)
+
+    def test_defaults_and_override(self):
+        import config
+        with patch.dict(os.environ):
+            os.environ.pop("EINK_TIMELINE_STEP", None)
+            os.environ.pop("EINK_TIMELINE_AHEAD", None)
+            importlib.reload(config)
+            self.assertEqual((config.TIMELINE_STEP, config.TIMELINE_AHEAD), (0, 900))
+        with patch.dict(os.environ, {"EINK_TIMELINE_STEP": "60", "EINK_TIMELINE_AHEAD": "600"}):
+            importlib.reload(config)
+            self.assertEqual((config.TIMELINE_STEP, config.TIMELINE_AHEAD), (60, 600))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Tests for the refresh-pipeline stage timer (timing.py)."""
+
+import unittest
+from unittest.mock import patch
+
+import timing
+
+
+class TestStageTimer(unittest.TestCase):
+    """Spans, rolling percentiles, per-cycle collection, disabled no-op."""
+
+    def test_percentile_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(timing.percentile(values, 0.50), 50.0)
+        self.assertEqual(timing.percentile(values, 0.95), 95.0)
+        self.assertEqual(timing.percentile(values, 1.0), 100.0)
+        self.assertEqual(timing.percentile([7.0], 0.95), 7.0)
+
+    def test_span_records_elapsed_time(self):
+        timer = timing.StageTimer()
+        with patch("timing.time.perf_counter", side_effect=[10.0, 10.25]):
+            with timer.span("download"):
+                pass
+
+        stats = timer.stats()
+        self.assertEqual(stats["download"]["count"], 1)
+        self.assertAlmostEqual(stats["download"]["max"], 0.25)
+
+    def test_rolling_window_and_order(self):
+        timer = timing.StageTimer(window=4)
+        for seconds in (9.0, 1.0, 2.0, 3.0, 4.0):
+            timer.record("display", seconds)
+        timer.record("poll", 25.0)
+
+        stats = timer.stats()
+        # Pipeline order, not insertion order; oldest sample (9.0) evicted.
+        self.assertEqual(list(stats), ["poll", "display"])
+        self.assertEqual(stats["display"]["count"], 4)
+        self.assertEqual(stats["display"]["max"], 4.0)
+        self.assertEqual(stats["display"]["p50"], 2.0)
+
+    def test_cycle_sums_repeated_stages_and_resets(self):
+        timer = timing.StageTimer()
+        timer.begin_cycle()
+        timer.record("poll", 1.0)
+        timer.record("poll", 2.0)
+        timer.record("display", 0.5)
+        cycle = timer.end_cycle()
+
+        self.assertEqual(cycle["poll"], 3.0)
+        self.assertEqual(cycle["display"], 0.5)
+        self.assertIn("total", cycle)
+        self.assertEqual(timer.last_cycle, cycle)
+
+        timer.begin_cycle()
+        self.assertNotIn("poll", timer.end_cycle())
+
+    def test_current_cycle_peeks_without_closing(self):
+        timer = timing.StageTimer()
+        timer.begin_cycle()
+        timer.record("download", 0.25)
+        snapshot = timer.current_cycle()
+
+        self.assertEqual(snapshot["download"], 0.25)
+        self.assertIn("total", snapshot)
+        timer.record("display", 1.0)
+        self.assertEqual(set(timer.end_cycle()), {"download", "display", "total"})
+
+    def test_disabled_timer_is_a_noop(self):
+        timer = timing.StageTimer(enabled=False)
+        with patch("timing.time.perf_counter") as clock:
+            with timer.span("display"):
+                pass
+            timer.begin_cycle()
+            timer.record("poll", 1.0)
+        self.assertEqual(timer.end_cycle(), {})
+        self.assertEqual(timer.stats(), {})
+        clock.assert_not_called()
+        # One shared no-op span object, no per-call allocation.
+        self.assertIs(timer.span("a"), timer.span("b"))
+
+    def test_format_cycle(self):
+        line = timing.format_cycle({"display": 0.5, "total": 26.0, "poll": 25.0})
+        self.assertEqual(line, "poll=25000ms display=500ms total=26000ms")
+
+    def test_format_stats(self):
+        line = timing.format_stats(
+            {"download": {"count": 2, "p50": 0.1, "p95": 0.2, "max": 0.3}}
+        )
+        self.assertEqual(line, "download p50=100ms p95=200ms max=300ms")
+
+
+if __name__ == "__main__":
+    unittest.main()
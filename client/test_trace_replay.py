@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Tests for replaying recorded client sessions."""
+
+import contextlib
+import io
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import client
+import config
+import timing
+import trace_replay
+from test_session_trace import RecordedSessionMixin
+
+
+class TestFakeClock(unittest.TestCase):
+
+    def test_clock_only_moves_forward(self):
+        clock = trace_replay.FakeClock(5.0)
+        clock.sleep(2.5)
+        clock.advance_to(1.0)
+        self.assertEqual(clock.monotonic(), 7.5)
+        self.assertEqual(clock.perf_counter(), 7.5)
+        self.assertEqual(clock.gmtime().tm_year, 2023)
+
+    def test_exception_by_name(self):
+        import requests
+        self.assertIsInstance(trace_replay._exception("ConnectTimeout"), requests.ConnectTimeout)
+        self.assertIsInstance(trace_replay._exception("OSError", "SPI"), OSError)
+        gpio = trace_replay._exception("GPIOPinInUse")
+        self.assertEqual(type(gpio).__name__, "GPIOPinInUse")
+
+
+class TestReplay(RecordedSessionMixin, unittest.TestCase):
+    """Round trip: record a real session, replay it without network or panel."""
+
+    def setUp(self):
+        super().setUp()
+        self.events = self.record_session()
+        self.heartbeats = len(self.server.heartbeats)
+        self.server.stop()  # the replay must not need it
+
+    def test_replay_matches_the_recording(self):
+        state = (client.epd, client._server_get, client.time, timing.time, config.SERVER_URL)
+
+        report = trace_replay.Replay(self.events).run()
+
+        self.assertEqual(report["divergences"], [])
+        self.assertEqual(report["cycles"], 6)
+        self.assertEqual(report["served"], report["events"])
+        self.assertFalse(report["truncated"])
+        self.assertFalse(report["exited"])
+        # The fake clock spans the recorded session.
+        cycles = [e for e in self.events if e["k"] == "cycle"]
+        self.assertGreaterEqual(report["trace_seconds"], cycles[-1]["t"] - cycles[0]["t"])
+        self.assertEqual(report["stages"]["heartbeat"]["count"], self.heartbeats)
+        self.assertIn("display", report["stages"])
+        self.assertEqual(
+            state, (client.epd, client._server_get, client.time, timing.time, config.SERVER_URL)
+        )
+
+    def test_replay_from_a_later_cycle(self):
+        third = [i for i, e in enumerate(self.events) if e["k"] == "cycle"][2]
+        report = trace_replay.Replay(self.events[third:]).run()
+        self.assertEqual(report["divergences"], [])
+        self.assertEqual(report["cycles"], 4)
+
+    def test_replay_ignores_the_host_config(self):
+        first = next(i for i, e in enumerate(self.events) if e["k"] == "cycle")
+        for name in ("PREVIEW_DELTA", "COMPOSITE", "SERVER_URLS"):
+            self.assertIn(name, self.events[first]["cfg"])
+        older = [dict(e) for e in self.events]
+        older[first]["cfg"] = {name: value for name, value in older[first]["cfg"].items()
+                               if name not in trace_replay.Replay._CONFIG_DEFAULTS}
+        for events in (self.events, older):
+            with patch.object(config, "PREVIEW_DELTA", True), \
+                    patch.object(config, "SERVER_URLS", "http://a.invalid,http://b.invalid"):
+                report = trace_replay.Replay(events).run()
+                self.assertEqual(config.SERVER_URLS, "http://a.invalid,http://b.invalid")
+            self.assertEqual(report["divergences"], [])
+            self.assertEqual(report["cycles"], 6)
+
+    def test_changed_behaviour_is_a_divergence(self):
+        # Drop the recorded content-skip heartbeat: the client still sends it.
+        skip = next(i for i, e in enumerate(self.events)
+                    if e.get("p") == "/api/client_heartbeat" and i > 5)
+        del self.events[skip]
+        report = trace_replay.Replay(self.events).run()
+        self.assertEqual(len(report["divergences"]), 1)
+        self.assertIn("client did post /api/client_heartbeat", report["divergences"][0])
+        self.assertLess(report["cycles"], 6)
+
+    def test_truncated_trace_and_cli(self):
+        path = os.path.join(os.path.dirname(self.trace_path), "cut.jsonl")
+        cut = next(i for i, e in enumerate(self.events) if e.get("c") == "display")
+        with open(path, "w", encoding="utf-8") as fh:
+            for event in self.events[:cut]:
+                fh.write(json.dumps(event) + "\n")
+            fh.write('{"t": 1.0, "k": "hw", "c"')  # torn last line
+        report = trace_replay.replay([path])
+        self.assertTrue(report["truncated"])
+        self.assertEqual(report["divergences"], [])
+        self.assertIn("trace ended inside a cycle", trace_replay.format_report(report))
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(trace_replay.main([self.trace_path]), 0)
+        self.assertIn("replayed 6 cycles", out.getvalue())
+
+
+class TestPixelHashReplay(RecordedSessionMixin, unittest.TestCase):
+    """A session whose content skip compared pixels (several server endpoints)."""
+
+    def setUp(self):
+        super().setUp()
+        port = self.server.url.rsplit(":", 1)[1]
+        pool = f"http://127.0.0.1:{port},http://localhost:{port}"
+        for patcher in (patch.object(config, "SERVER_URLS", pool),
+                        patch.object(client, "_endpoint_pool", None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.events = self.record_session()
+        self.server.stop()
+
+    def test_replay_models_the_pixel_hash(self):
+        cycles = [e for e in self.events if e["k"] == "cycle"]
+        self.assertEqual(cycles[0]["cfg"]["SERVER_URLS"], config.SERVER_URLS)
+        self.assertEqual(list(cycles[1]["px"].values()), [cycles[1]["st"]["hash"]])
+        with patch.object(config, "SERVER_URLS", ""):
+            report = trace_replay.Replay(self.events).run()
+        self.assertEqual(report["divergences"], [])
+        self.assertEqual(report["cycles"], 6)
+
+    def test_replay_from_a_later_cycle(self):
+        cycles = [i for i, e in enumerate(self.events) if e["k"] == "cycle"]
+        events = [dict(e) for e in self.events[cycles[1]:]]  # starts with the content skip
+        events[0]["cfg"] = self.events[cycles[0]]["cfg"]  # as at the start of a rotated file
+        report = trace_replay.Replay(events).run()
+        self.assertEqual(report["divergences"], [])
+        self.assertEqual(report["cycles"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
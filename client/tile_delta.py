@@ -0,0 +1,142 @@
+"""Tile-delta frame transfer: download only the parts of a frame that changed.
+
+A cloud panel downloads the whole preview PNG for every changed frame, even
+when only a clock or a weather icon moved. With EINK_PREVIEW_DELTA the
+client keeps the last frame and asks for the difference instead:
+
+    POST /preview/delta?<the /preview query: raw=true, name=...>
+    {"tile": 64, "size": [800, 480], "mode": "RGB", "tiles": ["<digest>", ...]}
+
+tiles is the client's manifest: tile_digests() of its last frame, row by
+row. The server normalizes its current frame the same way, compares the
+manifests and answers with one of
+
+- Content-Type application/x-eink-tile-delta: one line of JSON
+  {"size": [w, h], "mode": "RGB", "tile": 64, "tiles": [[x, y, n], ...]},
+  a newline, then the n bytes of a PNG for each changed tile, in order;
+  no tiles at all when the frame is unchanged;
+- Content-Type image/png: the full frame, when the manifest does not match
+  the frame's geometry or the patch would not be smaller;
+
+with the frame_digest() of the resulting frame in X-Frame-Digest either way.
+The client verifies the reconstructed frame against it and falls back to a
+plain GET /preview on any mismatch. A server without the endpoint answers
+404/405 (401 behind its auth guard), and the client then stops asking for
+the rest of the process (client._endpoint_unsupported).
+
+Frames are compared in a normalized mode (normalize()): "1" and "L" stay,
+everything else becomes RGB, so palette PNGs cannot produce tiles with a
+different palette than the base.
+"""
+
+import hashlib
+import json
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+TILE = 64
+CONTENT_TYPE = "application/x-eink-tile-delta"
+DIGEST_HEADER = "X-Frame-Digest"
+# Hex characters kept per tile digest in the manifest (64 bits).
+TILE_DIGEST_CHARS = 16
+
+
+class DeltaError(ValueError):
+    """A patch that does not apply to the base frame."""
+
+
+def normalize(img: Image.Image) -> Image.Image:
+    """The frame in the mode tiles are compared and patched in."""
+    return img if img.mode in ("1", "L", "RGB") else img.convert("RGB")
+
+
+def frame_digest(img: Image.Image) -> str:
+    """SHA-256 over mode, size and raw pixel bytes (like client._artifact_digest)."""
+    digest = hashlib.sha256(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+def tile_boxes(size: Tuple[int, int], tile: int = TILE) -> List[Tuple[int, int, int, int]]:
+    """(left, top, right, bottom) of every tile, row by row; edge tiles are clipped."""
+    width, height = size
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in range(0, height, tile)
+        for x in range(0, width, tile)
+    ]
+
+
+def tile_digests(img: Image.Image, tile: int = TILE) -> List[str]:
+    """The manifest of a normalized frame."""
+    return [
+        hashlib.sha256(img.crop(box).tobytes()).hexdigest()[:TILE_DIGEST_CHARS]
+        for box in tile_boxes(img.size, tile)
+    ]
+
+
+def manifest(img: Image.Image, tile: int = TILE) -> dict:
+    """Request body for POST /preview/delta."""
+    return {"tile": tile, "size": list(img.size), "mode": img.mode,
+            "tiles": tile_digests(img, tile)}
+
+
+def encode(frame: Image.Image, request: dict) -> Tuple[str, bytes]:
+    """Server side: (content type, body) answering a manifest for frame."""
+    frame = normalize(frame)
+    full = BytesIO()
+    frame.save(full, format="PNG")
+    tile = request.get("tile")
+    if not isinstance(tile, int) or tile < 8 or request.get("mode") != frame.mode \
+            or request.get("size") != list(frame.size):
+        return "image/png", full.getvalue()
+    theirs = request.get("tiles") or []
+    boxes = tile_boxes(frame.size, tile)
+    if len(theirs) != len(boxes):
+        return "image/png", full.getvalue()
+    entries, blobs = [], []
+    for box, ours, known in zip(boxes, tile_digests(frame, tile), theirs):
+        if ours == known:
+            continue
+        buf = BytesIO()
+        frame.crop(box).save(buf, format="PNG")
+        entries.append([box[0], box[1], buf.tell()])
+        blobs.append(buf.getvalue())
+    header = json.dumps({"size": list(frame.size), "mode": frame.mode, "tile": tile,
+                         "tiles": entries}, separators=(",", ":")).encode("utf-8")
+    body = header + b"\n" + b"".join(blobs)
+    if len(body) >= full.tell():
+        return "image/png", full.getvalue()
+    return CONTENT_TYPE, body
+
+
+def apply(base: Optional[Image.Image], content_type: str, body: bytes) -> Image.Image:
+    """Client side: the full normalized frame from a /preview/delta response."""
+    if not content_type.startswith(CONTENT_TYPE):
+        img = Image.open(BytesIO(body))
+        img.load()
+        return normalize(img)
+    if base is None:
+        raise DeltaError("patch without a base frame")
+    newline = body.find(b"\n")
+    try:
+        header = json.loads(body[:newline]) if newline > 0 else None
+        tiles = header["tiles"]
+        if header["size"] != list(base.size) or header["mode"] != base.mode:
+            raise DeltaError("patch does not match the base frame")
+    except (ValueError, KeyError, TypeError) as e:
+        raise DeltaError(f"malformed patch header: {e}") from None
+    frame = base.copy()
+    offset = newline + 1
+    for x, y, length in tiles:
+        piece = Image.open(BytesIO(body[offset:offset + length]))
+        piece.load()
+        if piece.mode != frame.mode:
+            raise DeltaError(f"tile at {x},{y} is {piece.mode}, frame is {frame.mode}")
+        frame.paste(piece, (x, y))
+        offset += length
+    if offset != len(body):
+        raise DeltaError("patch length does not match its header")
+    return frame
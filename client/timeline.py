@@ -0,0 +1,169 @@
+"""Render-ahead timeline: frames for upcoming times, fetched before they are due.
+
+Time-driven designs (clocks, countdowns, year progress, calendars) change on
+the wall clock, and the client used to fetch each new frame only when the
+change was due: every transition paid the server render and the round trip
+on top of the panel refresh, and none happened while the server was
+unreachable. With EINK_TIMELINE_STEP set, a Timeline keeps the frames for
+the slots of the next EINK_TIMELINE_AHEAD seconds - slots are the multiples
+of the step on the Unix clock, so step 60 means every full minute - and
+client.py writes each one early enough that the panel has finished its
+refresh when the slot begins.
+
+Frames are fetched on a background thread as the PNG wire bytes (compact;
+decoded only when written) with
+
+    GET /preview?<the client's /preview query>&at=<slot, Unix seconds>
+
+which the server must confirm with an X-Render-At header echoing the
+slot. A server without the parameter renders the present and sends no
+header; the timeline then switches itself off for the process. Stored
+frames are dropped when the preview path changes or the server announces a
+content change (invalidate()), and refetched.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("eink-client")
+
+RENDER_AT_HEADER = "X-Render-At"
+# Upper bound on stored frames, whatever step and horizon say.
+MAX_FRAMES = 240
+# Pause before retrying after a failed fetch (server unreachable).
+RETRY_SECONDS = 30.0
+
+
+class TimelineUnsupported(Exception):
+    """The server ignored ?at= (no X-Render-At confirmation)."""
+
+
+class Timeline:
+    """Frames per upcoming slot and the thread fetching them.
+
+    fetch(path, at) returns the frame bytes for path rendered at Unix time
+    at, raises TimelineUnsupported when the server cannot render ahead, and
+    any other exception when the fetch failed.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, int], bytes],
+        step: int,
+        ahead: int,
+        max_frames: int = MAX_FRAMES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.fetch = fetch
+        self.step = step
+        self.ahead = ahead
+        self.max_frames = max_frames
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._frames: Dict[int, bytes] = {}
+        self._path: Optional[str] = None
+        self._generation = 0  # bumped by invalidate(); stale fetches are dropped
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.supported = True
+
+    def slots(self, now: Optional[float] = None) -> List[int]:
+        """The upcoming slot times within the horizon, soonest first."""
+        now = self._clock() if now is None else now
+        first = (int(now) // self.step + 1) * self.step
+        count = min(self.max_frames, max(1, self.ahead // self.step))
+        return [first + i * self.step for i in range(count)]
+
+    def set_path(self, path: str) -> None:
+        """Follow the client's current /preview path (query included)."""
+        with self._cond:
+            if path == self._path:
+                return
+            self._path = path
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """Drop every stored frame; they are fetched again with the new content."""
+        with self._cond:
+            self._frames.clear()
+            self._generation += 1
+            self._cond.notify_all()
+
+    def frames(self) -> List[int]:
+        with self._cond:
+            return sorted(self._frames)
+
+    def seconds_until_due(self, lead: float = 0.0) -> Optional[float]:
+        """Seconds until the next stored frame must be written; None = nothing stored."""
+        with self._cond:
+            if not self._frames:
+                return None
+            return min(self._frames) - lead - self._clock()
+
+    def take(self, lead: float = 0.0) -> Optional[Tuple[int, bytes]]:
+        """(slot, frame) of the latest slot due within lead seconds; older ones are dropped."""
+        with self._cond:
+            limit = self._clock() + lead
+            due = [at for at in self._frames if at <= limit]
+            if not due:
+                return None
+            latest = max(due)
+            frame = self._frames[latest]
+            for at in due:
+                del self._frames[at]
+            self._cond.notify_all()  # a slot was used up: fetch the next one
+            return latest, frame
+
+    def prefetch(self) -> bool:
+        """Fetch every missing slot once; False when a fetch failed."""
+        while True:
+            with self._cond:
+                if not self._running or not self.supported or self._path is None:
+                    return True
+                generation, path = self._generation, self._path
+                for at in list(self._frames):
+                    if at < self._clock() - self.step:
+                        del self._frames[at]  # never taken (e.g. written by a server refresh)
+                missing = [at for at in self.slots() if at not in self._frames]
+            if not missing:
+                return True
+            at = missing[0]
+            try:
+                frame = self.fetch(path, at)
+            except TimelineUnsupported:
+                logger.info("Server cannot render ahead (no %s) - timeline off",
+                            RENDER_AT_HEADER)
+                with self._cond:
+                    self.supported = False
+                return True
+            except Exception as e:
+                logger.warning("Timeline prefetch for %d failed: %s", at, e)
+                return False
+            with self._cond:
+                if generation == self._generation and at > self._clock():
+                    self._frames[at] = frame
+
+    def start(self) -> "Timeline":
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="eink-timeline", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            ok = self.prefetch()
+            with self._cond:
+                if not self._running or not self.supported:
+                    return
+                # Woken by take()/invalidate()/set_path(); otherwise once a
+                # step (the horizon moved on) or after a failed fetch.
+                self._cond.wait(min(self.step, RETRY_SECONDS) if ok else RETRY_SECONDS)
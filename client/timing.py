@@ -0,0 +1,159 @@
+"""Per-stage latency spans for the refresh pipeline.
+
+A StageTimer measures named stages (poll, settings, download, hash, decode,
+compose, convert, artifact, init, getbuffer, display, sleep, heartbeat) with
+time.perf_counter(), keeps a rolling window per stage for p50/p95/max, and
+collects the stages of the current refresh cycle for a one-line summary.
+
+Disabled timers hand out one shared no-op context manager: the cost of an
+instrumented call site is a method call and an attribute check.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Deque, Dict, List, Optional
+
+# Pipeline order for summaries; stages not listed here sort after these.
+STAGE_ORDER = (
+    "poll", "settings", "download", "hash", "decode", "compose", "convert", "artifact",
+    "init", "getbuffer", "display", "sleep", "heartbeat",
+)
+
+_NOOP_SPAN = nullcontext()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..1) of an already sorted, non-empty list."""
+    rank = math.ceil(q * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+class _Span:
+    """Context manager recording the elapsed time of one stage."""
+
+    __slots__ = ("_timer", "_stage", "_start")
+
+    def __init__(self, timer: "StageTimer", stage: str) -> None:
+        self._timer = timer
+        self._stage = stage
+        self._start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._timer.record(self._stage, time.perf_counter() - self._start)
+
+
+class StageTimer:
+    """Rolling per-stage latency statistics plus the current cycle's spans.
+
+    record() may be called from any thread (worker threads time their own
+    stages); a stage that runs several times within one cycle is summed.
+    observer, when set, receives every (stage, seconds) sample outside the
+    lock (the metrics histogram hooks in here).
+    """
+
+    def __init__(self, enabled: bool = True, window: int = 256) -> None:
+        self.enabled = enabled
+        self._window = window
+        self._lock = threading.Lock()
+        self._history: Dict[str, Deque[float]] = {}
+        self._cycle: Dict[str, float] = {}
+        self._cycle_start: Optional[float] = None
+        self.last_cycle: Dict[str, float] = {}
+        self.observer: Optional[Callable[[str, float], None]] = None
+
+    def span(self, stage: str):
+        """Context manager timing one stage; a shared no-op when disabled."""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, stage)
+
+    def record(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            history = self._history.get(stage)
+            if history is None:
+                history = self._history[stage] = deque(maxlen=self._window)
+            history.append(seconds)
+            self._cycle[stage] = self._cycle.get(stage, 0.0) + seconds
+        if self.observer is not None:
+            self.observer(stage, seconds)
+
+    def begin_cycle(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._cycle = {}
+            self._cycle_start = time.perf_counter()
+
+    def current_cycle(self) -> Dict[str, float]:
+        """Stage durations of the still-open cycle plus "total" elapsed so far."""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            cycle = dict(self._cycle)
+            if self._cycle_start is not None:
+                cycle["total"] = time.perf_counter() - self._cycle_start
+        return cycle
+
+    def end_cycle(self) -> Dict[str, float]:
+        """Close the current cycle; returns its stage durations plus "total"."""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            cycle = dict(self._cycle)
+            if self._cycle_start is not None:
+                cycle["total"] = time.perf_counter() - self._cycle_start
+            self._cycle = {}
+            self._cycle_start = None
+            self.last_cycle = cycle
+        return cycle
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Rolling {stage: {count, p50, p95, max}} in seconds, pipeline order."""
+        with self._lock:
+            snapshot = {stage: sorted(values) for stage, values in self._history.items() if values}
+        return {
+            stage: {
+                "count": len(values),
+                "p50": percentile(values, 0.50),
+                "p95": percentile(values, 0.95),
+                "max": values[-1],
+            }
+            for stage, values in sorted(snapshot.items(), key=lambda item: _stage_key(item[0]))
+        }
+
+
+def _stage_key(stage: str):
+    try:
+        return (STAGE_ORDER.index(stage), stage)
+    except ValueError:
+        return (len(STAGE_ORDER), stage)
+
+
+def format_cycle(cycle: Dict[str, float]) -> str:
+    """Render a cycle dict as "poll=25003ms download=412ms ... total=25480ms"."""
+    parts = [
+        f"{stage}={cycle[stage] * 1000:.0f}ms"
+        for stage in sorted(cycle, key=_stage_key)
+        if stage != "total"
+    ]
+    if "total" in cycle:
+        parts.append(f"total={cycle['total'] * 1000:.0f}ms")
+    return " ".join(parts)
+
+
+def format_stats(stats: Dict[str, Dict[str, float]]) -> str:
+    """Render rolling stats as "download p50=410ms p95=900ms max=1200ms; ..."."""
+    return "; ".join(
+        f"{stage} p50={s['p50'] * 1000:.0f}ms p95={s['p95'] * 1000:.0f}ms "
+        f"max={s['max'] * 1000:.0f}ms"
+        for stage, s in stats.items()
+    )
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""Replay a recorded client session (session_trace.py, EINK_TRACE_PATH).
+
+Drives the real process_refresh_cycle() from a trace with a fake clock: the
+recorded server requests and hardware calls are served back in order, each
+taking its recorded time on the fake clock; /preview bytes are synthesized
+per recorded digest (equal digests give equal bytes, so the content skip
+behaves as in the field). The first cycle restores the client state its
+cycle event recorded; every later cycle must start in the recorded state.
+
+A call the trace does not have next, or a cycle starting in a different
+state, is a divergence - the replay stops there, reports it and exits 1. A
+field incident becomes a regression test; the stage timings on the fake
+clock (recorded network and hardware times) make it a benchmark input:
+
+    python3 trace_replay.py /var/log/eink/trace.jsonl.1 /var/log/eink/trace.jsonl
+    python3 trace_replay.py trace.jsonl --cycles 50 --json replay.json
+
+Nothing touches the network, the panel or the real EINK_LAST_SENT_PATH.
+"""
+
+import argparse
+import builtins
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional
+
+import requests
+from PIL import Image
+
+import client
+import config
+import timing
+from session_trace import DIGEST_CHARS, HW_CALLS, TRACE_CONFIG
+
+
+class ReplayDivergence(Exception):
+    """The client made a call the trace does not have at this point."""
+
+
+class TraceEnded(Exception):
+    """The client asked for more than the trace recorded."""
+
+
+def load_events(paths: Iterable[str]) -> List[dict]:
+    """Events of the given files, oldest file first (pass path.2 path.1 path)."""
+    events = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        pass  # a torn last line after a crash
+    return events
+
+
+class FakeClock:
+    """Stands in for the time module of client and timing during a replay."""
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+        self._epoch = 1_700_000_000.0
+
+    def advance_to(self, t: float) -> None:
+        self.now = max(self.now, t)
+
+    def monotonic(self) -> float:
+        return self.now
+
+    perf_counter = monotonic
+
+    def time(self) -> float:
+        return self._epoch + self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(0.0, seconds)
+
+    def gmtime(self, secs=None):
+        return time.gmtime(self.time() if secs is None else secs)
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def _exception(name: str, message: str = "") -> Exception:
+    """Re-create a recorded exception by type name (requests, builtins, else generic)."""
+    cls = getattr(requests.exceptions, name, None) or getattr(builtins, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, Exception)):
+        cls = type(name, (Exception,), {})
+    return cls(message or f"replayed {name}")
+
+
+class Replay:
+    """Serves a trace back to the real client code; see the module docstring."""
+
+    _CLIENT_STATE = (
+        "epd", "driver_name", "time", "_timer", "_tracer", "_last_artifact",
+        "_server_get", "_server_post", "_last_fetch_hash", "_last_fetch_bytes",
+        "_last_displayed_hash", "_last_panel_write_monotonic", "_consecutive_hw_failures",
+        "_initial_display_done", "_hw_recovery_pending", "_preview_only",
+        "_heartbeat_telemetry_accepted", "_auth_error_logged", "_endpoint_pool",
+    )
+    _CONFIG_STATE = TRACE_CONFIG + (
+        "PANEL_EMULATOR", "DRIVER_PROCESS", "STAGE_TIMING", "LAST_SENT_PATH", "LAST_SENT_ASYNC",
+        "PREVIEW_RESUME", "CAPABILITIES", "PLAYLIST", "TIMELINE_STEP", "LONGPOLL_ADAPTIVE",
+    )
+    # What a trace recorded before these were part of its cfg ran with.
+    _CONFIG_DEFAULTS = {"PREVIEW_DELTA": False, "COMPOSITE": False, "SERVER_URLS": ""}
+    _MODULES = ("waveshare_epd", "waveshare_epd.epd7in3e", "waveshare_epd.epd7in5_V2",
+                "waveshare_epd.epdconfig")
+
+    def __init__(self, events: List[dict]) -> None:
+        start = next((i for i, e in enumerate(events) if e.get("k") == "cycle"), None)
+        self.events = events[start:] if start is not None else []
+        self.cursor = 0
+        self.clock = FakeClock(self.events[0]["t"] if self.events else 0.0)
+        self.divergences: List[str] = []
+        self.truncated = False
+        self.exited = False
+        self.cycles = 0
+        self.stage_samples: Dict[str, List[float]] = {}
+        self._previews: Dict[Optional[str], bytes] = {}  # recorded digest -> synthesized PNG
+        self._recorded_digest: Dict[str, str] = {}  # synthesized SHA-256 -> recorded digest
+        self._pixel_digest: Dict[str, str] = {}  # body digest -> pixel digest (cycle "px")
+        for event in self.events:
+            self._pixel_digest.update(event.get("px", {}))
+        self._body_digest = {pixels: body for body, pixels in self._pixel_digest.items()}
+
+    # --- serving events ---
+
+    def _take(self, kind: str, key: str, key_name: str) -> dict:
+        if self.cursor >= len(self.events):
+            self.truncated = True
+            raise TraceEnded(f"{kind} {key}")
+        event = self.events[self.cursor]
+        if event.get("k") != kind or event.get(key_name) != key:
+            message = f"cycle {self.cycles}: client did {kind} {key}, trace has {_describe(event)}"
+            self.divergences.append(message)
+            raise ReplayDivergence(message)
+        self.cursor += 1
+        self.clock.advance_to(event["t"])
+        self.clock.sleep(event.get("d", 0.0))
+        return event
+
+    def _preview_bytes(self, digest: Optional[str], size: Optional[list]) -> bytes:
+        """Deterministic stand-in content per recorded digest."""
+        if digest not in self._previews:
+            width, height = size or self._preview_size(digest)
+            seed = bytes.fromhex(digest or "00" * (DIGEST_CHARS // 2))
+            buf = BytesIO()
+            Image.new("RGB", (width, height), tuple(seed[:3])).save(buf, format="PNG")
+            data = buf.getvalue()
+            self._previews[digest] = data
+            self._recorded_digest[hashlib.sha256(data).hexdigest()] = digest
+            if client._pixel_hashing():
+                pixels = self._pixel_digest.get(digest, digest)
+                self._recorded_digest[self._displayed_hash(data)] = pixels
+        return self._previews[digest]
+
+    def _preview_size(self, digest: Optional[str]) -> list:
+        previews = [e for e in self.events if e.get("wh") and e.get("k") == "get"]
+        match = next((e for e in previews if e.get("h") == digest), None)
+        return (match or (previews[0] if previews else {"wh": [800, 480]}))["wh"]
+
+    def _response(self, event: dict) -> requests.Response:
+        if "e" in event:
+            raise _exception(event["e"])
+        resp = requests.Response()
+        resp.status_code = event["s"]
+        resp.reason = ""
+        resp.url = f"{config.SERVER_URL}{event['p']}"
+        if "wh" in event:
+            resp._content = self._preview_bytes(event.get("h"), event["wh"])
+        elif "b" in event:
+            resp._content = json.dumps(event["b"]).encode("utf-8")
+        else:
+            resp._content = b""
+        return resp
+
+    def server_get(self, path, timeout):
+        return self._response(self._take("get", path, "p"))
+
+    def server_post(self, path, payload, timeout):
+        return self._response(self._take("post", path, "p"))
+
+    def hw(self, call: str) -> dict:
+        event = self._take("hw", call, "c")
+        if "e" in event:
+            name, _, message = event["e"].partition(": ")
+            raise _exception(name, message)
+        return event
+
+    # --- fake driver modules ---
+
+    def _epd_class(self):
+        replay = self
+
+        class ReplayEPD:
+            def __init__(self, size=None, consume=True):
+                event = replay.hw("EPD") if consume else {}
+                self.width, self.height = size or event.get("wh") or (800, 480)
+
+            def getbuffer(self, img):
+                return bytearray(replay.hw("getbuffer").get("n", 0))
+
+            def __getattr__(self, name):
+                if name not in HW_CALLS:
+                    raise AttributeError(name)
+                return lambda *args, **kwargs: replay.hw(name).get("r")
+
+        return ReplayEPD
+
+    def _install_modules(self) -> None:
+        self._saved_modules = {name: sys.modules.get(name) for name in self._MODULES}
+        self.epd_class = self._epd_class()
+        epdconfig = types.ModuleType("waveshare_epd.epdconfig")
+        epdconfig.module_exit = lambda: self.hw("module_exit") and None
+        package = types.ModuleType("waveshare_epd")
+        package.__path__ = []
+        package.epdconfig = epdconfig
+        sys.modules["waveshare_epd"] = package
+        sys.modules["waveshare_epd.epdconfig"] = epdconfig
+        for name in ("epd7in3e", "epd7in5_V2"):
+            module = types.ModuleType(f"waveshare_epd.{name}")
+            module.EPD = self.epd_class
+            module.epdconfig = epdconfig
+            setattr(package, name, module)
+            sys.modules[f"waveshare_epd.{name}"] = module
+
+    def _restore_modules(self) -> None:
+        for name, module in self._saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+
+    # --- client state ---
+
+    def _restore_state(self, event: dict) -> None:
+        st = event["st"]
+        for name, value in event.get("cfg", {}).items():
+            setattr(config, name, value)
+        client.driver_name = st["drv"]
+        client.epd = self.epd_class(st.get("wh"), consume=False) if st["epd"] else None
+        client._initial_display_done = st["init"]
+        client._hw_recovery_pending = st["rec"]
+        client._preview_only = st["prev"]
+        client._consecutive_hw_failures = st["hwf"]
+        client._heartbeat_telemetry_accepted = st.get("tel", True)
+        client._last_displayed_hash = None
+        if st["hash"]:
+            data = self._preview_bytes(self._body_digest.get(st["hash"], st["hash"]), None)
+            client._last_displayed_hash = self._displayed_hash(data)
+        client._last_panel_write_monotonic = (
+            self.clock.monotonic() - st["age"] if st.get("age") is not None else None
+        )
+
+    def _displayed_hash(self, data: bytes) -> str:
+        """client._last_displayed_hash after showing data (_decode_preview's rule)."""
+        if not client._pixel_hashing():
+            return hashlib.sha256(data).hexdigest()
+        img = Image.open(BytesIO(data))
+        img.load()
+        if config.PREVIEW_DELTA or config.COMPOSITE:
+            import tile_delta
+            img = tile_delta.normalize(img)
+        return client._artifact_digest(img)
+
+    def _check_state(self, event: dict) -> None:
+        state = client._trace_state()
+        if client._last_displayed_hash is not None:
+            full = client._last_displayed_hash
+            state["hash"] = self._recorded_digest.get(full, full[:DIGEST_CHARS])
+        for key in ("drv", "epd", "init", "rec", "prev", "hwf", "hash"):
+            if state.get(key) != event["st"].get(key):
+                self.divergences.append(
+                    f"cycle {self.cycles}: starts with {key}={state.get(key)!r}, "
+                    f"trace has {event['st'].get(key)!r}"
+                )
+
+    def run(self, max_cycles: Optional[int] = None) -> dict:
+        """Replay every cycle (or max_cycles) in a sandboxed client; returns the report."""
+        saved_client = {name: getattr(client, name) for name in self._CLIENT_STATE}
+        saved_config = {name: getattr(config, name) for name in self._CONFIG_STATE}
+        saved_timing_time = timing.time
+        logger = logging.getLogger("eink-client")
+        log_level = logger.level
+        tmpdir = tempfile.TemporaryDirectory()
+        began = time.perf_counter()
+        try:
+            self._install_modules()
+            client.time = timing.time = self.clock
+            client._server_get = self.server_get
+            client._server_post = self.server_post
+            client._tracer = None
+            client._last_artifact = None
+            client._timer = timing.StageTimer(enabled=True)
+            client._timer.observer = (
+                lambda stage, seconds: self.stage_samples.setdefault(stage, []).append(seconds)
+            )
+            config.PANEL_EMULATOR = False
+            config.DRIVER_PROCESS = False
+            config.STAGE_TIMING = False
+            config.LAST_SENT_ASYNC = False
+            config.PREVIEW_RESUME = 0  # one recorded response per preview
+            # Extensions whose state a trace does not record stay off.
+            config.CAPABILITIES = config.PLAYLIST = config.LONGPOLL_ADAPTIVE = False
+            config.TIMELINE_STEP = 0
+            config.LAST_SENT_PATH = os.path.join(tmpdir.name, "eink_last_sent.png")
+            for name, value in self._CONFIG_DEFAULTS.items():
+                setattr(config, name, value)
+            logger.setLevel(logging.CRITICAL)
+            self._replay_cycles(max_cycles)
+        finally:
+            logger.setLevel(log_level)
+            self._restore_modules()
+            timing.time = saved_timing_time
+            for name, value in saved_client.items():
+                setattr(client, name, value)
+            for name, value in saved_config.items():
+                setattr(config, name, value)
+            tmpdir.cleanup()
+        return self._report(time.perf_counter() - began)
+
+    def _replay_cycles(self, max_cycles: Optional[int]) -> None:
+        while self.cursor < len(self.events) and not self.divergences:
+            if max_cycles is not None and self.cycles >= max_cycles:
+                break
+            event = self.events[self.cursor]
+            if event.get("k") != "cycle":
+                self.divergences.append(
+                    f"cycle {self.cycles}: client skipped recorded {_describe(event)}"
+                )
+                break
+            self.cursor += 1
+            self.clock.advance_to(event["t"])
+            if self.cycles == 0:
+                self._restore_state(event)
+            else:
+                self._check_state(event)
+                if self.divergences:
+                    break
+            self.cycles += 1
+            try:
+                client.process_refresh_cycle()
+            except SystemExit:
+                self.exited = True  # E5.4 escalation, like in the field
+                break
+            if self.truncated:
+                break
+
+    def _report(self, wall_seconds: float) -> dict:
+        stages = {}
+        for stage, values in self.stage_samples.items():
+            ordered = sorted(values)
+            stages[stage] = {
+                "count": len(ordered),
+                "p50_ms": round(timing.percentile(ordered, 0.50) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        first = self.events[0]["t"] if self.events else 0.0
+        return {
+            "cycles": self.cycles,
+            "events": len(self.events),
+            "served": self.cursor,
+            "divergences": list(self.divergences),
+            "exited": self.exited,
+            "truncated": self.truncated,
+            "trace_seconds": round(self.clock.now - first, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "stages": stages,
+        }
+
+
+def _describe(event: dict) -> str:
+    if event.get("k") == "cycle":
+        return "the next cycle"
+    return f"{event.get('k')} {event.get('p', event.get('c'))}"
+
+
+def replay(paths: Iterable[str], max_cycles: Optional[int] = None) -> dict:
+    return Replay(load_events(paths)).run(max_cycles)
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"replayed {report['cycles']} cycles, {report['served']}/{report['events']} events, "
+        f"{report['trace_seconds']:g}s of trace in {report['wall_seconds']:g}s"
+    ]
+    if report["exited"]:
+        lines.append("  client exited (hardware failure escalation)")
+    if report["truncated"]:
+        lines.append("  trace ended inside a cycle")
+    for message in report["divergences"]:
+        lines.append(f"  DIVERGENCE {message}")
+    stages = sorted(report["stages"].items(), key=lambda item: timing._stage_key(item[0]))
+    for stage, s in stages:
+        lines.append(f"  {stage:<10} n={s['count']:<5} p50={s['p50_ms']:.0f}ms max={s['max_ms']:.0f}ms")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a client session trace")
+    parser.add_argument("paths", nargs="+", help="trace files, oldest first (path.2 path.1 path)")
+    parser.add_argument("--cycles", type=int, help="stop after this many cycles")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+    report = replay(args.paths, args.cycles)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    return 1 if report["divergences"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())